@@ -0,0 +1,120 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Compares the stage aggregated metrics computed by the metrics pipeline with the ones sent by the collector listener.
+Requires the local stack started with the pipelines-stage-agg.yaml pipelines and a Spark application run with the
+collector, then run from the deployment directory:
+
+    python dev/compare_stage_aggregation.py --endpoint http://localhost:9200
+
+For each stage, the pipeline documents of the windows are merged and the max and skew are compared with the listener
+ones. The percentiles approximated from the merged histogram buckets, like the pipeline does for each window, are
+compared with the exact percentiles of the task metrics.
+"""
+
+import argparse
+import math
+
+import requests
+
+COUNTERS = {'input': 'InputBytesRead', 'shuffle': 'ShuffleBytesRead'}
+
+PERCENTS = [50, 90]
+
+
+def search(endpoint: str, index: str, query: dict) -> dict:
+    response = requests.post(f'{endpoint}/{index}/_search', json=query)
+    if not response.ok:
+        raise Exception(f'Error {response.status_code} on {index}: {response.text}')
+    return response.json()
+
+
+def documents(endpoint: str, index: str, app_id: str = None) -> list:
+    query = {'size': 10000, 'query': {'bool': {'filter': [{'term': {'appId': app_id}}] if app_id else []}}}
+    return [hit['_source'] for hit in search(endpoint, index, query)['hits']['hits']]
+
+
+def skewness(minimum: float, maximum: float, mean: float) -> float:
+    """
+    The relative distance skew of the listener, max |x - mean| / (max - min), reached by the min or the max task
+    """
+    value_range = maximum - minimum
+    return max(maximum - mean, mean - minimum) / value_range if value_range > 0 else 0.0
+
+
+def merge_windows(windows: list, name: str) -> dict:
+    """
+    Merges the pipeline documents of the windows of a stage for one counter
+    """
+    windows = [w for w in windows if f'max{name}' in w]
+    count = sum(w['taskCount'] for w in windows)
+    stage = {
+        'count': count,
+        'min': min(w[f'min{name}'] for w in windows),
+        'max': max(w[f'max{name}'] for w in windows),
+        'mean': sum(w[f'mean{name}'] * w['taskCount'] for w in windows) / count,
+        'buckets': windows[0][f'{name[0].lower()}{name[1:]}Buckets'],
+        'bucket_counts': [sum(c) for c in zip(*(w[f'{name[0].lower()}{name[1:]}BucketCounts'] for w in windows))],
+    }
+    stage['skewness'] = skewness(stage['min'], stage['max'], stage['mean'])
+    return stage
+
+
+def approximate_percentile(stage: dict, percent: float) -> float:
+    """
+    The upper bound of the first histogram bucket reaching the percentile, capped by the max of the stage, like the
+    p50 and p90 of the pipeline
+    """
+    rank = percent / 100 * stage['count']
+    cumulated = 0
+    for bound, count in zip(stage['buckets'], stage['bucket_counts']):
+        cumulated += count
+        if cumulated >= rank:
+            return min(bound, stage['max'])
+    return stage['max']
+
+
+def exact_percentiles(endpoint: str, app_id: str, stage_id: int, field: str) -> dict:
+    query = {'size': 0, 'query': {'bool': {'filter': [{'term': {'appId': app_id}}, {'term': {'stageId': stage_id}}]}},
+             'aggs': {'p': {'percentiles': {'field': field, 'percents': PERCENTS}}}}
+    values = search(endpoint, 'spark-task-metrics', query)['aggregations']['p']['values']
+    return {p: values[f'{float(p)}'] for p in PERCENTS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the pipeline and listener stage aggregated metrics')
+    parser.add_argument('--endpoint', default='http://localhost:9200')
+    parser.add_argument('--app-id', help='limit the comparison to one application')
+    parser.add_argument('--tolerance', type=float, default=1e-6, help='maximum difference of the skew')
+    args = parser.parse_args()
+    endpoint = args.endpoint.rstrip('/')
+
+    listener = {(d['appId'], d['stageId']): d for d in documents(endpoint, 'spark-stage-agg-metrics', args.app_id)}
+    pipeline = {}
+    for document in documents(endpoint, 'spark-stage-agg-metrics-pipeline', args.app_id):
+        pipeline.setdefault((document['appId'], document['stageId']), []).append(document)
+
+    mismatches = 0
+    print(f"{'application':32}{'stage':>6}{'counter':>9}{'max':>16}{'skew listener':>15}{'skew pipeline':>15}  "
+          + '  '.join(f'p{p} approx/exact' for p in PERCENTS))
+    for key in sorted(listener.keys() & pipeline.keys()):
+        for counter, name in COUNTERS.items():
+            stage = merge_windows(pipeline[key], name)
+            expected = listener[key]
+            skew_delta = abs(stage['skewness'] - expected[f'{counter}BytesReadSkewness'])
+            if skew_delta > args.tolerance or stage['max'] != expected[f'max{name}']:
+                mismatches += 1
+            exact = exact_percentiles(endpoint, key[0], key[1], f'{counter}BytesRead')
+            ratios = '  '.join(f"{approximate_percentile(stage, p) / exact[p] if exact[p] else math.nan:>16.2f}"
+                               for p in PERCENTS)
+            print(f"{key[0]:32}{key[1]:>6}{counter:>9}{stage['max']:>16.0f}"
+                  f"{expected[f'{counter}BytesReadSkewness']:>15.4f}{stage['skewness']:>15.4f}  {ratios}")
+
+    missing = len(listener.keys() - pipeline.keys())
+    print(f'{len(listener.keys() & pipeline.keys())} stages compared, {mismatches} mismatches, '
+          f'{missing} stages without pipeline documents')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Benchmark of the metrics index templates on synthetic Spark task and stage metrics.
+Compares the previous mapping (text appName, long identifiers, double skewness, default codec, unsorted indices)
+with the templates of the bootstrap function:
+ * store: the primary store size after a force merge to one segment
+ * query: the median latency of the queries run by the data skew dashboard, without request cache
+The previous mapping is derived from the current templates, so both indices receive the same documents.
+Requires requests and an Opensearch 2.x endpoint (a test domain with fine grained access control or a local Opensearch),
+run from the deployment directory:
+
+    python dev/index_template_benchmark.py --endpoint https://localhost:9200 --user admin --password <PASSWORD>
+"""
+
+import argparse
+import copy
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+
+import requests
+
+TEMPLATES_PATH = Path(__file__).parent.parent.joinpath('infra/resources/lambda/opensearch-bootstrap/resources/templates')
+
+# The previous types of the fields narrowed by the templates
+LEGACY_TYPES = {'integer': 'long', 'short': 'long', 'scaled_float': 'double'}
+
+BULK_SIZE = 5000
+
+
+def legacy_template(template: dict) -> dict:
+    """
+    Returns the index template as it was before the storage optimizations
+    """
+    legacy = copy.deepcopy(template)
+    mappings = legacy['template']['mappings']
+    for name, field in mappings['properties'].items():
+        field.pop('doc_values', None)
+        field.pop('scaling_factor', None)
+        if name == 'appName':
+            field.clear()
+            field.update({'type': 'text', 'fields': {'keyword': {'type': 'keyword', 'ignore_above': 256}}})
+        elif field.get('type') in LEGACY_TYPES:
+            field['type'] = LEGACY_TYPES[field['type']]
+    legacy['template']['settings'] = {'index': {}}
+    return legacy
+
+
+def index_settings(template: dict) -> dict:
+    """
+    The settings of the benchmark index, one shard without replica so the store size is comparable,
+    without the lifecycle settings
+    """
+    settings = {k: v for k, v in template['template']['settings']['index'].items() if not k.startswith('plugins.')}
+    return {'index': dict(settings, number_of_shards=1, number_of_replicas=0, refresh_interval='-1')}
+
+
+def synthetic_metrics(apps: int, tasks: int, seed: int = 42):
+    """
+    Generates the task metrics of the applications in the order the collector sends them, interleaving applications
+    running at the same time, and the stage aggregated metrics at the end of each stage.
+    """
+    rng = random.Random(seed)
+    start = int(time.time() * 1000) - 86400000
+    running = []
+    for app in range(apps):
+        app_id = f'application_{start}_{app:04d}'
+        stages = []
+        for stage_id in range(rng.randint(20, 200)):
+            stages.append((stage_id, rng.choice((10, 200, 2000)), rng.random() < 0.1))
+        running.append({'appId': app_id, 'appName': f'etl-job-{app % 25}', 'stages': stages, 'time': start})
+
+    tasks_per_app = tasks // apps
+    emitted = {app['appId']: 0 for app in running}
+    while running:
+        app = rng.choice(running)
+        stage_id, partitions, skewed = app['stages'].pop(0)
+        job_id = str(stage_id // 5)
+        input_bytes = []
+        shuffle_bytes = []
+        for partition in range(min(partitions, tasks_per_app - emitted[app['appId']])):
+            app['time'] += rng.randint(1, 50)
+            factor = rng.lognormvariate(0, 1.5 if skewed else 0.2)
+            read = float(int(64 * 1024 * 1024 * factor))
+            shuffle = float(int(8 * 1024 * 1024 * factor))
+            input_bytes.append(read)
+            shuffle_bytes.append(shuffle)
+            yield 'task', {
+                'appName': app['appName'], 'appId': app['appId'], 'jobId': job_id, 'metricsType': 'taskMetrics',
+                'metricTime': app['time'], 'stageId': stage_id, 'stageAttemptId': 0, 'partitionId': partition,
+                'taskId': str(emitted[app['appId']]), 'executorId': str(rng.randint(1, 100)),
+                'runTime': int(2000 * factor), 'executorCpuTime': int(1.5e9 * factor),
+                'peakExecutionMemory': int(256 * 1024 * 1024 * factor),
+                'inputBytesRead': read, 'inputRecordsRead': float(int(read / 120)),
+                'outputBytesWritten': float(int(read / 4)), 'outputRecordsWritten': float(int(read / 480)),
+                'shuffleBytesRead': shuffle, 'shuffleRecordsRead': float(int(shuffle / 60)),
+                'shuffleBytesWritten': shuffle, 'shuffleRecordsWritten': float(int(shuffle / 60)),
+            }
+            emitted[app['appId']] += 1
+        if input_bytes:
+            yield 'stage', {
+                'appName': app['appName'], 'appId': app['appId'], 'jobId': job_id, 'metricsType': 'stageAggMetrics',
+                'metricTime': app['time'], 'stageId': stage_id,
+                'maxInputBytesRead': max(input_bytes), 'maxShuffleBytesRead': max(shuffle_bytes),
+                'inputBytesReadSkewness': skewness(input_bytes), 'shuffleBytesReadSkewness': skewness(shuffle_bytes),
+            }
+        if not app['stages'] or emitted[app['appId']] >= tasks_per_app:
+            running.remove(app)
+
+
+def skewness(values: list) -> float:
+    if len(values) < 3:
+        return 0.0
+    mean = statistics.fmean(values)
+    deviation = statistics.pstdev(values)
+    return sum(((v - mean) / deviation) ** 3 for v in values) / len(values) if deviation else 0.0
+
+
+def dashboard_queries(app_ids: list) -> dict:
+    """
+    The queries of the data skew dashboard, filtered on one application
+    """
+    app_filter = {'bool': {'filter': [{'terms': {'appId': app_ids}}]}}
+    return {
+        'task': {
+            'stage totals': {'size': 0, 'query': app_filter, 'aggs': {'stages': {
+                'terms': {'field': 'stageId', 'size': 500},
+                'aggs': {f: {'sum': {'field': f}} for f in ('inputBytesRead', 'shuffleBytesRead', 'runTime')}}}},
+            'task distribution': {'size': 0, 'query': app_filter, 'aggs': {'input': {
+                'percentiles': {'field': 'inputBytesRead', 'percents': [50, 90, 99]}}}},
+            'latest tasks': {'size': 50, 'query': app_filter, 'sort': [{'metricTime': 'desc'}]},
+        },
+        'stage': {
+            'skewed stages': {'size': 20, 'query': app_filter, 'sort': [{'inputBytesReadSkewness': 'desc'}]},
+            'applications': {'size': 0, 'aggs': {'apps': {'terms': {'field': '{app_name}', 'size': 100}}}},
+        },
+    }
+
+
+class Benchmark:
+
+    def __init__(self, endpoint: str, auth: tuple, verify: bool):
+        self.endpoint = endpoint.rstrip('/')
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.verify = verify
+
+    def request(self, method: str, path: str, payload=None, data: str = None) -> dict:
+        headers = {'Content-Type': 'application/x-ndjson' if data else 'application/json'}
+        response = self.session.request(method, f'{self.endpoint}/{path}', json=payload, data=data, headers=headers)
+        if not response.ok:
+            raise Exception(f'Error {response.status_code} on {method} {path}: {response.text}')
+        return response.json()
+
+    def create_index(self, name: str, template: dict):
+        self.session.delete(f'{self.endpoint}/{name}')
+        self.request('PUT', name, {'settings': index_settings(template),
+                                   'mappings': template['template']['mappings']})
+
+    def load(self, indices: dict, apps: int, tasks: int):
+        batches = {kind: [] for kind in indices}
+        for kind, document in synthetic_metrics(apps, tasks):
+            batches[kind].append(document)
+            if len(batches[kind]) >= BULK_SIZE:
+                self.bulk(indices[kind], batches[kind])
+                batches[kind] = []
+        for kind, documents in batches.items():
+            if documents:
+                self.bulk(indices[kind], documents)
+
+    def bulk(self, names: list, documents: list):
+        for name in names:
+            lines = []
+            for document in documents:
+                lines.append(json.dumps({'index': {'_index': name}}))
+                lines.append(json.dumps(document))
+            response = self.request('POST', '_bulk', data='\n'.join(lines) + '\n')
+            if response['errors']:
+                error = next(i['index']['error'] for i in response['items'] if 'error' in i['index'])
+                raise Exception(f'Error in bulk indexing into {name}: {error}')
+
+    def store_size(self, name: str) -> int:
+        self.request('POST', f'{name}/_refresh')
+        self.request('POST', f'{name}/_forcemerge?max_num_segments=1')
+        return self.request('GET', f'{name}/_stats/store')['indices'][name]['primaries']['store']['size_in_bytes']
+
+    def latency(self, name: str, query: dict, runs: int) -> float:
+        samples = []
+        for _ in range(runs):
+            response = self.request('POST', f'{name}/_search?request_cache=false', query)
+            samples.append(response['took'])
+        return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the previous and current metrics index templates')
+    parser.add_argument('--endpoint', default='https://localhost:9200')
+    parser.add_argument('--user', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--insecure', action='store_true', help='skip the TLS certificate verification')
+    parser.add_argument('--apps', type=int, default=50)
+    parser.add_argument('--tasks', type=int, default=500000, help='total number of task metrics documents')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    benchmark = Benchmark(args.endpoint, (args.user, args.password), not args.insecure)
+    templates = {
+        'task': json.loads(TEMPLATES_PATH.joinpath('spark-task-metrics.json').read_text()),
+        'stage': json.loads(TEMPLATES_PATH.joinpath('spark-stage-agg-metrics.json').read_text()),
+    }
+    variants = {
+        'legacy': {kind: legacy_template(template) for kind, template in templates.items()},
+        'current': templates,
+    }
+    indices = {kind: [f'benchmark-{kind}-{variant}' for variant in variants] for kind in templates}
+    for variant, variant_templates in variants.items():
+        for kind, template in variant_templates.items():
+            benchmark.create_index(f'benchmark-{kind}-{variant}', template)
+
+    start = time.perf_counter()
+    benchmark.load(indices, args.apps, args.tasks)
+    print(f'Loaded {args.tasks} task metrics of {args.apps} applications in {time.perf_counter() - start:.0f}s')
+
+    sample = benchmark.request('POST', 'benchmark-task-current/_search', {'size': 1, 'query': {'match_all': {}}})
+    app_ids = [sample['hits']['hits'][0]['_source']['appId']]
+
+    print(f"{'':28}{'legacy':>12}{'current':>12}{'ratio':>8}")
+    for kind in templates:
+        sizes = {v: benchmark.store_size(f'benchmark-{kind}-{v}') for v in variants}
+        print(f"{kind + ' store MB':28}{sizes['legacy'] / 1e6:>12.1f}{sizes['current'] / 1e6:>12.1f}"
+              f"{sizes['current'] / sizes['legacy']:>8.2f}")
+    for kind, queries in dashboard_queries(app_ids).items():
+        for name, query in queries.items():
+            latencies = {}
+            for variant in variants:
+                app_name = 'appName.keyword' if variant == 'legacy' else 'appName'
+                variant_query = json.loads(json.dumps(query).replace('{app_name}', app_name))
+                latencies[variant] = benchmark.latency(f'benchmark-{kind}-{variant}', variant_query, args.runs)
+            ratio = latencies['current'] / latencies['legacy'] if latencies['legacy'] else float('nan')
+            print(f"{name + ' ms':28}{latencies['legacy']:>12.0f}{latencies['current']:>12.0f}{ratio:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
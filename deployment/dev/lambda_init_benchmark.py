@@ -0,0 +1,111 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Local benchmark of the cold start of the Opensearch bootstrap function.
+Compares the legacy layer and module-level initialization with the trimmed layer and lazy initialization:
+ * import: the time to import the handler module, spent in the Lambda INIT phase of every cold start
+ * init: the time to create the HTTP session, the SigV4 signer and the AWS clients used by the first request
+Each measure runs in a fresh interpreter. Requires pip and boto3, run from the deployment directory:
+
+    python dev/lambda_init_benchmark.py
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from infra.lambda_layer import build_layer  # noqa: E402
+
+LAMBDA_PATH = Path(__file__).parent.parent.joinpath('infra/resources/lambda')
+
+LEGACY_REQUIREMENTS = 'boto3~=1.26.85\nrequests~=2.24.0\nrequests_aws4auth\njinja2\nopensearch-py~=2.1.1\n'
+
+# The module-level work of the bootstrap function before lazy initialization
+LEGACY_INIT = '''
+import json, time
+start = time.perf_counter()
+import boto3
+import requests
+from botocore.exceptions import ClientError
+from jinja2 import Template
+from opensearchpy import AWSV4SignerAuth
+from requests_aws4auth import AWS4Auth
+imported = time.perf_counter()
+credentials = boto3.Session().get_credentials()
+auth = AWSV4SignerAuth(credentials, 'us-east-1')
+session = requests.Session()
+ssm_client = boto3.client('secretsmanager')
+os_client = boto3.client('opensearch')
+awsauth = AWS4Auth(credentials.access_key, credentials.secret_key, 'us-east-1', 'es', session_token=credentials.token)
+print(json.dumps({'import': imported - start, 'init': time.perf_counter() - imported}))
+'''
+
+LAZY_INIT = '''
+import json, time
+start = time.perf_counter()
+import bootstrap
+imported = time.perf_counter()
+bootstrap.session()
+bootstrap.awsauth()
+bootstrap.ssm_client()
+print(json.dumps({'import': imported - start, 'init': time.perf_counter() - imported}))
+'''
+
+ENVIRONMENT = {
+    'AWS_REGION': 'us-east-1',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'AKIAEXAMPLE',
+    'AWS_SECRET_ACCESS_KEY': 'secret',
+    'AWS_SESSION_TOKEN': 'token',
+    'DOMAIN_ENDPOINT': 'localhost',
+    'DOMAIN_NAME': 'benchmark',
+    'USER_SECRET_ARN': 'user',
+    'ADMIN_SECRET_ARN': 'admin',
+    'PIPELINE_ROLE_ARN': 'role',
+    'LAMBDA_TASK_ROOT': str(LAMBDA_PATH.joinpath('opensearch-bootstrap')),
+}
+
+
+def layer_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+
+def measure(code: str, python_path: list, runs: int) -> dict:
+    env = dict(os.environ, **ENVIRONMENT, PYTHONPATH=os.pathsep.join(str(p) for p in python_path))
+    samples = [json.loads(subprocess.check_output([sys.executable, '-c', code], env=env)) for _ in range(runs)]
+    return {k: statistics.median(s[k] for s in samples) * 1000 for k in ('import', 'init')}
+
+
+def main(runs: int = 10):
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_requirements = Path(tmp).joinpath('requirements.txt')
+        legacy_requirements.write_text(LEGACY_REQUIREMENTS)
+        legacy_layer = Path(tmp).joinpath('legacy')
+        site_packages = legacy_layer.joinpath('python/lib/python3.11/site-packages')
+        subprocess.check_call([sys.executable, '-m', 'pip', 'install', '--quiet', '-t', str(site_packages),
+                               '-r', str(legacy_requirements)])
+
+        layer = build_layer(LAMBDA_PATH.joinpath('opensearch-bootstrap/requirements.txt'),
+                            LAMBDA_PATH.joinpath('common'),
+                            Path(tmp).joinpath('cache'))
+        python = layer.joinpath('python')
+
+        legacy = measure(LEGACY_INIT, [site_packages], runs)
+        lazy = measure(LAZY_INIT, [LAMBDA_PATH.joinpath('opensearch-bootstrap'), python,
+                                   python.joinpath('lib/python3.11/site-packages')], runs)
+
+        print(f"{'':8}{'layer MB':>10}{'import ms':>11}{'init ms':>9}{'total ms':>10}")
+        for name, result, path in (('legacy', legacy, legacy_layer), ('lazy', lazy, layer)):
+            print(f"{name:8}{layer_size(path) / 1e6:>10.1f}{result['import']:>11.0f}{result['init']:>9.0f}"
+                  f"{result['import'] + result['init']:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
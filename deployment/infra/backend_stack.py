@@ -3,7 +3,6 @@
 
 
 from pathlib import Path
-import subprocess
 
 from aws_cdk import (
     Aspects, CfnOutput, Duration, Fn, Stack, )
@@ -12,7 +11,9 @@ from aws_cdk.aws_lambda import LayerVersion, Code, Runtime, Function
 from constructs import Construct
 from cdk_nag import AwsSolutionsChecks, NagSuppressions
 
-from infra.cluster_sizing import ClusterConfig
+from infra.cluster_sizing import CapacityPlan, ClusterConfig
+from infra.ingestion_layout import IngestionLayout
+from infra.lambda_layer import build_layer
 from infra.opensearch_rp import OpensearchRp
 from infra.opensearch import Opensearch
 from infra.opensearch_bootstrap import OpensearchBootstrap
@@ -30,9 +31,21 @@ class BackendStack(Stack):
         # Stack, needed to get region and account ID
         stack = Stack.of(self)
 
-        # Parameter for T-shirt sizing the Opensearch domain
-        self.__tshirt_size = ClusterConfig.load_tshirt_size(self.node.try_get_context("TshirtSize"))
-        cluster_sizing = ClusterConfig(self.__tshirt_size)
+        # Capacity plan parameters from the capacity planner, or T-shirt sizing the Opensearch domain
+        plan = CapacityPlan.from_context(self.node.try_get_context)
+        if plan is None:
+            self.__tshirt_size = ClusterConfig.load_tshirt_size(self.node.try_get_context("TshirtSize"))
+            # Parameter for the expected ingest rate in GB per day, used to size the indices
+            ingest_rate = ClusterConfig.load_ingest_rate(self.node.try_get_context("IngestRate"))
+            cluster_sizing = ClusterConfig(self.__tshirt_size, ingest_rate)
+        else:
+            cluster_sizing = ClusterConfig(plan)
+
+        # Tenants of the ingestion layout, each with its own prefixed indices
+        ingestion_layout = IngestionLayout.from_context(self.node.try_get_context('IngestionLayout'))
+
+        # Ingest pipeline stamping the index time and the ingestion latency of each document, it adds an indexing cost
+        ingest_latency = str(self.node.try_get_context('IngestLatency')).lower() == 'true'
 
         # Get the VPC from parameter or create a new one
         vpc_id_param = scope.node.try_get_context("VpcID")
@@ -74,16 +87,13 @@ class BackendStack(Stack):
         bootstrap_cr_helpers = OpensearchCrHelpers(self, 'BoostrapCrHelpers', bootstrap_function_name, prereq)
         secret_cr_helpers = OpensearchCrHelpers(self, 'SecretCrHelpers', rotation_function_name, prereq)
         
-        # Build the lambda layer assets
-        subprocess.call(
-            ['pip', 'install', '-t',
-             Path(__file__).parent.joinpath('./resources/lambda/layer/python/lib/python3.11/site-packages'), '-r',
-             Path(__file__).parent.joinpath('./resources/lambda/opensearch-bootstrap/requirements.txt'), '--upgrade'])
+        # Build the lambda layer assets, only when the requirements change
+        layer_path = build_layer(Path(__file__).parent.joinpath('resources/lambda/opensearch-bootstrap/requirements.txt'),
+                                 Path(__file__).parent.joinpath('resources/lambda/common'))
 
         requirements_layer = LayerVersion(scope=self,
                                           id='PythonRequirementsTemplate',
-                                          code=Code.from_asset(
-                                              str(Path(__file__).parent.joinpath('resources/lambda/layer'))),
+                                          code=Code.from_asset(str(layer_path)),
                                           compatible_runtimes=[Runtime.PYTHON_3_11])
         
                 
@@ -125,7 +135,9 @@ class BackendStack(Stack):
                                                   source_security_group_id=bootstrap_cr_helpers.security_group.security_group_id
                                                   )
 
-        cr = OpensearchBootstrap(self, 'OsBootstrap', bootstrap_cr_helpers, domain.domain, requirements_layer, user_secret.secret, admin_secret.secret, domain.pipeline_role)
+        cr = OpensearchBootstrap(self, 'OsBootstrap', bootstrap_cr_helpers, domain.domain, requirements_layer, user_secret.secret, admin_secret.secret, domain.pipeline_role,
+                                 cluster_sizing.index_lifecycle, cluster_sizing.index_settings(len(ingestion_layout.groups)),
+                                 ingestion_layout.tenants, ingest_latency)
         # We add dependency to avoid race condition on ingress rule deletion
         cr.node.add_dependency(from_cr_ingress)
 
@@ -160,7 +172,7 @@ class BackendStack(Stack):
 
         CfnOutput(self, 'OpensearchIndexes',
                   description='Indexes used in Opensearch to store logs and metrics',
-                  value='spark-logs, spark-metrics'
+                  value='spark-logs, spark-task-metrics, spark-stage-agg-metrics, spark-app-summary'
                   )
         Aspects.of(self).add(AwsSolutionsChecks())
 
@@ -0,0 +1,322 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Capacity planner of the Opensearch domain and the ingestion pipelines.
+Computes a CapacityPlan from the workload and prints it with the CDK context parameters to deploy it:
+
+    python -m infra.capacity_planner --logs-gb 300 --task-metrics-gb 80 --hot-days 7 --warm-days 30 --cold-days 90 \\
+        --peak-docs 40000 --query-concurrency 10
+
+The sizing follows the Amazon Opensearch Service guidance: storage includes the replicas and the indexing and
+service overhead, vCPUs cover the peak indexing rate and the concurrent dashboard queries, and the JVM heap
+holds the shards of the hot tier.
+"""
+
+import argparse
+import json
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from infra.cluster_sizing import PRESETS, CapacityPlan, IndexLifecycle, TshirtSize
+
+
+@dataclass(frozen=True)
+class InstanceType:
+    name: str
+    vcpu: int
+    memory_gb: int
+    # The maximum EBS volume size per node in GB
+    max_ebs_gb: int
+    # The on-demand price per hour in us-east-1, only used to rank the layouts
+    price: float
+
+
+# The data node types considered by the planner, from the smallest to the largest
+DATA_NODE_TYPES = [
+    InstanceType('t3.small.search', 2, 2, 100, 0.036),
+    InstanceType('m6g.large.search', 2, 8, 512, 0.128),
+    InstanceType('m6g.xlarge.search', 4, 16, 1024, 0.256),
+    InstanceType('m6g.2xlarge.search', 8, 32, 1536, 0.511),
+    InstanceType('m6g.4xlarge.search', 16, 64, 3072, 1.022),
+    InstanceType('r6g.large.search', 2, 16, 1024, 0.167),
+    InstanceType('r6g.xlarge.search', 4, 32, 1536, 0.335),
+    InstanceType('r6g.2xlarge.search', 8, 64, 3072, 0.669),
+    InstanceType('r6g.4xlarge.search', 16, 128, 6144, 1.339),
+    InstanceType('r6g.8xlarge.search', 32, 256, 12288, 2.678),
+    InstanceType('r6g.12xlarge.search', 48, 384, 18432, 4.017),
+]
+
+# The dedicated master node type by maximum number of data nodes
+MASTER_NODE_TYPES = [
+    (10, InstanceType('c6g.large.search', 2, 4, 0, 0.113)),
+    (30, InstanceType('c6g.2xlarge.search', 8, 16, 0, 0.453)),
+    (75, InstanceType('r6g.2xlarge.search', 8, 64, 0, 0.669)),
+    (200, InstanceType('r6g.4xlarge.search', 16, 128, 0, 1.339)),
+]
+MASTER_NODE_COUNT = 3
+
+# The UltraWarm node types with their cache size in GB
+WARM_NODE_TYPES = [
+    InstanceType('ultrawarm1.medium.search', 2, 15, 1536, 0.238),
+    InstanceType('ultrawarm1.large.search', 16, 122, 20480, 2.68),
+]
+
+# The storage needed per GB of source data: indexing overhead, operating system and service reservations
+STORAGE_OVERHEAD = 1.45
+# The size of the indexed data per GB of source data
+INDEX_RATIO = 1.1
+# The documents per second a vCPU indexes, for 1KB documents
+DOCS_PER_VCPU = 2000
+# The vCPUs used by a dashboard query
+VCPU_PER_QUERY = 1.5
+# The maximum number of shards per GB of JVM heap
+SHARDS_PER_HEAP_GB = 25
+# The bytes written to disk per byte indexed: translog, refreshes and merges
+WRITE_AMPLIFICATION = 3
+# The gp3 baseline included with the volume
+GP3_BASELINE_THROUGHPUT = 125
+GP3_BASELINE_IOPS = 3000
+# The throughput an OpenSearch Compute Unit of a pipeline ingests, in MB/s
+OCU_THROUGHPUT = 1.5
+MAX_PIPELINE_UNITS = 96
+MAX_DATA_NODES = 80
+
+
+@dataclass
+class SizingInputs:
+    """
+    The workload to size the domain and the pipelines for.
+    Retention days are per tier: the warm tier uses UltraWarm and the cold tier uses cold storage.
+    """
+    # The source data ingested per day in GB, by stream (logs, task_metrics, stage_agg_metrics)
+    daily_ingest_gb: Dict[str, float]
+    hot_days: int = 7
+    warm_days: int = 0
+    cold_days: int = 0
+    replicas: int = 1
+    peak_docs_per_sec: int = 10000
+    query_concurrency: int = 5
+    az_count: int = 3
+    avg_doc_kb: float = 1.0
+
+    def __post_init__(self):
+        if self.hot_days < 1:
+            raise Exception("The hot tier must retain at least 1 day")
+        if self.cold_days > 0 and self.warm_days == 0:
+            raise Exception("The cold tier requires a warm tier")
+        if self.az_count not in (1, 2, 3):
+            raise Exception("The AZ count must be 1, 2 or 3")
+        if self.az_count > 1 and self.replicas < 1:
+            raise Exception("Multi-AZ domains require at least 1 replica")
+        if sum(self.daily_ingest_gb.values()) <= 0:
+            raise Exception("The daily ingest must be positive")
+
+
+def rollover_size(node: InstanceType) -> int:
+    """
+    The primary shard size triggering the rollover, smaller shards on smaller heaps.
+    """
+    if node.memory_gb >= 64:
+        return 50
+    if node.memory_gb >= 32:
+        return 30
+    if node.memory_gb >= 8:
+        return 20
+    return 5
+
+
+def round_up(value: float, step: int) -> int:
+    return int(math.ceil(value / step) * step)
+
+
+def master_node(data_node_count: int, warm: bool) -> Optional[InstanceType]:
+    """
+    The dedicated master node type, None if the domain doesn't need dedicated masters.
+    UltraWarm requires dedicated masters.
+    """
+    if data_node_count <= 3 and not warm:
+        return None
+    return next(t for limit, t in MASTER_NODE_TYPES if data_node_count <= limit)
+
+
+def data_nodes(inputs: SizingInputs, hot_storage_gb: float, explanation: List[str]):
+    """
+    Chooses the cheapest data node type and count meeting the storage, vCPU and heap requirements,
+    including the dedicated masters the layout needs.
+    """
+    daily_gb = sum(inputs.daily_ingest_gb.values())
+    indexing_vcpu = inputs.peak_docs_per_sec * (1 + inputs.replicas) * max(inputs.avg_doc_kb, 1.0) / DOCS_PER_VCPU
+    search_vcpu = inputs.query_concurrency * VCPU_PER_QUERY
+    minimum = max(inputs.replicas + 1, inputs.az_count)
+
+    candidates = []
+    for node in DATA_NODE_TYPES:
+        # t3 nodes don't support UltraWarm and are only suitable for small domains
+        if node.name.startswith('t3') and (inputs.warm_days > 0 or daily_gb > 5):
+            continue
+        shards = inputs.hot_days * (1 + inputs.replicas) * sum(
+            max(1, math.ceil(gb * INDEX_RATIO / rollover_size(node))) for gb in inputs.daily_ingest_gb.values())
+        heap_gb = min(node.memory_gb / 2, 32)
+        requirements = {
+            'storage': math.ceil(hot_storage_gb / node.max_ebs_gb),
+            'vCPU': math.ceil((indexing_vcpu + search_vcpu) / node.vcpu),
+            'heap': math.ceil(shards / (heap_gb * SHARDS_PER_HEAP_GB)),
+            'minimum': minimum,
+        }
+        count = round_up(max(requirements.values()), inputs.az_count)
+        if count <= MAX_DATA_NODES:
+            master = master_node(count, inputs.warm_days > 0)
+            cost = node.price * count + (master.price * MASTER_NODE_COUNT if master else 0)
+            candidates.append((cost, count, node, requirements))
+
+    if not candidates:
+        raise Exception(f"The workload requires more than {MAX_DATA_NODES} data nodes, split it across several domains")
+    _, count, node, requirements = min(candidates, key=lambda c: (c[0], c[1]))
+    bound = max(requirements, key=requirements.get)
+    explanation.append(f"Data nodes: {count}x {node.name}, the cheapest layout, sized by {bound} "
+                       f"({', '.join(f'{k} {v}' for k, v in requirements.items())} nodes, rounded to a multiple of "
+                       f"{inputs.az_count} AZs). It needs {indexing_vcpu:.0f} vCPUs for indexing at "
+                       f"{inputs.peak_docs_per_sec} docs/s with {inputs.replicas} replicas and "
+                       f"{search_vcpu:.0f} vCPUs for {inputs.query_concurrency} concurrent queries")
+    return node, count
+
+
+def plan_capacity(inputs: SizingInputs) -> CapacityPlan:
+    """
+    Computes the capacity plan of a workload.
+    """
+    explanation = []
+    daily_gb = sum(inputs.daily_ingest_gb.values())
+
+    hot_storage_gb = daily_gb * inputs.hot_days * (1 + inputs.replicas) * STORAGE_OVERHEAD
+    explanation.append(f"Hot storage: {hot_storage_gb:.0f} GB for {daily_gb:g} GB/day over {inputs.hot_days} days "
+                       f"with {inputs.replicas} replicas and a {STORAGE_OVERHEAD} overhead")
+    node, count = data_nodes(inputs, hot_storage_gb, explanation)
+
+    volume_size = max(10, round_up(hot_storage_gb / count, 10))
+    write_mbps = (inputs.peak_docs_per_sec * inputs.avg_doc_kb / 1024 * (1 + inputs.replicas)
+                  * WRITE_AMPLIFICATION / count)
+    throughput = iops = None
+    if write_mbps > GP3_BASELINE_THROUGHPUT:
+        throughput = min(1000, round_up(write_mbps, 25))
+        iops = min(16000, max(GP3_BASELINE_IOPS, throughput * 4))
+    explanation.append(f"EBS: {volume_size} GB gp3 per node, {write_mbps:.0f} MB/s of peak writes per node "
+                       + (f"need {throughput} MB/s and {iops} IOPS" if throughput else "fit in the gp3 baseline"))
+
+    warm_type = None
+    warm_count = 0
+    if inputs.warm_days > 0:
+        warm_storage_gb = daily_gb * inputs.warm_days * INDEX_RATIO
+        warm_type, warm_count = min(((w, max(2, math.ceil(warm_storage_gb / w.max_ebs_gb))) for w in WARM_NODE_TYPES),
+                                    key=lambda w: w[0].price * w[1])
+        explanation.append(f"UltraWarm: {warm_count}x {warm_type.name} to cache {warm_storage_gb:.0f} GB "
+                           f"over {inputs.warm_days} days, without replicas")
+    if inputs.cold_days > 0:
+        explanation.append(f"Cold storage: {daily_gb * inputs.cold_days * INDEX_RATIO:.0f} GB over {inputs.cold_days} days, "
+                           f"in Amazon S3 without nodes")
+
+    master = master_node(count, warm_count > 0)
+    if master:
+        explanation.append(f"Dedicated masters: {MASTER_NODE_COUNT}x {master.name} for {count} data nodes"
+                           + (" and UltraWarm" if warm_count else ""))
+    else:
+        explanation.append("No dedicated masters: 3 data nodes or less and no UltraWarm")
+
+    def pipeline_units(streams: List[str], name: str):
+        gb = sum(inputs.daily_ingest_gb.get(s, 0) for s in streams)
+        average = gb * 1024 / 86400
+        peak = inputs.peak_docs_per_sec * inputs.avg_doc_kb / 1024 * gb / daily_gb
+        units = (min(MAX_PIPELINE_UNITS, max(1, math.ceil(average / OCU_THROUGHPUT))),
+                 min(MAX_PIPELINE_UNITS, max(1, math.ceil(max(average, peak) * 1.2 / OCU_THROUGHPUT))))
+        explanation.append(f"{name} pipeline: {units[0]}-{units[1]} OCUs for {average:.1f} MB/s on average "
+                           f"and {peak:.1f} MB/s at peak")
+        return units
+
+    logs_units = pipeline_units(['logs'], 'Logs')
+    metrics_units = pipeline_units(['task_metrics', 'stage_agg_metrics'], 'Metrics')
+
+    hot_days, warm_days = inputs.hot_days, inputs.warm_days
+    lifecycle = IndexLifecycle(rollover_size_gb=rollover_size(node),
+                               rollover_age='1d',
+                               warm_age=f'{hot_days}d' if warm_days else None,
+                               cold_age=f'{hot_days + warm_days}d' if inputs.cold_days else None,
+                               delete_age=f'{hot_days + warm_days + inputs.cold_days}d')
+
+    return CapacityPlan(data_node_type=node.name,
+                        data_node_count=count,
+                        az_count=inputs.az_count,
+                        replicas=inputs.replicas,
+                        ebs_volume_size=volume_size,
+                        ebs_throughput=throughput,
+                        ebs_iops=iops,
+                        index_lifecycle=lifecycle,
+                        ingest_rate=round(daily_gb, 2),
+                        master_node_type=master.name if master else None,
+                        master_node_count=MASTER_NODE_COUNT if master else 0,
+                        warm_node_type=warm_type.name if warm_type else None,
+                        warm_node_count=warm_count,
+                        logs_pipeline_units=logs_units,
+                        metrics_pipeline_units=metrics_units,
+                        explanation=tuple(explanation))
+
+
+def describe(plan: CapacityPlan) -> str:
+    """
+    Formats a plan with its explanation and the CDK context parameters to deploy it.
+    """
+    lines = [
+        f"Data nodes:        {plan.data_node_count}x {plan.data_node_type} in {plan.az_count} AZ(s), {plan.replicas} replica(s)",
+        "Masters:           " + (f"{plan.master_node_count}x {plan.master_node_type}" if plan.master_node_count else "none"),
+        f"EBS per node:      {plan.ebs_volume_size} GB gp3"
+        + (f", {plan.ebs_throughput} MB/s, {plan.ebs_iops} IOPS" if plan.ebs_throughput else ""),
+        "UltraWarm:         " + (f"{plan.warm_node_count}x {plan.warm_node_type}" if plan.warm_node_count else "none"),
+        f"Logs pipeline:     {plan.logs_pipeline_units[0]}-{plan.logs_pipeline_units[1]} OCUs",
+        f"Metrics pipeline:  {plan.metrics_pipeline_units[0]}-{plan.metrics_pipeline_units[1]} OCUs",
+        f"Index lifecycle:   {json.dumps(plan.index_lifecycle.to_properties())}",
+    ]
+    if plan.explanation:
+        lines += ['', 'Explanation:'] + [f" * {e}" for e in plan.explanation]
+    lines += ['', 'CDK context:', ' '.join(f'-c {k}={v}' for k, v in plan.to_context().items())]
+    return '\n'.join(lines)
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Plan the capacity of the Spark observability backend')
+    parser.add_argument('--preset', choices=[s.name for s in TshirtSize], help='print the plan of a TshirtSize preset')
+    parser.add_argument('--logs-gb', type=float, default=0, help='logs ingested per day in GB')
+    parser.add_argument('--task-metrics-gb', type=float, default=0, help='task metrics ingested per day in GB')
+    parser.add_argument('--stage-metrics-gb', type=float, default=0, help='stage aggregated metrics ingested per day in GB')
+    parser.add_argument('--hot-days', type=int, default=7, help='retention on the hot tier in days')
+    parser.add_argument('--warm-days', type=int, default=0, help='retention on UltraWarm in days')
+    parser.add_argument('--cold-days', type=int, default=0, help='retention on cold storage in days')
+    parser.add_argument('--replicas', type=int, default=1, help='replicas of each shard on the hot tier')
+    parser.add_argument('--peak-docs', type=int, default=10000, help='peak indexing rate in documents per second')
+    parser.add_argument('--query-concurrency', type=int, default=5, help='concurrent dashboard queries')
+    parser.add_argument('--az-count', type=int, default=3, help='availability zones of the domain')
+    parser.add_argument('--avg-doc-kb', type=float, default=1.0, help='average document size in KB')
+    parser.add_argument('--json', action='store_true', help='print the CDK context as JSON for cdk.json')
+    options = parser.parse_args(args)
+
+    if options.preset:
+        plan = PRESETS[TshirtSize[options.preset]]
+    else:
+        plan = plan_capacity(SizingInputs(
+            daily_ingest_gb={'logs': options.logs_gb,
+                             'task_metrics': options.task_metrics_gb,
+                             'stage_agg_metrics': options.stage_metrics_gb},
+            hot_days=options.hot_days,
+            warm_days=options.warm_days,
+            cold_days=options.cold_days,
+            replicas=options.replicas,
+            peak_docs_per_sec=options.peak_docs,
+            query_concurrency=options.query_concurrency,
+            az_count=options.az_count,
+            avg_doc_kb=options.avg_doc_kb))
+
+    print(json.dumps({'context': plan.to_context()}, indent=2) if options.json else describe(plan))
+
+
+if __name__ == '__main__':
+    main()
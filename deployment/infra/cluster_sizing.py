@@ -1,8 +1,10 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import math
+from dataclasses import dataclass, replace
 from enum import Enum
-from typing import Optional
+from typing import Callable, Optional
 
 from aws_cdk.aws_opensearchservice import CfnDomain
 
@@ -15,98 +17,243 @@ class TshirtSize(Enum):
     XL = 'xl'
 
 
+@dataclass(frozen=True)
+class IndexLifecycle:
+    """
+    The thresholds of the Index State Management policies applied to the rolled over Spark indices.
+    Ages use the Opensearch units (e.g. `7d`), the rollover size is the size of a primary shard in GB.
+    Without warm_age, indices stay on the hot tier until they are deleted. Cold storage requires the warm tier.
+    """
+    rollover_size_gb: int
+    rollover_age: str
+    delete_age: str
+    warm_age: Optional[str] = None
+    cold_age: Optional[str] = None
+    merge_segments: int = 1
+
+    def __post_init__(self):
+        if self.cold_age is not None and self.warm_age is None:
+            raise Exception("Index lifecycle cold age requires a warm age")
+
+    def to_properties(self) -> dict:
+        """
+        The lifecycle thresholds as custom resource properties, without the tiers that are not enabled.
+        """
+        properties = {
+            'RolloverSize': f'{self.rollover_size_gb}gb',
+            'RolloverAge': self.rollover_age,
+            'DeleteAge': self.delete_age,
+            'MergeSegments': str(self.merge_segments),
+        }
+        if self.warm_age is not None:
+            properties['WarmAge'] = self.warm_age
+        if self.cold_age is not None:
+            properties['ColdAge'] = self.cold_age
+        return properties
+
+
+# The share of the ingested volume going to each rolled over index
+INGEST_SHARES = {
+    'spark_logs': 0.7,
+    'spark_task_metrics': 0.25,
+    'spark_stage_agg_metrics': 0.05,
+}
+
+
+@dataclass(frozen=True)
+class CapacityPlan:
+    """
+    The layout of the Opensearch domain and the ingestion pipelines.
+    Plans are either computed by the capacity planner from the workload or taken from the TshirtSize presets.
+    """
+    data_node_type: str
+    data_node_count: int
+    az_count: int
+    replicas: int
+    ebs_volume_size: int
+    index_lifecycle: IndexLifecycle
+    # The expected ingest rate in GB per day
+    ingest_rate: float
+    master_node_type: Optional[str] = None
+    master_node_count: int = 0
+    ebs_throughput: Optional[int] = None
+    ebs_iops: Optional[int] = None
+    warm_node_type: Optional[str] = None
+    warm_node_count: int = 0
+    logs_pipeline_units: tuple = (1, 10)
+    metrics_pipeline_units: tuple = (1, 4)
+    # Why each value was chosen, filled by the capacity planner
+    explanation: tuple = ()
+
+    def to_context(self) -> dict:
+        """
+        The plan as CDK context parameters of the backend and ingestor stacks.
+        """
+        context = {
+            'DataNodeType': self.data_node_type,
+            'DataNodeCount': self.data_node_count,
+            'AzCount': self.az_count,
+            'Replicas': self.replicas,
+            'EbsVolumeSize': self.ebs_volume_size,
+            'IngestRate': self.ingest_rate,
+            'RolloverSizeGb': self.index_lifecycle.rollover_size_gb,
+            'DeleteAge': self.index_lifecycle.delete_age,
+            'LogsPipelineMinUnits': self.logs_pipeline_units[0],
+            'LogsPipelineMaxUnits': self.logs_pipeline_units[1],
+            'MetricsPipelineMinUnits': self.metrics_pipeline_units[0],
+            'MetricsPipelineMaxUnits': self.metrics_pipeline_units[1],
+        }
+        optional = {
+            'MasterNodeType': self.master_node_type,
+            'MasterNodeCount': self.master_node_count or None,
+            'EbsThroughput': self.ebs_throughput,
+            'EbsIops': self.ebs_iops,
+            'WarmNodeType': self.warm_node_type,
+            'WarmNodeCount': self.warm_node_count or None,
+            'WarmAge': self.index_lifecycle.warm_age,
+            'ColdAge': self.index_lifecycle.cold_age,
+        }
+        context.update({k: v for k, v in optional.items() if v is not None})
+        return context
+
+    def from_context(get: Callable[[str], Optional[str]]):
+        """
+        Loads a plan from the CDK context parameters written by `to_context`, None if the context has no plan.
+        """
+        if get('DataNodeType') is None:
+            return None
+        if get('DeleteAge') is None:
+            raise Exception("DeleteAge parameter is required with DataNodeType")
+
+        def number(key: str, default=None, convert=int):
+            value = get(key)
+            if value is None:
+                if default is None:
+                    raise Exception(f"{key} parameter is required with DataNodeType")
+                return default
+            try:
+                return convert(value)
+            except ValueError:
+                raise Exception(f"{key} parameter must be a number")
+
+        return CapacityPlan(
+            data_node_type=get('DataNodeType'),
+            data_node_count=number('DataNodeCount'),
+            az_count=number('AzCount'),
+            replicas=number('Replicas'),
+            ebs_volume_size=number('EbsVolumeSize'),
+            ingest_rate=number('IngestRate', convert=float),
+            index_lifecycle=IndexLifecycle(rollover_size_gb=number('RolloverSizeGb'),
+                                           rollover_age='1d',
+                                           warm_age=get('WarmAge'),
+                                           cold_age=get('ColdAge'),
+                                           delete_age=get('DeleteAge')),
+            master_node_type=get('MasterNodeType'),
+            master_node_count=number('MasterNodeCount', 0),
+            ebs_throughput=number('EbsThroughput', 0) or None,
+            ebs_iops=number('EbsIops', 0) or None,
+            warm_node_type=get('WarmNodeType'),
+            warm_node_count=number('WarmNodeCount', 0),
+            logs_pipeline_units=(number('LogsPipelineMinUnits', 1), number('LogsPipelineMaxUnits', 10)),
+            metrics_pipeline_units=(number('MetricsPipelineMinUnits', 1), number('MetricsPipelineMaxUnits', 4)),
+        )
+
+
+# The capacity plans of the TshirtSize presets, the ingest rate is the volume the hot tier can retain with its replicas
+PRESETS = {
+    TshirtSize.XS: CapacityPlan(
+        data_node_type="t3.small.search",
+        data_node_count=3,
+        az_count=1,
+        replicas=1,
+        ebs_volume_size=10,
+        index_lifecycle=IndexLifecycle(rollover_size_gb=5, rollover_age='1d', delete_age='7d'),
+        ingest_rate=2,
+    ),
+    TshirtSize.S: CapacityPlan(
+        data_node_type="m6g.large.search",
+        data_node_count=3,
+        az_count=3,
+        replicas=2,
+        ebs_volume_size=80,
+        index_lifecycle=IndexLifecycle(rollover_size_gb=20, rollover_age='1d', delete_age='30d'),
+        ingest_rate=2,
+    ),
+    TshirtSize.M: CapacityPlan(
+        data_node_type="r6g.xlarge.search",
+        data_node_count=3,
+        az_count=3,
+        replicas=2,
+        ebs_volume_size=600,
+        index_lifecycle=IndexLifecycle(rollover_size_gb=30, rollover_age='1d', warm_age='3d', cold_age='30d', delete_age='90d'),
+        ingest_rate=150,
+        master_node_type="c6g.large.search",
+        master_node_count=3,
+        warm_node_type="ultrawarm1.medium.search",
+        warm_node_count=1,
+    ),
+    TshirtSize.L: CapacityPlan(
+        data_node_type="r6g.4xlarge.search",
+        data_node_count=3,
+        az_count=3,
+        replicas=2,
+        ebs_volume_size=4096,
+        index_lifecycle=IndexLifecycle(rollover_size_gb=50, rollover_age='1d', warm_age='7d', cold_age='30d', delete_age='180d'),
+        ingest_rate=500,
+        master_node_type="c6g.xlarge.search",
+        master_node_count=3,
+        warm_node_type="ultrawarm1.large.search",
+        warm_node_count=1,
+    ),
+    TshirtSize.XL: CapacityPlan(
+        data_node_type="r6g.4xlarge.search",
+        data_node_count=12,
+        az_count=3,
+        replicas=2,
+        ebs_volume_size=4096,
+        index_lifecycle=IndexLifecycle(rollover_size_gb=50, rollover_age='1d', warm_age='7d', cold_age='60d', delete_age='365d'),
+        ingest_rate=2000,
+        master_node_type="c6g.2xlarge.search",
+        master_node_count=5,
+        warm_node_type="ultrawarm1.large.search",
+        warm_node_count=4,
+    ),
+}
+
+
 class ClusterConfig:
 
-    def __init__(self, size: TshirtSize, **kwargs) -> None:
-        if size == TshirtSize.XS:
-            self._cluster_config = CfnDomain.ClusterConfigProperty(
-                dedicated_master_enabled=False,
-                instance_count=3,
-                instance_type="t3.small.search",
-                warm_enabled=False,
-                zone_awareness_enabled=False
-            )
-            self._ebs_config = CfnDomain.EBSOptionsProperty(
-                ebs_enabled=True,
-                volume_size=10,
-                volume_type="gp3"
-            )
-        elif size == TshirtSize.S:
-            self._cluster_config = CfnDomain.ClusterConfigProperty(
-                dedicated_master_enabled=False,
-                instance_count=3,
-                instance_type="m6g.large.search",
-                warm_enabled=False,
-                zone_awareness_config=CfnDomain.ZoneAwarenessConfigProperty(
-                    availability_zone_count=3
-                ),
-                zone_awareness_enabled=True
-            )
-            self._ebs_config = CfnDomain.EBSOptionsProperty(
-                ebs_enabled=True,
-                volume_size=80,
-                volume_type="gp3"
-            )
-        elif size == TshirtSize.M:
-            self._cluster_config = CfnDomain.ClusterConfigProperty(
-                dedicated_master_count=3,
-                dedicated_master_enabled=True,
-                dedicated_master_type="c6g.large.search",
-                instance_count=3,
-                instance_type="r6g.xlarge.search",
-                warm_count=1,
-                warm_enabled=True,
-                warm_type="ultrawarm1.medium.search",
-                zone_awareness_config=CfnDomain.ZoneAwarenessConfigProperty(
-                    availability_zone_count=3
-                ),
-                zone_awareness_enabled=True
-            )
-            self._ebs_config = CfnDomain.EBSOptionsProperty(
-                ebs_enabled=True,
-                volume_size=600,
-                volume_type="gp3"
-            )
-        elif size == TshirtSize.L:
-            self._cluster_config = CfnDomain.ClusterConfigProperty(
-                dedicated_master_count=3,
-                dedicated_master_enabled=True,
-                dedicated_master_type="c6g.xlarge.search",
-                instance_count=3,
-                instance_type="r6g.4xlarge.search",
-                warm_count=1,
-                warm_enabled=True,
-                warm_type="ultrawarm1.large.search",
-                zone_awareness_config=CfnDomain.ZoneAwarenessConfigProperty(
-                    availability_zone_count=3
-                ),
-                zone_awareness_enabled=True
-            )
-            self._ebs_config = CfnDomain.EBSOptionsProperty(
-                ebs_enabled=True,
-                volume_size=4096,
-                volume_type="gp3"
-            )
-        else:
-            self._cluster_config = CfnDomain.ClusterConfigProperty(
-                dedicated_master_count=5,
-                dedicated_master_enabled=True,
-                dedicated_master_type="c6g.2xlarge.search",
-                instance_count=12,
-                instance_type="r6.4xlarge.search",
-                warm_count=4,
-                warm_enabled=True,
-                warm_type="ultrawarm1.large.search",
-                zone_awareness_config=CfnDomain.ZoneAwarenessConfigProperty(
-                    availability_zone_count=3
-                ),
-                zone_awareness_enabled=True
-            )
-            self._ebs_config = CfnDomain.EBSOptionsProperty(
-                ebs_enabled=True,
-                volume_size=4096,
-                volume_type="gp3"
-            )
+    def __init__(self, size, ingest_rate: Optional[float] = None, **kwargs) -> None:
+        """
+        The Opensearch domain configuration of a TshirtSize preset or of a CapacityPlan.
+        The ingest rate overrides the one of the plan.
+        """
+        plan = PRESETS[size] if isinstance(size, TshirtSize) else size
+        if ingest_rate is not None:
+            plan = replace(plan, ingest_rate=ingest_rate)
+        self._plan = plan
+
+        self._cluster_config = CfnDomain.ClusterConfigProperty(
+            dedicated_master_count=plan.master_node_count or None,
+            dedicated_master_enabled=plan.master_node_count > 0,
+            dedicated_master_type=plan.master_node_type,
+            instance_count=plan.data_node_count,
+            instance_type=plan.data_node_type,
+            warm_count=plan.warm_node_count or None,
+            warm_enabled=plan.warm_node_count > 0,
+            warm_type=plan.warm_node_type,
+            zone_awareness_config=CfnDomain.ZoneAwarenessConfigProperty(
+                availability_zone_count=plan.az_count
+            ) if plan.az_count > 1 else None,
+            zone_awareness_enabled=plan.az_count > 1
+        )
+        self._ebs_config = CfnDomain.EBSOptionsProperty(
+            ebs_enabled=True,
+            iops=plan.ebs_iops,
+            throughput=plan.ebs_throughput,
+            volume_size=plan.ebs_volume_size,
+            volume_type="gp3"
+        )
 
     def load_tshirt_size(size: Optional[str]):
         if size is None:
@@ -124,6 +271,17 @@ class ClusterConfig:
         else:
             raise Exception("TshirtSize parameter must be XS, S, M, L or XL")
 
+    def load_ingest_rate(rate: Optional[str]):
+        if rate is None:
+            return None
+        try:
+            value = float(rate)
+        except ValueError:
+            raise Exception("IngestRate parameter must be a number of GB per day")
+        if value <= 0:
+            raise Exception("IngestRate parameter must be a number of GB per day")
+        return value
+
     @property
     def cluster_config(self):
         return self._cluster_config
@@ -131,3 +289,43 @@ class ClusterConfig:
     @property
     def ebs_config(self):
         return self._ebs_config
+
+    @property
+    def plan(self):
+        return self._plan
+
+    @property
+    def index_lifecycle(self):
+        return self._plan.index_lifecycle
+
+    def index_settings(self, groups: int = 1) -> dict:
+        """
+        The settings of the Spark index templates, by template name, derived from the cluster layout and the ingest rate.
+        The ingest rate is split evenly between the groups of indices, the shared indices and the prefixed indices of each tenant.
+        Primary shards are a multiple of the data nodes so indexing is spread evenly across the nodes,
+        with enough shards for an index to reach the rollover size in about a day at the ingest rate.
+        Replicas come from the plan, presets put a copy of each shard in every availability zone.
+        Logs are refreshed and their translog flushed less often because they are written much more than they are searched.
+        """
+        data_nodes = self._plan.data_node_count
+        replicas = str(self._plan.replicas)
+
+        settings = {}
+        for name, share in INGEST_SHARES.items():
+            shards = max(1, math.ceil(self._plan.ingest_rate / groups * share / self._plan.index_lifecycle.rollover_size_gb))
+            settings[name] = {
+                'number_of_shards': str(math.ceil(shards / data_nodes) * data_nodes),
+                'number_of_replicas': replicas,
+                'refresh_interval': '10s',
+            }
+        settings['spark_logs'].update({
+            'refresh_interval': '30s',
+            'translog.durability': 'async',
+            'translog.sync_interval': '30s',
+        })
+        # job and application summaries are a few documents per application
+        settings['spark_app_summary'] = {
+            'number_of_shards': '1',
+            'number_of_replicas': replicas,
+        }
+        return settings
@@ -0,0 +1,112 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Union
+
+# The streams sent by the collector to their own pipelines, with the pipeline name prefix
+STREAMS = {
+    'Logs': 'spark-obs-logs',
+    'Metrics': 'spark-obs-metrics',
+}
+
+# The maximum length of an Opensearch Ingestion pipeline name
+MAX_PIPELINE_NAME = 28
+MAX_SHARDS = 10
+TENANT_PATTERN = re.compile(r'^[a-z][a-z0-9]*$')
+
+
+@dataclass(frozen=True)
+class IngestionPipeline:
+    """
+    A pipeline shard of a stream, for the shared indices or the prefixed indices of a tenant.
+    """
+    stream: str
+    tenant: Optional[str]
+    shard: int
+
+    @property
+    def name(self) -> str:
+        parts = [STREAMS[self.stream]]
+        if self.tenant:
+            parts.append(self.tenant)
+        if self.shard > 1:
+            parts.append(str(self.shard))
+        return '-'.join(parts)
+
+    @property
+    def construct_id(self) -> str:
+        """
+        The ID of the pipeline construct, the first shard of the shared indices keeps the ID of the single pipeline.
+        """
+        return f"{self.stream}Pipeline{(self.tenant or '').capitalize()}{self.shard if self.shard > 1 else ''}"
+
+    @property
+    def index_prefix(self) -> str:
+        return f'{self.tenant}-' if self.tenant else ''
+
+
+@dataclass(frozen=True)
+class IngestionLayout:
+    """
+    The pipeline shards of each stream and the tenants getting their own pipelines and prefixed indices.
+    The shared pipelines are always created, tenants get the same number of shards.
+    """
+    logs_shards: int = 1
+    metrics_shards: int = 1
+    tenants: tuple = ()
+
+    def __post_init__(self):
+        for shards in (self.logs_shards, self.metrics_shards):
+            if not 1 <= shards <= MAX_SHARDS:
+                raise Exception(f"IngestionLayout shards must be between 1 and {MAX_SHARDS}")
+        for tenant in self.tenants:
+            if not TENANT_PATTERN.match(tenant):
+                raise Exception(f"IngestionLayout tenant {tenant} must be lowercase letters and digits starting with a letter")
+        if len(set(self.tenants)) != len(self.tenants):
+            raise Exception("IngestionLayout tenants must be unique")
+        for pipeline in self.pipelines():
+            if len(pipeline.name) > MAX_PIPELINE_NAME:
+                raise Exception(f"IngestionLayout tenant {pipeline.tenant} is too long for the pipeline name {pipeline.name}")
+
+    @property
+    def groups(self) -> List[Optional[str]]:
+        """
+        The shared indices, None, and the tenants.
+        """
+        return [None] + list(self.tenants)
+
+    def shards(self, stream: str) -> int:
+        return self.logs_shards if stream == 'Logs' else self.metrics_shards
+
+    def pipelines(self, stream: Optional[str] = None) -> List[IngestionPipeline]:
+        """
+        The pipelines of a stream, or of all the streams, grouped by tenant.
+        """
+        return [IngestionPipeline(s, tenant, shard)
+                for s in ([stream] if stream else STREAMS)
+                for tenant in self.groups
+                for shard in range(1, self.shards(s) + 1)]
+
+    def from_context(value: Union[None, str, dict]):
+        """
+        Loads the layout from the IngestionLayout context parameter, a JSON object like
+        `{"logs": 4, "metrics": 2, "tenants": ["teama", "teamb"]}`, or the single pipeline layout without it.
+        """
+        if value is None:
+            return IngestionLayout()
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise Exception("IngestionLayout parameter must be a JSON object")
+        if not isinstance(value, dict) or not set(value.keys()) <= {'logs', 'metrics', 'tenants'}:
+            raise Exception("IngestionLayout parameter must be a JSON object with logs, metrics and tenants keys")
+        try:
+            return IngestionLayout(logs_shards=int(value.get('logs', 1)),
+                                   metrics_shards=int(value.get('metrics', 1)),
+                                   tenants=tuple(value.get('tenants', [])))
+        except (TypeError, ValueError):
+            raise Exception("IngestionLayout shards must be numbers and tenants a list of names")
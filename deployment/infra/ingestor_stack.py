@@ -1,16 +1,26 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+from typing import Optional
+
 from aws_cdk import (
-    Aspects, Stack, CfnOutput, Fn, RemovalPolicy, Names, UniqueResourceNameOptions,
+    Aspects, Stack, CfnOutput, Duration, Fn, RemovalPolicy, Names, UniqueResourceNameOptions,
 )
 from aws_cdk.aws_ec2 import Vpc, SubnetSelection, SubnetType, SecurityGroup, Peer, Port, SubnetFilter
-from aws_cdk.aws_iam import ManagedPolicy, PolicyStatement, ServicePrincipal
+from aws_cdk.aws_iam import ManagedPolicy, PolicyStatement, Role, ServicePrincipal
 from aws_cdk.aws_logs import LogGroup, RetentionDays
 from aws_cdk.aws_osis import CfnPipeline
+from aws_cdk.aws_s3 import Bucket, BlockPublicAccess, BucketEncryption, EventType, LifecycleRule, NotificationKeyFilter
+from aws_cdk.aws_s3_notifications import SqsDestination
+from aws_cdk.aws_sqs import DeadLetterQueue, Queue
 from constructs import Construct
 from cdk_nag import AwsSolutionsChecks, NagSuppressions
 
+from infra.cluster_sizing import CapacityPlan, ClusterConfig
+from infra.ingestion_layout import IngestionLayout, IngestionPipeline
+from infra.metrics_archive import ARCHIVE_PREFIX, archive_sink as metrics_archive_sink
+from infra.pipeline_sizing import PipelineTuning, tune_pipeline
+
 
 class IngestorStack(Stack):
 
@@ -28,31 +38,129 @@ class IngestorStack(Stack):
         if opensearch_domain_endpoint is None:
             raise Exception("OpensearchDomainEndpoint context parameter must be set")
 
+        # Wire format used by the collector, JSON documents for the http source or OTLP for the OpenTelemetry sources
+        wire_format = self.node.try_get_context('WireFormat') or 'json'
+        if wire_format not in ('json', 'otlp'):
+            raise Exception("WireFormat context parameter must be json or otlp")
+        otlp = wire_format == 'otlp'
+
+        # Sink used by the log collector, the http source of the pipeline or rolling objects in an S3 bucket
+        logs_sink = self.node.try_get_context('LogsSink') or 'http'
+        if logs_sink not in ('http', 's3'):
+            raise Exception("LogsSink context parameter must be http or s3")
+        s3_logs = logs_sink == 's3'
+
+        # Stage aggregated metrics computed by the collector listener or by the metrics pipeline from the task metrics
+        stage_aggregation = self.node.try_get_context('StageAggregation') or 'listener'
+        if stage_aggregation not in ('listener', 'pipeline'):
+            raise Exception("StageAggregation context parameter must be listener or pipeline")
+        if stage_aggregation == 'pipeline' and otlp:
+            raise Exception("StageAggregation context parameter pipeline requires the json WireFormat")
+
+        # Archive of the task metrics as Parquet objects in S3, kept longer than the indices for capacity planning
+        metrics_archive = str(self.node.try_get_context('MetricsArchive')).lower() == 'true'
+        if metrics_archive and otlp:
+            raise Exception("MetricsArchive context parameter requires the json WireFormat")
+        try:
+            archive_retention = int(self.node.try_get_context('MetricsArchiveRetention') or 365)
+        except ValueError:
+            raise Exception("MetricsArchiveRetention parameter must be a number of days")
+
+        # Capacity plan or T-shirt size of the backend, used to size the pipelines. Without them, pipelines keep the default settings
+        plan = CapacityPlan.from_context(self.node.try_get_context)
+        if plan is None and self.node.try_get_context('TshirtSize') is not None:
+            plan = ClusterConfig(ClusterConfig.load_tshirt_size(self.node.try_get_context('TshirtSize')),
+                                 ClusterConfig.load_ingest_rate(self.node.try_get_context('IngestRate'))).plan
+
+        # Pipeline shards of each stream and tenants with their own pipelines and prefixed indices
+        layout = IngestionLayout.from_context(self.node.try_get_context('IngestionLayout'))
+        if s3_logs and layout.tenants:
+            raise Exception("IngestionLayout tenants are not supported with the s3 LogsSink")
+        # The collector spreads the tasks of a stage across the pipelines of a group, each one would aggregate a part of the stage
+        if stage_aggregation == 'pipeline' and layout.metrics_shards > 1:
+            raise Exception("StageAggregation context parameter pipeline requires a single metrics pipeline in the IngestionLayout")
+
+        # Distributed tracing of Spark applications is optional
+        enable_tracing = str(self.node.try_get_context('EnableTracing')).lower() == 'true'
+
+        pipeline_names = [pipeline.name for pipeline in layout.pipelines()]
+        if enable_tracing:
+            pipeline_names.append('spark-obs-traces')
+
         # Policy for the ingestor component
         collector_policy = ManagedPolicy(self, 'CollectorPolicy',
                                          statements=[
                                              PolicyStatement(
                                                  actions=['osis:Ingest'],
                                                  resources=[
-                                                     f'arn:aws:osis:{stack.region}:{stack.account}:pipeline/spark-obs-logs',
-                                                     f'arn:aws:osis:{stack.region}:{stack.account}:pipeline/spark-obs-metrics'
+                                                     f'arn:aws:osis:{stack.region}:{stack.account}:pipeline/{name}'
+                                                     for name in pipeline_names
                                                  ]
                                              ),
                                          ])
 
-        logs_log_group = LogGroup(self, 'LogsIngestionLogGroup',
-                                  removal_policy=RemovalPolicy.DESTROY,
-                                  retention=RetentionDays.ONE_WEEK,
-                                  log_group_name="/aws/vendedlogs/osis-logs-" + Names.unique_resource_name(self).lower()
-                                  )
-        logs_log_group.grant_write(ServicePrincipal("es.amazonaws.com"))
+        pipeline_role = Role.from_role_arn(self, 'PipelineRole', pipeline_role_arn)
 
-        metrics_log_group = LogGroup(self, 'MetricsIngestionLogGroup',
-                                     removal_policy=RemovalPolicy.DESTROY,
-                                     retention=RetentionDays.ONE_WEEK,
-                                     log_group_name="/aws/vendedlogs/osis-metrics-" + Names.unique_resource_name(self).lower()
-                                     )
-        metrics_log_group.grant_write(ServicePrincipal("es.amazonaws.com"))
+        # Bucket receiving the documents rejected by the Opensearch sinks of the pipelines, replayed with the dlq_replay tool
+        dlq_bucket = Bucket(self, 'DlqBucket',
+                            encryption=BucketEncryption.S3_MANAGED,
+                            block_public_access=BlockPublicAccess.BLOCK_ALL,
+                            enforce_ssl=True,
+                            auto_delete_objects=True,
+                            removal_policy=RemovalPolicy.DESTROY,
+                            lifecycle_rules=[LifecycleRule(
+                                expiration=Duration.days(30),
+                                abort_incomplete_multipart_upload_after=Duration.days(1),
+                            )],
+                            )
+        dlq_bucket.grant_put(pipeline_role)
+
+        # Bucket receiving the task metrics archived by the metrics pipelines
+        archive_sink = '    # metrics archive disabled'
+        if metrics_archive:
+            archive_bucket = Bucket(self, 'MetricsArchiveBucket',
+                                    encryption=BucketEncryption.S3_MANAGED,
+                                    block_public_access=BlockPublicAccess.BLOCK_ALL,
+                                    enforce_ssl=True,
+                                    removal_policy=RemovalPolicy.RETAIN,
+                                    lifecycle_rules=[LifecycleRule(
+                                        expiration=Duration.days(archive_retention),
+                                        abort_incomplete_multipart_upload_after=Duration.days(1),
+                                    )],
+                                    )
+            archive_bucket.grant_put(pipeline_role)
+            archive_sink = metrics_archive_sink(archive_bucket.bucket_name, stack.region, pipeline_role_arn)
+
+        # Bucket receiving the log objects written by the collector and queue notifying the pipeline of new objects
+        if s3_logs:
+            logs_bucket = Bucket(self, 'LogsBucket',
+                                 encryption=BucketEncryption.S3_MANAGED,
+                                 block_public_access=BlockPublicAccess.BLOCK_ALL,
+                                 enforce_ssl=True,
+                                 auto_delete_objects=True,
+                                 removal_policy=RemovalPolicy.DESTROY,
+                                 lifecycle_rules=[LifecycleRule(
+                                     expiration=Duration.days(7),
+                                     abort_incomplete_multipart_upload_after=Duration.days(1),
+                                 )],
+                                 )
+
+            logs_dlq = Queue(self, 'LogsNotificationDlq', enforce_ssl=True, retention_period=Duration.days(14))
+            logs_queue = Queue(self, 'LogsNotificationQueue',
+                               enforce_ssl=True,
+                               visibility_timeout=Duration.minutes(5),
+                               dead_letter_queue=DeadLetterQueue(max_receive_count=5, queue=logs_dlq),
+                               )
+            logs_bucket.add_event_notification(EventType.OBJECT_CREATED, SqsDestination(logs_queue),
+                                               NotificationKeyFilter(suffix='.ndjson.gz'))
+
+            logs_bucket.grant_read(pipeline_role)
+            logs_queue.grant_consume_messages(pipeline_role)
+
+            collector_policy.add_statements(PolicyStatement(
+                actions=['s3:PutObject', 's3:AbortMultipartUpload'],
+                resources=[logs_bucket.arn_for_objects('*')],
+            ))
 
         # Get the VPC from parameter or create a new one
         vpc_id_param = scope.node.try_get_context("VpcID")
@@ -76,106 +184,136 @@ class IngestorStack(Stack):
                 connection=Port.tcp(443)
             )
 
-            # OSI pipeline for logs
-            logs_pipeline = CfnPipeline(self, 'LogsPipeline',
-                                        max_units=10,
-                                        min_units=1,
-                                        pipeline_configuration_body=open(
-                                            './infra/resources/pipelines/logs-pipeline.yaml')
-                                        .read()
-                                        .format(
-                                            domain_url=opensearch_domain_endpoint,
-                                            role_arn=pipeline_role_arn,
-                                            region=stack.region
-                                        ),
-                                        pipeline_name="spark-obs-logs",
-                                        log_publishing_options=CfnPipeline.LogPublishingOptionsProperty(
-                                            cloud_watch_log_destination=CfnPipeline.CloudWatchLogDestinationProperty(
-                                                log_group=logs_log_group.log_group_name
-                                            ),
-                                            is_logging_enabled=True
-                                        ),
-                                        vpc_options=CfnPipeline.VpcOptionsProperty(
-                                            security_group_ids=[sec_group.security_group_id],
-                                            subnet_ids=subnets_ids,
-                                        ))
-
-            # OSI pipeline for metrics
-            metrics_pipeline = CfnPipeline(self, 'MetricsPipeline',
-                                           max_units=4,
-                                           min_units=1,
-                                           pipeline_configuration_body=open(
-                                               './infra/resources/pipelines/metrics-pipeline.yaml')
-                                           .read()
-                                           .format(
-                                               domain_url=opensearch_domain_endpoint,
-                                               role_arn=pipeline_role_arn,
-                                               region=stack.region
-                                           ),
-                                           pipeline_name="spark-obs-metrics",
-                                           log_publishing_options=CfnPipeline.LogPublishingOptionsProperty(
-                                               cloud_watch_log_destination=CfnPipeline.CloudWatchLogDestinationProperty(
-                                                   log_group=metrics_log_group.log_group_name
-                                               ),
-                                               is_logging_enabled=True
-                                           ),
-                                           vpc_options=CfnPipeline.VpcOptionsProperty(
-                                               security_group_ids=[sec_group.security_group_id],
-                                               subnet_ids=subnets_ids,
-                                           ))
+            vpc_options = CfnPipeline.VpcOptionsProperty(
+                security_group_ids=[sec_group.security_group_id],
+                subnet_ids=subnets_ids,
+            )
         else:
             # OSI pipelines are public
-            logs_pipeline = CfnPipeline(self, 'LogsPipeline',
-                                        max_units=10,
-                                        min_units=1,
-                                        pipeline_configuration_body=open(
-                                            './infra/resources/pipelines/logs-pipeline.yaml')
-                                        .read()
-                                        .format(
-                                            domain_url=opensearch_domain_endpoint,
-                                            role_arn=pipeline_role_arn,
-                                            region=stack.region
-                                        ),
-                                        pipeline_name="spark-obs-logs",
-                                        log_publishing_options=CfnPipeline.LogPublishingOptionsProperty(
-                                            cloud_watch_log_destination=CfnPipeline.CloudWatchLogDestinationProperty(
-                                                log_group=logs_log_group.log_group_name
-                                            ),
-                                            is_logging_enabled=True
-                                        ),
-                                        )
-
-            # OSI pipeline for metrics
-            metrics_pipeline = CfnPipeline(self, 'MetricsPipeline',
-                                           max_units=4,
-                                           min_units=1,
-                                           pipeline_configuration_body=open(
-                                               './infra/resources/pipelines/metrics-pipeline.yaml')
-                                           .read()
-                                           .format(
-                                               domain_url=opensearch_domain_endpoint,
-                                               role_arn=pipeline_role_arn,
-                                               region=stack.region
-                                           ),
-                                           pipeline_name="spark-obs-metrics",
-                                           log_publishing_options=CfnPipeline.LogPublishingOptionsProperty(
-                                               cloud_watch_log_destination=CfnPipeline.CloudWatchLogDestinationProperty(
-                                                   log_group=metrics_log_group.log_group_name
-                                               ),
-                                               is_logging_enabled=True
-                                           ),
-                                           )
-
-        CfnOutput(self, 'MetricsPipelineUrl',
-                  description='Pipeline endpoint for metrics',
-                  value=Fn.join('', ['https://', Fn.select(0, metrics_pipeline.attr_ingest_endpoint_urls), '/ingest']),
-                  )
+            vpc_options = None
+
+        def endpoint_urls(pipeline: CfnPipeline, path: str) -> str:
+            # All the ingestion endpoints of the pipeline as a comma separated list of URLs, used by the collector for failover
+            return Fn.join('', ['https://', Fn.join(f'{path},https://', pipeline.attr_ingest_endpoint_urls), path])
+
+        def pipeline_tuning(prefix: str, pull_source: bool = False) -> PipelineTuning:
+            # The units, buffer, workers and bulk settings of a pipeline shard, derived from the plan and overridden by the context
+            return tune_pipeline(prefix, plan, pull_source, pipelines=len(layout.pipelines(prefix)),
+                                 groups=len(layout.groups)).with_context(self.node.try_get_context, prefix)
+
+        def create_pipeline(pipeline_id: str, log_group_id: str, name: str, configuration: str, tuning: PipelineTuning,
+                            variables: Optional[dict] = None, index_prefix: str = '') -> CfnPipeline:
+            log_group = LogGroup(self, log_group_id,
+                                 removal_policy=RemovalPolicy.DESTROY,
+                                 retention=RetentionDays.ONE_WEEK,
+                                 log_group_name=f"/aws/vendedlogs/osis-{name.removeprefix('spark-obs-')}-" + Names.unique_resource_name(self).lower()
+                                 )
+            log_group.grant_write(ServicePrincipal("es.amazonaws.com"))
 
-        CfnOutput(self, 'LogsPipelineUrl',
-                  description='Pipeline endpoint for logs',
-                  value=Fn.join('', ['https://', Fn.select(0, logs_pipeline.attr_ingest_endpoint_urls), '/ingest']),
+            pipeline = CfnPipeline(self, pipeline_id,
+                                   max_units=tuning.max_units,
+                                   min_units=tuning.min_units,
+                                   pipeline_configuration_body=open(
+                                       f'./infra/resources/pipelines/{configuration}')
+                                   .read()
+                                   .format(
+                                       domain_url=opensearch_domain_endpoint,
+                                       role_arn=pipeline_role_arn,
+                                       region=stack.region,
+                                       index_prefix=index_prefix,
+                                       pipeline_name=name,
+                                       dlq_bucket=dlq_bucket.bucket_name,
+                                       **tuning.to_variables(),
+                                       **(variables or {})
+                                   ),
+                                   buffer_options=CfnPipeline.BufferOptionsProperty(persistent_buffer_enabled=True)
+                                   if tuning.persistent_buffer else None,
+                                   pipeline_name=name,
+                                   log_publishing_options=CfnPipeline.LogPublishingOptionsProperty(
+                                       cloud_watch_log_destination=CfnPipeline.CloudWatchLogDestinationProperty(
+                                           log_group=log_group.log_group_name
+                                       ),
+                                       is_logging_enabled=True
+                                   ),
+                                   vpc_options=vpc_options,
+                                   )
+            # The pipelines check their access to the DLQ bucket and the logs queue when they're created
+            pipeline.node.add_dependency(pipeline_role)
+            return pipeline
+
+        def create_shard(pipeline: IngestionPipeline, configuration: str, tuning: PipelineTuning,
+                         variables: Optional[dict] = None) -> CfnPipeline:
+            # The log group of the first shard of the shared indices keeps the ID of the single pipeline
+            log_group_id = pipeline.construct_id.replace('Pipeline', 'IngestionLogGroup', 1)
+            return create_pipeline(pipeline.construct_id, log_group_id, pipeline.name, configuration, tuning,
+                                   variables=variables, index_prefix=pipeline.index_prefix)
+
+        # OSI pipelines for logs, the shards pull the objects written by the collector from the same queue when logs are sent to S3
+        if s3_logs:
+            logs_pipelines = [create_shard(pipeline, 'logs-s3-pipeline.yaml', pipeline_tuning('Logs', pull_source=True),
+                                           variables={'queue_url': logs_queue.queue_url})
+                              for pipeline in layout.pipelines('Logs')]
+        else:
+            logs_pipelines = [create_shard(pipeline, 'logs-otel-pipeline.yaml' if otlp else 'logs-pipeline.yaml', pipeline_tuning('Logs'))
+                              for pipeline in layout.pipelines('Logs')]
+
+        # OSI pipelines for metrics
+        if otlp:
+            metrics_config = 'metrics-otel-pipeline.yaml'
+        elif stage_aggregation == 'pipeline':
+            metrics_config = 'metrics-stage-agg-pipeline.yaml'
+        else:
+            metrics_config = 'metrics-pipeline.yaml'
+        metrics_pipelines = [create_shard(pipeline, metrics_config, pipeline_tuning('Metrics'),
+                                          variables={'archive_sink': archive_sink})
+                             for pipeline in layout.pipelines('Metrics')]
+
+        # OSI pipeline for traces, using the OpenTelemetry trace analytics indices
+        if enable_tracing:
+            # A single pipeline writing to the shared trace analytics indices, whatever the layout
+            traces_tuning = tune_pipeline('Traces', plan).with_context(self.node.try_get_context, 'Traces')
+            traces_pipeline = create_pipeline('TracesPipeline', 'TracesIngestionLogGroup', 'spark-obs-traces', 'traces-pipeline.yaml', traces_tuning)
+
+            CfnOutput(self, 'TracesPipelineUrl',
+                      description='Pipeline endpoints for traces',
+                      value=endpoint_urls(traces_pipeline, '/v1/traces'),
+                      )
+
+        def group_urls(stream: str, pipelines: list, tenant: Optional[str], path: str) -> str:
+            # The ingestion endpoints of all the shards of a stream for the shared indices or a tenant
+            return Fn.join(',', [endpoint_urls(pipeline, path)
+                                 for pipeline, shard in zip(pipelines, layout.pipelines(stream)) if shard.tenant == tenant])
+
+        for tenant in layout.groups:
+            output_prefix = (tenant or '').capitalize()
+            CfnOutput(self, f'{output_prefix}MetricsPipelineUrl',
+                      description='Pipeline endpoints for metrics' + (f' of the {tenant} tenant' if tenant else ''),
+                      value=group_urls('Metrics', metrics_pipelines, tenant, '/v1/metrics' if otlp else '/ingest'),
+                      )
+
+            if not s3_logs:
+                CfnOutput(self, f'{output_prefix}LogsPipelineUrl',
+                          description='Pipeline endpoints for logs' + (f' of the {tenant} tenant' if tenant else ''),
+                          value=group_urls('Logs', logs_pipelines, tenant, '/v1/logs' if otlp else '/ingest'),
+                          )
+
+        if s3_logs:
+            CfnOutput(self, 'LogsBucketUri',
+                      description='S3 location for logs, used as the collector location with the s3 sink',
+                      value=logs_bucket.s3_url_for_object('logs'),
+                      )
+
+        CfnOutput(self, 'DlqBucketUri',
+                  description='S3 location of the documents rejected by the pipelines, used as the source of the dlq_replay tool',
+                  value=dlq_bucket.s3_url_for_object(),
                   )
 
+        if metrics_archive:
+            CfnOutput(self, 'MetricsArchiveUri',
+                      description='S3 location of the task metrics archived as Parquet objects, used as the source of the metrics_archive tool',
+                      value=archive_bucket.s3_url_for_object(ARCHIVE_PREFIX),
+                      )
+
         CfnOutput(self, 'CollectorPolicyArn',
                   description='Collector managed policy ARN to attach to the role used by the Spark job',
                   value=collector_policy.managed_policy_arn,
@@ -183,6 +321,37 @@ class IngestorStack(Stack):
 
         Aspects.of(self).add(AwsSolutionsChecks())
 
-        NagSuppressions.add_resource_suppressions_by_path(stack=self, path='/IngestorStack/PipelineSecurityGroup/Resource', suppressions=[
-            {"id": "AwsSolutions-EC23", "reason": "The ingestor source is not predictable when deploying the ingestor stack."},
-        ])
\ No newline at end of file
+        if vpc_options is not None:
+            NagSuppressions.add_resource_suppressions_by_path(stack=self, path='/IngestorStack/PipelineSecurityGroup/Resource', suppressions=[
+                {"id": "AwsSolutions-EC23", "reason": "The ingestor source is not predictable when deploying the ingestor stack."},
+            ])
+
+        NagSuppressions.add_resource_suppressions_by_path(stack=self, path='/IngestorStack/DlqBucket/Resource', suppressions=[
+            {"id": "AwsSolutions-S1", "reason": "Rejected documents are transient and expire after they are replayed"},
+        ])
+
+        NagSuppressions.add_resource_suppressions_by_path(stack=self, path='/IngestorStack/PipelineRole/Policy/Resource', suppressions=[
+            {"id": "AwsSolutions-IAM5", "reason": "Object keys are dynamic and wildcards are generated by grantRead and grantPut methods"},
+        ])
+
+        if metrics_archive:
+            NagSuppressions.add_resource_suppressions_by_path(stack=self, path='/IngestorStack/MetricsArchiveBucket/Resource', suppressions=[
+                {"id": "AwsSolutions-S1", "reason": "Archive objects are only written by the pipelines and read by the metrics_archive tool"},
+            ])
+
+        if s3_logs:
+            NagSuppressions.add_resource_suppressions_by_path(stack=self, path='/IngestorStack/LogsBucket/Resource', suppressions=[
+                {"id": "AwsSolutions-S1", "reason": "Log objects are transient and expire after they are ingested by the pipeline"},
+            ])
+
+            NagSuppressions.add_resource_suppressions_by_path(stack=self, path='/IngestorStack/CollectorPolicy/Resource', suppressions=[
+                {"id": "AwsSolutions-IAM5", "reason": "Log object keys are dynamic and wildcards are generated by grantRead method"},
+            ])
+
+            NagSuppressions.add_resource_suppressions_by_path(stack=self, path=[
+                '/IngestorStack/BucketNotificationsHandler050a0587b7544547bf325f094a3db834/Role/Resource',
+                '/IngestorStack/BucketNotificationsHandler050a0587b7544547bf325f094a3db834/Role/DefaultPolicy/Resource',
+            ], suppressions=[
+                {"id": "AwsSolutions-IAM4", "reason": "Resources provided by CDK framework"},
+                {"id": "AwsSolutions-IAM5", "reason": "Resources provided by CDK framework"},
+            ])
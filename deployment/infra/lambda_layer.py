@@ -0,0 +1,101 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import compileall
+import hashlib
+import os
+import py_compile
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# The Python version of the Lambda runtime using the layer
+LAYER_PYTHON_VERSION = (3, 11)
+
+# Directories of installed packages not needed at runtime
+UNUSED_DIRECTORIES = ('tests', 'test', '__pycache__')
+
+# The directory storing the built layers by content hash, can be overridden with the LAYER_CACHE_DIR environment variable
+DEFAULT_CACHE_DIR = Path.home().joinpath('.cache', 'spark-observability', 'lambda-layers')
+
+
+def layer_hash(requirements: Path, common: Path) -> str:
+    """
+    Computes the cache key of a layer from the requirements, the common modules, the Python version of the build
+    and the code of this module, so any change to the layer content or to the way it's built invalidates the cache.
+    """
+    digest = hashlib.sha256()
+    digest.update(requirements.read_bytes())
+    for module in sorted(common.glob('*.py')):
+        digest.update(module.name.encode('utf-8'))
+        digest.update(module.read_bytes())
+    digest.update(f'{sys.version_info[0]}.{sys.version_info[1]}'.encode('utf-8'))
+    digest.update(Path(__file__).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def build_layer(requirements: Path, common: Path, cache_dir: Path = None) -> Path:
+    """
+    Builds the Python requirements layer shared by the Opensearch Lambda functions.
+    The layer is stored in a content-addressed cache directory and only rebuilt when its hash changes,
+    so repeated synths reuse it and produce the same asset.
+    When the LAYER_WHEELHOUSE environment variable is set, packages are installed from this directory
+    without accessing the package index.
+    boto3 and botocore are not installed because the Lambda runtime provides them.
+    The modules of the common directory are added at the root of the layer.
+    Tests are stripped and the modules are precompiled for the Lambda runtime,
+    because the layer is read-only and the runtime can't write its own bytecode cache.
+    Returns the layer directory.
+    """
+    cache_dir = Path(cache_dir or os.environ.get('LAYER_CACHE_DIR', DEFAULT_CACHE_DIR))
+    target = cache_dir.joinpath(layer_hash(requirements, common))
+    if target.is_dir():
+        return target
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Build in a temporary directory renamed at the end so an interrupted build is never reused
+    build = Path(tempfile.mkdtemp(dir=cache_dir, prefix='.build-'))
+    try:
+        python = build.joinpath('python')
+        site_packages = python.joinpath(f'lib/python{LAYER_PYTHON_VERSION[0]}.{LAYER_PYTHON_VERSION[1]}/site-packages')
+        site_packages.mkdir(parents=True)
+
+        wheelhouse = os.environ.get('LAYER_WHEELHOUSE')
+        index_options = ['--no-index', '--find-links', wheelhouse] if wheelhouse else []
+        subprocess.check_call([sys.executable, '-m', 'pip', 'install', '--quiet', '--no-compile', *index_options,
+                               '-t', str(site_packages), '-r', str(requirements)])
+
+        # console scripts of the installed packages
+        shutil.rmtree(site_packages.joinpath('bin'), ignore_errors=True)
+
+        for module in common.glob('*.py'):
+            shutil.copy(module, python)
+
+        strip_layer(python)
+        build.chmod(0o755)
+        try:
+            build.rename(target)
+        except OSError:
+            # Another synth built the same layer concurrently
+            shutil.rmtree(build)
+    except BaseException:
+        shutil.rmtree(build, ignore_errors=True)
+        raise
+    return target
+
+
+def strip_layer(python: Path):
+    """
+    Removes the files not needed at runtime and precompiles the modules when the build runs the Lambda Python version.
+    Bytecode is compiled with unchecked hashes so it stays valid whatever the file timestamps in the layer archive,
+    and with the paths of the Lambda layer mount point so it doesn't depend on the build directory.
+    """
+    for directory in sorted(python.rglob('*'), reverse=True):
+        if directory.is_dir() and directory.name in UNUSED_DIRECTORIES:
+            shutil.rmtree(directory)
+
+    if sys.version_info[:2] == LAYER_PYTHON_VERSION:
+        compileall.compile_dir(str(python), ddir='/opt/python', quiet=1, optimize=0,
+                               invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
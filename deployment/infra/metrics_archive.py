@@ -0,0 +1,56 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+
+# The prefix of the task metrics objects in the archive bucket, objects are partitioned by day and application
+ARCHIVE_PREFIX = 'task-metrics'
+
+# The columns of the archived task metrics, with the types sent by the collector. Counters are sent as doubles
+TASK_METRICS_COLUMNS = [
+    ('appName', 'string'),
+    ('appId', 'string'),
+    ('jobId', 'string'),
+    ('stageId', 'int'),
+    ('stageAttemptId', 'int'),
+    ('taskId', 'string'),
+    ('executorId', 'string'),
+    ('partitionId', 'int'),
+    ('inputBytesRead', 'double'),
+    ('inputRecordsRead', 'double'),
+    ('runTime', 'double'),
+    ('executorCpuTime', 'double'),
+    ('peakExecutionMemory', 'double'),
+    ('outputRecordsWritten', 'double'),
+    ('outputBytesWritten', 'double'),
+    ('shuffleRecordsRead', 'double'),
+    ('shuffleBytesRead', 'double'),
+    ('shuffleRecordsWritten', 'double'),
+    ('shuffleBytesWritten', 'double'),
+    ('metricTime', 'long'),
+]
+
+
+def task_metrics_schema() -> str:
+    """
+    The Avro schema of the Parquet objects written by the archive sink, all the columns are optional.
+    """
+    return json.dumps({
+        'type': 'record',
+        'name': 'TaskMetrics',
+        'namespace': 'com.amazonaws.sparkobservability',
+        'fields': [{'name': name, 'type': ['null', avro_type], 'default': None} for name, avro_type in TASK_METRICS_COLUMNS],
+    }, separators=(',', ':'))
+
+
+def archive_sink(bucket: str, region: str, role_arn: str) -> str:
+    """
+    The S3 sink archiving the task metrics, inserted in the sinks of the metrics pipelines.
+    """
+    return open('./infra/resources/pipelines/metrics-archive-sink.yaml').read().format(
+        archive_bucket=bucket,
+        archive_prefix=ARCHIVE_PREFIX,
+        region=region,
+        role_arn=role_arn,
+        schema=task_metrics_schema(),
+    )
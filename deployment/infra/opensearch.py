@@ -93,6 +93,11 @@ class Opensearch(Construct):
                                value="true"
                            )],
                            )
+
+
+        # Cold storage for the indices migrated by the lifecycle policies, not yet modeled in the CfnDomain properties
+        if cluster_sizing.index_lifecycle.cold_age is not None:
+            self.__domain.add_property_override('ClusterConfig.ColdStorageOptions.Enabled', True)
         
         # The role used by the Opensearch Ingestion pipeline
         self.__pipeline_role = Role(self, 'PipelineRole',
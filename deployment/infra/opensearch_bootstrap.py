@@ -1,6 +1,7 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import hashlib
 import subprocess
 from pathlib import Path
 
@@ -14,8 +15,20 @@ from aws_cdk.aws_secretsmanager import ISecret
 from aws_cdk.aws_opensearchservice import CfnDomain
 from aws_cdk.aws_iam import IRole
 
+from infra.cluster_sizing import IndexLifecycle
 from infra.opensearch_cr_helpers import OpensearchCrHelpers
 
+def resources_hash(path: Path) -> str:
+    """
+    Hashes the content of the bootstrap resources directory.
+    """
+    digest = hashlib.sha256()
+    for file in sorted(p for p in path.rglob('*') if p.is_file()):
+        digest.update(str(file.relative_to(path)).encode('utf-8'))
+        digest.update(file.read_bytes())
+    return digest.hexdigest()
+
+
 class OpensearchBootstrap(Construct):
 
     def __init__(self, scope: Construct, id: str, 
@@ -25,16 +38,20 @@ class OpensearchBootstrap(Construct):
                  user_secret: ISecret,
                  admin_secret: ISecret,
                  pipeline_role: IRole,
+                 index_lifecycle: IndexLifecycle,
+                 index_settings: dict,
+                 tenants: tuple = (),
+                 ingest_latency: bool = False,
                  **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
+        bootstrap_path = Path(__file__).parent.joinpath('resources/lambda/opensearch-bootstrap')
 
         bootstrap_lambda = Function(scope=self,
                                     id='OsBootstrapFunction',
                                     function_name=opensearch_cr_helpers.function_name,
                                     runtime=Runtime.PYTHON_3_11,
-                                    code=Code.from_asset(
-                                        str(Path(__file__).parent.joinpath('resources/lambda/opensearch-bootstrap'))),
+                                    code=Code.from_asset(str(bootstrap_path)),
                                     handler='bootstrap.on_event',
                                     environment={'PIPELINE_ROLE_ARN': pipeline_role.role_arn,
                                                  'DOMAIN_ENDPOINT': domain.get_att('DomainEndpoint').to_string(),
@@ -57,6 +74,16 @@ class OpensearchBootstrap(Construct):
         os_bootstrap = CustomResource(scope=self,
                                       id='ExecuteOsBootstrap',
                                       service_token=bootstrap_lambda_provider.service_token,
-                                      properties={'Timeout': 900}
+                                      properties={'Timeout': 900,
+                                                  # Triggers an update of the changed resources when the bootstrap resources change
+                                                  'ResourcesHash': resources_hash(bootstrap_path.joinpath('resources')),
+                                                  # The thresholds of the index lifecycle policies, based on the TshirtSize
+                                                  'IndexLifecycle': index_lifecycle.to_properties(),
+                                                  # The shards, replicas and write settings of the index templates
+                                                  'IndexSettings': index_settings,
+                                                  # The tenants getting their own prefixed index templates, policies and aliases
+                                                  'Tenants': list(tenants),
+                                                  # Whether the ingest latency pipeline is the default pipeline of the index templates
+                                                  'IngestLatency': str(ingest_latency).lower()}
                                       )
         os_bootstrap.node.add_dependency(domain)
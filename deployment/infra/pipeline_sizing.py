@@ -0,0 +1,168 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import math
+from dataclasses import dataclass, replace
+from typing import Callable, Optional
+
+from infra.capacity_planner import MAX_PIPELINE_UNITS, OCU_THROUGHPUT
+from infra.cluster_sizing import CapacityPlan, ClusterConfig
+
+# The index receiving most of the documents of a pipeline, its share of the ingest rate and the units used
+# when the ingestor stack is deployed without a T-shirt size or a capacity plan.
+# Traces aren't part of the plan, the sampled task spans are sized like the task metrics they follow.
+PIPELINE_STREAMS = {
+    'Logs': ('spark_logs', 0.7, (1, 10)),
+    'Metrics': ('spark_task_metrics', 0.3, (1, 4)),
+    'Traces': ('spark_task_metrics', 0.3, (1, 4)),
+}
+
+# The peak ingest rate over the daily average, Spark applications are often scheduled in batches
+PEAK_FACTOR = 4
+# The vCPUs of an OpenSearch Compute Unit, one worker thread per vCPU
+OCU_VCPU = 2
+# The average size of a log or metric document in KB
+AVG_DOC_KB = 1
+# The bulk request size per primary shard of the target index, and the bounds of the bulk request size in MiB
+BULK_MB_PER_SHARD = 2
+MIN_BULK_MB = 5
+MAX_BULK_MB = 20
+# The HTTP payload limit of the small data node types in MiB
+SMALL_NODE_PAYLOAD_MB = 10
+# The batches held by the in-memory buffer per worker
+BUFFER_BATCHES = 4
+# The time a worker waits for a full batch, in ms
+MIN_DELAY = 250
+MAX_DELAY = 3000
+# The bulk request retries before the documents are dropped, with an exponential backoff up to a few minutes
+MAX_RETRIES = 16
+# Pipelines with a persistent buffer run on at least 2 units
+PERSISTENT_BUFFER_MIN_UNITS = 2
+
+
+@dataclass(frozen=True)
+class PipelineTuning:
+    """
+    The capacity, buffer, worker and bulk sink settings of an ingestion pipeline.
+    The defaults are the ones of Data Prepper, sizes are in documents except the bulk size in MiB and the delay in ms.
+    With the persistent buffer, the pipeline buffers the documents in durable storage instead of the in-memory buffer.
+    """
+    min_units: int
+    max_units: int
+    workers: int = 1
+    delay: int = 3000
+    buffer_size: int = 12800
+    batch_size: int = 200
+    bulk_size: int = 5
+    max_retries: int = MAX_RETRIES
+    persistent_buffer: bool = False
+
+    def __post_init__(self):
+        if not 1 <= self.min_units <= self.max_units <= MAX_PIPELINE_UNITS:
+            raise Exception(f"Pipeline units must be between 1 and {MAX_PIPELINE_UNITS} with min units below max units")
+        if self.persistent_buffer and self.min_units < PERSISTENT_BUFFER_MIN_UNITS:
+            raise Exception(f"Pipelines with a persistent buffer require at least {PERSISTENT_BUFFER_MIN_UNITS} units")
+        if self.batch_size > self.buffer_size:
+            raise Exception("Pipeline batch size must be lower than the buffer size")
+        if min(self.workers, self.delay, self.batch_size, self.bulk_size, self.max_retries) < 1:
+            raise Exception("Pipeline workers, delay, batch size, bulk size and retries must be positive")
+
+    def to_variables(self) -> dict:
+        """
+        The settings as variables of the pipeline configuration templates.
+        The buffer is a block of the pipeline definition, a comment when the persistent buffer replaces it.
+        """
+        if self.persistent_buffer:
+            buffer = '  # persistent buffer enabled on the pipeline'
+        else:
+            buffer = (f'  buffer:\n'
+                      f'    bounded_blocking:\n'
+                      f'      buffer_size: {self.buffer_size}\n'
+                      f'      batch_size: {self.batch_size}')
+        return {
+            'workers': self.workers,
+            'delay': self.delay,
+            'buffer': buffer,
+            'bulk_size': self.bulk_size,
+            'max_retries': self.max_retries,
+        }
+
+    def with_context(self, get: Callable[[str], Optional[str]], prefix: str):
+        """
+        Overrides the settings with the CDK context parameters of the pipeline, e.g. `LogsPipelineBulkSize`.
+        """
+        def number(key: str, default: int) -> int:
+            value = get(f'{prefix}{key}')
+            if value is None:
+                return default
+            try:
+                return int(value)
+            except ValueError:
+                raise Exception(f"{prefix}{key} parameter must be a number")
+
+        persistent_buffer = get('PersistentBuffer')
+        persistent_buffer = self.persistent_buffer if persistent_buffer is None \
+            else str(persistent_buffer).lower() == 'true'
+        min_units = number('PipelineMinUnits', self.min_units)
+        if persistent_buffer and get(f'{prefix}PipelineMinUnits') is None:
+            min_units = max(min_units, PERSISTENT_BUFFER_MIN_UNITS)
+
+        return replace(self,
+                       min_units=min_units,
+                       max_units=max(number('PipelineMaxUnits', self.max_units), min_units),
+                       workers=number('PipelineWorkers', self.workers),
+                       delay=number('PipelineDelay', self.delay),
+                       buffer_size=number('PipelineBufferSize', self.buffer_size),
+                       batch_size=number('PipelineBatchSize', self.batch_size),
+                       bulk_size=number('PipelineBulkSize', self.bulk_size),
+                       max_retries=number('PipelineMaxRetries', self.max_retries),
+                       persistent_buffer=persistent_buffer)
+
+
+def payload_limit(data_node_type: str) -> int:
+    """
+    The maximum bulk request size the data nodes accept in MiB.
+    """
+    if any(f'.{size}.' in data_node_type for size in ('micro', 'small', 'medium')):
+        return SMALL_NODE_PAYLOAD_MB
+    return MAX_BULK_MB
+
+
+def tune_pipeline(name: str, plan: Optional[CapacityPlan], pull_source: bool = False,
+                  pipelines: int = 1, groups: int = 1) -> PipelineTuning:
+    """
+    Derives the settings of the Logs, Metrics or Traces pipeline from the capacity plan of the domain.
+    The ingest rate of the stream is split evenly between its pipelines, and the indices between the groups of indices.
+    Units cover the average ingest rate of the pipeline and scale up to the peak rate.
+    Each worker fills batches of one bulk request, bulk requests carry a few MiB per primary shard of the target
+    index within the payload limit of the data nodes, and workers wait longer for a full batch at low ingest rates.
+    Multi-AZ domains get the persistent buffer so documents are kept while the domain rejects bulk requests,
+    except with a pull source like S3 which already keeps the documents until they are ingested.
+    Without a plan, the pipeline keeps the Data Prepper defaults.
+    """
+    index, share, default_units = PIPELINE_STREAMS[name]
+    if plan is None:
+        return PipelineTuning(*default_units)
+
+    average_mbps = plan.ingest_rate * share * 1024 / 86400 / pipelines
+    min_units = min(MAX_PIPELINE_UNITS, max(1, math.ceil(average_mbps / OCU_THROUGHPUT)))
+    max_units = min(MAX_PIPELINE_UNITS, max(min_units, math.ceil(average_mbps * PEAK_FACTOR * 1.2 / OCU_THROUGHPUT)))
+    persistent_buffer = plan.az_count > 1 and not pull_source
+    if persistent_buffer:
+        min_units = max(min_units, PERSISTENT_BUFFER_MIN_UNITS)
+        max_units = max(max_units, min_units)
+
+    shards = int(ClusterConfig(plan).index_settings(groups)[index]['number_of_shards'])
+    bulk_size = max(MIN_BULK_MB, min(shards * BULK_MB_PER_SHARD, payload_limit(plan.data_node_type)))
+    batch_size = bulk_size * 1024 // AVG_DOC_KB
+    docs_per_worker = average_mbps * 1024 / AVG_DOC_KB / (min_units * OCU_VCPU)
+    delay = MAX_DELAY if docs_per_worker == 0 else int(min(MAX_DELAY, max(MIN_DELAY, 1000 * batch_size / docs_per_worker)))
+
+    return PipelineTuning(min_units=min_units,
+                          max_units=max_units,
+                          workers=OCU_VCPU,
+                          delay=delay,
+                          buffer_size=batch_size * OCU_VCPU * BUFFER_BATCHES,
+                          batch_size=batch_size,
+                          bulk_size=bulk_size,
+                          persistent_buffer=persistent_buffer)
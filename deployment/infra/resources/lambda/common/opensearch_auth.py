@@ -0,0 +1,26 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.session import Session
+from requests.auth import AuthBase
+
+
+class OpensearchAuth(AuthBase):
+    """
+    Signs requests to an Opensearch domain with SigV4, using botocore which is already provided by the Lambda runtime.
+    Credentials are resolved on each request so they are refreshed when they expire.
+    """
+
+    def __init__(self, region: str, service: str = 'es'):
+        self.region = region
+        self.service = service
+        self.credentials = Session().get_credentials()
+
+    def __call__(self, request):
+        aws_request = AWSRequest(method=request.method, url=request.url, data=request.body,
+                                 headers={k: v for k, v in request.headers.items() if k.lower() != 'connection'})
+        SigV4Auth(self.credentials.get_frozen_credentials(), self.service, self.region).add_auth(aws_request)
+        request.headers.update(dict(aws_request.headers.items()))
+        return request
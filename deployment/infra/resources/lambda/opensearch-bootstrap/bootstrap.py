@@ -3,17 +3,15 @@
 
 
 import base64
-from email import header
+from functools import lru_cache
+import hashlib
 import json
 import logging
 import os
 
-import boto3
-import requests
-from botocore.exceptions import ClientError
-from jinja2 import Template
-from opensearchpy import AWSV4SignerAuth
-from requests_aws4auth import AWS4Auth
+from step_runner import Step, run_steps
+
+# Third party modules and AWS clients are only loaded when a request needs them to keep the cold start short
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -21,14 +19,11 @@ logger.setLevel(logging.INFO)
 host = os.environ['DOMAIN_ENDPOINT']
 domain_name = os.environ['DOMAIN_NAME']
 region = os.environ['AWS_REGION']
-credentials = boto3.Session().get_credentials()
-auth = AWSV4SignerAuth(credentials, region)
 user_secret_arn = os.environ['USER_SECRET_ARN']
 admin_secret_arn = os.environ['ADMIN_SECRET_ARN']
 
-session = requests.Session()
-ssm_client = boto3.client('secretsmanager')
-os_client = boto3.client('opensearch')
+# The number of bootstrap steps running concurrently, also the number of keep-alive connections to the domain
+max_workers = 8
 
 pipeline_iam_role = os.environ['PIPELINE_ROLE_ARN']
 
@@ -39,22 +34,70 @@ admin_path = f"{os.environ['LAMBDA_TASK_ROOT']}/resources/users/admin.j2"
 logs_template_path = f"{os.environ['LAMBDA_TASK_ROOT']}/resources/templates/spark-logs.json"
 stage_agg_template_path = f"{os.environ['LAMBDA_TASK_ROOT']}/resources/templates/spark-stage-agg-metrics.json"
 task_template_path = f"{os.environ['LAMBDA_TASK_ROOT']}/resources/templates/spark-task-metrics.json"
+app_summary_template_path = f"{os.environ['LAMBDA_TASK_ROOT']}/resources/templates/spark-app-summary.json"
 data_skew_path = f"{os.environ['LAMBDA_TASK_ROOT']}/resources/dashboards/data-skew.ndjson"
+ingestion_latency_path = f"{os.environ['LAMBDA_TASK_ROOT']}/resources/dashboards/ingestion-latency.ndjson"
+ingest_latency_pipeline_path = f"{os.environ['LAMBDA_TASK_ROOT']}/resources/ingest/ingest-latency.json"
+lifecycle_policy_path = f"{os.environ['LAMBDA_TASK_ROOT']}/resources/policies/lifecycle.j2"
+
+# The ingest pipeline stamping the index time and the ingestion latency, the default pipeline of the index templates
+ingest_latency_pipeline = 'spark_ingest_latency'
 
+# The indices written through a rollover alias and managed by a lifecycle policy, with the timestamp field used by cold storage
+rollover_indices = [
+    ('spark-logs', 'logTime'),
+    ('spark-task-metrics', 'metricTime'),
+    ('spark-stage-agg-metrics', 'metricTime'),
+]
 
-awsauth = AWS4Auth(credentials.access_key,
-                   credentials.secret_key,
-                   region,
-                   'es',
-                   session_token=credentials.token)
+# The document storing the hashes of the applied resources, used to only apply the changed ones on update
+manifest_path = '.spark-obs-bootstrap/_doc/manifest'
 
 
+@lru_cache(maxsize=None)
+def session():
+    """
+    The HTTP session shared by the bootstrap steps, with a connection pool sized for the concurrent steps.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    s = requests.Session()
+    s.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+    return s
+
+@lru_cache(maxsize=None)
+def awsauth():
+    """
+    The SigV4 signer of the requests sent to the Opensearch domain.
+    """
+    from opensearch_auth import OpensearchAuth
+    return OpensearchAuth(region)
+
+@lru_cache(maxsize=None)
+def ssm_client():
+    """
+    The Secrets Manager client used to read the users passwords.
+    """
+    import boto3
+    return boto3.client('secretsmanager')
+
+@lru_cache(maxsize=None)
+def os_client():
+    """
+    The Opensearch service client used to update the domain config.
+    """
+    import boto3
+    return boto3.client('opensearch')
+
+
+@lru_cache(maxsize=None)
 def get_secret(secret_arn: str):
     """
-    Retrieves the secret value from Secrets Manager.
+    Retrieves the secret value from Secrets Manager, once per invocation.
     """
+    from botocore.exceptions import ClientError
     try:
-        response = ssm_client.get_secret_value(SecretId=secret_arn)
+        response = ssm_client().get_secret_value(SecretId=secret_arn)
     except ClientError as e:
         logger.error(f"Failed to get secret: {e}")
         raise e
@@ -76,18 +119,20 @@ def load_content(path: str):
 
 def send_to_os(action: str, path: str, payload: str = None, headers: dict = None):
     """
-    Sends a request to OpenSearch service with AWS4Auth.
+    Sends a request to OpenSearch service, signed with SigV4 by the botocore based OpensearchAuth.
     """
     url = f"https://{host}/{path}"
 
     if action == 'PUT':
-        r = session.put(url, auth=awsauth, json=payload, headers=headers)
+        r = session().put(url, auth=awsauth(), json=payload, headers=headers)
+    elif action == 'GET':
+        r = session().get(url, auth=awsauth(), headers=headers)
     elif action == 'DELETE':
-        r = session.delete(url, auth=awsauth, headers=headers)
+        r = session().delete(url, auth=awsauth(), headers=headers)
     elif action == 'POST':
-        r = session.post(url, auth=awsauth, json=payload, headers=headers)
+        r = session().post(url, auth=awsauth(), json=payload, headers=headers)
     elif action == 'POST_FILE':
-        r = session.post(url, auth=awsauth, files={'file': payload}, headers=headers)
+        r = session().post(url, auth=awsauth(), files={'file': payload}, headers=headers)
     else:
         raise Exception('HTTP action not supported')
     logger.info(r.text)
@@ -135,13 +180,21 @@ def saved_objects(name: str, action: str, resource_path: str = None, id : str =
     else:
         raise Exception('Resource action not supported, only CREATE or DELETE')
     
-def index_template(name: str, action: str, resource_path: str = None, id : str = None):
+def index_template(name: str, action: str, resource_path: str = None, id : str = None, settings: dict = None, prefix: str = ''):
     """
-    Index template CRUD operations
+    Index template CRUD operations, the settings are added to the index settings of the template
+    and the prefix of a tenant is added to the index patterns and the rollover alias
     """
     if action == 'CREATE':
         logger.info(f'Creating {name} index template at {resource_path}')
-        response = os_resource(action='PUT', os_path=f"_index_template/{name}", resource_path=resource_path)
+        payload = json.loads(load_content(resource_path))
+        index = payload['template'].setdefault('settings', {}).setdefault('index', {})
+        index.update(settings or {})
+        if prefix:
+            payload['index_patterns'] = [f'{prefix}{pattern}' for pattern in payload['index_patterns']]
+            if 'plugins.index_state_management.rollover_alias' in index:
+                index['plugins.index_state_management.rollover_alias'] = f"{prefix}{index['plugins.index_state_management.rollover_alias']}"
+        response = send_to_os('PUT', f"_index_template/{name}", payload)
         if not response.ok:
             raise Exception(f'Error {response.status_code} in {name} index template creation: {response.text}')
         
@@ -157,6 +210,7 @@ def user(action: str, secret_arn: str, resource_path: str = None):
     """
     User CRUD operations
     """
+    from jinja2 import Template
     if action == 'CREATE':
         secret = get_secret(secret_arn)
         content = load_content(resource_path)
@@ -176,6 +230,9 @@ def user(action: str, secret_arn: str, resource_path: str = None):
 
 def on_event(event: json, context):
     logger.info(event)
+    # secrets are read once per invocation, warm invocations must see the rotated passwords
+    get_secret.cache_clear()
+    secret_version.cache_clear()
     request_type = event['RequestType']
     if request_type == 'Create': return on_create(event)
     if request_type == 'Update': return on_update(event)
@@ -183,14 +240,11 @@ def on_event(event: json, context):
     raise Exception("Invalid request type: %s" % request_type)
 
 
-def on_create(event: json):
-    props = event["ResourceProperties"]
-    logger.info("create new resource with props %s" % props)
-
-    # create role for pipeline    
-    os_resource('PUT', os_path=f"_opendistro/_security/api/roles/pipeline_role", resource_path=pipeline_role_path)
-
-    # create the role mapping for pipeline
+def pipeline_role_mapping():
+    """
+    Creates the role mapping between the pipeline role and the pipeline IAM role
+    """
+    from jinja2 import Template
     content = load_content(pipeline_role_mapping_path)
     payload = Template(content).render(backend_role=pipeline_iam_role)
     path = "_opendistro/_security/api/rolesmapping/pipeline_role"
@@ -200,9 +254,12 @@ def on_create(event: json):
     if not response.ok:
         raise Exception(f'Error {response.status_code} in pipeline role mapping creation: {response.text}')
 
-    # enable internal database users
+def enable_internal_users():
+    """
+    Updates the domain config to enable internal database users
+    """
     logger.info(f'Updating domain config to enable internal database users')
-    response = os_client.update_domain_config(
+    response = os_client().update_domain_config(
         DomainName=domain_name,
         AdvancedSecurityOptions={
             "InternalUserDatabaseEnabled": True
@@ -213,24 +270,12 @@ def on_create(event: json):
     if status_code != 200:
         raise Exception(f'Error {status_code} in domain security configuration update: {response["ResponseMetadata"]}')
 
-    # create the admin for dashboard
-    user('CREATE', secret_arn=admin_secret_arn, resource_path=admin_path)
-
-    # create the user for dashboard
-    user('CREATE', secret_arn=user_secret_arn, resource_path=user_path)
-
-    # create the index template for spark logs
-    index_template('spark_logs', 'CREATE', resource_path=logs_template_path)
-
-    # create the index template for spark task metrics
-    index_template('spark_task_metrics', 'CREATE', resource_path=task_template_path)
-
-    # create the index template for spark stage agg metrics
-    index_template('spark_stage_agg_metrics', 'CREATE', resource_path=stage_agg_template_path)
-
-    # create the opensearch dashboards saved objects
-    logger.info(f'Creating saved objects at {data_skew_path}')
-    response = os_resource(action='POST_FILE', os_path="_dashboards/api/saved_objects/_import?overwrite=true", resource_path=data_skew_path, headers={'osd-xsrf': 'true'})
+def dashboard(path: str):
+    """
+    Creates the opensearch dashboards saved objects of a dashboards file and returns them
+    """
+    logger.info(f'Creating saved objects at {path}')
+    response = os_resource(action='POST_FILE', os_path="_dashboards/api/saved_objects/_import?overwrite=true", resource_path=path, headers={'osd-xsrf': 'true'})
     if not response.ok:
         raise Exception(f'Error {response.status_code} in saved objects creation: {response.text}')
     resources = response.json()['successResults']
@@ -239,9 +284,272 @@ def on_create(event: json):
             del r['meta']
         if 'overwrite' in r:
             del r['overwrite']
+    return resources
+
+
+def ingest_pipeline(name: str, action: str, resource_path: str = None):
+    """
+    Ingest pipeline CRUD operations
+    """
+    if action == 'CREATE':
+        logger.info(f'Creating {name} ingest pipeline at {resource_path}')
+        response = os_resource(action='PUT', os_path=f'_ingest/pipeline/{name}', resource_path=resource_path)
+        if not response.ok:
+            raise Exception(f'Error {response.status_code} in {name} ingest pipeline creation: {response.text}')
+
+    elif action == 'DELETE':
+        response = send_to_os('DELETE', f'_ingest/pipeline/{name}')
+        if not response.ok and response.status_code != 404:
+            raise Exception(f'Error {response.status_code} in deleting {name} ingest pipeline: {response.text}')
+
+    else:
+        raise Exception('Resource action not supported, only CREATE or DELETE')
+
+
+def lifecycle_policy_name(alias: str):
+    """
+    The name of the ISM policy managing the indices of a rollover alias.
+    """
+    return f"{alias.replace('-', '_')}_lifecycle"
+
+def lifecycle_policy(name: str, payload: dict):
+    """
+    Creates or updates an ISM policy and switches the indices it already manages to the new version.
+    """
+    path = f'_plugins/_ism/policies/{name}'
+    response = send_to_os('GET', path)
+    if response.ok:
+        current = response.json()
+        response = send_to_os('PUT', f"{path}?if_seq_no={current['_seq_no']}&if_primary_term={current['_primary_term']}", payload)
+        if not response.ok:
+            raise Exception(f'Error {response.status_code} in {name} policy update: {response.text}')
+        # indices keep the policy version they started with until they are explicitly changed
+        pattern = payload['policy']['ism_template'][0]['index_patterns'][0]
+        response = send_to_os('POST', f'_plugins/_ism/change_policy/{pattern}', {'policy_id': name})
+        if not response.ok:
+            raise Exception(f'Error {response.status_code} in changing the policy of {pattern}: {response.text}')
+    elif response.status_code == 404:
+        response = send_to_os('PUT', path, payload)
+        if not response.ok:
+            raise Exception(f'Error {response.status_code} in {name} policy creation: {response.text}')
+    else:
+        raise Exception(f'Error {response.status_code} in reading {name} policy: {response.text}')
+
+def write_index(alias: str):
+    """
+    Creates the first index of a rollover alias and makes it the write index, unless the alias already exists.
+    """
+    response = send_to_os('GET', f'_alias/{alias}')
+    if response.ok:
+        logger.info(f'Rollover alias {alias} already exists')
+        return
+    response = send_to_os('GET', alias)
+    if response.ok:
+        # domains bootstrapped before the lifecycle management write to a concrete index with the alias name
+        logger.warning(f'Index {alias} exists and is not managed by the lifecycle policy, delete it to enable the rollover')
+        return
+    response = send_to_os('PUT', f'{alias}-000001', {'aliases': {alias: {'is_write_index': True}}})
+    if not response.ok:
+        raise Exception(f'Error {response.status_code} in {alias} write index creation: {response.text}')
+
+
+@lru_cache(maxsize=None)
+def secret_version(secret_arn: str):
+    """
+    Retrieves the current version ID of a secret, used to detect password rotations without reading the password.
+    """
+    versions = ssm_client().describe_secret(SecretId=secret_arn)['VersionIdsToStages']
+    return next(version for version, stages in versions.items() if 'AWSCURRENT' in stages)
+
+def content_hash(*parts: str):
+    """
+    Hashes the rendered content of a bootstrap resource.
+    """
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+def read_manifest():
+    """
+    Reads the hashes and targets of the resources applied by the last bootstrap, empty if there is no manifest.
+    """
+    response = send_to_os('GET', manifest_path)
+    if response.status_code == 404:
+        return {}
+    if not response.ok:
+        raise Exception(f'Error {response.status_code} in reading the bootstrap manifest: {response.text}')
+    return response.json()['_source']['resources']
+
+def write_manifest(resources: dict):
+    """
+    Stores the hashes and targets of the applied resources in the bootstrap manifest.
+    """
+    response = send_to_os('PUT', manifest_path, {'resources': resources})
+    if not response.ok:
+        raise Exception(f'Error {response.status_code} in writing the bootstrap manifest: {response.text}')
+
+def delete_target(target: dict):
+    """
+    Deletes an Opensearch resource removed from the bootstrap, identified by its manifest target.
+    """
+    logger.info(f'Deleting {target}')
+    if target['type'] == 'index_template':
+        index_template(target['id'], 'DELETE')
+    elif target['type'] == 'saved_objects':
+        for r in target.get('objects', []):
+            saved_objects(name='nested', action='DELETE', type=r['type'], id=r['id'])
+    elif target['type'] == 'ingest_pipeline':
+        ingest_pipeline(target['id'], 'DELETE')
+    elif target['type'] == 'ism_policy':
+        response = send_to_os('DELETE', f"_plugins/_ism/policies/{target['id']}")
+        if not response.ok and response.status_code != 404:
+            raise Exception(f'Error {response.status_code} in deleting {target}: {response.text}')
+    elif target['type'] in ('roles', 'rolesmapping', 'internalusers'):
+        response = send_to_os('DELETE', f"_plugins/_security/api/{target['type']}/{target['id']}")
+        if not response.ok and response.status_code != 404:
+            raise Exception(f'Error {response.status_code} in deleting {target}: {response.text}')
+
+def tenant_groups(tenants: list):
+    """
+    The prefixes of the index groups, none for the shared indices and one per tenant,
+    with the prefix of the Opensearch resources names.
+    """
+    return [('', '')] + [(f'{tenant}-', f'{tenant}_') for tenant in tenants]
+
+def bootstrap_resources(lifecycle: dict, index_settings: dict, tenants: list = (), ingest_latency: bool = False):
+    """
+    Renders the bootstrap resources and returns them as (step, hash, target) tuples.
+    The target identifies the Opensearch resource so it can be deleted when it's removed from the bootstrap.
+    The lifecycle contains the thresholds of the ISM policies and index_settings the settings of each index template,
+    both from the custom resource properties. Each tenant gets its own index templates, policies and rollover aliases.
+    With ingest_latency, the ingest latency pipeline is the default pipeline of the index templates.
+    """
+    from jinja2 import Template
+    templates = [
+        ('spark_logs', logs_template_path),
+        ('spark_task_metrics', task_template_path),
+        ('spark_stage_agg_metrics', stage_agg_template_path),
+        ('spark_app_summary', app_summary_template_path),
+    ]
+    resources = [
+        # create role for pipeline and its mapping to the pipeline IAM role
+        (Step('pipeline_role', lambda: os_resource('PUT', os_path="_opendistro/_security/api/roles/pipeline_role", resource_path=pipeline_role_path)),
+         content_hash(load_content(pipeline_role_path)),
+         {'type': 'roles', 'id': 'pipeline_role'}),
+        (Step('pipeline_role_mapping', pipeline_role_mapping, depends_on=['pipeline_role']),
+         content_hash(Template(load_content(pipeline_role_mapping_path)).render(backend_role=pipeline_iam_role)),
+         {'type': 'rolesmapping', 'id': 'pipeline_role'}),
+        # enable internal database users, then create the admin and the user for dashboard
+        (Step('internal_users', enable_internal_users),
+         content_hash('InternalUserDatabaseEnabled'),
+         {'type': 'domain_config'}),
+        (Step('admin_user', lambda: user('CREATE', secret_arn=admin_secret_arn, resource_path=admin_path), depends_on=['internal_users']),
+         content_hash(load_content(admin_path), secret_version(admin_secret_arn)),
+         {'type': 'internalusers', 'id': get_secret(admin_secret_arn)['username']}),
+        (Step('dashboard_user', lambda: user('CREATE', secret_arn=user_secret_arn, resource_path=user_path), depends_on=['internal_users']),
+         content_hash(load_content(user_path), secret_version(user_secret_arn)),
+         {'type': 'internalusers', 'id': get_secret(user_secret_arn)['username']}),
+        # create the opensearch dashboards saved objects
+        (Step('data_skew_dashboard', lambda: dashboard(data_skew_path)),
+         content_hash(load_content(data_skew_path)),
+         {'type': 'saved_objects'}),
+        (Step('ingestion_latency_dashboard', lambda: dashboard(ingestion_latency_path)),
+         content_hash(load_content(ingestion_latency_path)),
+         {'type': 'saved_objects'}),
+        # create the ingest latency pipeline even when it's disabled, indices created while it was enabled keep it as
+        # their default pipeline and their indexing fails when it's missing
+        (Step('ingest_latency_pipeline', lambda: ingest_pipeline(ingest_latency_pipeline, 'CREATE', resource_path=ingest_latency_pipeline_path)),
+         content_hash(load_content(ingest_latency_pipeline_path)),
+         {'type': 'ingest_pipeline', 'id': ingest_latency_pipeline}),
+    ]
+    for prefix, name_prefix in tenant_groups(tenants):
+        # create the index templates for spark logs, task metrics, stage agg metrics and job and application summaries
+        for name, path in templates:
+            settings = index_settings.get(name, {})
+            if ingest_latency:
+                settings = dict(settings, default_pipeline=ingest_latency_pipeline)
+            template_name = f'{name_prefix}{name}'
+            resources.append((Step(f'{template_name}_template', lambda name=template_name, path=path, settings=settings, prefix=prefix:
+                                   index_template(name, 'CREATE', resource_path=path, settings=settings, prefix=prefix),
+                                   depends_on=['ingest_latency_pipeline']),
+                              content_hash(load_content(path), json.dumps(settings, sort_keys=True)),
+                              {'type': 'index_template', 'id': template_name}))
+        # create the lifecycle policies, then the rollover aliases so their first index is managed by the policy
+        for alias, timestamp_field in rollover_indices:
+            alias = f'{prefix}{alias}'
+            name = lifecycle_policy_name(alias)
+            policy = Template(load_content(lifecycle_policy_path)).render(
+                alias=alias,
+                timestamp_field=timestamp_field,
+                rollover_size=lifecycle['RolloverSize'],
+                rollover_age=lifecycle['RolloverAge'],
+                merge_segments=lifecycle['MergeSegments'],
+                warm_age=lifecycle.get('WarmAge'),
+                cold_age=lifecycle.get('ColdAge'),
+                delete_age=lifecycle['DeleteAge'])
+            resources.append((Step(name, lambda name=name, policy=policy: lifecycle_policy(name, json.loads(policy))),
+                              content_hash(policy),
+                              {'type': 'ism_policy', 'id': name}))
+            resources.append((Step(f"{alias.replace('-', '_')}_write_index", lambda alias=alias: write_index(alias),
+                                   depends_on=[name, f"{alias.replace('-', '_')}_template"]),
+                              content_hash(alias),
+                              # the indices are kept when the alias is removed from the bootstrap
+                              {'type': 'write_index', 'id': alias}))
+    return resources
+
+def apply_changes(previous: dict, lifecycle: dict, index_settings: dict, tenants: list = (), ingest_latency: bool = False):
+    """
+    Applies the bootstrap resources whose hash changed since the previous manifest and deletes the removed ones.
+    Steps only wait for the changed steps they depend on, the others run concurrently.
+    Returns the saved objects of the dashboards and the latency of each step.
+    """
+    resources = bootstrap_resources(lifecycle, index_settings, tenants, ingest_latency)
+    # create the shared session and signer before the steps use them from the thread pool
+    session()
+    awsauth()
+    changed = [(step, digest, target) for step, digest, target in resources
+               if previous.get(step.name, {}).get('hash') != digest]
+    changed_names = {step.name for step, _, _ in changed}
+    logger.info(f'Changed bootstrap resources: {sorted(changed_names)}')
+
+    steps = [Step(step.name, step.function, depends_on=[d for d in step.depends_on if d in changed_names], retries=step.retries)
+             for step, _, _ in changed]
+    results, latencies = run_steps(steps, max_workers=max_workers)
+
+    manifest = {}
+    for step, digest, target in resources:
+        if step.name in results:
+            if target['type'] == 'saved_objects':
+                target['objects'] = results[step.name]
+                # delete the saved objects removed from the dashboards file
+                kept = {(r['type'], r['id']) for r in target['objects']}
+                removed = [r for r in previous.get(step.name, {}).get('target', {}).get('objects', [])
+                           if (r['type'], r['id']) not in kept]
+                delete_target({'type': 'saved_objects', 'objects': removed})
+            manifest[step.name] = {'hash': digest, 'target': target}
+        else:
+            manifest[step.name] = previous[step.name]
+
+    for name in previous.keys() - manifest.keys():
+        delete_target(previous[name]['target'])
+
+    if manifest != previous:
+        write_manifest(manifest)
+    dashboards = [o for entry in manifest.values() if entry['target']['type'] == 'saved_objects' for o in entry['target']['objects']]
+    return dashboards, latencies
+
+
+def on_create(event: json):
+    props = event["ResourceProperties"]
+    logger.info("create new resource with props %s" % props)
+
+    # apply all the resources, even if a manifest remains from a previous deployment
+    resources, latencies = apply_changes({}, props['IndexLifecycle'], props['IndexSettings'], props.get('Tenants', []),
+                                         props.get('IngestLatency') == 'true')
+    logger.info(f'Bootstrap steps latency in ms: {latencies}')
+
     return {    
         'Data': {
-            'Resources': resources
+            'Resources': resources,
+            'StepLatencies': latencies
         }
     }
 
@@ -250,7 +558,18 @@ def on_update(event: json):
     physical_id = event["PhysicalResourceId"]
     props = event["ResourceProperties"]
     logger.info("update resource %s with props %s" % (physical_id, props))
-    return on_create(event)
+
+    # only apply the resources changed since the last bootstrap
+    resources, latencies = apply_changes(read_manifest(), props['IndexLifecycle'], props['IndexSettings'], props.get('Tenants', []),
+                                         props.get('IngestLatency') == 'true')
+    logger.info(f'Bootstrap steps latency in ms: {latencies}')
+
+    return {
+        'Data': {
+            'Resources': resources,
+            'StepLatencies': latencies
+        }
+    }
 
 
 def on_delete(event: json):
@@ -275,17 +594,36 @@ def on_delete(event: json):
     # delete the readonly user for dashboard
     user('DELETE', secret_arn=user_secret_arn)
 
-    # delete index template for spark logs
-    index_template('spark_logs', 'DELETE')
+    for _, name_prefix in tenant_groups(event["ResourceProperties"].get('Tenants', [])):
+        # delete index template for spark logs
+        index_template(f'{name_prefix}spark_logs', 'DELETE')
+
+        # delete the index template for spark task metrics
+        index_template(f'{name_prefix}spark_task_metrics', 'DELETE')
 
-    # delete the index template for spark task metrics
-    index_template('spark_task_metrics', 'DELETE')
+        # delete the index template for spark stage agg metrics
+        index_template(f'{name_prefix}spark_stage_agg_metrics', 'DELETE')
 
-    # delete the index template for spark stage agg metrics
-    index_template('spark_stage_agg_metrics', 'DELETE')
+        # delete the index template for spark job and application summaries
+        index_template(f'{name_prefix}spark_app_summary', 'DELETE')
 
-    # delete the data skew dashboard
+    # delete the lifecycle policies, the rolled over indices are kept
+    for prefix, _ in tenant_groups(event["ResourceProperties"].get('Tenants', [])):
+        for alias, _ in rollover_indices:
+            delete_target({'type': 'ism_policy', 'id': lifecycle_policy_name(f'{prefix}{alias}')})
+
+    # delete the ingest pipeline after the index templates using it
+    ingest_pipeline(ingest_latency_pipeline, 'DELETE')
+
+    # delete the dashboards, using the saved objects from the bootstrap manifest
     logger.info(f'Deleting saved objects')
-    resources = event['Data']['Resources']
-    for r in resources:
-        response = saved_objects(name='nested', action='DELETE', type=r['type'], id=r['id'])
\ No newline at end of file
+    manifest = read_manifest()
+    for name in ('data_skew_dashboard', 'ingestion_latency_dashboard'):
+        resources = manifest.get(name, {}).get('target', {}).get('objects', [])
+        for r in resources:
+            response = saved_objects(name='nested', action='DELETE', type=r['type'], id=r['id'])
+
+    # delete the bootstrap manifest
+    response = send_to_os('DELETE', manifest_path.split('/')[0])
+    if not response.ok and response.status_code != 404:
+        raise Exception(f'Error {response.status_code} in deleting the bootstrap manifest: {response.text}')
\ No newline at end of file
@@ -0,0 +1,87 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+logger = logging.getLogger()
+
+
+@dataclass
+class Step:
+    """
+    A bootstrap step: a function to run once all the steps it depends on have succeeded.
+    """
+    name: str
+    function: Callable[[], Any]
+    depends_on: Sequence[str] = field(default_factory=tuple)
+    retries: int = 2
+
+
+def run_step(step: Step, backoff: float) -> Tuple[Any, float]:
+    """
+    Runs a step and retries it with an exponential backoff when it fails.
+    Returns the result of the step and its duration in milliseconds, including retries.
+    """
+    start = time.perf_counter()
+    for attempt in range(step.retries + 1):
+        try:
+            result = step.function()
+            duration = (time.perf_counter() - start) * 1000
+            logger.info(f'Step {step.name} succeeded in {duration:.0f} ms after {attempt + 1} attempt(s)')
+            return result, duration
+        except Exception as e:
+            if attempt == step.retries:
+                raise
+            logger.warning(f'Step {step.name} failed on attempt {attempt + 1}, retrying: {e}')
+            time.sleep(backoff * 2 ** attempt)
+
+
+def run_steps(steps: Sequence[Step], max_workers: int, backoff: float = 1.0) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """
+    Runs steps on a thread pool, starting each step as soon as the steps it depends on have succeeded.
+    Steps without dependencies between them run concurrently.
+    If a step fails after its retries, no new step is started and the error is raised once the running steps are done.
+    Returns the result and the duration in milliseconds of each step, by step name.
+    """
+    by_name = {step.name: step for step in steps}
+    for step in steps:
+        unknown = [d for d in step.depends_on if d not in by_name]
+        if unknown:
+            raise Exception(f'Step {step.name} depends on unknown steps {unknown}')
+
+    results = {}
+    durations = {}
+    pending = list(steps)
+    running = {}
+    error = None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            if error is None:
+                ready = [s for s in pending if all(d in results for d in s.depends_on)]
+                for step in ready:
+                    pending.remove(step)
+                    running[executor.submit(run_step, step, backoff)] = step
+
+            if not running:
+                if error is None:
+                    raise Exception(f'Steps {[s.name for s in pending]} have circular dependencies')
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    results[step.name], duration = future.result()
+                    durations[step.name] = round(duration)
+                except Exception as e:
+                    logger.error(f'Step {step.name} failed: {e}')
+                    error = error or e
+
+    if error is not None:
+        raise error
+    return results, durations
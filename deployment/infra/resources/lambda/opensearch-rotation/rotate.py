@@ -1,44 +1,50 @@
 # Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-import boto3
+from functools import lru_cache
 import logging
 import os
-from requests_aws4auth import AWS4Auth
-import requests
-from opensearchpy import AWSV4SignerAuth
-from botocore.exceptions import ClientError
 import base64
 import json
 
-
+# Third party modules and AWS clients are only loaded when a request needs them to keep the cold start short
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-host = os.environ['DOMAIN_ENDPOINT']
-domain_name = os.environ['DOMAIN_NAME']
-region = os.environ['AWS_REGION']
-credentials = boto3.Session().get_credentials()
-auth = AWSV4SignerAuth(credentials, region)
 
-session = requests.Session()
-ssm_client = boto3.client('secretsmanager', endpoint_url=os.environ['SECRETS_MANAGER_ENDPOINT'])
-os_client = boto3.client('opensearch')
-awsauth = AWS4Auth(credentials.access_key,
-                credentials.secret_key,
-                region,
-                'es',
-                session_token=credentials.token)
 
+@lru_cache(maxsize=None)
+def session():
+    """
+    The HTTP session used to send requests to the Opensearch domain.
+    """
+    import requests
+    return requests.Session()
+
+@lru_cache(maxsize=None)
+def awsauth():
+    """
+    The SigV4 signer of the requests sent to the Opensearch domain.
+    """
+    from opensearch_auth import OpensearchAuth
+    return OpensearchAuth(os.environ['AWS_REGION'])
+
+@lru_cache(maxsize=None)
+def secrets_client():
+    """
+    The Secrets Manager client, using the VPC endpoint if one is configured.
+    """
+    import boto3
+    return boto3.client('secretsmanager', endpoint_url=os.environ.get('SECRETS_MANAGER_ENDPOINT'))
 
 
 def get_secret(secret_arn: str):
-    ssm_client = boto3.client('secretsmanager', endpoint_url=os.environ['SECRETS_MANAGER_ENDPOINT'])
     """
     Retrieves the secret value from Secrets Manager.
     """
+    from botocore.exceptions import ClientError
     try:
-        response = ssm_client.get_secret_value(SecretId=secret_arn)
+        response = secrets_client().get_secret_value(SecretId=secret_arn)
     except ClientError as e:
         logger.error(f"Failed to get secret: {e}")
         raise e
@@ -52,20 +58,20 @@ def get_secret(secret_arn: str):
 
 def send_to_os(action: str, path: str, payload: str = None, headers: dict = None):
     """
-    Sends a request to OpenSearch service with AWS4Auth.
+    Sends a request to OpenSearch service, signed with SigV4 by the botocore based OpensearchAuth.
     """
-    url = f"https://{host}/{path}"
+    url = f"https://{os.environ['DOMAIN_ENDPOINT']}/{path}"
 
     if action == 'PUT':
-        r = session.put(url, auth=awsauth, json=payload, headers=headers)
+        r = session().put(url, auth=awsauth(), json=payload, headers=headers)
     elif action == 'DELETE':
-        r = session.delete(url, auth=awsauth, headers=headers)
+        r = session().delete(url, auth=awsauth(), headers=headers)
     elif action == 'POST':
-        r = session.post(url, auth=awsauth, json=payload, headers=headers)
+        r = session().post(url, auth=awsauth(), json=payload, headers=headers)
     elif action == 'POST_FILE':
-        r = session.post(url, auth=awsauth, files={'file': payload}, headers=headers)
+        r = session().post(url, auth=awsauth(), files={'file': payload}, headers=headers)
     elif action == 'PATCH':
-        r = session.patch(url, auth=awsauth, json=payload, headers=headers)
+        r = session().patch(url, auth=awsauth(), json=payload, headers=headers)
     else:
         raise Exception('HTTP action not supported')
     logger.info(r.text)
@@ -96,6 +102,7 @@ def lambda_handler(event, context):
     arn = event['SecretId']
     token = event['ClientRequestToken']
     step = event['Step']
+    ssm_client = secrets_client()
 
     # Make sure the version is staged correctly
     metadata = ssm_client.describe_secret(SecretId=arn)
@@ -164,7 +171,7 @@ def create_secret(ssm_client, arn, token):
         logger.info("createSecret: Successfully put secret for ARN %s and version %s." % (arn, token))
 
     
-def set_secret(arn, token):
+def set_secret(ssm_client, arn, token):
     """Set the secret
 
     This method should set the AWSPENDING secret in the service that the secret belongs to. For example, if the secret is a database
@@ -186,7 +193,7 @@ def set_secret(arn, token):
         raise Exception(f'Error {response.status_code} in rotation {secret["username"]} password: {response.text}')
     
 
-def test_secret(arn, token):
+def test_secret(ssm_client, arn, token):
     """Test the secret
 
     This method should validate that the AWSPENDING secret works in the service that the secret belongs to. For example, if the secret
@@ -207,7 +214,7 @@ def test_secret(arn, token):
     logger.info("No test secret to run for " % arn)
 
 
-def finish_secret(arn, token):
+def finish_secret(ssm_client, arn, token):
     """Finish the secret
 
     This method finalizes the rotation process by marking the secret version passed in as the AWSCURRENT secret.
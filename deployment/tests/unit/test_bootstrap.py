@@ -0,0 +1,164 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('jinja2')
+pytest.importorskip('botocore')
+
+BOOTSTRAP_DIR = Path(__file__).parents[2].joinpath('infra/resources/lambda/opensearch-bootstrap')
+for name, value in {'DOMAIN_ENDPOINT': 'domain.example.com', 'DOMAIN_NAME': 'domain', 'AWS_REGION': 'us-east-1',
+                    'USER_SECRET_ARN': 'user-secret', 'ADMIN_SECRET_ARN': 'admin-secret',
+                    'PIPELINE_ROLE_ARN': 'arn:aws:iam::123456789012:role/pipeline',
+                    'LAMBDA_TASK_ROOT': str(BOOTSTRAP_DIR)}.items():
+    os.environ.setdefault(name, value)
+sys.path.append(str(BOOTSTRAP_DIR))
+
+import bootstrap
+
+PROPERTIES = {'IndexLifecycle': {'RolloverSize': '30gb', 'RolloverAge': '1d', 'MergeSegments': 1, 'DeleteAge': '30d'},
+              'IndexSettings': {}}
+
+
+class FakeResponse:
+
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.body = body if body is not None else {}
+        self.text = json.dumps(self.body)
+
+    def json(self):
+        return self.body
+
+
+class FakeDomain:
+    """
+    Records the requests of the bootstrap and keeps the manifest document.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.payloads = {}
+        self.manifest = None
+
+    def send_to_os(self, action, path, payload=None, headers=None):
+        self.requests.append((action, path))
+        if action == 'PUT':
+            self.payloads[path] = payload
+        if path == bootstrap.manifest_path:
+            if action == 'PUT':
+                self.manifest = json.loads(json.dumps(payload))
+            elif self.manifest is None:
+                return FakeResponse(404)
+            else:
+                return FakeResponse(200, {'_source': self.manifest})
+        elif action == 'GET':
+            return FakeResponse(404)
+        elif action == 'POST_FILE':
+            objects = [json.loads(line) for line in payload.read().splitlines()]
+            payload.close()
+            return FakeResponse(200, {'successResults': [{'type': o['type'], 'id': o['id'], 'meta': {}, 'overwrite': True}
+                                                         for o in objects if 'type' in o]})
+        return FakeResponse()
+
+
+class FakeSecrets:
+
+    def __init__(self):
+        self.calls = []
+        self.version = 'v1'
+
+    def get_secret_value(self, SecretId):
+        self.calls.append(('get_secret_value', SecretId))
+        return {'SecretString': json.dumps({'username': SecretId.split('-')[0], 'password': 'secret'}),
+                'VersionId': self.version}
+
+    def describe_secret(self, SecretId):
+        self.calls.append(('describe_secret', SecretId))
+        return {'VersionIdsToStages': {'v0': ['AWSPREVIOUS'], self.version: ['AWSCURRENT']}}
+
+
+class FakeDomainConfig:
+
+    def update_domain_config(self, **kwargs):
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+
+@pytest.fixture
+def domain(monkeypatch):
+    domain = FakeDomain()
+    secrets = FakeSecrets()
+    monkeypatch.setattr(bootstrap, 'send_to_os', domain.send_to_os)
+    monkeypatch.setattr(bootstrap, 'ssm_client', lambda: secrets)
+    monkeypatch.setattr(bootstrap, 'os_client', lambda: FakeDomainConfig())
+    monkeypatch.setattr(bootstrap, 'session', lambda: None)
+    monkeypatch.setattr(bootstrap, 'awsauth', lambda: None)
+    domain.secrets = secrets
+    return domain
+
+
+def invoke(request_type, **properties):
+    return bootstrap.on_event({'RequestType': request_type, 'PhysicalResourceId': 'bootstrap',
+                               'ResourceProperties': dict(PROPERTIES, **properties)}, None)
+
+
+def test_unchanged_update_only_reads_the_manifest(domain):
+    invoke('Create')
+    assert ('PUT', '_index_template/spark_logs') in domain.requests
+    assert set(domain.manifest['resources']) == {step.name for step, _, _ in bootstrap.bootstrap_resources(
+        PROPERTIES['IndexLifecycle'], PROPERTIES['IndexSettings'])}
+
+    domain.requests.clear()
+    domain.secrets.calls.clear()
+    response = invoke('Update')
+    assert domain.requests == [('GET', bootstrap.manifest_path)]
+    # each secret is read once for the user name and described once for its version
+    assert sorted(domain.secrets.calls) == [('describe_secret', 'admin-secret'), ('describe_secret', 'user-secret'),
+                                            ('get_secret_value', 'admin-secret'), ('get_secret_value', 'user-secret')]
+    assert {o['id'] for o in response['Data']['Resources']} >= {'0aca6e20-897d-11ee-b2b4-2901cdfd50fd'}
+
+
+def test_update_applies_the_changed_resources_and_deletes_the_removed_ones(domain):
+    invoke('Create')
+    resources = domain.manifest['resources']
+    resources['spark_logs_template']['hash'] = 'outdated'
+    resources['old_template'] = {'hash': 'x', 'target': {'type': 'index_template', 'id': 'old'}}
+    resources['data_skew_dashboard']['hash'] = 'outdated'
+    resources['data_skew_dashboard']['target']['objects'].append({'type': 'visualization', 'id': 'removed'})
+
+    domain.requests.clear()
+    invoke('Update')
+    assert ('PUT', '_index_template/spark_logs') in domain.requests
+    assert ('PUT', '_index_template/spark_task_metrics') not in domain.requests
+    assert ('DELETE', '_index_template/old') in domain.requests
+    assert ('DELETE', '_dashboards/api/saved_objects/visualization/removed') in domain.requests
+    assert ('DELETE', '_dashboards/api/saved_objects/dashboard/0aca6e20-897d-11ee-b2b4-2901cdfd50fd') not in domain.requests
+    assert 'old_template' not in domain.manifest['resources']
+    assert domain.manifest['resources']['spark_logs_template']['hash'] != 'outdated'
+
+
+def test_password_rotations_update_the_users(domain):
+    invoke('Create')
+    domain.requests.clear()
+    domain.secrets.version = 'v2'
+    invoke('Update')
+    assert ('PUT', '_plugins/_security/api/internalusers/admin') in domain.requests
+    assert ('PUT', '_plugins/_security/api/internalusers/user') in domain.requests
+    assert ('PUT', '_index_template/spark_logs') not in domain.requests
+
+
+def test_ingest_latency_pipeline_is_the_default_pipeline_when_enabled(domain):
+    invoke('Create')
+    assert ('PUT', '_ingest/pipeline/spark_ingest_latency') in domain.requests
+    assert 'default_pipeline' not in domain.payloads['_index_template/spark_task_metrics']['template']['settings']['index']
+
+    domain.requests.clear()
+    invoke('Update', IngestLatency='true')
+    index_settings = domain.payloads['_index_template/spark_task_metrics']['template']['settings']['index']
+    assert index_settings['default_pipeline'] == 'spark_ingest_latency'
+    # the pipeline is unchanged and kept for the indices created while it was enabled
+    assert ('PUT', '_ingest/pipeline/spark_ingest_latency') not in domain.requests
+    assert ('DELETE', '_ingest/pipeline/spark_ingest_latency') not in domain.requests
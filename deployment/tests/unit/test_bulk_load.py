@@ -0,0 +1,83 @@
+import gzip
+import json
+
+from tools.bulk_load import BulkLoader, RefreshSettings, read_documents
+from tools.checkpoint import Checkpoint
+from tools.opensearch_client import BatchSizer
+
+
+class FakeResponse:
+
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.body = body or {}
+        self.text = json.dumps(self.body)
+
+    def json(self):
+        return self.body
+
+
+class FakeClient:
+    """
+    Throttles the first bulk request and rejects the documents with a rejected field.
+    """
+
+    def __init__(self):
+        self.documents = []
+        self.settings = {'spark-logs-000001': {'settings': {'index': {'refresh_interval': '5s'}}}}
+        self.puts = []
+
+    def bulk(self, items, on_throttled=None):
+        if not self.documents and on_throttled:
+            on_throttled()
+        self.documents.extend(items)
+        return [(item, {'type': 'mapper_parsing_exception'}) for item in items if item[1].get('rejected')]
+
+    def request(self, method, path, body=None):
+        if method == 'GET':
+            return FakeResponse(200, self.settings) if 'spark-logs' in path else FakeResponse(404)
+        if method == 'PUT':
+            self.puts.append((path, body['index']['refresh_interval']))
+        return FakeResponse()
+
+
+LOG = {'logTime': 1700000000000, 'level': {'name': 'warn'}, 'message': 'Lost task',
+       'taskName': 'task 3.0 in stage 2.0 (TID 17)', 'threadId': 42, 'loggerFqcn': 'org.apache.logging'}
+TASK = {'metricsType': 'taskMetrics', 'metricTime': 1700000000000, 'appId': 'application_1_0001'}
+STAGE = {'metricsType': 'stageAggMetrics', 'metricTime': 1700000000000, 'appId': 'application_1_0001'}
+
+
+def test_ndjson_json_and_bulk_files_are_read(tmp_path):
+    with gzip.open(tmp_path / 'metrics.ndjson.gz', 'wt') as file_:
+        file_.write(json.dumps(TASK) + '\n' + json.dumps([STAGE, STAGE]) + '\n')
+    (tmp_path / 'logs.json').write_text(json.dumps([LOG]))
+    (tmp_path / 'backfill.ndjson').write_text(
+        json.dumps({'index': {'_index': 'teama-spark-task-metrics', '_id': 'x'}}) + '\n' + json.dumps(TASK) + '\n')
+
+    assert len(list(read_documents(str(tmp_path / 'metrics.ndjson.gz')))) == 3
+    assert list(read_documents(str(tmp_path / 'logs.json'))) == [(None, LOG)]
+    assert list(read_documents(str(tmp_path / 'backfill.ndjson'))) == \
+        [({'_index': 'teama-spark-task-metrics', '_id': 'x'}, TASK)]
+
+
+def test_load_adapts_the_bulk_size_and_resumes(tmp_path):
+    lines = [dict(TASK, taskId=str(i)) for i in range(50)] + [dict(TASK, rejected=True)] + [dict(LOG)]
+    (tmp_path / 'docs.ndjson').write_text(''.join(json.dumps(line) + '\n' for line in lines))
+    path = str(tmp_path / 'docs.ndjson')
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.json'))
+    checkpoint.advance(path, 10)
+    client = FakeClient()
+    sizer = BatchSizer(1, 0.001, 2)
+    loader = BulkLoader(client, checkpoint, workers=3, sizer=sizer, index_prefix='teama-',
+                        refresh=RefreshSettings(client, checkpoint), rejects=str(tmp_path / 'rejects.ndjson'))
+
+    totals = loader.run([str(tmp_path)])
+    assert totals['indexed'] == 41 and totals['rejected'] == 1 and totals['throttled'] == 1
+    assert sum(stats['indexed'] for stats in loader.writer.worker_stats.values()) == 41
+    assert sorted(int(item[1]['taskId']) for item in client.documents if 'metricsType' in item[1] and 'rejected' not in item[1])[:2] == [10, 11]
+    assert {item[0]['index']['_index'] for item in client.documents} == {'teama-spark-task-metrics', 'teama-spark-logs'}
+    assert client.puts == [('teama-spark-logs/_settings', '-1'), ('spark-logs-000001/_settings', '5s')]
+    assert Checkpoint(str(tmp_path / 'checkpoint.json')).is_done(path)
+    assert checkpoint.get('refresh') == {}
+    assert len((tmp_path / 'rejects.ndjson').read_text().splitlines()) == 1
@@ -0,0 +1,53 @@
+import pytest
+
+from infra.capacity_planner import SizingInputs, main, plan_capacity
+from infra.cluster_sizing import PRESETS, CapacityPlan, TshirtSize
+
+
+def test_small_workload_fits_a_single_az_domain():
+    plan = plan_capacity(SizingInputs({'logs': 2, 'task_metrics': 0.5}, az_count=1, peak_docs_per_sec=500,
+                                      query_concurrency=2))
+    assert plan.data_node_type == 't3.small.search'
+    assert plan.master_node_count == 0
+    assert plan.warm_node_count == 0
+    assert plan.index_lifecycle.delete_age == '7d'
+
+
+def test_warm_and_cold_tiers_require_dedicated_masters():
+    plan = plan_capacity(SizingInputs({'logs': 300, 'task_metrics': 80, 'stage_agg_metrics': 5},
+                                      hot_days=7, warm_days=30, cold_days=90, peak_docs_per_sec=40000))
+    assert plan.data_node_count % 3 == 0
+    assert plan.master_node_count == 3
+    assert plan.warm_node_count >= 2
+    assert (plan.index_lifecycle.warm_age, plan.index_lifecycle.cold_age, plan.index_lifecycle.delete_age) == \
+           ('7d', '37d', '127d')
+    assert plan.logs_pipeline_units[0] <= plan.logs_pipeline_units[1]
+    assert len(plan.explanation) > 0
+
+
+def test_indexing_rate_drives_the_node_count():
+    inputs = dict(daily_ingest_gb={'logs': 100}, hot_days=3)
+    low = plan_capacity(SizingInputs(peak_docs_per_sec=5000, **inputs))
+    high = plan_capacity(SizingInputs(peak_docs_per_sec=200000, **inputs))
+    assert high.data_node_count > low.data_node_count
+
+
+def test_cold_tier_requires_warm_tier():
+    with pytest.raises(Exception):
+        SizingInputs({'logs': 10}, cold_days=30)
+
+
+def test_plan_round_trips_through_the_context():
+    for plan in [PRESETS[TshirtSize.XL],
+                 plan_capacity(SizingInputs({'logs': 500}, warm_days=10, peak_docs_per_sec=300000))]:
+        context = {k: str(v) for k, v in plan.to_context().items()}
+        loaded = CapacityPlan.from_context(context.get)
+        assert loaded.to_context() == CapacityPlan.from_context(plan.to_context().get).to_context()
+        assert loaded.data_node_count == plan.data_node_count
+        assert loaded.index_lifecycle == plan.index_lifecycle
+        assert loaded.ebs_throughput == plan.ebs_throughput
+
+
+def test_cli_prints_the_preset_context(capsys):
+    main(['--preset', 'L'])
+    assert '-c DataNodeType=r6g.4xlarge.search -c DataNodeCount=3' in capsys.readouterr().out
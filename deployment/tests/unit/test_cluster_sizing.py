@@ -0,0 +1,22 @@
+from infra.cluster_sizing import ClusterConfig, TshirtSize
+
+
+def test_shards_are_spread_across_data_nodes():
+    settings = ClusterConfig(TshirtSize.XL).index_settings()
+    for name in ('spark_logs', 'spark_task_metrics', 'spark_stage_agg_metrics'):
+        assert int(settings[name]['number_of_shards']) % 12 == 0
+    assert settings['spark_app_summary']['number_of_shards'] == '1'
+    assert settings['spark_logs']['number_of_replicas'] == '2'
+
+
+def test_shards_follow_the_ingest_rate():
+    low = ClusterConfig(TshirtSize.L, 100).index_settings()['spark_logs']
+    high = ClusterConfig(TshirtSize.L, 3000).index_settings()['spark_logs']
+    assert low['number_of_shards'] == '3'
+    assert high['number_of_shards'] == '42'
+    assert high['translog.durability'] == 'async'
+
+
+def test_single_az_domain_keeps_one_replica():
+    settings = ClusterConfig(TshirtSize.XS).index_settings()
+    assert settings['spark_logs']['number_of_replicas'] == '1'
@@ -0,0 +1,26 @@
+from tools.common import lookup, percentile, prepare
+
+LOG = {'logTime': 1700000000000, 'level': {'name': 'warn'}, 'message': 'Lost task',
+       'taskName': 'task 3.0 in stage 2.0 (TID 17)', 'threadId': 42, 'loggerFqcn': 'org.apache.logging'}
+STAGE = {'metricsType': 'stageAggMetrics', 'metricTime': 1700000000000, 'appId': 'application_1_0001'}
+
+
+def test_documents_are_prepared_like_the_pipelines():
+    log = dict(LOG)
+    assert prepare(log) == 'spark-logs'
+    assert log['level'] == 'WARN' and (log['taskId'], log['stageId']) == ('3.0', '2.0')
+    assert log['@timestamp'] == 1700000000000 and 'threadId' not in log and 'taskName' not in log
+    assert prepare(dict(STAGE)) == 'spark-stage-agg-metrics'
+    assert prepare({'traceId': 'a', 'spanId': 'b'}) == 'otel-v1-apm-span'
+    assert prepare({'metricsType': 'unknown'}) is None
+
+
+def test_fields_are_looked_up_by_path():
+    document = {'message': {'message': 'm'}, 'level': 'INFO'}
+    assert lookup(document, 'message/message') == (document['message'], 'message')
+    assert lookup(document, '/level') == (document, 'level')
+    assert lookup(document, 'level/name') == (None, None)
+
+
+def test_percentiles_are_nearest_ranks():
+    assert percentile([1, 2, 3, 4], 50) == 3 and percentile([1, 2, 3, 4], 99) == 4
@@ -0,0 +1,82 @@
+import io
+import json
+
+import pytest
+
+from tools.checkpoint import Checkpoint
+from tools.dlq_replay import DlqRecord, Fixes, Replay, parse_records
+
+
+class FakeClient:
+    """
+    Indexes the bulk items in memory and rejects the documents with a reject field.
+    """
+
+    def __init__(self):
+        self.indexed = []
+
+    def bulk(self, items, on_throttled=None):
+        rejected = [(item, {'type': 'mapper_parsing_exception', 'status': 400}) for item in items if 'reject' in item[1]]
+        self.indexed.extend(item for item in items if 'reject' not in item[1])
+        return rejected
+
+
+def dlq_entry(index, document, status=400, document_id=None):
+    return {'pluginId': 'opensearch', 'pluginName': 'opensearch', 'pipelineName': 'pipeline',
+            'failedData': {'index': index, 'indexId': document_id, 'status': status, 'message': 'failed',
+                           'document': document}}
+
+
+def test_records_are_parsed_from_arrays_and_lines():
+    array = json.dumps([dlq_entry('spark-logs', {'level': 'INFO'}), dlq_entry('spark-logs', json.dumps({'level': 'WARN'}))])
+    lines = '\n'.join(json.dumps(dlq_entry('spark-task-metrics', {'stageId': i})) for i in range(3))
+
+    assert [r.document['level'] for r in parse_records(io.BytesIO(array.encode()))] == ['INFO', 'WARN']
+    assert [r.document['stageId'] for r in parse_records(io.BytesIO(lines.encode()))] == [0, 1, 2]
+    assert list(parse_records(io.BytesIO(b''))) == []
+
+
+def test_arrays_are_decoded_across_chunks():
+    entries = [dlq_entry('spark-logs', {'message': f'é {i}' * i}) for i in range(20)]
+    body = (' \n' + json.dumps(entries, indent=2)).encode()
+
+    records = parse_records(io.BytesIO(body), chunk_size=16)
+    assert [r.document['message'] for r in records] == [f'é {i}' * i for i in range(20)]
+    with pytest.raises(ValueError):
+        list(parse_records(io.BytesIO(body[:-40]), chunk_size=16))
+
+
+def test_fixes_filter_and_repair_documents():
+    fixes = Fixes(statuses=[400], drop_fields=['message/params'], stringify_fields=['stackTrace'], index='spark-logs-replay')
+    record = DlqRecord('spark-logs', {'message': {'message': 'm', 'params': [1]}, 'stackTrace': {'frames': []}},
+                       document_id='a1', status=400)
+
+    action, document = fixes.apply(record)
+    assert action == {'index': {'_index': 'spark-logs-replay', '_id': 'a1'}}
+    assert document == {'message': {'message': 'm'}, 'stackTrace': '{"frames": []}'}
+    assert fixes.apply(DlqRecord('spark-logs', {}, status=429)) is None
+
+
+def test_replay_resumes_from_the_checkpoint(tmp_path):
+    source = tmp_path / 'dlq'
+    source.mkdir()
+    for i in range(5):
+        entries = [dlq_entry('spark-logs', {'object': i, 'doc': j}) for j in range(3)]
+        if i == 2:
+            entries.append(dlq_entry('spark-logs', {'object': i, 'reject': True}))
+        source.joinpath(f'dlq-{i}').write_text(json.dumps(entries))
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    rejects = tmp_path / 'rejects.ndjson'
+
+    # A previous run replayed the first two objects
+    Checkpoint(checkpoint).complete(str(source / 'dlq-0'))
+    Checkpoint(checkpoint).complete(str(source / 'dlq-1'))
+
+    client = FakeClient()
+    stats = Replay(client, Checkpoint(checkpoint), Fixes(), workers=2, batch_size=2, rejects=str(rejects)).run(str(source))
+
+    assert stats['objects'] == 3
+    assert stats['indexed'] == 9 and stats['rejected'] == 1
+    assert sorted(d['object'] for _, d in client.indexed) == [2, 2, 2, 3, 3, 3, 4, 4, 4]
+    assert json.loads(rejects.read_text())['failedData']['status'] == 400
+    assert all(Checkpoint(checkpoint).is_done(str(source / f'dlq-{i}')) for i in range(5))
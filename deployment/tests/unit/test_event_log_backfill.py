@@ -0,0 +1,105 @@
+import gzip
+import json
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tools.common import stage_aggregation
+from tools.event_log_backfill import EventLogMetrics, list_event_logs, load_event_log, read_events
+
+
+def task_end(stage_id, index, input_bytes, shuffle_bytes, finish=1700000001000):
+    return {'Event': 'SparkListenerTaskEnd', 'Stage ID': stage_id, 'Stage Attempt ID': 0,
+            'Task Info': {'Task ID': 100 * stage_id + index, 'Index': index, 'Attempt': 0, 'Executor ID': '1',
+                          'Partition ID': index, 'Finish Time': finish},
+            'Task Metrics': {'Executor Run Time': 10, 'Executor CPU Time': 10000000,
+                             'Input Metrics': {'Bytes Read': input_bytes, 'Records Read': 1},
+                             'Shuffle Read Metrics': {'Remote Bytes Read': shuffle_bytes, 'Local Bytes Read': 0,
+                                                      'Total Records Read': 1}}}
+
+
+def stage_completed(stage_id, completion=1700000002000):
+    return {'Event': 'SparkListenerStageCompleted',
+            'Stage Info': {'Stage ID': stage_id, 'Stage Attempt ID': 0, 'Completion Time': completion}}
+
+
+EVENTS = [
+    {'Event': 'SparkListenerApplicationStart', 'App Name': 'etl', 'App ID': 'application_1_0001', 'Timestamp': 0},
+    {'Event': 'SparkListenerJobStart', 'Job ID': 3, 'Stage IDs': [0, 1]},
+    task_end(0, 0, 100, 0), task_end(0, 1, 100, 0),
+    task_end(1, 0, 10, 5),
+    task_end(0, 2, 400, 0),
+    stage_completed(0),
+    task_end(1, 1, 30, 5),
+    stage_completed(1),
+]
+
+
+def listener_skew(values):
+    # The Scala implementation of collectStageCustomMetrics
+    mean = sum(values) / len(values)
+    value_range = (max(values) - min(values)) or 1
+    return max(abs(x - mean) / value_range for x in values)
+
+
+def test_stage_aggregation_matches_the_listener():
+    values = np.random.default_rng(7).exponential(1000, size=(500, 2))
+    values[:, 1] = 42
+    skewness, maximum = stage_aggregation(values)
+    assert skewness[0] == pytest.approx(listener_skew(list(values[:, 0])))
+    assert skewness[1] == 0 and maximum[1] == 42
+
+
+def test_documents_are_rebuilt_per_stage_or_like_the_listener_buffer():
+    metrics = EventLogMetrics('stage')
+    documents = [d for event in EVENTS for d in metrics.process(event)]
+    tasks = [d for index, d in documents if index == 'spark-task-metrics']
+    stages = [d for index, d in documents if index == 'spark-stage-agg-metrics']
+    assert len(tasks) == 5 and tasks[0]['taskId'] == '0.0' and tasks[0]['jobId'] == '3'
+    assert tasks[0]['appId'] == 'application_1_0001' and tasks[2]['shuffleBytesRead'] == 5
+    assert stages[0]['inputBytesReadSkewness'] == pytest.approx(listener_skew([100, 100, 400]))
+    assert (stages[0]['maxInputBytesRead'], stages[1]['maxInputBytesRead']) == (400, 30)
+
+    # The listener buffer holds the task of stage 1 ended before stage 0 completed
+    listener = EventLogMetrics('listener')
+    stages = [d for event in EVENTS for index, d in listener.process(event) if index == 'spark-stage-agg-metrics']
+    assert stages[0]['inputBytesReadSkewness'] == pytest.approx(listener_skew([100, 100, 10, 400]))
+    assert stages[1]['maxInputBytesRead'] == 30
+
+
+def test_compressed_and_rolling_event_logs_are_streamed(tmp_path):
+    zstd = pytest.importorskip('zstandard')
+    lines = [json.dumps(event) + '\n' for event in EVENTS]
+    with gzip.open(tmp_path / 'application_1_0001.gz', 'wt') as file_:
+        file_.writelines(lines)
+    rolling = tmp_path / 'eventlog_v2_application_1_0002'
+    rolling.mkdir()
+    # Rolled files in the wrong lexical order, each with several zstd frames like the Spark codec flushes
+    for index, part in ((10, lines[5:]), (2, lines[:5])):
+        frames = b''.join(zstd.ZstdCompressor().compress(line.encode()) for line in part)
+        rolling.joinpath(f'events_{index}_application_1_0002.zstd').write_bytes(frames)
+    rolling.joinpath('appstatus_application_1_0002').write_text('')
+
+    logs = list_event_logs(str(tmp_path))
+    assert [len(paths) for _, paths in logs] == [1, 2]
+    for _, paths in logs:
+        assert [event['Event'] for event in read_events(paths)] == [event['Event'] for event in EVENTS]
+
+
+def test_indexed_applications_are_skipped_without_documents(tmp_path):
+    path = tmp_path / 'application_1_0001'
+    path.write_text(''.join(json.dumps(event) + '\n' for event in EVENTS))
+    sent, checked = [], []
+
+    def is_indexed(app_id):
+        checked.append(app_id)
+        return True
+
+    assert not load_event_log([str(path)], EventLogMetrics('stage'), sent.append, 'teama-', is_indexed)
+    assert checked == ['application_1_0001'] and sent == []
+
+    assert load_event_log([str(path)], EventLogMetrics('stage'), sent.append, 'teama-')
+    assert {action['index']['_index'] for action, _ in sent} == {'teama-spark-task-metrics', 'teama-spark-stage-agg-metrics'}
+    # 5 tasks and 2 stages
+    assert len(sent) == 7
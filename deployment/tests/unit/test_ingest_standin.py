@@ -0,0 +1,85 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+requests = pytest.importorskip('requests')
+pytest.importorskip('botocore')
+
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+
+from tools.ingest_standin import IngestServer, NdjsonSink, Pipeline, SigV4Verifier, compile_condition
+
+TASK = {'metricsType': 'taskMetrics', 'metricTime': 1700000000000, 'appId': 'application_1_0001'}
+SUMMARY = {'metricsType': 'summaryMetrics', 'metricTime': 1700000000000, 'appId': 'application_1_0001'}
+
+
+def test_routes_are_read_from_the_pipeline_configurations():
+    metrics = Pipeline.load('metrics-pipeline.yaml', 'teama-')
+    assert metrics.path == '/ingest'
+    assert metrics.route(dict(TASK)) == ['teama-spark-task-metrics']
+    assert metrics.route({'metricsType': 'unknown'}) == []
+    assert Pipeline.load('logs-pipeline.yaml').route({'logTime': 0}) == ['spark-logs']
+
+    condition = compile_condition('/metricsType == "taskMetrics" and /stage/id != 2 or /level == "ERROR"')
+    assert condition({'metricsType': 'taskMetrics', 'stage': {'id': 1}}) and condition({'level': 'ERROR'})
+    assert not condition({'metricsType': 'taskMetrics', 'stage': {'id': 2}})
+    with pytest.raises(ValueError):
+        compile_condition('length(/message) > 10')
+
+
+def test_sigv4_signatures_are_verified(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'AKIDEXAMPLE')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'secret')
+    verifier = SigV4Verifier('us-east-1')
+    body = json.dumps([TASK]).encode()
+
+    def signed(key, secret, service='osis'):
+        request = AWSRequest(method='POST', url='http://localhost:2021/ingest', data=body,
+                             headers={'Content-Type': 'application/json'})
+        SigV4Auth(Credentials(key, secret), service, 'us-east-1').add_auth(request)
+        return dict({k.lower(): v for k, v in request.headers.items()}, host='localhost:2021')
+
+    assert verifier.verify('POST', '/ingest', signed('AKIDEXAMPLE', 'secret'), body) is None
+    assert 'match' in verifier.verify('POST', '/ingest', signed('AKIDEXAMPLE', 'other'), body)
+    assert 'match' in verifier.verify('POST', '/ingest', signed('AKIDEXAMPLE', 'secret'), body + b' ')
+    assert 'scope' in verifier.verify('POST', '/ingest', signed('AKIDEXAMPLE', 'secret', 'es'), body)
+    assert 'Authorization' in verifier.verify('POST', '/ingest', {'host': 'localhost:2021'}, body)
+    # Other credentials can't be verified, only their headers are checked
+    assert verifier.verify('POST', '/ingest', signed('AKIDOTHER', 'secret'), body) is None
+    assert verifier.unverified == 1
+
+
+def test_documents_are_routed_to_ndjson_files_and_throttled(tmp_path):
+
+    async def run():
+        server = IngestServer(Pipeline.load('metrics-pipeline.yaml'), NdjsonSink(str(tmp_path)))
+        http = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        url = f'http://127.0.0.1:{http.sockets[0].getsockname()[1]}'
+        session = requests.Session()
+
+        def post(path, body, **headers):
+            return session.post(url + path, data=body, headers=headers).status_code
+
+        statuses = [
+            await asyncio.to_thread(post, '/ingest', json.dumps([TASK, TASK, SUMMARY])),
+            await asyncio.to_thread(post, '/ingest', gzip.compress(json.dumps([TASK]).encode()), **{'Content-Encoding': 'gzip'}),
+            await asyncio.to_thread(post, '/ingest', json.dumps(TASK)),
+            await asyncio.to_thread(post, '/other', '[]'),
+        ]
+        server.throttle_rate = 1
+        statuses.append(await asyncio.to_thread(post, '/ingest', json.dumps([TASK])))
+        http.close()
+        await server.sink.close()
+        return server.stats, statuses
+
+    stats, statuses = asyncio.run(run())
+    assert statuses == [200, 200, 400, 404, 429]
+    assert stats.total['documents'] == 4 and stats.total['throttled'] == 1 and stats.total['errors'] == 2
+    tasks = [json.loads(line) for line in (tmp_path / 'spark-task-metrics.ndjson').read_text().splitlines()]
+    assert len(tasks) == 3 and tasks[0]['@timestamp'] == 1700000000000
+    assert len((tmp_path / 'spark-app-summary.ndjson').read_text().splitlines()) == 1
+    assert sum(stats.histogram) == 5
@@ -0,0 +1,25 @@
+import pytest
+
+from infra.ingestion_layout import IngestionLayout
+
+
+def test_default_layout_keeps_the_single_pipelines():
+    layout = IngestionLayout.from_context(None)
+    assert [p.name for p in layout.pipelines()] == ['spark-obs-logs', 'spark-obs-metrics']
+    assert [p.construct_id for p in layout.pipelines()] == ['LogsPipeline', 'MetricsPipeline']
+
+
+def test_tenants_get_sharded_pipelines_and_prefixed_indices():
+    layout = IngestionLayout.from_context('{"logs": 2, "tenants": ["teama"]}')
+    logs = layout.pipelines('Logs')
+    assert [p.name for p in logs] == ['spark-obs-logs', 'spark-obs-logs-2', 'spark-obs-logs-teama', 'spark-obs-logs-teama-2']
+    assert [p.index_prefix for p in logs] == ['', '', 'teama-', 'teama-']
+    assert len(layout.pipelines('Metrics')) == 2
+    assert len({p.construct_id for p in layout.pipelines()}) == len(layout.pipelines())
+
+
+def test_invalid_layouts_are_rejected():
+    for value in ('{"logs": 0}', '{"tenants": ["Team-A"]}', '{"tenants": ["teama", "teama"]}',
+                  '{"tenants": ["averylongtenant"]}', '{"shards": 2}', 'logs=2'):
+        with pytest.raises(Exception):
+            IngestionLayout.from_context(value)
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+from infra import lambda_layer
+from infra.lambda_layer import build_layer, layer_hash
+
+
+def fake_pip(calls):
+    def check_call(command):
+        calls.append(command)
+        site_packages = Path(command[command.index('-t') + 1])
+        site_packages.joinpath('requests').mkdir()
+        site_packages.joinpath('requests/__init__.py').write_text('')
+        site_packages.joinpath('requests/tests').mkdir()
+    return check_call
+
+
+def layer_sources(tmp_path, requirements='requests~=2.24.0\n'):
+    tmp_path.joinpath('requirements.txt').write_text(requirements)
+    tmp_path.joinpath('common').mkdir(exist_ok=True)
+    tmp_path.joinpath('common/opensearch_auth.py').write_text('')
+    return tmp_path.joinpath('requirements.txt'), tmp_path.joinpath('common')
+
+
+def test_layer_is_built_once(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(lambda_layer.subprocess, 'check_call', fake_pip(calls))
+    requirements, common = layer_sources(tmp_path)
+
+    layer = build_layer(requirements, common, tmp_path.joinpath('cache'))
+    assert layer == build_layer(requirements, common, tmp_path.joinpath('cache'))
+    assert len(calls) == 1
+    assert layer.joinpath('python/opensearch_auth.py').is_file()
+    assert not any(p.name == 'tests' for p in layer.rglob('*'))
+    assert [p.name for p in tmp_path.joinpath('cache').iterdir()] == [layer.name]
+
+
+def test_layer_is_rebuilt_when_requirements_change(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(lambda_layer.subprocess, 'check_call', fake_pip(calls))
+    requirements, common = layer_sources(tmp_path)
+    first = layer_hash(requirements, common)
+
+    requirements, common = layer_sources(tmp_path, 'requests~=2.31.0\n')
+    assert layer_hash(requirements, common) != first
+
+
+def test_layer_is_built_from_wheelhouse(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(lambda_layer.subprocess, 'check_call', fake_pip(calls))
+    monkeypatch.setenv('LAYER_WHEELHOUSE', str(tmp_path.joinpath('wheels')))
+    monkeypatch.setenv('LAYER_CACHE_DIR', str(tmp_path.joinpath('cache')))
+    requirements, common = layer_sources(tmp_path)
+
+    layer = build_layer(requirements, common)
+    assert layer.parent == tmp_path.joinpath('cache')
+    assert calls[0][calls[0].index('--find-links') + 1] == str(tmp_path.joinpath('wheels'))
+    assert '--no-index' in calls[0]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('yaml')
+
+from tools.ingest_standin import IngestServer, OpensearchSink, Pipeline
+from tools.latency_probe import CANARY_APP, Probe, canary, document_percentiles, parse_time, report
+
+TEMPLATES_PATH = Path(__file__).parents[2].joinpath('infra/resources/lambda/opensearch-bootstrap/resources/templates')
+
+
+class FakeResponse:
+
+    def __init__(self, body):
+        self.status_code = 200
+        self.ok = True
+        self.body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+
+class FakeDomain:
+    """
+    Stamps the index time like the ingest pipeline of the domain and makes the documents searchable after a refresh.
+    """
+
+    def __init__(self, refresh: float):
+        self.refresh = refresh
+        self.documents = []
+        self.lock = threading.Lock()
+
+    def bulk(self, items, on_throttled=None):
+        indexed = time.time()
+        with self.lock:
+            for action, document in items:
+                document['indexTime'] = datetime.fromtimestamp(indexed, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f123Z')
+                self.documents.append((indexed + self.refresh, action['index']['_index'], document))
+        return []
+
+    def request(self, method, path, body=None):
+        with self.lock:
+            if '_delete_by_query' in path:
+                deleted = [d for d in self.documents if d[2]['appId'] == CANARY_APP]
+                self.documents = [d for d in self.documents if d[2]['appId'] != CANARY_APP]
+                return FakeResponse({'deleted': len(deleted)})
+            if 'aggs' in body:
+                values = {'values': {'50.0': 40.0, '99.0': 900.0}}
+                return FakeResponse({'aggregations': {'buffering': values, 'buffering_count': {'value': 12},
+                                                      'transport': values, 'transport_count': {'value': 12},
+                                                      'pipeline': values, 'pipeline_count': {'value': 12}}})
+            batch_id = body['query']['term']['batchId']
+            hits = [{'_source': d} for searchable, index, d in self.documents
+                    if searchable <= time.time() and index == path.split('/')[0] and d['batchId'] == batch_id]
+            return FakeResponse({'hits': {'hits': hits}})
+
+
+def test_canaries_match_the_index_templates():
+    for stream, index in (('metrics', 'spark-task-metrics'), ('logs', 'spark-logs')):
+        fields = json.loads(TEMPLATES_PATH.joinpath(f'{index}.json').read_text())['template']['mappings']['properties']
+        assert set(canary(stream, 'id', 0)) <= set(fields)
+        assert {'sendTime', 'batchId', 'ingestTime', 'indexTime', 'ingestLatency'} <= set(fields)
+    assert parse_time('2024-05-01T10:00:00.123456789Z') == 1714557600123
+    assert parse_time('2024-05-01T10:00:00.123Z') == parse_time(1714557600123) == 1714557600123
+
+
+def test_canaries_are_timed_through_the_pipeline_and_the_refresh():
+    loop = asyncio.new_event_loop()
+    domain = FakeDomain(refresh=0.2)
+
+    async def start():
+        server = IngestServer(Pipeline.load('metrics-pipeline.yaml', 'teama-'), OpensearchSink(domain, batch_size=10))
+        return server, await asyncio.start_server(server.handle, '127.0.0.1', 0)
+
+    server, http = loop.run_until_complete(start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        url = f'http://127.0.0.1:{http.sockets[0].getsockname()[1]}/ingest'
+        probe = Probe(url, domain, 'teama-spark-task-metrics', poll_interval=0.02, timeout=5)
+        for _ in range(3):
+            assert probe.send() is not None
+        probe.session.close()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        http.close()
+        loop.run_until_complete(http.wait_closed())
+        loop.run_until_complete(server.sink.close())
+        loop.close()
+
+    stages = probe.stages()
+    assert len(stages['refresh']) == 3 and probe.lost == 0
+    assert all(180 <= refresh < 1000 for refresh in stages['refresh'])
+    assert all(0 <= transport <= pipeline for transport, pipeline in zip(stages['transport'], stages['pipeline']))
+    assert stages['searchable'][0] >= stages['refresh'][0]
+
+    table = report(stages, document_percentiles(domain, 'teama-spark-task-metrics', '15m'), probe.lost)
+    assert 'collector buffering (documents)' in table and 'index refresh (canaries)' in table
+    probe.cleanup(['teama-spark-task-metrics'])
+    assert not domain.documents
@@ -0,0 +1,83 @@
+import asyncio
+import itertools
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('yaml')
+
+from tools.common import prepare
+from tools.ingest_standin import IngestServer, NdjsonSink, Pipeline
+from tools.load_generator import IngestSender, Workload
+
+TEMPLATES_PATH = Path(__file__).parents[2].joinpath('infra/resources/lambda/opensearch-bootstrap/resources/templates')
+
+
+def template_fields(name):
+    return set(json.loads(TEMPLATES_PATH.joinpath(f'{name}.json').read_text())['template']['mappings']['properties'])
+
+
+def generate(count, **parameters):
+    return list(itertools.islice(Workload(seed=7, **parameters).documents(), count))
+
+
+def test_documents_match_the_index_templates():
+    documents = generate(5000, apps=3, stages=4, tasks_per_stage=40, stack_trace_ratio=0.2)
+    indices = {'spark-task-metrics': [], 'spark-stage-agg-metrics': [], 'spark-logs': []}
+    for stream, document in documents:
+        index = prepare(document)
+        assert (stream == 'logs') == (index == 'spark-logs')
+        indices[index].append(document)
+    for index, documents in indices.items():
+        assert documents
+        assert set().union(*documents) <= template_fields(index)
+    errors = [d for d in indices['spark-logs'] if 'stackTrace' in d]
+    assert 0.1 < len(errors) / len(indices['spark-logs']) < 0.3
+    # Occurrences of the same exception have the same fingerprint, whatever their message
+    fingerprints = {}
+    for error in errors:
+        fingerprints.setdefault(error['stackTrace'].split(':')[0], set()).add(error['stackTraceFingerprint'])
+    assert all(len(values) == 1 for values in fingerprints.values()) and len(fingerprints) > 1
+
+
+def test_skewed_stages_have_zipf_partition_sizes():
+
+    def stage_skewness(skewed_stages):
+        documents = generate(2000, apps=1, stages=10, tasks_per_stage=100, skewed_stages=skewed_stages, logs_per_task=0)
+        return [d['inputBytesReadSkewness'] for _, d in documents if d['metricsType'] == 'stageAggMetrics']
+
+    assert min(stage_skewness(1)) > 0.9 > max(stage_skewness(0))
+    tasks = [d for _, d in generate(100, apps=1, tasks_per_stage=100, skewed_stages=1, zipf=1.5, logs_per_task=0)]
+    sizes = sorted((d['inputBytesRead'] for d in tasks), reverse=True)
+    assert sizes[0] / sizes[1] == pytest.approx(2 ** 1.5, rel=0.01)
+
+
+def test_documents_are_sent_to_the_pipelines_with_retries(tmp_path):
+    loop = asyncio.new_event_loop()
+    server = IngestServer(Pipeline.load('metrics-pipeline.yaml'), NdjsonSink(str(tmp_path)), throttle_rate=0.3)
+    http = loop.run_until_complete(start_server(server))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        url = f'http://127.0.0.1:{http.sockets[0].getsockname()[1]}/ingest'
+        sender = IngestSender({'metrics': url}, workers=2, batch_size=50, backoff=0.01)
+        documents = generate(1000, apps=2, stages=2, tasks_per_stage=30)
+        for stream, document in documents:
+            sender.add(stream, document)
+        stats = sender.close()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        http.close()
+        loop.run_until_complete(http.wait_closed())
+        loop.close()
+    metrics = [d for stream, d in documents if stream == 'metrics']
+    assert stats['sent'] == len(metrics) and stats['failed'] == 0 and stats['throttled'] > 0
+    assert server.stats.total['documents'] == len(metrics)
+
+
+async def start_server(server):
+    return await asyncio.start_server(server.handle, '127.0.0.1', 0)
@@ -0,0 +1,56 @@
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+pytest.importorskip('duckdb')
+
+from tools.metrics_archive import MetricsArchive
+
+
+def write_partition(root, day, app_id, app_name, stages):
+    """
+    Writes the task metrics of an application, stages are lists of (inputBytesRead, runTime) per task.
+    """
+    rows = []
+    for stage_id, tasks in enumerate(stages):
+        for task, (input_bytes, run_time) in enumerate(tasks):
+            rows.append({'appName': app_name, 'appId': app_id, 'jobId': '0', 'stageId': stage_id, 'stageAttemptId': 0,
+                         'taskId': f'{stage_id}.{task}', 'executorId': str(task % 2), 'partitionId': task,
+                         'inputBytesRead': float(input_bytes), 'inputRecordsRead': 1.0, 'runTime': float(run_time),
+                         'executorCpuTime': 1e6 * run_time, 'peakExecutionMemory': 0.0, 'outputRecordsWritten': 0.0,
+                         'outputBytesWritten': 0.0, 'shuffleRecordsRead': 0.0, 'shuffleBytesRead': 0.0,
+                         'shuffleRecordsWritten': 0.0, 'shuffleBytesWritten': 0.0,
+                         'metricTime': 1700000000000 + 1000 * stage_id + run_time})
+    directory = root / f'dt={day}' / f'app_id={app_id}'
+    directory.mkdir(parents=True)
+    pq.write_table(pa.Table.from_pylist(rows), directory / 'part-0.parquet')
+
+
+@pytest.fixture
+def archive(tmp_path):
+    write_partition(tmp_path, '2024-01-15', 'app-1', 'etl', [[(100, 10), (100, 10), (400, 40)], [(50, 5), (50, 5)]])
+    write_partition(tmp_path, '2024-01-16', 'app-2', 'report', [[(10, 1000), (30, 3000)]])
+    return MetricsArchive(str(tmp_path))
+
+
+def test_partitions_are_pruned_by_day_and_application(archive):
+    assert len(archive.files()) == 2
+    assert [f.split('/')[-2] for f in archive.files(since='2024-01-16')] == ['app_id=app-2']
+    assert archive.files(app_ids=['app-1'], since='2024-01-16') == []
+
+
+def test_skew_matches_the_listener_relative_distance(archive):
+    skew = archive.skew(since='2024-01-15', until='2024-01-15').to_pylist()
+    # mean 200, range 300, the max task is 200 away from the mean
+    assert skew[0]['stageId'] == 0 and skew[0]['inputBytesReadSkewness'] == pytest.approx(2 / 3)
+    assert skew[1]['inputBytesReadSkewness'] == 0
+
+
+def test_slow_stages_and_app_totals(archive):
+    slow = archive.slow_stages(top=1).to_pylist()
+    assert (slow[0]['appId'], slow[0]['duration']) == ('app-2', 3000)
+
+    totals = {row['appId']: row for row in archive.app_totals(app_name='etl').to_pylist()}
+    assert list(totals) == ['app-1']
+    assert (totals['app-1']['taskCount'], totals['app-1']['stageCount']) == (5, 2)
+    assert totals['app-1']['totalInputBytesRead'] == 700
@@ -0,0 +1,45 @@
+import re
+from pathlib import Path
+
+import pytest
+
+yaml = pytest.importorskip('yaml')
+
+from infra.pipeline_sizing import tune_pipeline
+from tools.ingest_standin import PIPELINES_DIR, Placeholders
+
+COLLECTOR_DIR = Path(__file__).parents[3].joinpath('source/collector/src/main/scala/com/amazonaws/sparkobservability')
+
+
+def source(pipeline: str, name: str) -> dict:
+    """
+    The settings of the source of a pipeline configuration, rendered like the ingestor stack does.
+    """
+    template = PIPELINES_DIR.joinpath(pipeline).read_text()
+    rendered = template.format_map(Placeholders(tune_pipeline('Metrics', None).to_variables()))
+    pipelines = yaml.safe_load(rendered).values()
+    return next(p['source'][name] for p in pipelines if isinstance(p, dict) and name in p.get('source', {}))
+
+
+def constant(file: str, name: str) -> str:
+    return re.search(rf'val {name}: String = "([^"]+)"', COLLECTOR_DIR.joinpath(file).read_text()).group(1)
+
+
+@pytest.mark.parametrize('pipeline, name', [('logs-otel-pipeline.yaml', 'otel_logs_source'),
+                                            ('metrics-otel-pipeline.yaml', 'otel_metrics_source')])
+def test_otel_sources_accept_the_protobuf_payloads_of_the_collector(pipeline, name):
+    settings = source(pipeline, name)
+    # the encoder posts plain http requests, not grpc frames
+    assert constant('OtlpProtobufEncoder.scala', 'CONTENT_TYPE') == 'application/x-protobuf'
+    assert settings['unframed_requests'] is True
+    assert settings['compression'] == constant('OtlpProtobufEncoder.scala', 'CONTENT_ENCODING')
+
+
+def test_trace_source_accepts_the_json_payloads_of_the_tracer():
+    settings = source('traces-pipeline.yaml', 'otel_trace_source')
+    tracer = COLLECTOR_DIR.joinpath('SparkTracer.scala').read_text()
+    # OTLP/JSON is only served for unframed http requests, the spans are posted uncompressed
+    assert constant('SparkTracer.scala', 'contentType') == 'application/json'
+    assert settings['unframed_requests'] is True
+    assert 'contentEncoding' not in tracer
+    assert settings.get('compression', 'none') == 'none'
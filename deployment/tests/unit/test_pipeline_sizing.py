@@ -0,0 +1,44 @@
+import pytest
+
+from infra.cluster_sizing import PRESETS, TshirtSize
+from infra.pipeline_sizing import PipelineTuning, tune_pipeline
+
+
+def test_pipelines_keep_the_defaults_without_a_plan():
+    assert tune_pipeline('Logs', None) == PipelineTuning(1, 10)
+    assert tune_pipeline('Metrics', None) == PipelineTuning(1, 4)
+    assert tune_pipeline('Traces', None) == PipelineTuning(1, 4)
+
+
+def test_small_domains_get_single_unit_pipelines_with_in_memory_buffers():
+    tuning = tune_pipeline('Logs', PRESETS[TshirtSize.XS])
+    assert (tuning.min_units, tuning.max_units) == (1, 1)
+    assert not tuning.persistent_buffer
+    assert tuning.bulk_size <= 10
+    assert 'bounded_blocking' in tuning.to_variables()['buffer']
+
+
+def test_multi_az_domains_get_persistent_buffers_except_for_pull_sources():
+    plan = PRESETS[TshirtSize.L]
+    tuning = tune_pipeline('Logs', plan)
+    assert tuning.persistent_buffer
+    assert tuning.min_units >= 2
+    assert 'bounded_blocking' not in tuning.to_variables()['buffer']
+    assert not tune_pipeline('Logs', plan, pull_source=True).persistent_buffer
+
+
+def test_bulk_size_follows_the_shard_layout():
+    small = tune_pipeline('Logs', PRESETS[TshirtSize.M])
+    large = tune_pipeline('Logs', PRESETS[TshirtSize.XL])
+    assert small.bulk_size < large.bulk_size <= 20
+    assert large.batch_size <= large.buffer_size
+
+
+def test_context_overrides_the_derived_settings():
+    context = {'LogsPipelineBulkSize': '8', 'LogsPipelineMaxUnits': '6', 'PersistentBuffer': 'false'}
+    tuning = tune_pipeline('Logs', PRESETS[TshirtSize.L]).with_context(context.get, 'Logs')
+    assert (tuning.bulk_size, tuning.max_units, tuning.persistent_buffer) == (8, 6, False)
+    with pytest.raises(Exception):
+        tune_pipeline('Logs', PRESETS[TshirtSize.L]).with_context({'LogsPipelineMinUnits': '1'}.get, 'Logs')
+    traces = tune_pipeline('Traces', PRESETS[TshirtSize.L]).with_context({'TracesPipelineMaxUnits': '8'}.get, 'Traces')
+    assert traces.max_units == 8 and traces.persistent_buffer
@@ -0,0 +1,92 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parents[2].joinpath('infra/resources/lambda/opensearch-bootstrap')))
+
+from step_runner import Step, run_steps
+
+
+class Recorder:
+    """
+    Records the start and end of the steps.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def step(self, name, duration=0.05, failures=0, barrier=None):
+        attempts = []
+
+        def function():
+            with self.lock:
+                self.events.append(('start', name))
+            # Steps sharing a barrier only go on once they all started, so they must run at the same time
+            if barrier:
+                barrier.wait(timeout=5)
+            time.sleep(duration)
+            with self.lock:
+                self.events.append(('end', name))
+            attempts.append(name)
+            if len(attempts) <= failures:
+                raise Exception(f'{name} failed')
+            return f'{name} result'
+        return function
+
+    def position(self, event, name):
+        return self.events.index((event, name))
+
+
+def test_steps_start_after_their_dependencies_and_run_concurrently():
+    recorder = Recorder()
+    barrier = threading.Barrier(2)
+    steps = [
+        Step('role', recorder.step('role', barrier=barrier)),
+        Step('mapping', recorder.step('mapping'), depends_on=['role']),
+        Step('template', recorder.step('template', barrier=barrier)),
+        Step('index', recorder.step('index'), depends_on=['template', 'mapping']),
+    ]
+    results, durations = run_steps(steps, max_workers=4, backoff=0)
+
+    assert results == {name: f'{name} result' for name in ('role', 'mapping', 'template', 'index')}
+    assert recorder.position('end', 'role') < recorder.position('start', 'mapping')
+    assert recorder.position('end', 'mapping') < recorder.position('start', 'index')
+    assert recorder.position('end', 'template') < recorder.position('start', 'index')
+    # role and template have no dependency between them, both started before either ended
+    assert max(recorder.position('start', 'role'), recorder.position('start', 'template')) < \
+        min(recorder.position('end', 'role'), recorder.position('end', 'template'))
+    assert set(durations) == set(results) and all(duration >= 50 for duration in durations.values())
+
+
+def test_failed_steps_are_retried():
+    recorder = Recorder()
+    results, durations = run_steps([Step('flaky', recorder.step('flaky', duration=0, failures=2), retries=2)],
+                                   max_workers=1, backoff=0)
+    assert results == {'flaky': 'flaky result'}
+    assert recorder.events.count(('start', 'flaky')) == 3
+
+
+def test_failures_stop_the_dependent_steps_and_propagate():
+    recorder = Recorder()
+    steps = [
+        Step('broken', recorder.step('broken', duration=0, failures=10), retries=1),
+        Step('slow', recorder.step('slow', duration=0.1)),
+        Step('after', recorder.step('after'), depends_on=['broken']),
+    ]
+    with pytest.raises(Exception, match='broken failed'):
+        run_steps(steps, max_workers=2, backoff=0)
+    assert recorder.events.count(('start', 'broken')) == 2
+    # the running steps complete, the dependent ones never start
+    assert ('end', 'slow') in recorder.events
+    assert ('start', 'after') not in recorder.events
+
+
+def test_unknown_and_circular_dependencies_are_rejected():
+    with pytest.raises(Exception, match='unknown'):
+        run_steps([Step('a', lambda: None, depends_on=['missing'])], max_workers=1)
+    with pytest.raises(Exception, match='circular'):
+        run_steps([Step('a', lambda: None, depends_on=['b']), Step('b', lambda: None, depends_on=['a'])], max_workers=1)
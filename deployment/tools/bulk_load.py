@@ -0,0 +1,290 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Loads files of documents shaped like the collector output into the Spark indices, for example to reload data after
+a reindex or a mapping change. Run from the deployment directory:
+
+    python -m tools.bulk_load ./export --endpoint https://<domain-endpoint> --region us-east-1 \\
+        --checkpoint load.json --disable-refresh
+
+    python -m tools.bulk_load metrics.ndjson.gz logs/ --endpoint http://localhost:9200 --workers 8
+
+Files are NDJSON with one document or one array of documents per line, JSON files with an array of documents, or bulk
+request bodies like the output of the event log backfill tool, optionally compressed with gzip or zstd. Documents are
+routed like the pipelines do: metrics on their type, logs to the logs index and spans to the traces index, and
+prepared like the pipelines do before they're indexed.
+
+Files are streamed to the parallel bulk requests of the bulk writer. The bulk request size is shared by the workers,
+it's halved when the domain throttles requests and grows back slowly while requests succeed. The checkpoint keeps the
+number of documents of each file acknowledged by the domain so an interrupted load resumes where it stopped.
+"""
+
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from tools.checkpoint import Checkpoint
+from tools.common import TRACES_INDEX, prepare
+from tools.opensearch_client import MIB, BatchSizer, BulkItem, BulkWriter, OpensearchClient
+from tools.sources import list_files, open_file, read_lines
+
+logger = logging.getLogger(__name__)
+
+
+def read_documents(path: str) -> Iterator[Tuple[Optional[dict], dict]]:
+    """
+    The documents of a file, with the bulk action preceding them in bulk request bodies.
+    """
+    if re.search(r'\.json(\.gz|\.zstd|\.zst)?$', path):
+        with open_file(path) as stream:
+            content = json.load(stream)
+        for document in content if isinstance(content, list) else [content]:
+            yield None, document
+        return
+    action = None
+    for line in read_lines(path):
+        if not line.strip():
+            continue
+        value = json.loads(line)
+        if isinstance(value, list):
+            for document in value:
+                yield None, document
+        elif action is None and len(value) == 1 and next(iter(value)) in ('index', 'create') \
+                and isinstance(next(iter(value.values())), dict):
+            action = next(iter(value.values()))
+        else:
+            yield action, value
+            action = None
+
+
+class Progress:
+    """
+    The documents of each file acknowledged by the domain. Documents are acknowledged out of order by the workers,
+    the offset of a file is the number of its leading documents all acknowledged, saved to the checkpoint.
+    """
+
+    def __init__(self, checkpoint: Checkpoint):
+        self.checkpoint = checkpoint
+        self.lock = threading.Lock()
+        self.files: Dict[str, dict] = {}
+
+    def start(self, path: str) -> int:
+        offset = self.checkpoint.offset(path)
+        with self.lock:
+            self.files[path] = {'offset': offset, 'acked': set(), 'total': None}
+        return offset
+
+    def ack(self, path: str, seqs: List[int]):
+        with self.lock:
+            state = self.files[path]
+            state['acked'].update(seqs)
+            while state['offset'] in state['acked']:
+                state['acked'].remove(state['offset'])
+                state['offset'] += 1
+
+    def read(self, path: str, total: int):
+        with self.lock:
+            self.files[path]['total'] = total
+
+    def save(self):
+        with self.lock:
+            files = [(path, state['offset'], state['offset'] == state['total']) for path, state in self.files.items()]
+            self.files = {path: state for path, state in self.files.items() if state['offset'] != state['total']}
+        for path, offset, done in files:
+            if done:
+                self.checkpoint.complete(path)
+            elif offset:
+                self.checkpoint.advance(path, offset)
+
+
+class RefreshSettings:
+    """
+    Disables the refresh of the indices receiving documents and restores their refresh interval at the end.
+    The original intervals are saved with the checkpoint so they're restored after an interrupted load.
+    """
+
+    def __init__(self, client: OpensearchClient, checkpoint: Checkpoint):
+        self.client = client
+        self.checkpoint = checkpoint
+        self.seen = set()
+
+    def disable(self, index: str):
+        if index in self.seen:
+            return
+        self.seen.add(index)
+        response = self.client.request('GET', f'{index}/_settings/index.refresh_interval')
+        if response.status_code == 404:
+            return
+        if not response.ok:
+            raise Exception(f'Failed to get the settings of {index}: {response.text}')
+        saved = self.checkpoint.get('refresh', {})
+        for concrete, settings in response.json().items():
+            # An interval saved by an interrupted load is the original one, the current one is disabled
+            saved.setdefault(concrete, settings.get('settings', {}).get('index', {}).get('refresh_interval'))
+        self.checkpoint.set('refresh', saved)
+        response = self.client.request('PUT', f'{index}/_settings', {'index': {'refresh_interval': '-1'}})
+        if not response.ok:
+            raise Exception(f'Failed to disable the refresh of {index}: {response.text}')
+        logger.info(f'Refresh disabled on {index}')
+
+    def restore(self):
+        for index, interval in self.checkpoint.get('refresh', {}).items():
+            response = self.client.request('PUT', f'{index}/_settings', {'index': {'refresh_interval': interval}})
+            if not response.ok:
+                raise Exception(f'Failed to restore the refresh interval of {index}: {response.text}')
+            self.client.request('POST', f'{index}/_refresh')
+            logger.info(f'Refresh interval of {index} restored to {interval or "the default"}')
+        self.checkpoint.set('refresh', {})
+
+
+class BulkLoader:
+    """
+    Streams the documents of the files to a bulk writer, which acknowledges them to the progress once the domain
+    indexed or rejected them.
+    """
+
+    def __init__(self, client: OpensearchClient, checkpoint: Checkpoint, workers: int = 4, sizer: BatchSizer = None,
+                 stream: str = 'auto', index_prefix: str = '', index: Optional[str] = None,
+                 refresh: Optional[RefreshSettings] = None, rejects: Optional[str] = None, report_interval: float = 10):
+        self.checkpoint = checkpoint
+        self.sizer = sizer or BatchSizer(5, 0.5, 20)
+        self.stream = stream
+        self.index_prefix = index_prefix
+        self.index = index
+        self.refresh = refresh
+        self.rejects = rejects
+        self.report_interval = report_interval
+        self.progress = Progress(checkpoint)
+        self.rejects_lock = threading.Lock()
+        self.writer = BulkWriter(client, workers=workers, sizer=self.sizer, on_done=self.acknowledge)
+        self.skipped = 0
+
+    def items(self, path: str) -> Iterator[Tuple[int, BulkItem]]:
+        """
+        The bulk items of the documents of a file after its checkpoint offset, numbered in the file.
+        """
+        offset = self.progress.start(path)
+        seq = -1
+        for seq, (action, document) in enumerate(read_documents(path)):
+            if seq < offset:
+                continue
+            index = prepare(document, self.stream)
+            if self.index or action and action.get('_index'):
+                index = self.index or action['_index']
+            elif index is not None and index != TRACES_INDEX:
+                index = self.index_prefix + index
+            if index is None:
+                # Unknown documents are dropped like the pipelines do, they're acknowledged right away
+                self.skipped += 1
+                self.progress.ack(path, [seq])
+                continue
+            if self.refresh:
+                self.refresh.disable(index)
+            meta = {'_index': index}
+            if action and action.get('_id'):
+                meta['_id'] = action['_id']
+            yield seq, ({'index': meta}, document)
+        self.progress.read(path, seq + 1)
+
+    def run(self, sources: List[str]) -> dict:
+        reporter = threading.Thread(target=self.report, daemon=True)
+        start = time.monotonic()
+        reporter.start()
+        try:
+            for source in sources:
+                for path in list_files(source):
+                    if self.checkpoint.is_done(path):
+                        continue
+                    for seq, item in self.items(path):
+                        self.writer.add(item, (path, seq))
+            self.writer.close()
+        finally:
+            self.progress.save()
+        if self.refresh:
+            self.refresh.restore()
+        elapsed = time.monotonic() - start
+        self.summary(elapsed)
+        return self.totals()
+
+    def acknowledge(self, tags: List[Tuple[str, int]], rejected: list):
+        """
+        Acknowledges the documents of a bulk request to the progress of their files, rejected ones included.
+        """
+        if rejected:
+            self.reject([(item, error) for item, _, error in rejected])
+        acked = {}
+        for path, seq in tags:
+            acked.setdefault(path, []).append(seq)
+        for path, seqs in acked.items():
+            self.progress.ack(path, seqs)
+
+    def reject(self, rejected: list):
+        with self.rejects_lock:
+            if self.rejects:
+                with open(self.rejects, 'a') as file_:
+                    for (action, document), error in rejected:
+                        file_.write(json.dumps({'index': action['index'], 'error': error, 'document': document}) + '\n')
+            else:
+                for (action, _), error in rejected:
+                    logger.warning(f'Document rejected by {action["index"]["_index"]}: {error}')
+
+    def totals(self) -> dict:
+        return dict(self.writer.stats, skipped=self.skipped)
+
+    def report(self):
+        last, last_time = 0, time.monotonic()
+        while True:
+            time.sleep(self.report_interval)
+            self.progress.save()
+            now, documents = time.monotonic(), self.writer.stats['indexed']
+            logger.info(f'{(documents - last) / (now - last_time):.0f} docs/s, {documents} documents indexed, '
+                        f'bulk size {self.sizer.size / MIB:.1f} MiB, {len(self.writer.pool.in_flight)} requests in flight')
+            last, last_time = documents, now
+
+    def summary(self, elapsed: float):
+        for name, stats in sorted(self.writer.worker_stats.items()):
+            logger.info(f'{name}: {stats["indexed"]} documents, {stats["bytes"] / MIB:.1f} MiB, '
+                        f'{stats["requests"]} requests, {stats["throttled"]} throttled, {stats["rejected"]} rejected, '
+                        f'{stats["indexed"] / elapsed:.0f} docs/s, {stats["bytes"] / MIB / elapsed:.2f} MiB/s, '
+                        f'{100 * stats["busy"] / elapsed:.0f}% busy')
+        totals = self.totals()
+        logger.info(f'Load done in {elapsed:.1f}s: {totals}, {totals["indexed"] / elapsed:.0f} docs/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Loads files of collector documents into the Spark indices')
+    parser.add_argument('sources', nargs='+', help='Files or directories of documents, local or S3 prefixes')
+    parser.add_argument('--endpoint', required=True, help='Opensearch endpoint, like http://localhost:9200')
+    parser.add_argument('--region', help='Region of the Opensearch domain, requests are signed with SigV4 when set')
+    parser.add_argument('--stream', choices=['auto', 'logs', 'metrics', 'traces'], default='auto',
+                        help='Stream of the documents, detected from their fields by default')
+    parser.add_argument('--index-prefix', default='', help='Prefix of the indices of a tenant, like teama-')
+    parser.add_argument('--index', help='Index or alias receiving all the documents')
+    parser.add_argument('--workers', type=int, default=4, help='Parallel bulk requests')
+    parser.add_argument('--bulk-size', type=float, default=5, help='Initial bulk request size in MiB')
+    parser.add_argument('--min-bulk-size', type=float, default=0.5, help='Minimum bulk request size in MiB')
+    parser.add_argument('--max-bulk-size', type=float, default=20, help='Maximum bulk request size in MiB')
+    parser.add_argument('--disable-refresh', action='store_true', help='Disable the refresh of the indices during the load')
+    parser.add_argument('--checkpoint', help='File of the documents already loaded, to resume an interrupted load')
+    parser.add_argument('--rejects', help='NDJSON file receiving the rejected documents with their error')
+    parser.add_argument('--report-interval', type=float, default=10, help='Seconds between throughput reports')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(threadName)s %(message)s')
+    client = OpensearchClient(args.endpoint, args.region, pool_size=args.workers)
+    checkpoint = Checkpoint(args.checkpoint)
+    refresh = RefreshSettings(client, checkpoint) if args.disable_refresh or checkpoint.get('refresh') else None
+    loader = BulkLoader(client, checkpoint, workers=args.workers,
+                        sizer=BatchSizer(args.bulk_size, args.min_bulk_size, args.max_bulk_size),
+                        stream=args.stream, index_prefix=args.index_prefix, index=args.index, refresh=refresh,
+                        rejects=args.rejects, report_interval=args.report_interval)
+    loader.run(args.sources)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import threading
+from typing import Optional
+
+
+class Checkpoint:
+    """
+    The sources already processed by a tool, kept in a JSON file so an interrupted run resumes where it stopped.
+    The file is replaced atomically on each update, sources are object keys or file paths with an optional offset.
+    Without a path, the checkpoint is only kept in memory.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {'done': [], 'offsets': {}}
+        if path and os.path.exists(path):
+            with open(path) as file_:
+                self.state.update(json.load(file_))
+        self.done = set(self.state['done'])
+
+    def is_done(self, source: str) -> bool:
+        return source in self.done
+
+    def offset(self, source: str) -> int:
+        return self.state['offsets'].get(source, 0)
+
+    def complete(self, source: str):
+        with self.lock:
+            self.done.add(source)
+            self.state['offsets'].pop(source, None)
+            self._save()
+
+    def advance(self, source: str, offset: int):
+        with self.lock:
+            self.state['offsets'][source] = offset
+            self._save()
+
+    def get(self, key: str, default=None):
+        """
+        A value saved by the tool with the checkpoint, like settings to restore after an interrupted run.
+        """
+        return self.state.get(key, default)
+
+    def set(self, key: str, value):
+        with self.lock:
+            self.state[key] = value
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        self.state['done'] = sorted(self.done)
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as file_:
+            json.dump(self.state, file_)
+        os.replace(tmp, self.path)
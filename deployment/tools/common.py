@@ -0,0 +1,86 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import re
+import time
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# The indices of the metrics types, like the routes of the metrics pipeline
+METRICS_INDICES = {
+    'taskMetrics': 'spark-task-metrics',
+    'stageAggMetrics': 'spark-stage-agg-metrics',
+    'summaryMetrics': 'spark-app-summary',
+}
+LOGS_INDEX = 'spark-logs'
+TRACES_INDEX = 'otel-v1-apm-span'
+
+# The Spark task name of executor logs and the Log4j fields dropped by the logs pipeline
+TASK_NAME = re.compile(r'task (\d+(?:\.\d+)?) in stage (\d+(?:\.\d+)?) \(TID \d+\)')
+DELETED_LOG_FIELDS = ['taskName', 'instant', 'nanoTime', 'threadId', 'threadPriority', 'includeLocation', 'endOfBatch',
+                      'contextStack', 'loggerFqcn', 'populated', 'parameterCount']
+
+
+def now() -> int:
+    return int(time.time() * 1000)
+
+
+def percentile(values: List[float], rank: float) -> float:
+    """
+    The nearest rank percentile of sorted values.
+    """
+    return values[min(len(values) - 1, int(len(values) * rank / 100))]
+
+
+def lookup(document: dict, path: str):
+    """
+    The object holding the field at the path and the field key, or None when the field is missing.
+    """
+    keys = path.strip('/').split('/')
+    parent = document
+    for key in keys[:-1]:
+        parent = parent.get(key) if isinstance(parent, dict) else None
+    if isinstance(parent, dict) and keys[-1] in parent:
+        return parent, keys[-1]
+    return None, None
+
+
+def prepare(document: dict, stream: str = 'auto') -> Optional[str]:
+    """
+    Prepares the document like the pipelines do and returns the index of its stream, or None for unknown documents.
+    """
+    if stream == 'traces' or stream == 'auto' and 'traceId' in document and 'spanId' in document:
+        return TRACES_INDEX
+    if stream == 'metrics' or stream == 'auto' and 'metricsType' in document:
+        if 'metricTime' in document:
+            document.setdefault('@timestamp', document['metricTime'])
+        return METRICS_INDICES.get(document.get('metricsType'))
+    if stream == 'logs' or stream == 'auto' and 'logTime' in document:
+        task = TASK_NAME.match(str(document.get('taskName', '')))
+        if task:
+            document['taskId'], document['stageId'] = task.groups()
+        if 'logTime' in document:
+            document.setdefault('@timestamp', document['logTime'])
+        level = document.get('level')
+        if isinstance(level, dict):
+            level = level.get('name')
+        if level is not None:
+            document['level'] = str(level).upper()
+        for field in DELETED_LOG_FIELDS:
+            document.pop(field, None)
+        return LOGS_INDEX
+    return None
+
+
+def stage_aggregation(values: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    The relative distance skew and the max of each column of the task values of a stage, like collectStageCustomMetrics:
+    the maximum distance of a task to the mean divided by the range of the stage, a range of 0 counting as 1.
+    """
+    maximum = values.max(axis=0)
+    value_range = maximum - values.min(axis=0)
+    value_range[value_range == 0] = 1
+    skewness = abs(values - values.mean(axis=0)).max(axis=0) / value_range
+    return skewness, maximum
@@ -0,0 +1,253 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Replays the documents rejected by the Opensearch sinks of the pipelines and written to the DLQ bucket of the ingestor
+stack. DLQ objects are read from the bucket or from a local directory, one at a time, their documents are fixed or
+filtered and indexed again with the parallel bulk requests of a bulk writer. Objects are checkpointed once all their
+documents are indexed or rejected again, so an interrupted replay resumes with the next objects. Run from the
+deployment directory:
+
+    python -m tools.dlq_replay --source s3://<dlq-bucket>/spark-obs-logs/2024/01/15/ \\
+        --endpoint https://<domain-endpoint> --region us-east-1 --checkpoint replay.json
+
+    python -m tools.dlq_replay --source ./dlq --endpoint http://localhost:9200 --drop-field stackTrace/frames
+
+Documents rejected again are appended to the rejects file with their new error, in the format of the DLQ objects.
+"""
+
+import argparse
+import io
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import BinaryIO, Iterator, List, Optional, TextIO
+
+from tools.checkpoint import Checkpoint
+from tools.common import lookup
+from tools.opensearch_client import BulkItem, BulkWriter, OpensearchClient
+from tools.sources import list_files, open_file
+
+logger = logging.getLogger(__name__)
+
+# Characters read at a time from the DLQ objects, like the lines of the sources
+CHUNK_SIZE = 1 << 20
+
+
+@dataclass
+class DlqRecord:
+    """
+    A document rejected by an Opensearch sink, with the index and the error of the rejected bulk item.
+    """
+    index: str
+    document: dict
+    document_id: Optional[str] = None
+    status: Optional[int] = None
+    message: str = ''
+    pipeline: str = ''
+
+    def from_dlq_object(entry: dict):
+        """
+        Reads an entry of a DLQ object written by Data Prepper, the document is a JSON object or its serialized form.
+        """
+        failed = entry.get('failedData', entry)
+        document = failed.get('document')
+        if isinstance(document, str):
+            document = json.loads(document)
+        return DlqRecord(index=failed.get('index'),
+                         document=document,
+                         document_id=failed.get('indexId'),
+                         status=failed.get('status'),
+                         message=failed.get('message') or '',
+                         pipeline=entry.get('pipelineName', ''))
+
+    def to_dlq_object(self, error: dict) -> dict:
+        return {
+            'pipelineName': self.pipeline,
+            'failedData': {
+                'index': self.index,
+                'indexId': self.document_id,
+                'status': error.get('status', self.status),
+                'message': json.dumps(error),
+                'document': self.document,
+            },
+        }
+
+
+@dataclass
+class Fixes:
+    """
+    The filters and fixes applied to the rejected documents before they're indexed again.
+    Fields are JSON pointers without the leading slash like in the pipelines, e.g. `message/message`.
+    """
+    statuses: List[int] = field(default_factory=list)
+    drop_fields: List[str] = field(default_factory=list)
+    stringify_fields: List[str] = field(default_factory=list)
+    index: Optional[str] = None
+
+    def apply(self, record: DlqRecord) -> Optional[BulkItem]:
+        """
+        The bulk item indexing the fixed document, or None when the record is filtered out.
+        The DLQ document ID is kept so replaying twice doesn't duplicate documents.
+        """
+        if record.document is None or not record.index and not self.index:
+            return None
+        if self.statuses and record.status not in self.statuses:
+            return None
+        document = record.document
+        for path in self.drop_fields:
+            parent, key = lookup(document, path)
+            if parent is not None:
+                del parent[key]
+        # Objects conflicting with a keyword or text mapping are indexed as their JSON form
+        for path in self.stringify_fields:
+            parent, key = lookup(document, path)
+            if parent is not None and not isinstance(parent[key], str):
+                parent[key] = json.dumps(parent[key])
+        action = {'_index': self.index or record.index}
+        if record.document_id:
+            action['_id'] = record.document_id
+        return {'index': action}, document
+
+
+def read_records(key: str) -> Iterator[DlqRecord]:
+    with open_file(key) as stream:
+        yield from parse_records(stream)
+
+
+def parse_records(stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[DlqRecord]:
+    """
+    The records of a DLQ object, a JSON array of entries written by Data Prepper or one entry per line.
+    Objects are streamed, at most a chunk and an entry are held in memory.
+    """
+    buffered = io.BufferedReader(stream, buffer_size=chunk_size)
+    array = buffered.peek(chunk_size).lstrip().startswith(b'[')
+    text = io.TextIOWrapper(buffered, encoding='utf-8')
+    entries = array_entries(text, chunk_size) if array else (json.loads(line) for line in text if line.strip())
+    for entry in entries:
+        yield DlqRecord.from_dlq_object(entry)
+
+
+def array_entries(text: TextIO, chunk_size: int) -> Iterator[dict]:
+    """
+    The entries of a JSON array decoded one at a time, the buffer is extended when an entry spans several chunks.
+    """
+    decoder = json.JSONDecoder()
+    buffer = text.read(chunk_size).lstrip()
+    position = 1
+    while True:
+        # Separators between the entries
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position == len(buffer):
+            buffer, position = text.read(chunk_size), 0
+            if not buffer:
+                raise ValueError('DLQ object truncated, the JSON array is not closed')
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            entry, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = text.read(chunk_size)
+            if not chunk:
+                raise
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield entry
+
+
+class Replay:
+    """
+    Indexes the fixed documents with a bulk writer. Objects count their documents in flight, an object is checkpointed
+    once the reader moved past it and all its documents are indexed or rejected again.
+    """
+
+    def __init__(self, client: OpensearchClient, checkpoint: Checkpoint, fixes: Fixes, workers: int,
+                 batch_size: int, rejects: Optional[str]):
+        self.checkpoint = checkpoint
+        self.fixes = fixes
+        self.rejects = rejects
+        self.writer = BulkWriter(client, workers=workers, batch_size=batch_size, on_done=self.done)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.read = set()
+        self.stats = {'objects': 0, 'documents': 0, 'skipped': 0, 'indexed': 0, 'rejected': 0}
+
+    def run(self, source: str):
+        # DLQ objects in key order, so the checkpoint follows the DLQ writes
+        for key in list_files(source):
+            if self.checkpoint.is_done(key):
+                continue
+            self.stats['objects'] += 1
+            with self.lock:
+                self.pending[key] = 0
+            for record in read_records(key):
+                self.stats['documents'] += 1
+                item = self.fixes.apply(record)
+                if item is None:
+                    self.stats['skipped'] += 1
+                    continue
+                with self.lock:
+                    self.pending[key] += 1
+                self.writer.add(item, (key, record))
+            with self.lock:
+                self.read.add(key)
+            self.release([])
+        writer_stats = self.writer.close()
+        self.stats['indexed'], self.stats['rejected'] = writer_stats['indexed'], writer_stats['rejected']
+        self.release([])
+        logger.info(f'Replay done: {self.stats}')
+        return self.stats
+
+    def done(self, tags: list, rejected: list):
+        """
+        Writes the documents rejected again to the rejects file and releases the documents of a bulk request.
+        """
+        if rejected and self.rejects:
+            with self.lock, open(self.rejects, 'a') as file_:
+                for _, (_, record), error in rejected:
+                    file_.write(json.dumps(record.to_dlq_object(error)) + '\n')
+        self.release([key for key, _ in tags])
+
+    def release(self, keys: list):
+        """
+        Checkpoints the objects read and without documents in flight.
+        """
+        with self.lock:
+            for key in keys:
+                self.pending[key] -= 1
+            completed = [key for key in self.read if self.pending[key] == 0]
+            for key in completed:
+                self.read.discard(key)
+                del self.pending[key]
+        for key in completed:
+            self.checkpoint.complete(key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays the documents of the DLQ objects written by the pipelines')
+    parser.add_argument('--source', required=True, help='S3 prefix like s3://bucket/prefix/ or local directory of DLQ objects')
+    parser.add_argument('--endpoint', required=True, help='Opensearch endpoint, like http://localhost:9200')
+    parser.add_argument('--region', help='Region of the Opensearch domain, requests are signed with SigV4 when set')
+    parser.add_argument('--checkpoint', help='File of the objects already replayed, to resume an interrupted replay')
+    parser.add_argument('--rejects', default='rejects.ndjson', help='File receiving the documents rejected again')
+    parser.add_argument('--workers', type=int, default=4, help='Parallel bulk requests')
+    parser.add_argument('--batch-size', type=int, default=500, help='Documents per bulk request')
+    parser.add_argument('--status', type=int, action='append', default=[],
+                        help='Only replay the documents rejected with this status, e.g. 429, can be repeated')
+    parser.add_argument('--drop-field', action='append', default=[], help='Field removed from the documents, can be repeated')
+    parser.add_argument('--stringify-field', action='append', default=[],
+                        help='Field indexed as its JSON string, for mapping conflicts, can be repeated')
+    parser.add_argument('--index', help='Index or alias receiving the documents instead of their original index')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    client = OpensearchClient(args.endpoint, args.region, pool_size=args.workers)
+    fixes = Fixes(statuses=args.status, drop_fields=args.drop_field, stringify_fields=args.stringify_field, index=args.index)
+    Replay(client, Checkpoint(args.checkpoint), fixes, args.workers, args.batch_size, args.rejects).run(args.source)
+
+
+if __name__ == '__main__':
+    main()
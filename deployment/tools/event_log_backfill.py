@@ -0,0 +1,268 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Rebuilds the task metrics and stage aggregated metrics of the collector listener from Spark event logs, and loads them
+into the Spark indices so applications run without the collector can be analyzed in the dashboards.
+Event logs are read from S3 or a local directory, as single files or rolling event log directories, uncompressed or
+compressed with gzip or zstd (the Spark default codec). Run from the deployment directory:
+
+    python -m tools.event_log_backfill --source s3://<bucket>/logs/applications/<app>/jobs/<job>/sparklogs/ \\
+        --endpoint https://<domain-endpoint> --region us-east-1 --checkpoint backfill.json
+
+    python -m tools.event_log_backfill --source ./eventlogs --endpoint http://localhost:9200
+    python -m tools.event_log_backfill --source ./eventlogs --output metrics.ndjson
+
+Event logs are streamed line by line and task documents are sent as they are read. Only the input and shuffle bytes
+of the tasks of running stages are kept until their stage completes, so the memory doesn't grow with the event log.
+"""
+
+import argparse
+import json
+import logging
+import re
+from array import array
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from tools.checkpoint import Checkpoint
+from tools.common import stage_aggregation
+from tools.opensearch_client import BulkItem, BulkWriter, OpensearchClient
+from tools.sources import list_files, read_lines
+
+logger = logging.getLogger(__name__)
+
+TASK_METRICS_INDEX = 'spark-task-metrics'
+STAGE_AGG_METRICS_INDEX = 'spark-stage-agg-metrics'
+
+# The files of a rolling event log directory, events_<index>_<appId>[.<codec>]
+ROLLING_FILE = re.compile(r'^events_(\d+)_')
+
+
+class EventLogMetrics:
+    """
+    Rebuilds the metrics documents from the events of one application.
+    With the stage grouping, the stage aggregated metrics cover the tasks of each stage attempt. With the listener
+    grouping, they cover all the tasks ended since the previous stage completed, like the listener buffer does when
+    stages run concurrently, so the documents match the ones the listener would have sent.
+    """
+
+    def __init__(self, grouping: str = 'stage', app_id: Optional[str] = None):
+        self.grouping = grouping
+        self.app_name = None
+        self.app_id = app_id
+        self.stage_to_job: Dict[int, str] = {}
+        # Input and shuffle bytes read of the tasks ended, per stage attempt or in the single listener buffer
+        self.buffers: Dict[tuple, array] = {}
+        self.buffer_jobs: Dict[tuple, str] = {}
+        self.stats = {'tasks': 0, 'stages': 0}
+
+    def process(self, event: dict) -> Iterator[Tuple[str, dict]]:
+        """
+        The documents produced by an event, with the index receiving them.
+        """
+        kind = event.get('Event')
+        if kind == 'SparkListenerApplicationStart':
+            self.app_name = event.get('App Name')
+            self.app_id = event.get('App ID') or self.app_id
+        elif kind == 'SparkListenerJobStart':
+            for stage_id in event.get('Stage IDs', []):
+                self.stage_to_job[stage_id] = str(event['Job ID'])
+        elif kind == 'SparkListenerTaskEnd' and event.get('Task Metrics'):
+            yield TASK_METRICS_INDEX, self.task_metrics(event)
+        elif kind == 'SparkListenerStageCompleted':
+            document = self.stage_metrics(event['Stage Info'])
+            if document is not None:
+                yield STAGE_AGG_METRICS_INDEX, document
+
+    def task_metrics(self, event: dict) -> dict:
+        info, metrics = event['Task Info'], event['Task Metrics']
+        stage_id = event['Stage ID']
+        shuffle_read = metrics.get('Shuffle Read Metrics', {})
+        shuffle_write = metrics.get('Shuffle Write Metrics', {})
+        document = {
+            'appName': self.app_name,
+            'appId': self.app_id,
+            'jobId': self.stage_to_job.get(stage_id),
+            'stageId': stage_id,
+            'stageAttemptId': event.get('Stage Attempt ID', 0),
+            # The task ID of the listener is the task index and attempt of the TaskInfo
+            'taskId': f"{info['Index']}.{info['Attempt']}",
+            'executorId': info.get('Executor ID'),
+            'partitionId': info.get('Partition ID', -1),
+            'inputBytesRead': float(metrics.get('Input Metrics', {}).get('Bytes Read', 0)),
+            'inputRecordsRead': float(metrics.get('Input Metrics', {}).get('Records Read', 0)),
+            'runTime': float(metrics.get('Executor Run Time', 0)),
+            'executorCpuTime': float(metrics.get('Executor CPU Time', 0)),
+            'peakExecutionMemory': float(metrics.get('Peak Execution Memory', 0)),
+            'outputRecordsWritten': float(metrics.get('Output Metrics', {}).get('Records Written', 0)),
+            'outputBytesWritten': float(metrics.get('Output Metrics', {}).get('Bytes Written', 0)),
+            'shuffleRecordsRead': float(shuffle_read.get('Total Records Read', 0)),
+            'shuffleBytesRead': float(shuffle_read.get('Remote Bytes Read', 0) + shuffle_read.get('Local Bytes Read', 0)),
+            'shuffleRecordsWritten': float(shuffle_write.get('Shuffle Records Written', 0)),
+            'shuffleBytesWritten': float(shuffle_write.get('Shuffle Bytes Written', 0)),
+            'metricsType': 'taskMetrics',
+            'metricTime': info.get('Finish Time'),
+        }
+        key = self.buffer_key(stage_id, document['stageAttemptId'])
+        if key not in self.buffers:
+            self.buffers[key] = array('d')
+            self.buffer_jobs[key] = document['jobId']
+        self.buffers[key].extend((document['inputBytesRead'], document['shuffleBytesRead']))
+        self.stats['tasks'] += 1
+        return document
+
+    def stage_metrics(self, stage_info: dict) -> Optional[dict]:
+        stage_id = stage_info['Stage ID']
+        key = self.buffer_key(stage_id, stage_info.get('Stage Attempt ID', 0))
+        buffer = self.buffers.pop(key, None)
+        job_id = self.buffer_jobs.pop(key, None)
+        # The listener can't aggregate a stage without tasks and sends nothing
+        if not buffer:
+            return None
+        values = np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)
+        skewness, maximum = stage_aggregation(values)
+        self.stats['stages'] += 1
+        return {
+            'appName': self.app_name,
+            'appId': self.app_id,
+            'jobId': job_id,
+            'stageId': stage_id,
+            'inputBytesReadSkewness': float(skewness[0]),
+            'maxInputBytesRead': float(maximum[0]),
+            'shuffleBytesReadSkewness': float(skewness[1]),
+            'maxShuffleBytesRead': float(maximum[1]),
+            'metricsType': 'stageAggMetrics',
+            'metricTime': stage_info.get('Completion Time'),
+        }
+
+    def buffer_key(self, stage_id: int, attempt: int) -> tuple:
+        return () if self.grouping == 'listener' else (stage_id, attempt)
+
+
+def default_app_id(name: str) -> str:
+    """
+    The application ID from the event log name, used until the application start event is read.
+    """
+    name = name.rstrip('/').rsplit('/', 1)[-1].removeprefix('eventlog_v2_')
+    return re.sub(r'\.(gz|zstd|zst|inprogress)$', '', name)
+
+
+def list_event_logs(source: str) -> List[Tuple[str, List[str]]]:
+    """
+    The event logs under an S3 prefix or a local directory, as the name of the application and its files in order.
+    Files of a rolling event log directory are one application, status and in progress files are skipped.
+    """
+    applications = {}
+    for path in list_files(source):
+        directory, name = path.rsplit('/', 1) if '/' in path else ('', path)
+        if name.startswith('appstatus_') or name.endswith('.inprogress'):
+            continue
+        rolling = ROLLING_FILE.match(name)
+        if rolling and directory.rsplit('/', 1)[-1].startswith('eventlog_v2_'):
+            applications.setdefault(directory, []).append((int(rolling.group(1)), path))
+        else:
+            applications[path] = [(0, path)]
+    return [(name, [path for _, path in sorted(files)]) for name, files in applications.items()]
+
+
+def read_events(paths: List[str]) -> Iterator[dict]:
+    for path in paths:
+        if path.endswith(('.lz4', '.lzf', '.snappy')):
+            raise Exception(f'Event log codec of {path} is not supported, use zstd or gzip')
+        for line in read_lines(path):
+            if line.strip():
+                yield json.loads(line)
+
+
+def already_indexed(client: OpensearchClient, index: str, app_id: str) -> bool:
+    """
+    Whether the task metrics of the application were already sent by the collector or a previous backfill.
+    """
+    response = client.request('POST', f'{index}/_count', {'query': {'term': {'appId': app_id}}})
+    return response.ok and response.json()['count'] > 0
+
+
+def document_id(index: str, document: dict) -> str:
+    """
+    A stable ID so running the backfill twice doesn't duplicate the documents.
+    """
+    if index == TASK_METRICS_INDEX:
+        parts = [document['appId'], document['stageId'], document['stageAttemptId'], document['taskId']]
+    else:
+        # Stage documents have no attempt, the attempts of a stage complete at different times
+        parts = [document['appId'], document['stageId'], document['metricTime']]
+    return '-'.join(str(part) for part in parts)
+
+
+def load_event_log(paths: List[str], metrics: EventLogMetrics, send: Callable[[BulkItem], None], index_prefix: str = '',
+                   is_indexed: Optional[Callable[[str], bool]] = None) -> bool:
+    """
+    Sends the documents rebuilt from an event log, or returns False without sending any when is_indexed finds its
+    application already indexed.
+    """
+    for event in read_events(paths):
+        if event.get('Event') == 'SparkListenerApplicationStart' and is_indexed and is_indexed(event.get('App ID')):
+            return False
+        for index, document in metrics.process(event):
+            document['@timestamp'] = document['metricTime']
+            send(({'index': {'_index': index_prefix + index, '_id': document_id(index, document)}}, document))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuilds the listener metrics from Spark event logs and loads them')
+    parser.add_argument('--source', required=True, help='S3 prefix or local directory of event logs, or a single event log')
+    parser.add_argument('--endpoint', help='Opensearch endpoint, like http://localhost:9200')
+    parser.add_argument('--region', help='Region of the Opensearch domain, requests are signed with SigV4 when set')
+    parser.add_argument('--output', help='NDJSON file receiving the bulk requests instead of the Opensearch endpoint')
+    parser.add_argument('--index-prefix', default='', help='Prefix of the indices of a tenant, like teama-')
+    parser.add_argument('--grouping', choices=['stage', 'listener'], default='stage',
+                        help='Aggregate the tasks per stage attempt, or like the listener buffer with concurrent stages')
+    parser.add_argument('--force', action='store_true', help='Load applications already in the task metrics index')
+    parser.add_argument('--checkpoint', help='File of the event logs already loaded, to resume an interrupted backfill')
+    parser.add_argument('--workers', type=int, default=4, help='Parallel bulk requests')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Documents per bulk request')
+    args = parser.parse_args()
+    if bool(args.endpoint) == bool(args.output):
+        parser.error('one of --endpoint or --output is required')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    checkpoint = Checkpoint(args.checkpoint)
+    writer, output, is_indexed = None, None, None
+    if args.endpoint:
+        client = OpensearchClient(args.endpoint, args.region, pool_size=args.workers)
+        writer = BulkWriter(client, workers=args.workers, batch_size=args.batch_size)
+        send = writer.add
+        if not args.force:
+            is_indexed = partial(already_indexed, client, args.index_prefix + TASK_METRICS_INDEX)
+    else:
+        output = open(args.output, 'a')
+
+        def send(item: BulkItem):
+            output.write(json.dumps(item[0]) + '\n' + json.dumps(item[1]) + '\n')
+
+    for name, paths in list_event_logs(args.source):
+        if checkpoint.is_done(name):
+            continue
+        metrics = EventLogMetrics(args.grouping, default_app_id(name))
+        loaded = load_event_log(paths, metrics, send, args.index_prefix, is_indexed)
+        if writer:
+            writer.flush()
+        if not loaded:
+            # Not checkpointed, so a later run with --force loads it
+            logger.info(f'Skipped {name}, its application is already indexed')
+            continue
+        checkpoint.complete(name)
+        logger.info(f'Loaded {name}: {metrics.stats}')
+
+    if writer:
+        logger.info(f'Backfill done: {writer.close()}')
+    else:
+        output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,464 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+A local stand-in for the http source of an Opensearch Ingestion pipeline, to benchmark the collector without deploying
+the ingestor stack. It serves the path of the pipeline configuration, accepts JSON array bodies like the pipelines do,
+routes the documents with the route expressions of the configuration and writes them to NDJSON files per index or to
+the Opensearch of the dev compose stack. Run from the deployment directory:
+
+    python -m tools.ingest_standin --pipeline metrics-pipeline.yaml --output ./ingested
+    python -m tools.ingest_standin --pipeline logs-pipeline.yaml --opensearch http://localhost:9200 --port 2022
+
+and point the collector to http://localhost:2021/ingest, for example with `--conf spark.metrics.endpoint=...`.
+
+Like the pipelines, requests are acknowledged once the documents are buffered, and throttled with a 429 when the buffer
+is full. Latency and throttling can also be injected to test the retries and the endpoint failover of the collector.
+With --sigv4-region, requests must be signed for the osis service in the region, and the signature is checked when
+the local AWS credentials have the access key of the request. Accepted documents, bytes, throttled requests and the
+latency percentiles are reported every second, with a latency histogram at the end.
+"""
+
+import argparse
+import asyncio
+import bisect
+import gzip
+import hmac
+import json
+import logging
+import random
+import re
+import signal
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import yaml
+
+from tools.common import lookup, percentile, prepare
+from tools.opensearch_client import OpensearchClient
+
+logger = logging.getLogger(__name__)
+
+PIPELINES_DIR = Path(__file__).resolve().parents[1] / 'infra' / 'resources' / 'pipelines'
+
+# A comparison of a route expression, like /metricsType == "taskMetrics"
+CONDITION = re.compile(r'^(/[\w/@.-]*)\s*(==|!=)\s*("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?|true|false|null)$')
+
+AUTHORIZATION = re.compile(r'^AWS4-HMAC-SHA256 Credential=([^/]+)/(\d{8})/([^/]+)/([^/]+)/aws4_request,\s*'
+                           r'SignedHeaders=([^,]+),\s*Signature=([0-9a-f]+)$')
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class Placeholders(dict):
+    """
+    The variables of the pipeline configuration formatted by the ingestor stack, empty when not provided.
+    """
+
+    def __missing__(self, key):
+        return ''
+
+
+def compile_condition(expression: str) -> Callable[[dict], bool]:
+    """
+    Compiles a route expression made of comparisons of JSON pointers with literals, joined with and / or.
+    """
+    alternatives = []
+    for alternative in re.split(r'\s+or\s+', expression.strip()):
+        comparisons = []
+        for comparison in re.split(r'\s+and\s+', alternative.strip()):
+            match = CONDITION.match(comparison.strip().strip('()'))
+            if not match:
+                raise ValueError(f'Unsupported route expression: {expression}')
+            path, operator, literal = match.groups()
+            comparisons.append((path, operator == '==', json.loads(literal)))
+        alternatives.append(comparisons)
+
+    def condition(document: dict) -> bool:
+        for comparisons in alternatives:
+            matched = True
+            for path, equal, value in comparisons:
+                parent, key = lookup(document, path)
+                if ((parent[key] if parent is not None else None) == value) != equal:
+                    matched = False
+                    break
+            if matched:
+                return True
+        return False
+
+    return condition
+
+
+@dataclass
+class Pipeline:
+    """
+    The http source path, the routes and the Opensearch sinks of a pipeline configuration.
+    Sinks without routes receive all the documents.
+    """
+    path: str
+    routes: Dict[str, Callable[[dict], bool]]
+    sinks: List[Tuple[str, Optional[List[str]]]]
+
+    @classmethod
+    def load(cls, path: str, index_prefix: str = '') -> 'Pipeline':
+        config_path = Path(path) if Path(path).exists() else PIPELINES_DIR / path
+        config = yaml.safe_load(config_path.read_text().format_map(Placeholders(index_prefix=index_prefix)))
+        pipeline = next(value for value in config.values() if isinstance(value, dict) and 'http' in value.get('source', {}))
+        return cls(
+            path=pipeline['source']['http'].get('path', '/log/ingest'),
+            routes={name: compile_condition(expression) for route in pipeline.get('route', [])
+                    for name, expression in route.items()},
+            sinks=[(sink['opensearch']['index'], sink['opensearch'].get('routes'))
+                   for sink in pipeline['sink'] if 'opensearch' in sink],
+        )
+
+    def route(self, document: dict) -> List[str]:
+        """
+        The indices receiving the document.
+        """
+        matched = {name for name, condition in self.routes.items() if condition(document)}
+        return [index for index, routes in self.sinks if routes is None or matched.intersection(routes)]
+
+
+class SigV4Verifier:
+    """
+    Checks the SigV4 headers of the requests signed by the collector for the osis service.
+    The signature itself is only checked when the local credentials have the access key of the request.
+    """
+
+    def __init__(self, region: str, service: str = 'osis', max_skew: int = 300):
+        from botocore.session import Session
+        self.region = region
+        self.service = service
+        self.max_skew = max_skew
+        credentials = Session().get_credentials()
+        self.credentials = credentials.get_frozen_credentials() if credentials else None
+        self.unverified = 0
+
+    def verify(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> Optional[str]:
+        """
+        The reason the request is denied, or None when it's signed.
+        """
+        from botocore.auth import SigV4Auth
+        from botocore.awsrequest import AWSRequest
+
+        match = AUTHORIZATION.match(headers.get('authorization', ''))
+        if not match:
+            return 'Missing or malformed SigV4 Authorization header'
+        access_key, date, region, service, signed_headers, signature = match.groups()
+        if (region, service) != (self.region, self.service):
+            return f'Credential scope {region}/{service} doesn\'t match {self.region}/{self.service}'
+        amz_date = headers.get('x-amz-date', '')
+        try:
+            signed_at = datetime.strptime(amz_date, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+        except ValueError:
+            return 'Missing or malformed X-Amz-Date header'
+        if not amz_date.startswith(date) or abs(time.time() - signed_at.timestamp()) > self.max_skew:
+            return 'Signature expired'
+        signed_headers = signed_headers.split(';')
+        if 'host' not in signed_headers or any(name not in headers for name in signed_headers):
+            return 'Signed headers missing from the request'
+        if self.credentials is None or self.credentials.access_key != access_key:
+            self.unverified += 1
+            return None
+
+        request = AWSRequest(method=method, url=f'http://{headers["host"]}{target}', data=body,
+                             headers={name: headers[name] for name in signed_headers})
+        request.context['timestamp'] = amz_date
+        auth = SigV4Auth(self.credentials, self.service, self.region)
+        expected = auth.signature(auth.string_to_sign(request, auth.canonical_request(request)), request)
+        if not hmac.compare_digest(expected, signature):
+            return 'The request signature doesn\'t match'
+        return None
+
+
+class NdjsonSink:
+    """
+    Appends the documents to one NDJSON file per index.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.files = {}
+
+    def backlog(self) -> int:
+        return 0
+
+    def put(self, index: str, document: dict):
+        if index not in self.files:
+            self.files[index] = open(self.directory / f'{index}.ndjson', 'a')
+        self.files[index].write(json.dumps(document) + '\n')
+
+    async def close(self):
+        for file_ in self.files.values():
+            file_.close()
+
+
+class OpensearchSink:
+    """
+    Buffers the documents and sends them to Opensearch in bulk requests from a background task, like the Opensearch
+    sinks of the pipelines. The backlog is the number of buffered documents.
+    """
+
+    def __init__(self, client: OpensearchClient, batch_size: int = 1000):
+        self.client = client
+        self.batch_size = batch_size
+        self.buffer: List[tuple] = []
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.task = asyncio.create_task(self.run())
+        self.stats = {'indexed': 0, 'rejected': 0}
+
+    def backlog(self) -> int:
+        return len(self.buffer)
+
+    def put(self, index: str, document: dict):
+        self.buffer.append(({'index': {'_index': index}}, document))
+        self.ready.set()
+
+    async def run(self):
+        while not self.closed or self.buffer:
+            if not self.buffer:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            items, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+            rejected = await asyncio.to_thread(self.client.bulk, items)
+            self.stats['indexed'] += len(items) - len(rejected)
+            self.stats['rejected'] += len(rejected)
+            for (action, _), error in rejected:
+                logger.warning(f'Document rejected by {action["index"]["_index"]}: {error}')
+
+    async def close(self):
+        self.closed = True
+        self.ready.set()
+        await self.task
+        logger.info(f'Opensearch sink: {self.stats}')
+
+
+class Stats:
+    """
+    The requests, documents and latencies of the current report interval and of the whole run.
+    """
+
+    def __init__(self):
+        self.interval = self.counters()
+        self.total = self.counters()
+        self.latencies: List[float] = []
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.indices: Dict[str, int] = {}
+
+    @staticmethod
+    def counters() -> dict:
+        return {'requests': 0, 'documents': 0, 'bytes': 0, 'throttled': 0, 'errors': 0}
+
+    def record(self, latency: float, status: int, documents: int = 0, size: int = 0):
+        for counters in (self.interval, self.total):
+            counters['requests'] += 1
+            counters['documents'] += documents
+            counters['bytes'] += size
+            counters['throttled'] += status == 429
+            counters['errors'] += status not in (200, 429)
+        self.latencies.append(latency)
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def report(self, elapsed: float) -> str:
+        interval, latencies = self.interval, sorted(self.latencies)
+        self.interval, self.latencies = self.counters(), []
+        line = (f'{interval["documents"] / elapsed:.0f} docs/s, {interval["bytes"] / elapsed / 1024:.0f} KiB/s, '
+                f'{interval["requests"] / elapsed:.1f} req/s, {interval["throttled"]} throttled, {interval["errors"]} errors')
+        if latencies:
+            line += (f', latency p50 {percentile(latencies, 50):.1f} ms, p99 {percentile(latencies, 99):.1f} ms, '
+                     f'max {latencies[-1]:.1f} ms')
+        return line
+
+    def summary(self) -> List[str]:
+        lines = [f'Total: {self.total}', f'Documents per index: {self.indices}', 'Latency histogram (ms):']
+        peak = max(self.histogram) or 1
+        for bound, count in zip(LATENCY_BUCKETS + [float('inf')], self.histogram):
+            lines.append(f'  <= {bound:>6} {count:>8} {"#" * round(40 * count / peak)}')
+        return lines
+
+
+class IngestServer:
+
+    def __init__(self, pipeline: Pipeline, sink, verifier: Optional[SigV4Verifier] = None, latency: float = 0,
+                 jitter: float = 0, throttle_rate: float = 0, max_in_flight: int = 0, buffer_size: int = 100000):
+        self.pipeline = pipeline
+        self.sink = sink
+        self.verifier = verifier
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.max_in_flight = max_in_flight
+        self.buffer_size = buffer_size
+        self.in_flight = 0
+        self.stats = Stats()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serves the HTTP/1.1 requests of a connection, kept alive like the connection pool of the collector.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await read_body(reader, headers)
+                status, message = await self.ingest(method, target, headers, body)
+                content = json.dumps({'message': message}).encode() if message else b''
+                writer.write(f'HTTP/1.1 {status} {HTTP_REASONS.get(status, "")}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(content)}\r\n\r\n'.encode('latin-1') + content)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def ingest(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Optional[str]]:
+        start = time.monotonic()
+        self.in_flight += 1
+        status, message, documents = 200, None, []
+        try:
+            if urlsplit(target).path != self.pipeline.path:
+                status, message = 404, f'Unknown path, the pipeline serves {self.pipeline.path}'
+            elif method != 'POST':
+                status, message = 405, 'Only POST is supported'
+            elif self.verifier and (message := self.verifier.verify(method, target, headers, body)):
+                status = 403
+            else:
+                if self.latency or self.jitter:
+                    await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+                if (random.random() < self.throttle_rate or self.sink.backlog() >= self.buffer_size
+                        or self.max_in_flight and self.in_flight > self.max_in_flight):
+                    status, message = 429, 'The buffer is full'
+                else:
+                    status, message, documents = self.accept(headers, body)
+            return status, message
+        finally:
+            self.in_flight -= 1
+            self.stats.record((time.monotonic() - start) * 1000, status, len(documents), len(body))
+
+    def accept(self, headers: Dict[str, str], body: bytes) -> Tuple[int, Optional[str], list]:
+        if headers.get('content-encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        try:
+            documents = json.loads(body)
+        except ValueError as e:
+            return 400, f'The body is not JSON: {e}', []
+        if not isinstance(documents, list) or not all(isinstance(document, dict) for document in documents):
+            return 400, 'The body must be a JSON array of objects', []
+        received = datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+        for document in documents:
+            # The processors of the pipelines, approximated by the preparation of the bulk loader
+            document['ingestTime'] = received
+            prepare(document)
+            for index in self.pipeline.route(document):
+                self.sink.put(index, document)
+                self.stats.indices[index] = self.stats.indices.get(index, 0) + 1
+        return 200, None, documents
+
+    async def report(self, interval: float):
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            if self.stats.interval['requests']:
+                logger.info(self.stats.report(now - last))
+            last = now
+
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+                429: 'Too Many Requests'}
+
+
+async def read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                return b''.join(chunks)
+            chunks.append(chunk[:-2])
+    return await reader.readexactly(int(headers.get('content-length', 0)))
+
+
+async def serve(args):
+    pipeline = Pipeline.load(args.pipeline, args.index_prefix)
+    if args.opensearch:
+        sink = OpensearchSink(OpensearchClient(args.opensearch, args.opensearch_region), args.batch_size)
+    else:
+        sink = NdjsonSink(args.output)
+    verifier = SigV4Verifier(args.sigv4_region) if args.sigv4_region else None
+    server = IngestServer(pipeline, sink, verifier, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                          throttle_rate=args.throttle_rate, max_in_flight=args.max_in_flight,
+                          buffer_size=args.buffer_size)
+    http = await asyncio.start_server(server.handle, args.host, args.port)
+    logger.info(f'Serving {pipeline.path} on {args.host}:{args.port}, sinks {[index for index, _ in pipeline.sinks]}')
+    reporter = asyncio.create_task(server.report(args.report_interval))
+    try:
+        # Stopped by docker or timeout, the summary is still reported
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    try:
+        async with http:
+            await http.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        reporter.cancel()
+        await sink.close()
+        for line in server.stats.summary():
+            logger.info(line)
+        if verifier and verifier.unverified:
+            logger.info(f'{verifier.unverified} requests signed with other credentials, only their headers were checked')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the http source of the ingestion pipelines')
+    parser.add_argument('--pipeline', default='metrics-pipeline.yaml',
+                        help='Pipeline configuration of the ingestor stack, or the path of a configuration file')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=2021, help='Port to listen on, 2021 like the Data Prepper http source')
+    parser.add_argument('--index-prefix', default='', help='Prefix of the indices of a tenant, like teama-')
+    parser.add_argument('--output', default='ingested', help='Directory of the NDJSON files of the indices')
+    parser.add_argument('--opensearch', help='Opensearch endpoint receiving the documents instead of the NDJSON files')
+    parser.add_argument('--opensearch-region', help='Region of the Opensearch domain, requests are signed when set')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Documents per bulk request of the Opensearch sink')
+    parser.add_argument('--sigv4-region', help='Require requests signed with SigV4 for the osis service in the region')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Latency added to each request')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Random latency up to this value added to each request')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='Ratio of the requests throttled with a 429')
+    parser.add_argument('--max-in-flight', type=int, default=0, help='Concurrent requests above which requests are throttled')
+    parser.add_argument('--buffer-size', type=int, default=100000,
+                        help='Documents waiting for the Opensearch sink above which requests are throttled')
+    parser.add_argument('--report-interval', type=float, default=1, help='Seconds between throughput reports')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
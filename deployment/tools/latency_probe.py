@@ -0,0 +1,245 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Measures the end-to-end ingestion latency, from the time a Spark task ends to the time its document is searchable.
+Run from the deployment directory:
+
+    python -m tools.latency_probe --url https://<metrics-pipeline>/ingest --region us-east-1 \\
+        --endpoint https://<domain-endpoint> --endpoint-region us-east-1 --canaries 30 --interval 2
+
+The probe sends canary documents of the latency-probe application to the pipeline, one per batch stamped with its send
+time and batch ID like the collector does, and polls the index for the batch ID until the canary is searchable. When the
+backend is deployed with IngestLatency, the ingest pipeline of the domain stamps the index time, which splits the time
+to searchable into the pipeline stage, from the send time to the index time, and the index refresh, from the index time
+to the first search finding the canary. Canaries aren't buffered, so the collector buffering, from the task end or the
+log event to the send time, is read from the latency fields of the documents of real applications over the last --window.
+
+Percentiles are computed on the clocks of the collector, the pipeline and the domain hosts, and the searchable time is
+known within --poll-interval. Canaries are deleted at the end unless --keep-canaries is set.
+"""
+
+import argparse
+import logging
+import re
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+import requests
+
+from tools.common import now, percentile
+from tools.opensearch_client import AUTH_DIR, OpensearchClient
+
+logger = logging.getLogger(__name__)
+
+CANARY_APP = 'latency-probe'
+
+# The index of the canaries of each pipeline and the indices they can reach, deleted at the end
+STREAM_INDICES = {
+    'metrics': ('spark-task-metrics', ['spark-task-metrics', 'spark-stage-agg-metrics']),
+    'logs': ('spark-logs', ['spark-logs']),
+}
+
+# The latency fields stamped by the ingest pipeline of the domain, in milliseconds
+LATENCY_FIELDS = ['buffering', 'transport', 'pipeline']
+
+# Fraction digits beyond microseconds, like the nanoseconds of the ingest timestamp of the domain
+EXTRA_DIGITS = re.compile(r'(\.\d{6})\d+')
+
+
+@dataclass
+class Canary:
+    batch_id: str
+    send_time: int
+    ingest_time: Optional[int] = None
+    index_time: Optional[int] = None
+    searchable_time: Optional[int] = None
+
+
+def canary(stream: str, batch_id: str, send_time: int) -> dict:
+    """
+    A canary document of the stream, shaped like the documents of the collector.
+    """
+    document = {'appName': CANARY_APP, 'appId': CANARY_APP, 'executorId': 'driver', 'sendTime': send_time,
+                'batchId': batch_id}
+    if stream == 'logs':
+        return dict(document, logTime=send_time, level='INFO', loggerName='tools.latency_probe',
+                    threadName='main', message={'message': f'Latency probe canary {batch_id}'})
+    return dict(document, metricsType='taskMetrics', metricTime=send_time, jobId='0', stageId=0, stageAttemptId=0,
+                partitionId=0, taskId=batch_id, runTime=0, executorCpuTime=0)
+
+
+def parse_time(value: Union[str, int, float, None]) -> Optional[int]:
+    """
+    Epoch milliseconds of a date field, either epoch milliseconds or an ISO 8601 string.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return int(datetime.fromisoformat(EXTRA_DIGITS.sub(r'\1', value).replace('Z', '+00:00')).timestamp() * 1000)
+
+
+class Probe:
+    """
+    Sends the canaries to the pipeline and waits until they're searchable, one at a time.
+    """
+
+    def __init__(self, url: str, client: OpensearchClient, index: str, stream: str = 'metrics',
+                 region: Optional[str] = None, poll_interval: float = 0.1, timeout: float = 120):
+        self.url = url
+        self.client = client
+        self.index = index
+        self.stream = stream
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.auth = None
+        if region:
+            sys.path.append(str(AUTH_DIR))
+            from opensearch_auth import OpensearchAuth
+            self.auth = OpensearchAuth(region, service='osis')
+        self.canaries: List[Canary] = []
+        self.lost = 0
+
+    def send(self) -> Optional[Canary]:
+        """
+        Sends a canary and returns it once it's searchable, or None when it's rejected or not found before the timeout.
+        """
+        probe = Canary(str(uuid.uuid4()), now())
+        response = self.session.post(self.url, json=[canary(self.stream, probe.batch_id, probe.send_time)],
+                                     auth=self.auth)
+        if response.status_code != 200:
+            logger.warning(f'Canary rejected by the pipeline with status {response.status_code}: {response.text[:200]}')
+            self.lost += 1
+            return None
+        query = {'size': 1, 'query': {'term': {'batchId': probe.batch_id}}, '_source': ['ingestTime', 'indexTime']}
+        while now() - probe.send_time < self.timeout * 1000:
+            searched = now()
+            response = self.client.request('POST', f'{self.index}/_search', query)
+            if not response.ok:
+                raise Exception(f'Search failed with status {response.status_code}: {response.text[:500]}')
+            hits = response.json()['hits']['hits']
+            if hits:
+                source = hits[0]['_source']
+                probe.ingest_time = parse_time(source.get('ingestTime'))
+                probe.index_time = parse_time(source.get('indexTime'))
+                probe.searchable_time = searched
+                self.canaries.append(probe)
+                return probe
+            time.sleep(self.poll_interval)
+        logger.warning(f'Canary {probe.batch_id} not searchable after {self.timeout}s')
+        self.lost += 1
+        return None
+
+    def stages(self) -> Dict[str, List[int]]:
+        """
+        The sorted latencies of the canaries in milliseconds, per stage. The index time is missing when the index
+        has no ingest pipeline, then only the time to searchable is known.
+        """
+        stages = {'transport': [], 'pipeline': [], 'refresh': [], 'searchable': []}
+        for probe in self.canaries:
+            stages['searchable'].append(probe.searchable_time - probe.send_time)
+            if probe.ingest_time is not None:
+                stages['transport'].append(probe.ingest_time - probe.send_time)
+            if probe.index_time is not None:
+                stages['pipeline'].append(probe.index_time - probe.send_time)
+                # Negative when the clock of the domain is ahead of the probe by more than the refresh
+                stages['refresh'].append(max(0, probe.searchable_time - probe.index_time))
+        return {stage: sorted(values) for stage, values in stages.items()}
+
+    def cleanup(self, indices: List[str]):
+        response = self.client.request('POST', f'{",".join(indices)}/_delete_by_query?conflicts=proceed&ignore_unavailable=true',
+                                       {'query': {'term': {'appId': CANARY_APP}}})
+        if not response.ok:
+            logger.warning(f'Canaries not deleted, status {response.status_code}: {response.text[:200]}')
+        else:
+            logger.info(f'{response.json().get("deleted", 0)} canaries deleted')
+
+
+def document_percentiles(client: OpensearchClient, index: str, window: str) -> Dict[str, Tuple[Optional[float], Optional[float], int]]:
+    """
+    The p50, p99 and count of the latency fields of the documents sent in the window, without the canaries.
+    """
+    aggregations = {}
+    for field in LATENCY_FIELDS:
+        aggregations[field] = {'percentiles': {'field': f'ingestLatency.{field}', 'percents': [50, 99]}}
+        aggregations[f'{field}_count'] = {'value_count': {'field': f'ingestLatency.{field}'}}
+    query = {'size': 0, 'aggs': aggregations,
+             'query': {'bool': {'filter': [{'range': {'sendTime': {'gte': f'now-{window}'}}}],
+                                'must_not': [{'term': {'appId': CANARY_APP}}]}}}
+    response = client.request('POST', f'{index}/_search', query)
+    if not response.ok:
+        raise Exception(f'Search failed with status {response.status_code}: {response.text[:500]}')
+    results = response.json()['aggregations']
+    return {field: (results[field]['values'].get('50.0'), results[field]['values'].get('99.0'),
+                    results[f'{field}_count']['value'])
+            for field in LATENCY_FIELDS}
+
+
+def report(stages: Dict[str, List[int]], documents: Dict[str, Tuple[Optional[float], Optional[float], int]],
+           lost: int) -> str:
+    """
+    The latency table of the canaries and of the documents, in milliseconds.
+    """
+    lines = [f'{"stage":<36}{"p50 ms":>10}{"p99 ms":>10}{"samples":>10}']
+
+    def line(name, p50, p99, count):
+        if not count:
+            return f'{name:<36}{"-":>10}{"-":>10}{0:>10}'
+        return f'{name:<36}{p50:>10.0f}{p99:>10.0f}{count:>10}'
+
+    lines.append(line('collector buffering (documents)', *documents['buffering']))
+    lines.append(line('transport to the pipeline (documents)', *documents['transport']))
+    lines.append(line('pipeline, send to index (documents)', *documents['pipeline']))
+    for stage, name in (('transport', 'transport to the pipeline (canaries)'),
+                        ('pipeline', 'pipeline, send to index (canaries)'), ('refresh', 'index refresh (canaries)'),
+                        ('searchable', 'send to searchable (canaries)')):
+        values = stages[stage]
+        if values:
+            lines.append(line(name, percentile(values, 50), percentile(values, 99), len(values)))
+        else:
+            lines.append(line(name, None, None, 0))
+    if lost:
+        lines.append(f'{lost} canaries lost')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the time from a Spark task end to its document searchable')
+    parser.add_argument('--url', required=True, help='URL of the pipeline, like https://<endpoint>/ingest')
+    parser.add_argument('--region', help='Region of the pipeline, requests are signed with SigV4 when set')
+    parser.add_argument('--endpoint', required=True, help='Opensearch endpoint searched for the canaries')
+    parser.add_argument('--endpoint-region', help='Region of the Opensearch domain, requests are signed when set')
+    parser.add_argument('--stream', choices=list(STREAM_INDICES), default='metrics',
+                        help='Pipeline of the URL, the canaries are task metrics or log events')
+    parser.add_argument('--index-prefix', default='', help='Prefix of the indices of a tenant, like teama-')
+    parser.add_argument('--canaries', type=int, default=20, help='Canaries to send, one at a time')
+    parser.add_argument('--interval', type=float, default=1, help='Seconds between a canary searchable and the next one')
+    parser.add_argument('--poll-interval', type=float, default=0.1, help='Seconds between the searches of a canary')
+    parser.add_argument('--timeout', type=float, default=120, help='Seconds before a canary is lost')
+    parser.add_argument('--window', default='1h', help='Window of the documents of real applications, like 15m')
+    parser.add_argument('--keep-canaries', action='store_true', help='Keep the canaries in the indices')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    index, indices = STREAM_INDICES[args.stream]
+    client = OpensearchClient(args.endpoint, args.endpoint_region, pool_size=1)
+    probe = Probe(args.url, client, args.index_prefix + index, args.stream, args.region, args.poll_interval, args.timeout)
+    try:
+        for n in range(args.canaries):
+            if n:
+                time.sleep(args.interval)
+            found = probe.send()
+            if found:
+                logger.info(f'Canary {n + 1}/{args.canaries} searchable in {found.searchable_time - found.send_time} ms')
+    finally:
+        if not args.keep_canaries:
+            probe.cleanup([args.index_prefix + name for name in indices])
+    print(report(probe.stages(), document_percentiles(client, args.index_prefix + index, args.window), probe.lost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,384 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Generates the telemetry of Spark applications, task metrics, stage aggregated metrics and Log4j logs shaped like the
+documents of the collector, and sends it at a target rate to the pipelines or directly to Opensearch. It's used to size
+the pipelines and the domain, and to reproduce slow dashboards, without running real jobs. Run from the deployment
+directory:
+
+    python -m tools.load_generator --metrics-url https://<metrics-pipeline>/ingest --logs-url https://<logs-pipeline>/ingest \\
+        --region us-east-1 --rate 5000 --duration 600
+
+    python -m tools.load_generator --endpoint http://localhost:9200 --rate 20000 --documents 1000000 --zipf 1.2
+
+Applications run concurrently and their stages one after the other. The partition sizes of the skewed stages follow
+a Zipf distribution, the others vary slightly around the mean, and the stage aggregated metrics are computed from the
+tasks like the listener does. Executor tasks log a few lines each, some of them warnings or errors with a stack trace
+of a few recurring exceptions so the fingerprints group them like real errors.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from tools.common import now, percentile, prepare, stage_aggregation
+from tools.opensearch_client import AUTH_DIR, RETRIED_STATUSES, BoundedExecutor, BulkWriter, OpensearchClient
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+
+# The frames of the stack trace fingerprint of the collector, see Utils.stackTraceFingerprint
+FINGERPRINT_FRAMES = 10
+
+# Recurring errors of Spark executors: the level, the logger, the message and the frames of the exception
+EXCEPTIONS = [
+    ('WARN', 'org.apache.spark.storage.BlockManager', 'Failed to fetch remote block',
+     'org.apache.spark.shuffle.FetchFailedException', 'Failed to connect to ip-10-0-{executor}-12.ec2.internal/10.0.1.12:7337',
+     ['org.apache.spark.storage.ShuffleBlockFetcherIterator.throwFetchFailedException',
+      'org.apache.spark.storage.ShuffleBlockFetcherIterator.next',
+      'org.apache.spark.util.CompletionIterator.next',
+      'org.apache.spark.sql.execution.UnsafeRowSerializerInstance$$anon$2$$anon$3.next',
+      'org.apache.spark.sql.execution.exchange.ShuffleExchangeExec.doExecute']),
+    ('ERROR', 'org.apache.spark.executor.Executor', 'Exception in task {task} in stage {stage} (TID {tid})',
+     'java.lang.OutOfMemoryError', 'Java heap space',
+     ['org.apache.spark.unsafe.memory.HeapMemoryAllocator.allocate',
+      'org.apache.spark.memory.TaskMemoryManager.allocatePage',
+      'org.apache.spark.sql.execution.UnsafeExternalRowSorter.insertRow',
+      'org.apache.spark.sql.execution.SortExec.doExecute']),
+    ('WARN', 'org.apache.spark.scheduler.TaskSetManager', 'Lost task {task} in stage {stage} (TID {tid})',
+     'java.io.FileNotFoundException', 'No such file or directory: s3://datalake/store_sales/part-{tid}.parquet',
+     ['org.apache.hadoop.fs.s3a.S3AFileSystem.s3GetFileStatus',
+      'org.apache.hadoop.fs.s3a.S3AFileSystem.open',
+      'org.apache.parquet.hadoop.ParquetFileReader.open',
+      'org.apache.spark.sql.execution.datasources.FileScanRDD$$anon$1.nextIterator']),
+    ('ERROR', 'org.apache.spark.util.Utils', 'Aborting task',
+     'org.apache.spark.SparkException', 'Task failed while writing rows',
+     ['org.apache.spark.sql.execution.datasources.FileFormatWriter$.executeTask',
+      'org.apache.spark.sql.execution.datasources.FileFormatWriter$.write',
+      'org.apache.spark.scheduler.ResultTask.runTask',
+      'org.apache.spark.executor.Executor$TaskRunner.run']),
+]
+
+
+class Workload:
+    """
+    An endless stream of the documents of concurrent Spark applications, with the stream receiving each document.
+    A finished application is replaced by a new one, so the workload runs for any duration.
+    """
+
+    def __init__(self, apps: int = 4, stages: int = 50, tasks_per_stage: int = 200, partition_mb: float = 128,
+                 zipf: float = 1.1, skewed_stages: float = 0.2, executors: int = 50, logs_per_task: float = 2,
+                 stack_trace_ratio: float = 0.01, seed: Optional[int] = None):
+        self.apps = apps
+        self.stages = stages
+        self.tasks_per_stage = tasks_per_stage
+        self.partition_bytes = partition_mb * MIB
+        self.zipf = zipf
+        self.skewed_stages = skewed_stages
+        self.executors = executors
+        self.logs_per_task = logs_per_task
+        self.stack_trace_ratio = stack_trace_ratio
+        self.rng = np.random.default_rng(seed)
+        self.random = random.Random(seed)
+        self.started = 0
+        self.stack_traces = [self.stack_trace(exception) for exception in EXCEPTIONS]
+        # The recurring exceptions are Zipf distributed too, the first ones are the most frequent
+        self.exception_weights = [1 / rank ** 1.5 for rank in range(1, len(EXCEPTIONS) + 1)]
+
+    def documents(self) -> Iterator[Tuple[str, dict]]:
+        running = [self.application() for _ in range(self.apps)]
+        while True:
+            index = self.random.randrange(len(running))
+            documents = next(running[index], None)
+            if documents is None:
+                running[index] = self.application()
+            else:
+                yield from documents
+
+    def application(self) -> Iterator[List[Tuple[str, dict]]]:
+        """
+        The documents of an application, one task at a time with its logs, so concurrent applications interleave.
+        """
+        self.started += 1
+        app = {'appName': f'tpcds-{self.started % 20}', 'appId': f'application_{int(time.time() * 1000)}_{self.started:04d}'}
+        tid = 0
+        for stage_id in range(self.stages):
+            job_id = str(stage_id // 5)
+            sizes = self.partition_sizes()
+            values = np.empty((len(sizes), 2))
+            for partition, size in enumerate(sizes):
+                tid += 1
+                task = self.task_metrics(app, job_id, stage_id, partition, size)
+                values[partition] = task['inputBytesRead'], task['shuffleBytesRead']
+                yield [('metrics', task)] + [('logs', log) for log in self.task_logs(app, task, tid)]
+            skewness, maximum = stage_aggregation(values)
+            yield [('metrics', dict(app, jobId=job_id, stageId=stage_id, metricsType='stageAggMetrics', metricTime=now(),
+                                    inputBytesReadSkewness=float(skewness[0]), maxInputBytesRead=float(maximum[0]),
+                                    shuffleBytesReadSkewness=float(skewness[1]), maxShuffleBytesRead=float(maximum[1])))]
+
+    def partition_sizes(self) -> np.ndarray:
+        """
+        The input bytes of the partitions of a stage, Zipf distributed over the partitions of skewed stages.
+        """
+        if self.rng.random() < self.skewed_stages:
+            ranks = self.rng.permutation(self.tasks_per_stage) + 1
+            weights = ranks ** -self.zipf
+            return self.partition_bytes * self.tasks_per_stage * weights / weights.sum()
+        return self.partition_bytes * self.rng.lognormal(0, 0.2, self.tasks_per_stage)
+
+    def task_metrics(self, app: dict, job_id: str, stage_id: int, partition: int, size: float) -> dict:
+        factor = size / self.partition_bytes
+        shuffle = float(int(size / 8))
+        return dict(app, **{
+            'jobId': job_id,
+            'stageId': stage_id,
+            'stageAttemptId': 0,
+            'taskId': f'{partition}.0',
+            'executorId': str(self.random.randint(1, self.executors)),
+            'partitionId': partition,
+            'inputBytesRead': float(int(size)),
+            'inputRecordsRead': float(int(size / 120)),
+            'runTime': float(int(2000 * factor) + 1),
+            'executorCpuTime': float(int(1.5e9 * factor)),
+            'peakExecutionMemory': float(int(2 * size)),
+            'outputRecordsWritten': float(int(size / 480)),
+            'outputBytesWritten': float(int(size / 4)),
+            'shuffleRecordsRead': float(int(shuffle / 60)),
+            'shuffleBytesRead': shuffle,
+            'shuffleRecordsWritten': float(int(shuffle / 60)),
+            'shuffleBytesWritten': shuffle,
+            'metricsType': 'taskMetrics',
+            'metricTime': now(),
+        })
+
+    def task_logs(self, app: dict, task: dict, tid: int) -> List[dict]:
+        """
+        The Log4j events of a task, like the collector appender sends them before the logs pipeline processors.
+        """
+        task_name = f'task {task["taskId"]} in stage {task["stageId"]}.0 (TID {tid})'
+        names = {'task': task['taskId'], 'stage': task['stageId'], 'tid': tid, 'executor': task['executorId']}
+        logs = []
+        for _ in range(self.rng.poisson(self.logs_per_task)):
+            log = {'level': 'INFO', 'loggerName': 'org.apache.spark.executor.Executor',
+                   'message': {'message': f'Finished {task_name}. {int(task["runTime"]) * 13} bytes result sent to driver'}}
+            if self.random.random() < self.stack_trace_ratio:
+                exception = self.random.choices(range(len(EXCEPTIONS)), self.exception_weights)[0]
+                level, logger_name, message = EXCEPTIONS[exception][:3]
+                stack_trace, fingerprint = self.stack_traces[exception]
+                log = {'level': level, 'loggerName': logger_name, 'message': {'message': message.format(**names)},
+                       'stackTrace': stack_trace.format(**names), 'stackTraceFingerprint': fingerprint}
+            time_ms = now()
+            logs.append(dict(app, **log, **{
+                'executorId': task['executorId'],
+                'threadName': f'Executor task launch worker for {task_name}',
+                'threadId': 60 + tid % 8,
+                'threadPriority': 5,
+                'loggerFqcn': 'org.apache.logging.slf4j.Log4jLogger',
+                'endOfBatch': False,
+                'instant': {'epochSecond': time_ms // 1000, 'nanoOfSecond': time_ms % 1000 * 1000000},
+                'contextData': {'mdc.taskName': task_name},
+                'taskName': task_name,
+                'logTime': time_ms,
+            }))
+        return logs
+
+    @staticmethod
+    def stack_trace(exception: tuple) -> Tuple[str, str]:
+        """
+        The stack trace of a recurring exception and its fingerprint, computed like the collector does from the
+        exception class and its top frames.
+        """
+        _, _, _, class_name, message, frames = exception
+        frames = frames + [f'org.apache.spark.scheduler.Task.run{n}' for n in range(30)]
+        lines = [f'{class_name}: {message}'] + [f'\tat {frame}({frame.split(".")[-2]}.scala:{100 + n})'
+                                                for n, frame in enumerate(frames)]
+        digest = hashlib.sha1(class_name.encode())
+        for frame in frames[:FINGERPRINT_FRAMES]:
+            digest.update(f'|{frame}'.encode())
+        # The message of the first line is formatted with the task of each occurrence
+        return '\n'.join(lines) + '\n', digest.hexdigest()[:16]
+
+
+class IngestSender:
+    """
+    Sends the documents of each stream to its pipeline URL in JSON arrays of a batch size, like the collector does,
+    stamped with the send time and ID of the batch at each attempt.
+    Requests are signed with SigV4 for the osis service when a region is set, and retried with an exponential backoff
+    when they're throttled. At most two requests per worker are in flight, like the bulk requests of the writer.
+    """
+
+    def __init__(self, urls: Dict[str, str], region: Optional[str] = None, workers: int = 4, batch_size: int = 100,
+                 max_retries: int = 8, backoff: float = 0.5):
+        self.urls = urls
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.mount('http', HTTPAdapter(pool_maxsize=workers))
+        self.auth = None
+        if region:
+            sys.path.append(str(AUTH_DIR))
+            from opensearch_auth import OpensearchAuth
+            self.auth = OpensearchAuth(region, service='osis')
+        self.pool = BoundedExecutor(workers)
+        self.batches = {stream: [] for stream in urls}
+        self.lock = threading.Lock()
+        self.stats = {'sent': 0, 'failed': 0, 'requests': 0, 'throttled': 0}
+        self.latencies: List[float] = []
+
+    def add(self, stream: str, document: dict):
+        if stream not in self.batches:
+            return
+        self.batches[stream].append(document)
+        if len(self.batches[stream]) >= self.batch_size:
+            self._submit(stream)
+
+    def close(self) -> dict:
+        for stream, batch in self.batches.items():
+            if batch:
+                self._submit(stream)
+        self.pool.shutdown()
+        self.session.close()
+        return self.stats
+
+    def _submit(self, stream: str):
+        self.pool.submit(self._send, self.urls[stream], self.batches[stream])
+        self.batches[stream] = []
+
+    def _send(self, url: str, documents: List[dict]):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            stamp = {'sendTime': now(), 'batchId': str(uuid.uuid4())}
+            for document in documents:
+                document.update(stamp)
+            body = json.dumps(documents, separators=(',', ':')).encode()
+            start = time.monotonic()
+            try:
+                response = self.session.post(url, data=body, auth=self.auth, headers={'Content-Type': 'application/json'})
+                status = response.status_code
+            except requests.ConnectionError:
+                status = None
+            with self.lock:
+                self.stats['requests'] += 1
+                self.latencies.append((time.monotonic() - start) * 1000)
+                if status == 200:
+                    self.stats['sent'] += len(documents)
+                    return
+                if status in RETRIED_STATUSES or status is None:
+                    self.stats['throttled'] += 1
+                    continue
+            logger.warning(f'Request to {url} failed with status {status}: {response.text[:200]}')
+            break
+        with self.lock:
+            self.stats['failed'] += len(documents)
+
+    def report(self) -> str:
+        with self.lock:
+            latencies, self.latencies = sorted(self.latencies), []
+            stats = dict(self.stats)
+        line = f'{stats["sent"]} sent, {stats["failed"]} failed, {stats["throttled"]} throttled requests'
+        if latencies:
+            line += f', request latency p50 {percentile(latencies, 50):.0f} ms, p99 {percentile(latencies, 99):.0f} ms'
+        return line
+
+
+class BulkSender:
+    """
+    Indexes the documents directly into the Spark indices, prepared and routed like the pipelines do.
+    """
+
+    def __init__(self, client: OpensearchClient, index_prefix: str = '', workers: int = 4, batch_size: int = 1000):
+        self.index_prefix = index_prefix
+        self.writer = BulkWriter(client, workers=workers, batch_size=batch_size)
+
+    def add(self, stream: str, document: dict):
+        index = prepare(document)
+        if index is not None:
+            self.writer.add(({'index': {'_index': self.index_prefix + index}}, document))
+
+    def close(self) -> dict:
+        return self.writer.close()
+
+    def report(self) -> str:
+        stats = self.writer.stats
+        return f'{stats["indexed"]} indexed, {stats["rejected"]} rejected, {stats["requests"]} bulk requests'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sends synthetic Spark telemetry to the pipelines or to Opensearch')
+    parser.add_argument('--metrics-url', help='URL of the metrics pipeline, like https://<endpoint>/ingest')
+    parser.add_argument('--logs-url', help='URL of the logs pipeline, like https://<endpoint>/ingest')
+    parser.add_argument('--region', help='Region of the pipelines, requests are signed with SigV4 when set')
+    parser.add_argument('--endpoint', help='Opensearch endpoint receiving bulk requests instead of the pipelines')
+    parser.add_argument('--endpoint-region', help='Region of the Opensearch domain, bulk requests are signed when set')
+    parser.add_argument('--index-prefix', default='', help='Prefix of the indices of a tenant, like teama-')
+    parser.add_argument('--rate', type=float, default=1000, help='Target documents per second, 0 for as fast as possible')
+    parser.add_argument('--duration', type=float, help='Seconds to run')
+    parser.add_argument('--documents', type=int, help='Documents to send')
+    parser.add_argument('--apps', type=int, default=4, help='Concurrent applications')
+    parser.add_argument('--stages', type=int, default=50, help='Stages per application')
+    parser.add_argument('--tasks-per-stage', type=int, default=200, help='Tasks per stage')
+    parser.add_argument('--partition-mb', type=float, default=128, help='Mean input MiB of the partitions')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent of the partition sizes of the skewed stages')
+    parser.add_argument('--skewed-stages', type=float, default=0.2, help='Ratio of the stages with skewed partitions')
+    parser.add_argument('--executors', type=int, default=50, help='Executors per application')
+    parser.add_argument('--logs-per-task', type=float, default=2, help='Mean log events per task')
+    parser.add_argument('--stack-trace-ratio', type=float, default=0.01, help='Ratio of the log events with a stack trace')
+    parser.add_argument('--workers', type=int, default=4, help='Parallel requests')
+    parser.add_argument('--batch-size', type=int, help='Documents per request, 100 to the pipelines and 1000 in bulk')
+    parser.add_argument('--report-interval', type=float, default=5, help='Seconds between throughput reports')
+    parser.add_argument('--seed', type=int, help='Seed of the random generators, for reproducible workloads')
+    args = parser.parse_args()
+    if bool(args.endpoint) == bool(args.metrics_url or args.logs_url):
+        parser.error('one of --endpoint or --metrics-url and --logs-url is required')
+    if not args.duration and not args.documents:
+        parser.error('one of --duration or --documents is required')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if args.endpoint:
+        sender = BulkSender(OpensearchClient(args.endpoint, args.endpoint_region, pool_size=args.workers),
+                            args.index_prefix, args.workers, args.batch_size or 1000)
+    else:
+        urls = {stream: url for stream, url in (('metrics', args.metrics_url), ('logs', args.logs_url)) if url}
+        sender = IngestSender(urls, args.region, args.workers, args.batch_size or 100)
+    workload = Workload(args.apps, args.stages, args.tasks_per_stage, args.partition_mb, args.zipf, args.skewed_stages,
+                        args.executors, args.logs_per_task, args.stack_trace_ratio, args.seed)
+
+    start = last_report = time.monotonic()
+    generated = last_generated = 0
+    for stream, document in workload.documents():
+        sender.add(stream, document)
+        generated += 1
+        if generated % 100 == 0:
+            current = time.monotonic()
+            # Paced every 100 documents, the sender blocks when the target is faster than the pipelines or the domain
+            if args.rate and start + generated / args.rate > current:
+                time.sleep(start + generated / args.rate - current)
+            if current - last_report >= args.report_interval:
+                logger.info(f'{(generated - last_generated) / (current - last_report):.0f} docs/s generated, '
+                            f'{sender.report()}')
+                last_report, last_generated = current, generated
+        if args.documents and generated >= args.documents or args.duration and time.monotonic() - start >= args.duration:
+            break
+    stats = sender.close()
+    elapsed = time.monotonic() - start
+    logger.info(f'Done in {elapsed:.1f}s: {generated} documents generated, {generated / elapsed:.0f} docs/s, '
+                f'{workload.started} applications, {stats}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+from tools.metrics_archive.archive import MetricsArchive
+
+__all__ = ['MetricsArchive']
@@ -0,0 +1,58 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Queries the task metrics archived as Parquet objects by the metrics pipelines. Run from the deployment directory:
+
+    python -m tools.metrics_archive --source s3://<archive-bucket>/task-metrics --since 2024-01-01 skew --top 10
+    python -m tools.metrics_archive --source ./archive --app-id application_1700000000000_0001 slow-stages
+    python -m tools.metrics_archive --source ./archive --since 2024-01-01 --until 2024-01-31 --format csv app-totals
+"""
+
+import argparse
+import json
+import sys
+
+import pyarrow.csv
+
+from tools.metrics_archive.archive import MetricsArchive
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Queries the task metrics archive')
+    parser.add_argument('--source', required=True, help='S3 location like s3://bucket/task-metrics or local directory of the archive')
+    parser.add_argument('--since', help='First day of the archive to query, like 2024-01-01')
+    parser.add_argument('--until', help='Last day of the archive to query, included')
+    parser.add_argument('--app-id', action='append', default=[], help='Application ID to query, can be repeated')
+    parser.add_argument('--app-name', help='Application name to query')
+    parser.add_argument('--format', choices=['table', 'csv', 'json'], default='table')
+    parser.add_argument('--top', type=int, default=20, help='Number of rows returned')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for command in ('skew', 'slow-stages'):
+        commands.add_parser(command).add_argument('--min-tasks', type=int, default=2 if command == 'skew' else 1,
+                                                  help='Minimum number of tasks of the stages')
+    commands.add_parser('app-totals')
+    commands.add_parser('files', help='Lists the objects left after the partition pruning')
+    args = parser.parse_args()
+
+    archive = MetricsArchive(args.source)
+    filters = {'since': args.since, 'until': args.until, 'app_ids': args.app_id, 'app_name': args.app_name}
+    if args.command == 'files':
+        print('\n'.join(archive.files(**filters)))
+        return
+    if args.command == 'app-totals':
+        result = archive.app_totals(top=args.top, **filters)
+    else:
+        result = archive.query(args.command.replace('-', '_'), top=args.top, min_tasks=args.min_tasks, **filters)
+
+    if args.format == 'csv':
+        pyarrow.csv.write_csv(result, sys.stdout.buffer)
+    elif args.format == 'json':
+        for row in result.to_pylist():
+            print(json.dumps(row, default=str))
+    else:
+        print(archive.connection.from_arrow(result))
+
+
+if __name__ == '__main__':
+    main()
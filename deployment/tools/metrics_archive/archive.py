@@ -0,0 +1,139 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+from datetime import date
+from typing import List, Optional, Sequence, Union
+
+import duckdb
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# The Hive partitions of the archive, the day the objects were written and the application ID
+PARTITIONING = ds.partitioning(pa.schema([('dt', pa.string()), ('app_id', pa.string())]), flavor='hive')
+
+# Task metrics are written when the task ends, the window of a task is [metricTime - runTime, metricTime] in ms
+SKEW_QUERY = '''
+    SELECT appId, any_value(appName) AS appName, stageId, stageAttemptId, count(*) AS taskCount,
+           max(inputBytesRead) AS maxInputBytesRead, avg(inputBytesRead) AS meanInputBytesRead,
+           coalesce(greatest(max(inputBytesRead) - avg(inputBytesRead), avg(inputBytesRead) - min(inputBytesRead))
+                    / nullif(max(inputBytesRead) - min(inputBytesRead), 0), 0) AS inputBytesReadSkewness,
+           max(shuffleBytesRead) AS maxShuffleBytesRead, avg(shuffleBytesRead) AS meanShuffleBytesRead,
+           coalesce(greatest(max(shuffleBytesRead) - avg(shuffleBytesRead), avg(shuffleBytesRead) - min(shuffleBytesRead))
+                    / nullif(max(shuffleBytesRead) - min(shuffleBytesRead), 0), 0) AS shuffleBytesReadSkewness
+    FROM tasks
+    GROUP BY appId, stageId, stageAttemptId
+    HAVING count(*) >= $min_tasks
+    ORDER BY greatest(inputBytesReadSkewness, shuffleBytesReadSkewness) DESC, taskCount DESC
+    LIMIT $top
+'''
+
+SLOW_STAGES_QUERY = '''
+    SELECT appId, any_value(appName) AS appName, stageId, stageAttemptId, count(*) AS taskCount,
+           max(metricTime) - min(metricTime - runTime) AS duration,
+           sum(runTime) AS totalRunTime, max(runTime) AS maxRunTime, quantile_cont(runTime, 0.5) AS medianRunTime,
+           sum(executorCpuTime) / 1e6 AS totalCpuTime,
+           sum(inputBytesRead) AS totalInputBytesRead, sum(shuffleBytesRead) AS totalShuffleBytesRead
+    FROM tasks
+    GROUP BY appId, stageId, stageAttemptId
+    HAVING count(*) >= $min_tasks
+    ORDER BY duration DESC
+    LIMIT $top
+'''
+
+APP_TOTALS_QUERY = '''
+    SELECT appId, any_value(appName) AS appName,
+           to_timestamp(min(metricTime - runTime) / 1000) AS startTime, to_timestamp(max(metricTime) / 1000) AS endTime,
+           count(DISTINCT jobId) AS jobCount, count(DISTINCT (stageId, stageAttemptId)) AS stageCount,
+           count(*) AS taskCount, count(DISTINCT executorId) AS executorCount,
+           sum(runTime) AS totalRunTime, sum(executorCpuTime) / 1e6 AS totalCpuTime,
+           max(peakExecutionMemory) AS maxPeakExecutionMemory,
+           sum(inputBytesRead) AS totalInputBytesRead, sum(inputRecordsRead) AS totalInputRecordsRead,
+           sum(outputBytesWritten) AS totalOutputBytesWritten, sum(outputRecordsWritten) AS totalOutputRecordsWritten,
+           sum(shuffleBytesRead) AS totalShuffleBytesRead, sum(shuffleBytesWritten) AS totalShuffleBytesWritten
+    FROM tasks
+    GROUP BY appId
+    ORDER BY totalRunTime DESC
+    LIMIT $top
+'''
+
+# The columns read by each query, the other columns of the Parquet objects are not read
+QUERY_COLUMNS = {
+    'skew': ['appId', 'appName', 'stageId', 'stageAttemptId', 'inputBytesRead', 'shuffleBytesRead'],
+    'slow_stages': ['appId', 'appName', 'stageId', 'stageAttemptId', 'metricTime', 'runTime', 'executorCpuTime',
+                    'inputBytesRead', 'shuffleBytesRead'],
+    'app_totals': ['appId', 'appName', 'jobId', 'stageId', 'stageAttemptId', 'executorId', 'metricTime', 'runTime',
+                   'executorCpuTime', 'peakExecutionMemory', 'inputBytesRead', 'inputRecordsRead', 'outputBytesWritten',
+                   'outputRecordsWritten', 'shuffleBytesRead', 'shuffleBytesWritten'],
+}
+
+
+class MetricsArchive:
+    """
+    Queries the task metrics archived as Parquet objects by the metrics pipelines, in an S3 location like
+    `s3://<bucket>/task-metrics` or a local directory with the same layout.
+    The day and application filters prune the partitions before any object is opened, the application name and
+    the time filters are pushed down to the Parquet row groups statistics, and only the columns of the query are read.
+    The filtered batches are streamed to DuckDB so the memory only holds the aggregation state.
+    """
+
+    def __init__(self, source: str):
+        self.dataset = ds.dataset(source, format='parquet', partitioning=PARTITIONING)
+        self.connection = duckdb.connect()
+
+    def filter(self, since: Union[None, str, date] = None, until: Union[None, str, date] = None,
+               app_ids: Sequence[str] = (), app_name: Optional[str] = None) -> Optional[ds.Expression]:
+        """
+        The partition and row filters, days are inclusive and compared as their ISO form like the partitions.
+        """
+        conditions = []
+        if since:
+            conditions.append(ds.field('dt') >= str(since))
+        if until:
+            conditions.append(ds.field('dt') <= str(until))
+        if app_ids:
+            conditions.append(ds.field('app_id').isin(list(app_ids)))
+        if app_name:
+            conditions.append(ds.field('appName') == app_name)
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def files(self, **filters) -> List[str]:
+        """
+        The objects left after the partition pruning.
+        """
+        return [fragment.path for fragment in self.dataset.get_fragments(filter=self.filter(**filters))]
+
+    def query(self, name: str, top: int = 20, min_tasks: int = 1, **filters) -> pa.Table:
+        """
+        Runs one of the queries, `skew`, `slow_stages` or `app_totals`, on the filtered task metrics.
+        """
+        scanner = self.dataset.scanner(columns=QUERY_COLUMNS[name], filter=self.filter(**filters))
+        tasks = scanner.to_reader()
+        sql = {'skew': SKEW_QUERY, 'slow_stages': SLOW_STAGES_QUERY, 'app_totals': APP_TOTALS_QUERY}[name]
+        parameters = {'top': top, 'min_tasks': min_tasks} if name != 'app_totals' else {'top': top}
+        self.connection.register('tasks', tasks)
+        try:
+            return self.connection.execute(sql, parameters).to_arrow_table()
+        finally:
+            self.connection.unregister('tasks')
+
+    def skew(self, top: int = 20, min_tasks: int = 2, **filters) -> pa.Table:
+        """
+        The most skewed stages, with the relative distance skew of the collector listener on the input and shuffle
+        bytes read: the maximum distance of a task to the mean over the range of the stage.
+        """
+        return self.query('skew', top=top, min_tasks=min_tasks, **filters)
+
+    def slow_stages(self, top: int = 20, min_tasks: int = 1, **filters) -> pa.Table:
+        """
+        The longest stages, from the start of their first task to the end of their last task, in ms.
+        """
+        return self.query('slow_stages', top=top, min_tasks=min_tasks, **filters)
+
+    def app_totals(self, top: int = 100, **filters) -> pa.Table:
+        """
+        The totals of the counters per application, sorted by the total run time of the tasks.
+        """
+        return self.query('app_totals', top=top, **filters)
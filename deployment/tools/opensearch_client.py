@@ -0,0 +1,240 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# The signer shared with the Lambda functions of the backend
+AUTH_DIR = Path(__file__).resolve().parents[1] / 'infra' / 'resources' / 'lambda' / 'common'
+
+MIB = 1024 * 1024
+
+# Status codes of the bulk items retried with a backoff, the others are rejected
+RETRIED_STATUSES = (429, 502, 503, 504)
+
+# A bulk action line and its document, the document is None for delete actions
+BulkItem = Tuple[dict, Optional[dict]]
+
+
+class OpensearchClient:
+    """
+    A thread safe client of the Opensearch domain, signing the requests with SigV4 when a region is set,
+    or without authentication for the Opensearch of the dev compose stack.
+    Bulk requests and rejected items are retried with an exponential backoff.
+    """
+
+    def __init__(self, endpoint: str, region: Optional[str] = None, pool_size: int = 10,
+                 max_retries: int = 8, backoff: float = 0.5):
+        self.endpoint = endpoint.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.mount(self.endpoint, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.auth = None
+        if region:
+            sys.path.append(str(AUTH_DIR))
+            from opensearch_auth import OpensearchAuth
+            self.auth = OpensearchAuth(region)
+
+    def request(self, method: str, path: str, body=None) -> requests.Response:
+        if body is not None and not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+        return self.session.request(method, f'{self.endpoint}/{path.lstrip("/")}', data=body, auth=self.auth,
+                                    headers={'Content-Type': 'application/json'})
+
+    def bulk(self, items: List[BulkItem], on_throttled: Optional[Callable[[], None]] = None) -> List[Tuple[BulkItem, dict]]:
+        """
+        Sends the items in bulk requests until they're all indexed or rejected, and returns the rejected items with
+        their error. Throttled requests and throttled items are retried, the whole batch is rejected after the retries.
+        The on_throttled callback is called each time the domain throttles the request or some of its items.
+        """
+        rejected = []
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            response = self.request('POST', '_bulk', encode_bulk(items))
+            if response.status_code in RETRIED_STATUSES:
+                logger.warning(f'Bulk request throttled with status {response.status_code}, retrying')
+                if on_throttled:
+                    on_throttled()
+                continue
+            if not response.ok:
+                raise Exception(f'Bulk request failed with status {response.status_code}: {response.text[:500]}')
+
+            retried = []
+            for item, result in zip(items, response.json()['items']):
+                result = next(iter(result.values()))
+                if result.get('status', 200) in RETRIED_STATUSES:
+                    retried.append(item)
+                elif 'error' in result:
+                    rejected.append((item, dict(result['error'], status=result.get('status'))))
+            if not retried:
+                return rejected
+            if on_throttled:
+                on_throttled()
+            items = retried
+        return rejected + [(item, {'type': 'retries_exhausted', 'reason': 'Too many throttled retries'})
+                           for item in items]
+
+
+class BoundedExecutor:
+    """
+    A pool of worker threads with at most two tasks per worker in flight, so the submitter blocks instead of buffering
+    when the workers are slower. Errors of the tasks are raised to the submitter.
+    """
+
+    def __init__(self, workers: int, thread_name_prefix: str = ''):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix)
+        self.max_in_flight = workers * 2
+        self.in_flight = set()
+
+    def submit(self, fn: Callable, *args):
+        if len(self.in_flight) >= self.max_in_flight:
+            done, self.in_flight = wait(self.in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+        self.in_flight.add(self.executor.submit(fn, *args))
+
+    def wait(self):
+        """
+        Waits for all the tasks in flight.
+        """
+        for future in wait(self.in_flight).done:
+            future.result()
+        self.in_flight = set()
+
+    def shutdown(self):
+        self.wait()
+        self.executor.shutdown()
+
+
+class BatchSizer:
+    """
+    The bulk request size in bytes shared by the workers, with an additive increase while requests succeed and a
+    multiplicative decrease when the domain throttles them. Throttles received within a second count once,
+    so concurrent workers throttled together only halve the size once.
+    """
+
+    def __init__(self, initial_mb: float, min_mb: float, max_mb: float):
+        self.size = initial_mb * MIB
+        self.min = min_mb * MIB
+        self.max = max_mb * MIB
+        self.step = max(self.min, self.max / 20)
+        self.lock = threading.Lock()
+        self.last_decrease = 0.0
+
+    def throttled(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_decrease > 1:
+                self.size = max(self.min, self.size / 2)
+                self.last_decrease = now
+
+    def succeeded(self):
+        with self.lock:
+            self.size = min(self.max, self.size + self.step)
+
+
+class BulkWriter:
+    """
+    Sends the items added by a reader in parallel bulk requests of a fixed number of items, or of the size of the sizer
+    in bytes when one is set. The requests are sent by a bounded executor, so the reader blocks instead of buffering
+    when the domain is slower.
+    Items are added with an optional tag, like the source and the position of their document. Once a request is done,
+    the on_done callback receives the tags of its items and the rejected items with their tag and error, so the reader
+    can acknowledge its sources. Without the callback, rejected items are logged.
+    """
+
+    def __init__(self, client: OpensearchClient, workers: int = 4, batch_size: int = 500,
+                 sizer: Optional[BatchSizer] = None,
+                 on_done: Optional[Callable[[list, List[Tuple[BulkItem, Any, dict]]], None]] = None):
+        self.client = client
+        self.batch_size = batch_size
+        self.sizer = sizer
+        self.on_done = on_done
+        self.pool = BoundedExecutor(workers, thread_name_prefix='bulk')
+        self.batch = []
+        self.batch_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {'indexed': 0, 'rejected': 0, 'requests': 0, 'throttled': 0, 'bytes': 0}
+        # The stats of each worker thread, with the seconds spent in bulk requests
+        self.worker_stats: Dict[str, dict] = {}
+
+    def add(self, item: BulkItem, tag=None):
+        self.batch.append((item, tag))
+        if self.sizer:
+            self.batch_bytes += len(json.dumps(item[1])) + 64
+            if self.batch_bytes >= self.sizer.size:
+                self._submit()
+        elif len(self.batch) >= self.batch_size:
+            self._submit()
+
+    def flush(self):
+        """
+        Sends the pending items and waits for all the requests in flight.
+        """
+        if self.batch:
+            self._submit()
+        self.pool.wait()
+
+    def close(self) -> dict:
+        self.flush()
+        self.pool.shutdown()
+        return self.stats
+
+    def _submit(self):
+        self.pool.submit(self._send, self.batch, self.batch_bytes)
+        self.batch = []
+        self.batch_bytes = 0
+
+    def _send(self, batch: List[Tuple[BulkItem, Any]], size: int):
+        throttled = []
+
+        def on_throttled():
+            # The other workers size their next batches down while this one is retried
+            throttled.append(1)
+            if self.sizer:
+                self.sizer.throttled()
+
+        start = time.monotonic()
+        rejected = self.client.bulk([item for item, _ in batch], on_throttled=on_throttled)
+        busy = time.monotonic() - start
+        if self.sizer and not throttled:
+            self.sizer.succeeded()
+        counts = {'indexed': len(batch) - len(rejected), 'rejected': len(rejected), 'requests': 1,
+                  'throttled': len(throttled), 'bytes': size}
+        with self.lock:
+            worker = self.worker_stats.setdefault(threading.current_thread().name, dict.fromkeys(self.stats, 0))
+            for key, count in counts.items():
+                self.stats[key] += count
+                worker[key] += count
+            worker['busy'] = worker.get('busy', 0.0) + busy
+        if self.on_done:
+            tags = {id(item): tag for item, tag in batch}
+            self.on_done([tag for _, tag in batch], [(item, tags[id(item)], error) for item, error in rejected])
+        else:
+            for item, error in rejected:
+                logger.warning(f'Document rejected by {item[0]}: {error}')
+
+
+def encode_bulk(items: List[BulkItem]) -> bytes:
+    """
+    The NDJSON body of a bulk request.
+    """
+    lines = []
+    for action, document in items:
+        lines.append(json.dumps(action))
+        if document is not None:
+            lines.append(json.dumps(document))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
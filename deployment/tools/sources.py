@@ -0,0 +1,59 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import gzip
+import io
+import os
+from functools import lru_cache
+from typing import BinaryIO, Iterator, List
+
+
+@lru_cache(maxsize=None)
+def s3_client():
+    """
+    The S3 client reading the sources, only created for S3 sources.
+    """
+    import boto3
+    return boto3.client('s3')
+
+
+def list_files(source: str) -> List[str]:
+    """
+    The files under an S3 prefix like s3://bucket/prefix/ or a local directory in key order, or the source file itself.
+    Hidden files are skipped.
+    """
+    if source.startswith('s3://'):
+        bucket, _, prefix = source[5:].partition('/')
+        paginator = s3_client().get_paginator('list_objects_v2')
+        paths = [f's3://{bucket}/{entry["Key"]}'
+                 for page in paginator.paginate(Bucket=bucket, Prefix=prefix) for entry in page.get('Contents', [])]
+    elif os.path.isfile(source):
+        return [source]
+    else:
+        paths = [os.path.join(root, name) for root, _, files in os.walk(source) for name in files]
+    return sorted(path for path in paths if not path.rsplit('/', 1)[-1].startswith('.'))
+
+
+def open_file(path: str) -> BinaryIO:
+    """
+    A stream of the decompressed file, gzip and zstd are detected from the file extension.
+    """
+    if path.startswith('s3://'):
+        bucket, _, key = path[5:].partition('/')
+        stream = s3_client().get_object(Bucket=bucket, Key=key)['Body']
+    else:
+        stream = open(path, 'rb')
+    if path.endswith('.gz'):
+        return gzip.GzipFile(fileobj=stream)
+    if path.endswith(('.zstd', '.zst')):
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    return stream
+
+
+def read_lines(path: str) -> Iterator[str]:
+    """
+    The lines of the decompressed file, read in chunks of 1 MiB.
+    """
+    with io.TextIOWrapper(io.BufferedReader(open_file(path), buffer_size=1 << 20), encoding='utf-8') as lines:
+        yield from lines
@@ -21,12 +21,31 @@ import scala.collection.mutable.{HashMap, ListBuffer}
  * @param region The AWS region where the Opensearch Ingestion pipeline is deployed
  * @param batchSize the number of records to bufferize before they are sent to the ingestion pipeline
  * @param timeThreshold the maximum time between batches are sent to the ingestion pipeline
+ * @param wireFormat the format used to send log events, json (default) or otlp
+ * @param sink where log events are sent: http (default) to the ingestion pipeline, s3 or directory to rolling NDJSON objects
+ * @param location the S3 URI in the form of s3://<BUCKET>/<PREFIX> or the local directory used by the s3 and directory sinks
+ * @param maxObjectSize the compressed size in MB after which an object is completed, 128 by default
+ * @param rolloverTime the maximum time in seconds an object stays open, 300 by default
  */
 
 @Plugin(name = "SparkObs", category = "Core", elementType = "appender", printObject = true)
-class CollectorAppender(name: String, endpoint: String, region: String, batchSize: Int, timeThreshold: Int) extends AbstractAppender(name, null, null, false, null) {
+class CollectorAppender(name: String, endpoint: String, region: String, batchSize: Int, timeThreshold: Int, wireFormat: String = PayloadEncoder.JSON_FORMAT,
+                        sink: String = CollectorAppender.HTTP_SINK, location: String = null, maxObjectSize: Int = 0, rolloverTime: Int = 0)
+  extends AbstractAppender(name, null, null, false, null) {
 
-  private val client = new ObservabilityClient[LogEvent](endpoint, region, batchSize, timeThreshold)
+  private val objectSink: Option[RollingObjectSink] = Option(sink).map(_.toLowerCase) match {
+    case None | Some(CollectorAppender.HTTP_SINK) => None
+    case Some(mode) => Some(RollingObjectSink(mode, location, region,
+      (if (maxObjectSize > 0) maxObjectSize else CollectorAppender.DEFAULT_MAX_OBJECT_SIZE) * 1024L * 1024L,
+      if (rolloverTime > 0) rolloverTime else CollectorAppender.DEFAULT_ROLLOVER_TIME))
+  }
+
+  private val client = new ObservabilityClient[LogEvent](endpoint, region, batchSize, timeThreshold,
+    (objectSink, Option(wireFormat).map(_.toLowerCase)) match {
+      case (Some(_), _) => NdjsonEncoder
+      case (None, Some(PayloadEncoder.OTLP_FORMAT)) => OtlpLogsEncoder
+      case _ => JsonArrayEncoder
+    }, objectSink)
 
   /**
    * Override the append method of the AbstractAppender class.
@@ -43,9 +62,23 @@ class CollectorAppender(name: String, endpoint: String, region: String, batchSiz
     //print(modifiedMessage)
     client.add(event)
   }
+
+  /**
+   * Override the stop method of the AbstractAppender class.
+   * Flush the remaining log events and complete the current object of the object sink.
+   */
+  override def stop(): Unit = {
+    client.close()
+    super.stop()
+  }
 }
 
 object CollectorAppender {
+  val HTTP_SINK: String = "http"
+  // The default compressed size in MB of the objects written by the object sinks
+  private val DEFAULT_MAX_OBJECT_SIZE = 128
+  // The default maximum time in seconds an object stays open
+  private val DEFAULT_ROLLOVER_TIME = 300
 
   /**
    * Factory method to create instances of the CollectorAppender.
@@ -54,10 +87,16 @@ object CollectorAppender {
    * @param region The AWS region where the Opensearch Ingestion pipeline is deployed
    * @param batchSize the number of records to bufferize before they are sent to the ingestion pipeline
    * @param timeThreshold the maximum time between batches are sent to the ingestion pipeline
+   * @param wireFormat the format used to send log events, json (default) or otlp
+   * @param sink where log events are sent: http (default), s3 or directory
+   * @param location the S3 URI or the local directory used by the s3 and directory sinks
+   * @param maxObjectSize the compressed size in MB after which an object is completed
+   * @param rolloverTime the maximum time in seconds an object stays open
    * @return An instance of the CollectorAppender class.
    */
   @PluginFactory
-  def createAppender(@PluginAttribute("name") name: String, @PluginAttribute("endpoint") endpoint: String, @PluginAttribute("region") region: String, @PluginAttribute("batchSize") batchSize: Int, @PluginAttribute("timeThreshold") timeThreshold: Int): CollectorAppender = {
-    new CollectorAppender(name, endpoint, region, batchSize, timeThreshold)
+  def createAppender(@PluginAttribute("name") name: String, @PluginAttribute("endpoint") endpoint: String, @PluginAttribute("region") region: String, @PluginAttribute("batchSize") batchSize: Int, @PluginAttribute("timeThreshold") timeThreshold: Int, @PluginAttribute("wireFormat") wireFormat: String,
+                     @PluginAttribute("sink") sink: String, @PluginAttribute("location") location: String, @PluginAttribute("maxObjectSize") maxObjectSize: Int, @PluginAttribute("rolloverTime") rolloverTime: Int): CollectorAppender = {
+    new CollectorAppender(name, endpoint, region, batchSize, timeThreshold, wireFormat, sink, location, maxObjectSize, rolloverTime)
   }
 }
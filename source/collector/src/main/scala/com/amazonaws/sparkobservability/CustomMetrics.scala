@@ -75,4 +75,50 @@ case class CustomStageAggMetrics(
                              shuffleBytesReadSkewness: Double,
                              maxShuffleBytesRead: Double,
                             override val metricTime: Long
-                            ) extends CustomMetrics(appName, appId, jobId, metricsType="stageAggMetrics", metricTime)
\ No newline at end of file
+                            ) extends CustomMetrics(appName, appId, jobId, metricsType="stageAggMetrics", metricTime)
+
+/**
+ * Case class that represents a rollup of all the task counters at the job or application level.
+ * One document is emitted per job when it ends and one per application when it ends, so runs can be listed without
+ * aggregating the raw task metrics.
+ */
+case class CustomSummaryMetrics(
+                             override val appName: String,
+                             override val appId: String,
+                             override val jobId: String,
+                             summaryLevel: String,
+                             result: String,
+                             startTime: Long,
+                             endTime: Long,
+                             duration: Long,
+                             jobCount: Int,
+                             stageCount: Int,
+                             failedStageCount: Int,
+                             taskCount: Int,
+                             failedTaskCount: Int,
+                             retriedTaskCount: Int,
+                             peakExecutors: Int,
+                             totalInputBytesRead: Double,
+                             maxInputBytesRead: Double,
+                             totalInputRecordsRead: Double,
+                             maxInputRecordsRead: Double,
+                             totalRunTime: Double,
+                             maxRunTime: Double,
+                             totalExecutorCpuTime: Double,
+                             maxExecutorCpuTime: Double,
+                             totalPeakExecutionMemory: Double,
+                             maxPeakExecutionMemory: Double,
+                             totalOutputRecordsWritten: Double,
+                             maxOutputRecordsWritten: Double,
+                             totalOutputBytesWritten: Double,
+                             maxOutputBytesWritten: Double,
+                             totalShuffleRecordsRead: Double,
+                             maxShuffleRecordsRead: Double,
+                             totalShuffleBytesRead: Double,
+                             maxShuffleBytesRead: Double,
+                             totalShuffleRecordsWritten: Double,
+                             maxShuffleRecordsWritten: Double,
+                             totalShuffleBytesWritten: Double,
+                             maxShuffleBytesWritten: Double,
+                             override val metricTime: Long
+                             ) extends CustomMetrics(appName, appId, jobId, metricsType="summaryMetrics", metricTime)
@@ -3,7 +3,9 @@
 
 package com.amazonaws.sparkobservability
 
+import org.apache.spark.Success
 import org.apache.spark.scheduler._
+import org.apache.spark.sql.execution.ui.{SparkListenerSQLExecutionEnd, SparkListenerSQLExecutionStart}
 import org.slf4j.LoggerFactory
 
 import java.time.Instant
@@ -23,7 +25,21 @@ class CustomMetricsListener extends SparkListener {
   /**
    * The client to send metrics to the observability solution.
    */
-  private val client = new ObservabilityClient[CustomMetrics](Utils.getObservabilityEndpoint(), Utils.getAwsRegion(), Utils.getBatchSize(), Utils.getTimeThreshold())
+  private val client = new ObservabilityClient[CustomMetrics](Utils.getObservabilityEndpoint(), Utils.getAwsRegion(), Utils.getBatchSize(), Utils.getTimeThreshold(),
+    Utils.getWireFormat() match {
+      case PayloadEncoder.OTLP_FORMAT => OtlpMetricsEncoder
+      case _ => JsonArrayEncoder
+    })
+
+  /**
+   * Whether the stage aggregated metrics are sent, or computed by the ingestion pipeline from the task metrics.
+   */
+  private val sendStageMetrics = Utils.getStageAggregation() != "pipeline"
+
+  /**
+   * The tracer to send application, SQL, job, stage and task spans, if tracing is enabled.
+   */
+  private val tracer = SparkTracer.fromConf()
 
   /**
    * A map to keep track of the mapping between stage ID and job ID. Used to enrich metrics.
@@ -36,11 +52,28 @@ class CustomMetricsListener extends SparkListener {
   private val taskMetricsBuffer = ListBuffer[CustomLightTaskMetrics]()
 
   /**
-   * Listen to application end and then flush any pending metrics to the observability client.
+   * The running summaries of active jobs, indexed by job ID
+   */
+  private val jobSummaries = HashMap.empty[String, RunSummary]
+
+  /**
+   * The running summary of the application
+   */
+  private val appSummary = new RunSummary(Instant.now.toEpochMilli)
+
+  /**
+   * The number of executors currently registered, used to track peak executors
+   */
+  private var activeExecutors = 0
+
+  /**
+   * Listen to application end, send the application summary and then flush any pending metrics to the observability client.
    */
   override def onApplicationEnd(applicationEnd: SparkListenerApplicationEnd): Unit = {
+    client.add(appSummary.toMetrics(Utils.getAppName(), Utils.getAppId(), null, RunSummary.APPLICATION_LEVEL, "ENDED", applicationEnd.time))
     println("shutdown hook! Flushing observability client...")
     client.flushEvents()
+    tracer.foreach(_.endApplication(applicationEnd.time))
   }
 
   /**
@@ -51,6 +84,37 @@ class CustomMetricsListener extends SparkListener {
   override def onApplicationStart(appStart: SparkListenerApplicationStart) {
     logger.debug(s"App started in ${appStart.time} seconds... Initializing lastFlush now")
     client.setLastFlush(Instant.now)
+    appSummary.startTime = appStart.time
+    tracer.foreach(_.startApplication(appStart.time))
+  }
+
+  /**
+   * Listen to Spark SQL execution events to build the SQL execution spans when tracing is enabled.
+   */
+  override def onOtherEvent(event: SparkListenerEvent): Unit = {
+    event match {
+      case start: SparkListenerSQLExecutionStart =>
+        tracer.foreach(_.startSqlExecution(start.executionId, start.description, start.time))
+      case end: SparkListenerSQLExecutionEnd =>
+        tracer.foreach(_.endSqlExecution(end.executionId, end.time))
+      case _ =>
+    }
+  }
+
+  /**
+   * Listen to executor registration to track the peak number of executors.
+   */
+  override def onExecutorAdded(executorAdded: SparkListenerExecutorAdded): Unit = {
+    activeExecutors += 1
+    appSummary.observeExecutors(activeExecutors)
+    jobSummaries.values.foreach(_.observeExecutors(activeExecutors))
+  }
+
+  /**
+   * Listen to executor removal to track the peak number of executors.
+   */
+  override def onExecutorRemoved(executorRemoved: SparkListenerExecutorRemoved): Unit = {
+    activeExecutors = (activeExecutors - 1).max(0)
   }
 
   /**
@@ -62,12 +126,25 @@ class CustomMetricsListener extends SparkListener {
     for (stageId <- jobStart.stageIds) {
       stageToJobMapping += (stageId -> jobStart.jobId.toString)
     }
+    val summary = new RunSummary(jobStart.time)
+    summary.observeExecutors(activeExecutors)
+    jobSummaries += (jobStart.jobId.toString -> summary)
+    tracer.foreach(_.startJob(jobStart.jobId, jobStart.properties, jobStart.time))
   }
 
   /**
-   * Listen to job end, and then flush any pending metrics to the observability client.
+   * Listen to job end, send the job summary and then flush any pending metrics to the observability client.
    */
   override def onJobEnd(jobEnd: SparkListenerJobEnd): Unit = {
+    val result = jobEnd.jobResult match {
+      case JobSucceeded => "SUCCEEDED"
+      case _ => "FAILED"
+    }
+    jobSummaries.remove(jobEnd.jobId.toString).foreach { summary =>
+      client.add(summary.toMetrics(Utils.getAppName(), Utils.getAppId(), jobEnd.jobId.toString, RunSummary.JOB_LEVEL, result, jobEnd.time))
+    }
+    appSummary.jobCount += 1
+    tracer.foreach(_.endJob(jobEnd.jobId, result, jobEnd.time))
     client.flushEvents()
   }
 
@@ -77,7 +154,17 @@ class CustomMetricsListener extends SparkListener {
   override def onStageCompleted(stageCompleted: SparkListenerStageCompleted): Unit = {
     val metrics = collectStageCustomMetrics(stageCompleted)
     logger.debug(s"Stage metrics collected: ${metrics}")
-    client.add(metrics)
+    if (sendStageMetrics) client.add(metrics)
+    val failed = stageCompleted.stageInfo.failureReason.isDefined
+    stageToJobMapping.get(stageCompleted.stageInfo.stageId).flatMap(jobSummaries.get).foreach(_.addStage(failed))
+    appSummary.addStage(failed)
+    tracer.foreach { t =>
+      val stageInfo = stageCompleted.stageInfo
+      stageToJobMapping.get(stageInfo.stageId).foreach { jobId =>
+        t.completeStage(jobId.toInt, stageInfo.stageId, stageInfo.attemptNumber, stageInfo.name,
+          stageInfo.submissionTime.getOrElse(0L), stageInfo.completionTime.getOrElse(0L), failed, metrics)
+      }
+    }
     stageToJobMapping.remove(stageCompleted.stageInfo.stageId)
     taskMetricsBuffer.clear()
   }
@@ -91,6 +178,11 @@ class CustomMetricsListener extends SparkListener {
     
     client.add(metrics)
     logger.debug(s"Task metrics collected: ${metrics}")
+    val failed = taskEnded.reason != Success
+    val retried = taskEnded.taskInfo.attemptNumber > 0 || taskEnded.taskInfo.speculative
+    jobSummaries.get(metrics.jobId).foreach(_.addTask(metrics, failed, retried))
+    appSummary.addTask(metrics, failed, retried)
+    tracer.foreach(_.endTask(metrics, taskEnded.taskInfo.launchTime, taskEnded.taskInfo.finishTime, failed))
     taskMetricsBuffer += CustomLightTaskMetrics(
       metrics.appName,
       metrics.appId,
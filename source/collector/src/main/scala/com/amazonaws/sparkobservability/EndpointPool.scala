@@ -0,0 +1,160 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import java.net.URI
+import java.time.{Clock, Duration, Instant}
+
+/**
+ * Contains static variables and the parser used by EndpointPool objects
+ */
+object EndpointPool {
+  // The weight of the last request in the rolling latency and error rate
+  private val EWMA_WEIGHT = 0.3
+  // The number of consecutive failures after which an endpoint is ejected
+  private val EJECTION_FAILURES = 3
+  // The initial time an endpoint stays ejected, doubled each time a probe fails
+  private[sparkobservability] val INITIAL_EJECTION = Duration.ofSeconds(30)
+  // The maximum time an endpoint stays ejected before it's probed again
+  private[sparkobservability] val MAX_EJECTION = Duration.ofSeconds(300)
+
+  /**
+   * Parse a comma separated list of endpoints, each in the form of `<URL>` or `<URL>|<REGION>`.
+   * @param endpoints the list of endpoints
+   * @param defaultRegion the AWS region of the endpoints without a region
+   * @return the endpoints
+   */
+  def parse(endpoints: String, defaultRegion: String): Seq[Endpoint] = {
+    endpoints.split(",").map(_.trim).filter(_.nonEmpty).map { endpoint =>
+      endpoint.split("\\|").map(_.trim) match {
+        case Array(url) => Endpoint(URI.create(url), defaultRegion)
+        case Array(url, region) => Endpoint(URI.create(url), region)
+        case _ => throw new IllegalArgumentException(s"Invalid endpoint $endpoint, must be <URL> or <URL>|<REGION>")
+      }
+    }.toSeq
+  }
+}
+
+/**
+ * Case class that represents an ingestion pipeline endpoint and the AWS region used to sign the requests
+ */
+case class Endpoint(uri: URI, region: String)
+
+/**
+ * The health of an endpoint tracked by the EndpointPool.
+ * @param endpoint the tracked endpoint
+ */
+class EndpointHealth(val endpoint: Endpoint) {
+
+  /**
+   * The rolling latency of the requests in milliseconds, failed ones included, None until the first request
+   */
+  var latency: Option[Double] = None
+
+  /**
+   * The rolling ratio of failed requests
+   */
+  var errorRate: Double = 0.0
+
+  /**
+   * The number of failed requests since the last successful one
+   */
+  var consecutiveFailures: Int = 0
+
+  /**
+   * The time until the endpoint is ejected, None if the endpoint is healthy
+   */
+  var ejectedUntil: Option[Instant] = None
+
+  /**
+   * The time the endpoint stays ejected after the next ejection
+   */
+  var ejection: Duration = EndpointPool.INITIAL_EJECTION
+
+  /**
+   * The score used to choose the endpoint, the lower the better.
+   * The latency is weighted by the error rate so a fast endpoint failing half of the requests counts twice as slow.
+   */
+  def score: Double = latency.getOrElse(0.0) / (1.0 - errorRate).max(0.01)
+}
+
+/**
+ * Spreads requests across a list of ingestion pipeline endpoints based on their health.
+ * Requests go to the healthy endpoint with the lowest latency weighted by the error rate, endpoints never used are tried first.
+ * After several consecutive failures an endpoint is ejected. When its ejection ends, it's half-open: a single request probes it,
+ * a success brings it back and a failure ejects it again for twice as long.
+ * When all the endpoints are ejected, the one whose ejection ends first is used so the collection never stops on the pool.
+ * @param endpoints the endpoints of the pool
+ * @param clock the clock used for ejections
+ */
+class EndpointPool(endpoints: Seq[Endpoint], clock: Clock = Clock.systemUTC) {
+
+  require(endpoints.nonEmpty, "At least one endpoint must be provided")
+
+  /**
+   * The health of each endpoint, in the order they are provided
+   */
+  val health: Seq[EndpointHealth] = endpoints.map(new EndpointHealth(_))
+
+  /**
+   * The endpoint currently probed after its ejection, if any
+   */
+  private var probing: Option[EndpointHealth] = None
+
+  /**
+   * The number of endpoints in the pool
+   */
+  def size: Int = health.size
+
+  /**
+   * Choose the endpoint for the next request.
+   * @param exclude the endpoints already tried for the current request
+   * @return the endpoint health to pass to `record` after the request
+   */
+  def select(exclude: Set[EndpointHealth] = Set.empty): EndpointHealth = synchronized {
+    val now = Instant.now(clock)
+    val candidates = health.filterNot(exclude.contains)
+    val healthy = candidates.filter(_.ejectedUntil.isEmpty)
+    val halfOpen = candidates.filter(h => h.ejectedUntil.exists(!_.isAfter(now)) && !probing.contains(h))
+
+    (halfOpen.headOption, healthy) match {
+      case (Some(probe), _) if probing.isEmpty =>
+        probing = Some(probe)
+        probe
+      case (_, h) if h.nonEmpty =>
+        h.find(_.latency.isEmpty).getOrElse(h.minBy(_.score))
+      case _ =>
+        (if (candidates.nonEmpty) candidates else health).minBy(_.ejectedUntil.getOrElse(Instant.MIN))
+    }
+  }
+
+  /**
+   * Record the result of a request and update the health of the endpoint.
+   * @param endpoint the endpoint health returned by `select`
+   * @param latencyMillis the duration of the request in milliseconds
+   * @param success true if the request succeeded
+   */
+  def record(endpoint: EndpointHealth, latencyMillis: Double, success: Boolean): Unit = synchronized {
+    val weight = EndpointPool.EWMA_WEIGHT
+    endpoint.errorRate = endpoint.errorRate * (1 - weight) + (if (success) 0.0 else weight)
+    endpoint.latency = Some(endpoint.latency.map(_ * (1 - weight) + latencyMillis * weight).getOrElse(latencyMillis))
+    if (probing.contains(endpoint)) probing = None
+
+    if (success) {
+      endpoint.consecutiveFailures = 0
+      endpoint.ejectedUntil = None
+      endpoint.ejection = EndpointPool.INITIAL_EJECTION
+    } else {
+      endpoint.consecutiveFailures += 1
+      val wasEjected = endpoint.ejectedUntil.isDefined
+      if (wasEjected || endpoint.consecutiveFailures >= EndpointPool.EJECTION_FAILURES) {
+        // A failed probe doubles the ejection time
+        if (wasEjected) endpoint.ejection = endpoint.ejection.multipliedBy(2)
+        if (endpoint.ejection.compareTo(EndpointPool.MAX_EJECTION) > 0) endpoint.ejection = EndpointPool.MAX_EJECTION
+        endpoint.ejectedUntil = Some(Instant.now(clock).plus(endpoint.ejection))
+        println("Ejecting endpoint " + endpoint.endpoint.uri + " for " + endpoint.ejection.getSeconds + " seconds")
+      }
+    }
+  }
+}
@@ -3,7 +3,7 @@
 
 package com.amazonaws.sparkobservability
 
-import com.google.gson.{Gson, JsonParser}
+import com.google.gson.{ExclusionStrategy, FieldAttributes, GsonBuilder, JsonObject, JsonParser}
 import software.amazon.awssdk.auth.credentials.DefaultCredentialsProvider
 import software.amazon.awssdk.auth.signer.Aws4Signer
 import software.amazon.awssdk.auth.signer.params.Aws4SignerParams
@@ -13,12 +13,11 @@ import software.amazon.awssdk.http.apache.ApacheHttpClient
 import software.amazon.awssdk.http.{HttpExecuteRequest, HttpExecuteResponse, SdkHttpFullRequest, SdkHttpMethod}
 import software.amazon.awssdk.regions.Region
 
-import java.net.URI
 import java.time.{Duration, Instant}
+import java.util.UUID
 import scala.collection.mutable.ListBuffer
 import scala.util.{Failure, Success, Try}
 import org.apache.logging.log4j.core.LogEvent
-import scala.util.matching.Regex
 
 /**
  * Contains static variables used by ObservabilityClient objects
@@ -31,18 +30,35 @@ object ObservabilityClient{
   private val INITIAL_BACKOFF = 5
   // The maximum time to wait before retrying
   private val MAX_BACKOFF = 60
+  // The fields of log events replaced by flat fields in the documents, and the location of the logging call
+  private val NORMALIZED_LOG_FIELDS = Set("level", "message", "thrown", "thrownProxy", "source")
+
+  /**
+   * Skip the log event fields replaced in the documents, so the thrown proxy and the stack frames are never serialized
+   */
+  private object NormalizedLogFields extends ExclusionStrategy {
+    override def shouldSkipField(field: FieldAttributes): Boolean =
+      classOf[LogEvent].isAssignableFrom(field.getDeclaringClass) && NORMALIZED_LOG_FIELDS.contains(field.getName)
+
+    override def shouldSkipClass(clazz: Class[_]): Boolean = false
+  }
 }
 
 /**
  * Client used to send records to the Observability solution.
  * The client is sending records to Amazon Opensearch Ingestion service via sigV4 HTTP requests.
- * @param endpoint the endpoint of the Opensearch Ingestion pipeline in the form of https://<NAME><HASH>.<REGION>.osis.amazonaws.com/<POSTFIX>
- * @param region the AWS region where the Opensearch Ingestion pipeline is deployed
+ * When several endpoints are provided, batches go to the fastest healthy one and fail over to the others, see EndpointPool.
+ * @param endpoint the comma separated endpoints of the Opensearch Ingestion pipelines in the form of
+ *                 https://<NAME><HASH>.<REGION>.osis.amazonaws.com/<POSTFIX>, optionally followed by |<REGION>
+ * @param region the AWS region where the Opensearch Ingestion pipelines without a region are deployed
  * @param batchSize the number of records to bufferize before they are sent to the ingestion pipeline
  * @param batchTime the maximum time between batches are sent to the ingestion pipeline
+ * @param encoder the encoder used to build the request body from a batch of records, a JSON array by default
+ * @param objectSink the sink writing batches to rolling objects instead of sending them to the ingestion pipeline, if any
  * @tparam A the type of records that can be sent through the client
  */
-class ObservabilityClient[A](endpoint: String, region: String, batchSize: Int, batchTime: Int) {
+class ObservabilityClient[A](endpoint: String, region: String, batchSize: Int, batchTime: Int, encoder: PayloadEncoder = JsonArrayEncoder,
+                             objectSink: Option[RollingObjectSink] = None) {
 
   /**
    * The credentials to authenticate HTTPS requests
@@ -63,20 +79,15 @@ class ObservabilityClient[A](endpoint: String, region: String, batchSize: Int, b
     .build
 
   /**
-   * The parameters for signing the HTTPS requests
+   * The parameters for signing the HTTPS requests, per AWS region
    */
-  private lazy val params: Aws4SignerParams = Aws4SignerParams.builder()
-    .awsCredentials(credentialsProvider.resolveCredentials())
-    .signingName("osis")
-    // TODO validate region and fail fast
-    .signingRegion(Region.of(region))
-    .build()
+  private val params = scala.collection.mutable.HashMap[String, Aws4SignerParams]()
 
   /**
-   * The HTTPS URI for the Opensearch Ingestion pipeline endpoint
+   * The HTTPS URIs for the Opensearch Ingestion pipeline endpoints and their health
    */
-  // TODO validate it's an HTTPS URL with a path after the URI and fail fast
-  private lazy val target = URI.create(endpoint)
+  // TODO validate they are HTTPS URLs with a path after the URI and fail fast
+  private lazy val endpoints = new EndpointPool(EndpointPool.parse(endpoint, region))
 
   /**
    * The buffer used to batch records. When batch size is reached, the buffer is sent
@@ -107,7 +118,7 @@ class ObservabilityClient[A](endpoint: String, region: String, batchSize: Int, b
   /**
    * The JSON object manipulator
    */
-  private val gson = new Gson
+  private val gson = new GsonBuilder().setExclusionStrategies(ObservabilityClient.NormalizedLogFields).create
 
   /**
    * Spark context metadata used to enrich logs
@@ -124,12 +135,6 @@ class ObservabilityClient[A](endpoint: String, region: String, batchSize: Int, b
    */
   private var executorId : String = ObservabilityClient.UNDEFINED_CONST
 
-  /**
-   * The regex patterns to extract task and stage IDs from the MDC taskName
-   */
-  private val taskPattern = new Regex("""task (\d+\.\d+)""")
-  private val stagePattern = new Regex("""stage (\d+\.\d+)""")
-
   /**
    * Set the last flush time to an Instant. Used to initialize the batching process after Spark application has started.
    * @param time The Instant to set the lastFlush
@@ -152,23 +157,64 @@ class ObservabilityClient[A](endpoint: String, region: String, batchSize: Int, b
   }
 
   /**
-   * Send String content to Opensearch Ingestion pipeline via the HTTPS client.
+   * Get the parameters for signing the HTTPS requests sent to a region.
+   * @param signingRegion the AWS region of the endpoint
+   * @return the signer parameters
+   */
+  private def signerParams(signingRegion: String): Aws4SignerParams = {
+    params.getOrElseUpdate(signingRegion, Aws4SignerParams.builder()
+      .awsCredentials(credentialsProvider.resolveCredentials())
+      .signingName("osis")
+      // TODO validate region and fail fast
+      .signingRegion(Region.of(signingRegion))
+      .build())
+  }
+
+  /**
+   * Send content to Opensearch Ingestion pipelines via the HTTPS client.
+   * The content is sent to the endpoint chosen by the endpoint pool and to the next ones if it fails, until all are tried.
    * The method throws two types of exceptions: non-retryable and retryable.
    * The type of exception is used to start an exponential back-off retry cycle or not.
-   * @param content The string to send to Opensearch Ingestion pipeline (generally a JSON)
+   * @param content The bytes to send to Opensearch Ingestion pipeline, encoded with the client encoder
    */
-  def sendContent(content: String): Unit = {
-    val request = SdkHttpFullRequest.builder
-      .contentStreamProvider(RequestBody.fromString(content).contentStreamProvider)
+  def sendContent(content: Array[Byte]): Unit = {
+    var tried = Set[EndpointHealth]()
+    var lastError: Throwable = null
+    while (tried.size < endpoints.size) {
+      val target = endpoints.select(tried)
+      tried += target
+      val start = System.nanoTime
+      val result = Try(sendToEndpoint(content, target.endpoint))
+      endpoints.record(target, (System.nanoTime - start) / 1e6, result.isSuccess)
+      result match {
+        case Success(_) => return
+        case Failure(e) =>
+          if (endpoints.size > 1) println("Error sending to " + target.endpoint.uri + ", failing over: " + e.getMessage)
+          lastError = e
+      }
+    }
+    throw lastError
+  }
+
+  /**
+   * Send content to an Opensearch Ingestion pipeline endpoint via the HTTPS client.
+   * @param content The bytes to send to Opensearch Ingestion pipeline, encoded with the client encoder
+   * @param endpoint The endpoint of the Opensearch Ingestion pipeline
+   */
+  private def sendToEndpoint(content: Array[Byte], endpoint: Endpoint): Unit = {
+    val target = endpoint.uri
+    val builder = SdkHttpFullRequest.builder
+      .contentStreamProvider(RequestBody.fromBytes(content).contentStreamProvider)
       .method(SdkHttpMethod.POST)
-      .putHeader("Content-Length", Integer.toString(content.length()))
-      .putHeader("Content-Type", "application/json")
+      .putHeader("Content-Length", Integer.toString(content.length))
+      .putHeader("Content-Type", encoder.contentType)
       .protocol("https")
       .uri(target)
       .encodedPath(target.getPath)
-      .build
+    encoder.contentEncoding.foreach(builder.putHeader("Content-Encoding", _))
+    val request = builder.build
 
-    val signedRequest = signer.sign(request, params)
+    val signedRequest = signer.sign(request, signerParams(endpoint.region))
     val executeRequest = HttpExecuteRequest.builder
       .request(signedRequest)
       .contentStreamProvider(Try(signedRequest.contentStreamProvider.get).getOrElse(null))
@@ -224,50 +270,91 @@ class ObservabilityClient[A](endpoint: String, region: String, batchSize: Int, b
   }
 
   /**
-   * Flush events from the buffer to the Opensearch Ingestion pipeline.
-   * This method converts each event in the buffer to a JSON string and sends it.
-   * If the log context is not initialized, it initializes it and recursively calls the flushEvents method.
+   * Convert an event into a JSON document enriched with the Spark context.
+   * @param event the event to convert
+   * @return the enriched JSON document
+   */
+  private def toDocument(event: A): JsonObject = {
+    val jsonObject = JsonParser.parseString(gson.toJson(event)).getAsJsonObject
+    jsonObject.addProperty("appName", appName)
+    jsonObject.addProperty("appId", appId)
+    if (event.isInstanceOf[CustomTaskMetrics]) {
+      jsonObject.addProperty("executorId", event.asInstanceOf[CustomTaskMetrics].executorId)
+    } else {
+      jsonObject.addProperty("executorId", executorId)
+    }
+    if (event.isInstanceOf[LogEvent]) {
+      val logEvent = event.asInstanceOf[LogEvent]
+      jsonObject.addProperty("logTime", logEvent.getTimeMillis)
+
+      // The task and stage IDs are parsed by the ingestion pipeline
+      Option(logEvent.getContextData.getValue[String]("mdc.taskName")).foreach(jsonObject.addProperty("taskName", _))
+      normalizeLogDocument(jsonObject, logEvent)
+    }
+    jsonObject
+  }
+
+  /**
+   * Add the Log4j structures skipped by the serializer as flat fields, so the document has the same fields
+   * whatever the message type: the level name, the formatted message, and the stack trace as a single string
+   * with a fingerprint identifying the error instead of the nested frames of the thrown proxy.
+   * @param jsonObject the document of the log event
+   * @param logEvent the log event
+   */
+  private def normalizeLogDocument(jsonObject: JsonObject, logEvent: LogEvent): Unit = {
+    Option(logEvent.getLevel).foreach(level => jsonObject.addProperty("level", level.name))
+    val message = new JsonObject
+    message.addProperty("message", logEvent.getMessage.getFormattedMessage)
+    jsonObject.add("message", message)
+    Option(logEvent.getThrown).foreach { thrown =>
+      jsonObject.addProperty("stackTrace", Utils.stackTrace(thrown))
+      jsonObject.addProperty("stackTraceFingerprint", Utils.stackTraceFingerprint(thrown))
+    }
+  }
+
+  /**
+   * Encode events into a request body with the client encoder.
+   * Record encoders get the events directly, document encoders get the events converted into enriched JSON documents
+   * stamped with the batch send time and ID, used to measure the ingestion latency of each stage.
+   * The batch is encoded again when it's retried, so the send time is the time of the last attempt.
+   * @param events the events to encode
+   * @return the bytes of the request body
+   */
+  private[sparkobservability] def encodeEvents(events: Seq[A]): Array[Byte] = {
+    encoder match {
+      case recordEncoder: RecordEncoder => recordEncoder.encodeRecords(events, RecordContext(appName, appId, executorId))
+      case documentEncoder: DocumentEncoder =>
+        val sendTime = System.currentTimeMillis
+        val batchId = UUID.randomUUID.toString
+        documentEncoder.encode(events.map { event =>
+          val document = toDocument(event)
+          document.addProperty("sendTime", sendTime)
+          document.addProperty("batchId", batchId)
+          document
+        })
+    }
+  }
+
+  /**
+   * Flush events from the buffer to the Opensearch Ingestion pipeline or to the object sink.
+   * This method encodes the events in the buffer with the client encoder and sends them.
+   * If the log context is not initialized, it initializes it and keeps the events in the buffer until it's available.
    * After sending the events, it clears the buffer and updates the backoff and retry variables if necessary.
    * If an error occurs during sending, it checks if it is a retryable error and updates the backoff and retry variables accordingly.
    * If the error is non-retryable, it throws a NonRetryableException.
    */
   def flushEvents(): Unit = {
-    val content = buffer.map { event =>
-      val jsonElement = JsonParser.parseString(gson.toJson(event))
-      val jsonObject = jsonElement.getAsJsonObject
-
-        if (logContextInitialized()) {
-          jsonObject.addProperty("appName", appName)
-          jsonObject.addProperty("appId", appId)
-          if (event.isInstanceOf[CustomTaskMetrics]) {
-            jsonObject.addProperty("executorId", event.asInstanceOf[CustomTaskMetrics].executorId)
-          } else {
-            jsonObject.addProperty("executorId", executorId)
-          }
-        }
-        else {
-          initLogContext()
-          if (logContextInitialized()) {
-            flushEvents()
-          }
-          return
-        }
-        if (event.isInstanceOf[LogEvent]) {
-          val logEvent = event.asInstanceOf[LogEvent]
-          jsonObject.addProperty("logTime", logEvent.getTimeMillis)
-
-          val taskName = logEvent.getContextData.getValue[String]("mdc.taskName")
-          val taskId = Try(taskName.split(" ")(1)).getOrElse("")
-          val stageId = Try(taskName.split(' ')(4)).getOrElse("")
-          jsonObject.addProperty("taskId", taskId)
-          jsonObject.addProperty("stageId", stageId)
-        }
-      jsonObject.toString
-    }.reduceOption((x, y) => x + "," + y)
+    if (!logContextInitialized()) {
+      initLogContext()
+      if (!logContextInitialized()) return
+    }
 
-    content match {
-      case Some(c) => {
-        val flush = Try(sendContent ("[" + c + "]"))
+    buffer.isEmpty match {
+      case false => {
+        val flush = objectSink match {
+          case Some(sink) => Try(sink.write(encodeEvents(buffer), RecordContext(appName, appId, executorId)))
+          case None => Try(sendContent(encodeEvents(buffer)))
+        }
         flush match{
           case Success(_) => {
             lastFlush = Instant.now
@@ -288,10 +375,18 @@ class ObservabilityClient[A](endpoint: String, region: String, batchSize: Int, b
             }
         }
       }
-      case None => println("no record to send...")
+      case true => println("no record to send...")
     }
   }
 
+  /**
+   * Flush the remaining events and complete the current object of the object sink, if any.
+   */
+  def close(): Unit = {
+    if (buffer.nonEmpty) Try(flushEvents())
+    objectSink.foreach(_.close())
+  }
+
   /**
    * Add an event to the client buffer and flush events if conditions are met.
    * @param event the event to add to the client buffer
@@ -0,0 +1,305 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import org.apache.logging.log4j.spi.StandardLevel
+import org.apache.logging.log4j.core.LogEvent
+
+import java.lang.reflect.{Field, Modifier}
+import java.nio.charset.StandardCharsets
+import java.util.concurrent.ConcurrentHashMap
+import scala.collection.mutable.LinkedHashMap
+
+/**
+ * Contains the OTLP messages shared by the metrics and logs encoders.
+ * Field numbers follow the opentelemetry-proto v1 definitions.
+ */
+object OtlpProtobufEncoder {
+  val CONTENT_TYPE: String = "application/x-protobuf"
+  val CONTENT_ENCODING: String = "gzip"
+
+  private val NANOS_PER_MILLI = 1000000L
+  private val SCOPE_NAME = "spark-observability-collector"
+
+  def nanos(millis: Long): Long = millis * NANOS_PER_MILLI
+
+  /**
+   * Encode a KeyValue attribute with a value of type string, int, double or bool.
+   * @param key the attribute key
+   * @param value the attribute value, unsupported types are sent as strings
+   * @return the KeyValue message
+   */
+  def keyValue(key: String, value: Any): ProtobufWriter = {
+    val anyValue = new ProtobufWriter(16)
+    value match {
+      case v: String => anyValue.string(1, v)
+      case v: java.lang.Boolean => anyValue.varint(2, if (v) 1 else 0)
+      case v: java.lang.Integer => anyValue.varint(3, v.longValue)
+      case v: java.lang.Long => anyValue.varint(3, v)
+      case v: java.lang.Double => anyValue.double(4, v)
+      case v => anyValue.string(1, String.valueOf(v))
+    }
+    new ProtobufWriter(key.length + 24).string(1, key).message(2, anyValue)
+  }
+
+  /**
+   * Encode the Resource message describing the Spark application, the service name is the application name.
+   * @param context the Spark context of the records
+   * @return the Resource message
+   */
+  def resource(context: RecordContext): ProtobufWriter = {
+    new ProtobufWriter()
+      .message(1, keyValue("service.name", context.appName))
+      .message(1, keyValue("spark.app.id", context.appId))
+      .message(1, keyValue("spark.executor.id", context.executorId))
+  }
+
+  /**
+   * Encode the InstrumentationScope message of the collector.
+   * @return the InstrumentationScope message
+   */
+  def scope(): ProtobufWriter = new ProtobufWriter().string(1, SCOPE_NAME)
+}
+
+/**
+ * Encode custom metrics as an OTLP ExportMetricsServiceRequest for the otel_metrics_source of Opensearch Ingestion.
+ * Task metrics are aggregated per stage attempt into delta histograms named `spark.task.<field>`, one data point per
+ * stage attempt and per request. Sending one gauge per task and per counter repeats the task identifiers in every data
+ * point and makes the request larger than the JSON documents, per task values stay available with the json format.
+ * Other metrics become gauges named `spark.<type>.<field>` with their identifiers as data point attributes.
+ */
+object OtlpMetricsEncoder extends RecordEncoder {
+
+  override val contentType: String = OtlpProtobufEncoder.CONTENT_TYPE
+  override val contentEncoding: Option[String] = Some(OtlpProtobufEncoder.CONTENT_ENCODING)
+
+  /**
+   * Fields sent as data point attributes, the job ID inherited from CustomMetrics is always sent
+   */
+  private val ATTRIBUTE_FIELDS = Set("stageId", "stageAttemptId", "taskId", "executorId", "partitionId", "summaryLevel", "result")
+
+  /**
+   * Numeric fields that aren't metrics: the record time is the data point time and the identifiers are resource
+   * attributes, the start and end times of a summary are timestamps
+   */
+  private val EXCLUDED_FIELDS = Set("metricTime", "startTime", "endTime", "appName", "appId", "jobId", "metricsType")
+
+  /**
+   * Histogram bucket bounds and unit by kind of task counter
+   */
+  private val MILLIS_BOUNDS = (Seq(100.0, 500.0, 1000.0, 5000.0, 10000.0, 30000.0, 60000.0, 300000.0, 600000.0), "ms")
+  private val NANOS_BOUNDS = (MILLIS_BOUNDS._1.map(_ * 1000000), "ns")
+  private val BYTES_BOUNDS = (Seq(1024.0, 65536.0, 1048576.0, 16777216.0, 134217728.0, 536870912.0, 1073741824.0, 4294967296.0), "By")
+  private val RECORDS_BOUNDS = (Seq(100.0, 1000.0, 10000.0, 100000.0, 1000000.0, 10000000.0, 100000000.0), "{record}")
+
+  private val AGGREGATION_TEMPORALITY_DELTA = 1
+
+  /**
+   * A numeric field of a metrics class with its encoded metric name and for task counters the histogram bucket bounds and unit
+   */
+  private case class NumericField(field: Field, name: Array[Byte], bounds: Seq[Double], unit: String)
+
+  /**
+   * The numeric and attribute fields declared by a metrics class
+   */
+  private case class Layout(numerics: Array[NumericField], attributes: Array[Field])
+
+  /**
+   * The layout of each metrics class, resolved once with reflection instead of for every record.
+   * Only the fields declared by the class are used, the fields inherited from CustomMetrics are handled separately.
+   */
+  private val layouts = new ConcurrentHashMap[Class[_], Layout]()
+
+  private def bounds(field: String): (Seq[Double], String) = field match {
+    case f if f.contains("CpuTime") => NANOS_BOUNDS
+    case f if f.contains("Time") => MILLIS_BOUNDS
+    case f if f.contains("Records") => RECORDS_BOUNDS
+    case _ => BYTES_BOUNDS
+  }
+
+  private def layout(metrics: CustomMetrics): Layout = layouts.computeIfAbsent(metrics.getClass, c => {
+    val fields = c.getDeclaredFields.filterNot(f => Modifier.isStatic(f.getModifiers) || EXCLUDED_FIELDS.contains(f.getName))
+    fields.foreach(_.setAccessible(true))
+    val prefix = "spark." + metrics.metricsType.stripSuffix("Metrics") + "."
+    val (attributes, numerics) = fields.partition(f => ATTRIBUTE_FIELDS.contains(f.getName))
+    Layout(
+      numerics
+        .filter(f => f.getType == classOf[Double] || f.getType == classOf[Long] || f.getType == classOf[Int])
+        .map { f =>
+          val (fieldBounds, unit) = bounds(f.getName)
+          NumericField(f, (prefix + f.getName).getBytes(StandardCharsets.UTF_8), fieldBounds, unit)
+        },
+      attributes
+    )
+  })
+
+  /**
+   * Accumulator of the distribution of one task counter for one stage attempt
+   */
+  private class Histogram(field: NumericField) {
+    val bucketCounts: Array[Long] = Array.fill(field.bounds.length + 1)(0L)
+    var count = 0L
+    var sum = 0.0
+    var min = Double.MaxValue
+    var max = Double.MinValue
+
+    def add(value: Double): Unit = {
+      val bucket = field.bounds.indexWhere(value <= _)
+      bucketCounts(if (bucket < 0) field.bounds.length else bucket) += 1
+      count += 1
+      sum += value
+      min = min.min(value)
+      max = max.max(value)
+    }
+
+    def toMetric(attributes: Array[Byte], startTime: Long, endTime: Long): ProtobufWriter = {
+      val dataPoint = new ProtobufWriter(attributes.length + 192)
+        .fixed64(2, OtlpProtobufEncoder.nanos(startTime))
+        .fixed64(3, OtlpProtobufEncoder.nanos(endTime))
+        .fixed64(4, count)
+        .double(5, sum)
+        .packedFixed64(6, bucketCounts)
+        .packedDouble(7, field.bounds)
+        .raw(attributes)
+        .double(11, min)
+        .double(12, max)
+      val histogram = new ProtobufWriter(dataPoint.size + 8)
+        .message(1, dataPoint)
+        .varint(2, AGGREGATION_TEMPORALITY_DELTA)
+      new ProtobufWriter(histogram.size + field.name.length + 16)
+        .bytes(1, field.name)
+        .string(3, field.unit)
+        .message(9, histogram)
+    }
+  }
+
+  /**
+   * Accumulator of the task counters of one stage attempt
+   */
+  private class StageHistograms(task: CustomTaskMetrics, fields: Array[NumericField]) {
+    private val attributes = new ProtobufWriter(64)
+      .message(9, OtlpProtobufEncoder.keyValue("jobId", task.jobId))
+      .message(9, OtlpProtobufEncoder.keyValue("stageId", task.stageId))
+      .message(9, OtlpProtobufEncoder.keyValue("stageAttemptId", task.stageAttemptId))
+      .toByteArray
+    private val histograms = fields.map(new Histogram(_))
+    private var startTime = task.metricTime
+    private var endTime = task.metricTime
+
+    def add(task: CustomTaskMetrics): Unit = {
+      for (i <- fields.indices) {
+        histograms(i).add(fields(i).field.get(task).asInstanceOf[Number].doubleValue)
+      }
+      startTime = startTime.min(task.metricTime)
+      endTime = endTime.max(task.metricTime)
+    }
+
+    def writeTo(scopeMetrics: ProtobufWriter): Unit =
+      histograms.foreach(h => scopeMetrics.message(2, h.toMetric(attributes, startTime, endTime)))
+  }
+
+  override def encodeRecords(records: Seq[Any], context: RecordContext): Array[Byte] = {
+    val scopeMetrics = new ProtobufWriter(4096).message(1, OtlpProtobufEncoder.scope())
+    val stages = LinkedHashMap.empty[(String, Integer, Integer), StageHistograms]
+
+    records.foreach {
+      case task: CustomTaskMetrics =>
+        stages.getOrElseUpdate((task.jobId, task.stageId, task.stageAttemptId),
+          new StageHistograms(task, layout(task).numerics)).add(task)
+      case metrics: CustomMetrics =>
+        val fields = layout(metrics)
+        val time = OtlpProtobufEncoder.nanos(metrics.metricTime)
+
+        // Attributes are encoded once and repeated in all the data points of the record
+        val attributes = new ProtobufWriter(128)
+        if (metrics.jobId != null) attributes.message(7, OtlpProtobufEncoder.keyValue("jobId", metrics.jobId))
+        fields.attributes.foreach { field =>
+          val value = field.get(metrics)
+          if (value != null) attributes.message(7, OtlpProtobufEncoder.keyValue(field.getName, value))
+        }
+        val attributeBytes = attributes.toByteArray
+
+        fields.numerics.foreach { numeric =>
+          val dataPoint = new ProtobufWriter(attributeBytes.length + 24).fixed64(3, time)
+          numeric.field.get(metrics) match {
+            case v: java.lang.Double => dataPoint.double(4, v)
+            case v: Number => dataPoint.fixed64(6, v.longValue)
+          }
+          dataPoint.raw(attributeBytes)
+          scopeMetrics.message(2, new ProtobufWriter(dataPoint.size + numeric.name.length + 8)
+            .bytes(1, numeric.name)
+            .message(5, new ProtobufWriter(dataPoint.size + 4).message(1, dataPoint)))
+        }
+      case _ =>
+    }
+    stages.values.foreach(_.writeTo(scopeMetrics))
+
+    val resourceMetrics = new ProtobufWriter(scopeMetrics.size + 128)
+      .message(1, OtlpProtobufEncoder.resource(context))
+      .message(2, scopeMetrics)
+    PayloadEncoder.gzip(new ProtobufWriter(resourceMetrics.size + 8).message(1, resourceMetrics).toByteArray)
+  }
+}
+
+/**
+ * Encode Log4j events as an OTLP ExportLogsServiceRequest for the otel_logs_source of Opensearch Ingestion.
+ * The MDC context data, the task and stage IDs and the exception are sent as log record attributes.
+ */
+object OtlpLogsEncoder extends RecordEncoder {
+
+  override val contentType: String = OtlpProtobufEncoder.CONTENT_TYPE
+  override val contentEncoding: Option[String] = Some(OtlpProtobufEncoder.CONTENT_ENCODING)
+
+  /**
+   * Map Log4j levels to OTLP severity numbers
+   * @param level the Log4j standard level
+   * @return the OTLP SeverityNumber
+   */
+  private def severityNumber(level: StandardLevel): Int = level match {
+    case StandardLevel.TRACE => 1
+    case StandardLevel.DEBUG => 5
+    case StandardLevel.INFO => 9
+    case StandardLevel.WARN => 13
+    case StandardLevel.ERROR => 17
+    case StandardLevel.FATAL => 21
+    case _ => 0
+  }
+
+  private def logRecord(event: LogEvent): ProtobufWriter = {
+    val time = OtlpProtobufEncoder.nanos(event.getTimeMillis)
+    val record = new ProtobufWriter(256)
+      .fixed64(1, time)
+      .varint(2, severityNumber(event.getLevel.getStandardLevel))
+      .string(3, event.getLevel.name)
+      .message(5, new ProtobufWriter().string(1, event.getMessage.getFormattedMessage))
+      .message(6, OtlpProtobufEncoder.keyValue("loggerName", event.getLoggerName))
+      .message(6, OtlpProtobufEncoder.keyValue("threadName", event.getThreadName))
+
+    event.getContextData.forEach { (key: String, value: AnyRef) =>
+      if (value != null) record.message(6, OtlpProtobufEncoder.keyValue(key, value))
+    }
+    val (taskId, stageId) = Utils.parseTaskName(event.getContextData.getValue[String]("mdc.taskName"))
+    record.message(6, OtlpProtobufEncoder.keyValue("taskId", taskId))
+    record.message(6, OtlpProtobufEncoder.keyValue("stageId", stageId))
+
+    Option(event.getThrown).foreach { thrown =>
+      record.message(6, OtlpProtobufEncoder.keyValue("exception.type", thrown.getClass.getName))
+      record.message(6, OtlpProtobufEncoder.keyValue("exception.message", String.valueOf(thrown.getMessage)))
+      record.message(6, OtlpProtobufEncoder.keyValue("exception.stacktrace", Utils.stackTrace(thrown)))
+    }
+    record.fixed64(11, time)
+  }
+
+  override def encodeRecords(records: Seq[Any], context: RecordContext): Array[Byte] = {
+    val scopeLogs = new ProtobufWriter(records.size * 256).message(1, OtlpProtobufEncoder.scope())
+    records.foreach {
+      case event: LogEvent => scopeLogs.message(2, logRecord(event))
+      case _ =>
+    }
+    val resourceLogs = new ProtobufWriter(scopeLogs.size + 128)
+      .message(1, OtlpProtobufEncoder.resource(context))
+      .message(2, scopeLogs)
+    PayloadEncoder.gzip(new ProtobufWriter(resourceLogs.size + 8).message(1, resourceLogs).toByteArray)
+  }
+}
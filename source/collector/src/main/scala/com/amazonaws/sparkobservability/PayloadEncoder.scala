@@ -0,0 +1,111 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import com.google.gson.JsonObject
+
+import java.io.ByteArrayOutputStream
+import java.nio.charset.StandardCharsets
+import java.util.zip.GZIPOutputStream
+
+/**
+ * Contains the supported wire formats and helpers used by PayloadEncoder objects
+ */
+object PayloadEncoder {
+  /**
+   * JSON documents sent to the Opensearch Ingestion http source
+   */
+  val JSON_FORMAT: String = "json"
+
+  /**
+   * OTLP protobuf messages sent to the Opensearch Ingestion otel sources
+   */
+  val OTLP_FORMAT: String = "otlp"
+
+  /**
+   * Compress a request body with gzip.
+   * @param content the bytes to compress
+   * @return the compressed bytes
+   */
+  def gzip(content: Array[Byte]): Array[Byte] = {
+    val output = new ByteArrayOutputStream(content.length / 4 + 64)
+    val gzip = new GZIPOutputStream(output)
+    gzip.write(content)
+    gzip.close()
+    output.toByteArray
+  }
+}
+
+/**
+ * Builds the body of a request sent by the ObservabilityClient from a batch of records.
+ */
+sealed trait PayloadEncoder {
+
+  /**
+   * The value of the Content-Type header of the request
+   */
+  def contentType: String
+
+  /**
+   * The value of the Content-Encoding header of the request, if any
+   */
+  def contentEncoding: Option[String] = None
+}
+
+/**
+ * Encodes a batch of records after they are converted into JSON documents and enriched by the ObservabilityClient.
+ */
+trait DocumentEncoder extends PayloadEncoder {
+
+  /**
+   * Encode the documents into the request body.
+   * @param documents the enriched documents to send
+   * @return the bytes of the request body
+   */
+  def encode(documents: Seq[JsonObject]): Array[Byte]
+}
+
+/**
+ * Encodes a batch of records directly, without the intermediate JSON documents.
+ * The Spark context is passed separately so it's sent once per request instead of once per record.
+ */
+trait RecordEncoder extends PayloadEncoder {
+
+  /**
+   * Encode the records into the request body.
+   * @param records the records to send
+   * @param context the Spark context of the records
+   * @return the bytes of the request body
+   */
+  def encodeRecords(records: Seq[Any], context: RecordContext): Array[Byte]
+}
+
+/**
+ * Case class that represents the Spark context shared by all the records of a request
+ */
+case class RecordContext(appName: String, appId: String, executorId: String)
+
+/**
+ * The default encoder, sending documents as a JSON array to the Opensearch Ingestion http source.
+ */
+object JsonArrayEncoder extends DocumentEncoder {
+
+  override val contentType: String = "application/json"
+
+  override def encode(documents: Seq[JsonObject]): Array[Byte] = {
+    documents.map(_.toString).mkString("[", ",", "]").getBytes(StandardCharsets.UTF_8)
+  }
+}
+
+/**
+ * Encodes documents as newline delimited JSON, the format written by the object sinks and read by the S3 source.
+ */
+object NdjsonEncoder extends DocumentEncoder {
+
+  override val contentType: String = "application/x-ndjson"
+
+  override def encode(documents: Seq[JsonObject]): Array[Byte] = {
+    documents.map(_.toString).mkString("", "\n", "\n").getBytes(StandardCharsets.UTF_8)
+  }
+}
@@ -0,0 +1,118 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import java.io.ByteArrayOutputStream
+import java.nio.charset.StandardCharsets
+
+/**
+ * Contains the protocol buffers wire types used by ProtobufWriter objects
+ */
+object ProtobufWriter {
+  private val VARINT = 0
+  private val FIXED64 = 1
+  private val LENGTH_DELIMITED = 2
+}
+
+/**
+ * Minimal protocol buffers writer used to encode OTLP messages.
+ * The collector doesn't depend on the protobuf runtime to avoid conflicts with the protobuf versions shipped with Spark and Hadoop.
+ * Fields must be written in the order of the message definition to be read by strict decoders.
+ * @param initialSize the initial size of the underlying buffer
+ */
+class ProtobufWriter(initialSize: Int = 64) {
+
+  private val out = new ByteArrayOutputStream(initialSize)
+
+  private def writeVarint(value: Long): Unit = {
+    var remaining = value
+    while ((remaining & ~0x7FL) != 0L) {
+      out.write(((remaining & 0x7F) | 0x80).toInt)
+      remaining >>>= 7
+    }
+    out.write(remaining.toInt)
+  }
+
+  private def writeLittleEndian(value: Long): Unit = {
+    for (i <- 0 until 8) out.write((value >>> (8 * i)).toInt & 0xFF)
+  }
+
+  private def writeTag(field: Int, wireType: Int): Unit = writeVarint((field << 3) | wireType)
+
+  /**
+   * Write a varint field, used for int32, int64, uint32, uint64, bool and enum fields.
+   */
+  def varint(field: Int, value: Long): ProtobufWriter = {
+    writeTag(field, ProtobufWriter.VARINT)
+    writeVarint(value)
+    this
+  }
+
+  /**
+   * Write a fixed64 or sfixed64 field.
+   */
+  def fixed64(field: Int, value: Long): ProtobufWriter = {
+    writeTag(field, ProtobufWriter.FIXED64)
+    writeLittleEndian(value)
+    this
+  }
+
+  /**
+   * Write a double field.
+   */
+  def double(field: Int, value: Double): ProtobufWriter = fixed64(field, java.lang.Double.doubleToRawLongBits(value))
+
+  /**
+   * Write a length-delimited bytes field.
+   */
+  def bytes(field: Int, value: Array[Byte]): ProtobufWriter = {
+    writeTag(field, ProtobufWriter.LENGTH_DELIMITED)
+    writeVarint(value.length)
+    out.write(value, 0, value.length)
+    this
+  }
+
+  /**
+   * Write a UTF-8 string field.
+   */
+  def string(field: Int, value: String): ProtobufWriter = bytes(field, value.getBytes(StandardCharsets.UTF_8))
+
+  /**
+   * Write an embedded message field.
+   */
+  def message(field: Int, value: ProtobufWriter): ProtobufWriter = {
+    writeTag(field, ProtobufWriter.LENGTH_DELIMITED)
+    writeVarint(value.size)
+    value.out.writeTo(out)
+    this
+  }
+
+  /**
+   * Write a packed repeated fixed64 field.
+   */
+  def packedFixed64(field: Int, values: Seq[Long]): ProtobufWriter = {
+    writeTag(field, ProtobufWriter.LENGTH_DELIMITED)
+    writeVarint(values.length * 8L)
+    values.foreach(writeLittleEndian)
+    this
+  }
+
+  /**
+   * Write a packed repeated double field.
+   */
+  def packedDouble(field: Int, values: Seq[Double]): ProtobufWriter =
+    packedFixed64(field, values.map(java.lang.Double.doubleToRawLongBits))
+
+  /**
+   * Append fields already encoded by another writer, used to repeat the same fields in several messages.
+   */
+  def raw(value: Array[Byte]): ProtobufWriter = {
+    out.write(value, 0, value.length)
+    this
+  }
+
+  def size: Int = out.size
+
+  def toByteArray: Array[Byte] = out.toByteArray
+}
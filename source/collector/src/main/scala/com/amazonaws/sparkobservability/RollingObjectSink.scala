@@ -0,0 +1,293 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import org.slf4j.LoggerFactory
+import software.amazon.awssdk.core.exception.{NonRetryableException, RetryableException}
+import software.amazon.awssdk.core.sync.RequestBody
+import software.amazon.awssdk.http.apache.ApacheHttpClient
+import software.amazon.awssdk.regions.Region
+import software.amazon.awssdk.services.s3.S3Client
+import software.amazon.awssdk.services.s3.model.{CompleteMultipartUploadRequest, CompletedMultipartUpload, CompletedPart, CreateMultipartUploadRequest, PutObjectRequest, UploadPartRequest}
+
+import java.io.{ByteArrayOutputStream, File, FileOutputStream}
+import java.net.URI
+import java.nio.file.{Files, StandardCopyOption}
+import java.time.{Duration, Instant}
+import java.util.zip.GZIPOutputStream
+import scala.collection.mutable.ListBuffer
+import scala.util.{Failure, Success, Try}
+
+/**
+ * Contains static variables and the factory used by RollingObjectSink objects
+ */
+object RollingObjectSink {
+  val S3_SINK: String = "s3"
+  val DIRECTORY_SINK: String = "directory"
+
+  /**
+   * The extension of the objects written by the sink, used to filter S3 notifications
+   */
+  val EXTENSION: String = ".ndjson.gz"
+
+  // The minimum size of an S3 multipart upload part, except the last one
+  private[sparkobservability] val S3_PART_SIZE = 8 * 1024 * 1024
+  // The size of the chunks appended to local files
+  private[sparkobservability] val DIRECTORY_PART_SIZE = 64 * 1024
+  // The number of parts kept in memory when writing fails before stopping the collection
+  private val MAX_PENDING_PARTS = 4
+  // The number of failed attempts to complete an object before stopping the collection
+  private val MAX_COMPLETE_ATTEMPTS = 8
+
+  /**
+   * Create the sink for a sink mode.
+   * @param sink the sink mode, s3 or directory
+   * @param location the S3 URI in the form of s3://<BUCKET>/<PREFIX> or the local directory
+   * @param region the AWS region of the S3 bucket
+   * @param maxObjectSize the compressed size in bytes after which an object is completed and a new one is started
+   * @param rolloverTime the maximum time in seconds an object stays open
+   * @return the sink
+   */
+  def apply(sink: String, location: String, region: String, maxObjectSize: Long, rolloverTime: Int): RollingObjectSink = {
+    sink match {
+      case S3_SINK => new S3ObjectSink(location, region, maxObjectSize, rolloverTime)
+      case DIRECTORY_SINK => new DirectoryObjectSink(location, maxObjectSize, rolloverTime)
+      case _ => throw new IllegalArgumentException(s"Unknown sink $sink, must be $S3_SINK or $DIRECTORY_SINK")
+    }
+  }
+}
+
+/**
+ * Sink writing batches of newline delimited JSON documents into rolling gzip compressed objects.
+ * The compressed stream is written in parts so an object never needs to be held entirely in memory.
+ * Objects are completed when they reach the maximum size or the maximum age, only completed objects are visible.
+ * Writing failures don't lose data: the parts are kept in memory and written again with the next batch.
+ * Completion failures don't either: the written parts are kept and the completion is retried with the next batch.
+ * @param maxObjectSize the compressed size in bytes after which an object is completed and a new one is started
+ * @param rolloverTime the maximum time in seconds an object stays open
+ * @param partSize the compressed size in bytes of the parts written to the storage
+ */
+abstract class RollingObjectSink(maxObjectSize: Long, rolloverTime: Int, partSize: Int) {
+
+  private val logger = LoggerFactory.getLogger(this.getClass.getName)
+
+  /**
+   * The compressed bytes not yet written to the storage
+   */
+  private val pending = new ByteArrayOutputStream(partSize)
+
+  /**
+   * The compression stream of the current object, null if no object is open
+   */
+  private var gzip: GZIPOutputStream = _
+
+  /**
+   * The time when the current object was opened
+   */
+  private var openedAt: Instant = Instant.now
+
+  /**
+   * The number of compressed bytes of the current object already written to the storage
+   */
+  private var written = 0L
+
+  /**
+   * The current object is finished and only waits to be completed in the storage
+   */
+  private var finishing = false
+
+  /**
+   * The number of failed attempts to complete the current object
+   */
+  private var failedCompletions = 0
+
+  /**
+   * The sequence number of objects created by the sink, used to build unique keys
+   */
+  private var sequence = 0
+
+  /**
+   * Start a new object in the storage.
+   * @param key the key of the object relative to the sink location
+   */
+  protected def open(key: String): Unit
+
+  /**
+   * Write a part of the current object to the storage.
+   * @param part the compressed bytes
+   * @param last true if it's the last part of the object
+   */
+  protected def writePart(part: Array[Byte], last: Boolean): Unit
+
+  /**
+   * Complete the current object so it becomes visible to readers.
+   * On failure the written parts must be kept so the completion can be attempted again.
+   */
+  protected def complete(): Unit
+
+  /**
+   * Build the key of a new object, partitioned by application and executor.
+   */
+  private def objectKey(context: RecordContext): String = {
+    sequence += 1
+    val now = Instant.now
+    f"appId=${context.appId}/executorId=${context.executorId}/${now.toEpochMilli}-$sequence%05d${RollingObjectSink.EXTENSION}"
+  }
+
+  /**
+   * Write the pending bytes as a part. On failure the bytes are kept for the next attempt.
+   * @return true if the pending bytes were written
+   */
+  private def writePending(last: Boolean): Boolean = {
+    Try(writePart(pending.toByteArray, last)) match {
+      case Success(_) =>
+        written += pending.size
+        pending.reset()
+        true
+      case Failure(e) =>
+        logger.warn("Error writing to the object sink, keeping data for the next batch: " + e.getMessage)
+        if (pending.size > partSize * RollingObjectSink.MAX_PENDING_PARTS)
+          throw NonRetryableException.create("Object sink can't write for too long, stopping the collection: " + e.getMessage)
+        false
+    }
+  }
+
+  /**
+   * Finish the compressed stream and complete the current object if possible.
+   * The last part is written once, a failed completion is retried with the parts already written.
+   */
+  private def rollover(): Unit = {
+    if (!finishing) {
+      gzip.finish()
+      finishing = true
+    }
+    if (pending.size == 0 || writePending(last = true)) {
+      Try(complete()) match {
+        case Success(_) =>
+          gzip = null
+          finishing = false
+          written = 0L
+          failedCompletions = 0
+        case Failure(e) =>
+          failedCompletions += 1
+          logger.warn("Error completing the object, keeping its parts for the next batch: " + e.getMessage)
+          if (failedCompletions >= RollingObjectSink.MAX_COMPLETE_ATTEMPTS)
+            throw NonRetryableException.create("Object sink can't complete the current object, stopping the collection: " + e.getMessage)
+      }
+    }
+  }
+
+  /**
+   * Append a batch of newline delimited JSON documents to the current object and write a part or complete the object
+   * when the thresholds are reached.
+   * @param content the uncompressed documents
+   * @param context the Spark context used to build the object key
+   */
+  def write(content: Array[Byte], context: RecordContext): Unit = synchronized {
+    // Complete the previous object if it failed to complete during the last rollover
+    // The batch is not appended so the client keeps it and retries with its back-off
+    if (finishing) rollover()
+    if (finishing) throw RetryableException.create("Object sink can't complete the current object")
+
+    if (gzip == null) {
+      open(objectKey(context))
+      openedAt = Instant.now
+      gzip = new GZIPOutputStream(pending, 64 * 1024)
+    }
+    gzip.write(content)
+
+    if (pending.size >= partSize) writePending(last = false)
+    if (written + pending.size >= maxObjectSize || Duration.between(openedAt, Instant.now).getSeconds >= rolloverTime) rollover()
+  }
+
+  /**
+   * Complete the current object. Must be called when the application stops.
+   */
+  def close(): Unit = synchronized {
+    if (gzip != null) rollover()
+  }
+}
+
+/**
+ * Sink writing objects to an S3 prefix. Small objects are written with a single PUT, larger objects with a multipart upload.
+ * @param location the S3 URI in the form of s3://<BUCKET>/<PREFIX>
+ * @param region the AWS region of the S3 bucket
+ * @param maxObjectSize the compressed size in bytes after which an object is completed and a new one is started
+ * @param rolloverTime the maximum time in seconds an object stays open
+ */
+class S3ObjectSink(location: String, region: String, maxObjectSize: Long, rolloverTime: Int)
+  extends RollingObjectSink(maxObjectSize, rolloverTime, RollingObjectSink.S3_PART_SIZE) {
+
+  private val uri = URI.create(location)
+  private val bucket = uri.getHost
+  private val prefix = uri.getPath.stripPrefix("/").stripSuffix("/")
+
+  private lazy val s3 = S3Client.builder
+    .region(Region.of(region))
+    .httpClientBuilder(ApacheHttpClient.builder)
+    .build
+
+  private var key: String = _
+  private var uploadId: String = _
+  private val parts = ListBuffer[CompletedPart]()
+
+  override protected def open(objectKey: String): Unit = {
+    key = if (prefix.isEmpty) objectKey else s"$prefix/$objectKey"
+    uploadId = null
+    parts.clear()
+  }
+
+  override protected def writePart(part: Array[Byte], last: Boolean): Unit = {
+    if (last && uploadId == null) {
+      s3.putObject(PutObjectRequest.builder.bucket(bucket).key(key).contentEncoding("gzip").contentType("application/x-ndjson").build,
+        RequestBody.fromBytes(part))
+    } else {
+      if (uploadId == null) {
+        uploadId = s3.createMultipartUpload(CreateMultipartUploadRequest.builder.bucket(bucket).key(key)
+          .contentEncoding("gzip").contentType("application/x-ndjson").build).uploadId
+      }
+      val partNumber = parts.size + 1
+      val response = s3.uploadPart(UploadPartRequest.builder.bucket(bucket).key(key).uploadId(uploadId).partNumber(partNumber).build,
+        RequestBody.fromBytes(part))
+      parts += CompletedPart.builder.partNumber(partNumber).eTag(response.eTag).build
+    }
+  }
+
+  override protected def complete(): Unit = {
+    // Failures are thrown with the upload left open, uploads never completed are aborted by the bucket lifecycle
+    if (uploadId != null) {
+      s3.completeMultipartUpload(CompleteMultipartUploadRequest.builder.bucket(bucket).key(key).uploadId(uploadId)
+        .multipartUpload(CompletedMultipartUpload.builder.parts(parts: _*).build).build)
+    }
+  }
+}
+
+/**
+ * Sink writing objects to a local directory, used for testing. Objects are written with an `.inprogress` suffix and
+ * renamed when they are completed.
+ * @param directory the local directory
+ * @param maxObjectSize the compressed size in bytes after which an object is completed and a new one is started
+ * @param rolloverTime the maximum time in seconds an object stays open
+ */
+class DirectoryObjectSink(directory: String, maxObjectSize: Long, rolloverTime: Int)
+  extends RollingObjectSink(maxObjectSize, rolloverTime, RollingObjectSink.DIRECTORY_PART_SIZE) {
+
+  private var target: File = _
+  private var inProgress: File = _
+
+  override protected def open(objectKey: String): Unit = {
+    target = new File(directory, objectKey)
+    inProgress = new File(target.getPath + ".inprogress")
+    target.getParentFile.mkdirs()
+  }
+
+  override protected def writePart(part: Array[Byte], last: Boolean): Unit = {
+    val out = new FileOutputStream(inProgress, true)
+    try out.write(part) finally out.close()
+  }
+
+  override protected def complete(): Unit = {
+    Files.move(inProgress.toPath, target.toPath, StandardCopyOption.ATOMIC_MOVE)
+  }
+}
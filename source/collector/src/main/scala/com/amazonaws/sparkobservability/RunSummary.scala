@@ -0,0 +1,131 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+/**
+ * Contains static variables used by RunSummary objects
+ */
+object RunSummary {
+  val JOB_LEVEL: String = "job"
+  val APPLICATION_LEVEL: String = "application"
+
+  /**
+   * The number of task counters tracked in a summary, in the order returned by `counters`
+   */
+  private val COUNTERS = 11
+
+  /**
+   * Extract the task counters from task metrics in a fixed order.
+   * @param metrics the task metrics
+   * @return the counters values
+   */
+  private def counters(metrics: CustomTaskMetrics): Array[Double] = Array(
+    metrics.inputBytesRead,
+    metrics.inputRecordsRead,
+    metrics.runTime,
+    metrics.executorCpuTime,
+    metrics.peakExecutionMemory,
+    metrics.outputRecordsWritten,
+    metrics.outputBytesWritten,
+    metrics.shuffleRecordsRead,
+    metrics.shuffleBytesRead,
+    metrics.shuffleRecordsWritten,
+    metrics.shuffleBytesWritten
+  )
+}
+
+/**
+ * Accumulator of task and stage counters used to build job and application summaries.
+ * Only totals, maxima and counts are kept so the memory footprint doesn't depend on the number of tasks.
+ * @param startTime the time in milliseconds when the job or the application started
+ */
+class RunSummary(var startTime: Long) {
+
+  private val totals = Array.fill(RunSummary.COUNTERS)(0.0)
+  private val maxima = Array.fill(RunSummary.COUNTERS)(0.0)
+
+  var jobCount: Int = 0
+  var stageCount: Int = 0
+  var failedStageCount: Int = 0
+  var taskCount: Int = 0
+  var failedTaskCount: Int = 0
+  var retriedTaskCount: Int = 0
+  var peakExecutors: Int = 0
+
+  /**
+   * Add the counters of an ended task to the summary.
+   * @param metrics the task metrics
+   * @param failed true if the task didn't succeed
+   * @param retried true if the task is a retry or a speculative attempt
+   */
+  def addTask(metrics: CustomTaskMetrics, failed: Boolean, retried: Boolean): Unit = {
+    val values = RunSummary.counters(metrics)
+    for (i <- values.indices) {
+      totals(i) += values(i)
+      maxima(i) = maxima(i).max(values(i))
+    }
+    taskCount += 1
+    if (failed) failedTaskCount += 1
+    if (retried) retriedTaskCount += 1
+  }
+
+  /**
+   * Add a completed stage to the summary.
+   * @param failed true if the stage failed
+   */
+  def addStage(failed: Boolean): Unit = {
+    stageCount += 1
+    if (failed) failedStageCount += 1
+  }
+
+  /**
+   * Keep track of the maximum number of executors observed during the run.
+   * @param executors the current number of executors
+   */
+  def observeExecutors(executors: Int): Unit = {
+    peakExecutors = peakExecutors.max(executors)
+  }
+
+  /**
+   * Build the summary document.
+   * @param appName the Spark application name
+   * @param appId the Spark application ID
+   * @param jobId the Spark job ID, null for application summaries
+   * @param summaryLevel the level of the summary, job or application
+   * @param result the final status of the run
+   * @param endTime the time in milliseconds when the job or the application ended
+   * @return The CustomSummaryMetrics for the run
+   */
+  def toMetrics(appName: String, appId: String, jobId: String, summaryLevel: String, result: String, endTime: Long): CustomSummaryMetrics = {
+    CustomSummaryMetrics(
+      appName,
+      appId,
+      jobId,
+      summaryLevel,
+      result,
+      startTime,
+      endTime,
+      endTime - startTime,
+      jobCount,
+      stageCount,
+      failedStageCount,
+      taskCount,
+      failedTaskCount,
+      retriedTaskCount,
+      peakExecutors,
+      totals(0), maxima(0),
+      totals(1), maxima(1),
+      totals(2), maxima(2),
+      totals(3), maxima(3),
+      totals(4), maxima(4),
+      totals(5), maxima(5),
+      totals(6), maxima(6),
+      totals(7), maxima(7),
+      totals(8), maxima(8),
+      totals(9), maxima(9),
+      totals(10), maxima(10),
+      endTime
+    )
+  }
+}
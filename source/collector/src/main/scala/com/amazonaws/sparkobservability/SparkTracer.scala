@@ -0,0 +1,300 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import com.google.gson.{JsonArray, JsonElement, JsonObject}
+
+import java.nio.charset.StandardCharsets
+import java.security.MessageDigest
+import scala.collection.JavaConverters._
+import scala.collection.mutable.HashMap
+import scala.util.Random
+
+/**
+ * Case class that represents a span of the Spark application trace.
+ * Times are in nanoseconds since epoch and IDs are hexadecimal strings as expected by OTLP/JSON.
+ */
+case class TraceSpan(
+                      traceId: String,
+                      spanId: String,
+                      parentSpanId: String,
+                      name: String,
+                      startTimeUnixNano: Long,
+                      endTimeUnixNano: Long,
+                      failed: Boolean,
+                      attributes: java.util.Map[String, AnyRef]
+                    )
+
+/**
+ * Contains static variables and helpers used by SparkTracer objects
+ */
+object SparkTracer {
+  private val SQL_EXECUTION_ID_PROPERTY = "spark.sql.execution.id"
+  private val NANOS_PER_MILLI = 1000000L
+
+  /**
+   * Derive a stable hexadecimal identifier from a seed, so spans can reference their parent without keeping state.
+   * @param seed the seed of the identifier
+   * @param bytes the length of the identifier in bytes, 16 for trace IDs and 8 for span IDs
+   * @return the hexadecimal identifier
+   */
+  def hexId(seed: String, bytes: Int): String = {
+    MessageDigest.getInstance("SHA-256")
+      .digest(seed.getBytes(StandardCharsets.UTF_8))
+      .take(bytes)
+      .map("%02x".format(_))
+      .mkString
+  }
+
+  /**
+   * Create the tracer from the Spark configuration if a traces endpoint is configured.
+   * @return the tracer or None if tracing is disabled
+   */
+  def fromConf(): Option[SparkTracer] = {
+    Utils.getTracesEndpoint().map { endpoint =>
+      val client = new ObservabilityClient[TraceSpan](endpoint, Utils.getAwsRegion(), Utils.getBatchSize(), Utils.getTimeThreshold(), OtlpJsonTraceEncoder)
+      new SparkTracer(client, Utils.getTaskSampleRate())
+    }
+  }
+}
+
+/**
+ * Build spans from Spark listener events following the hierarchy application > SQL execution > job > stage > task.
+ * Spans are sent when they end. Task spans are sampled, failed tasks are always kept.
+ * @param client the client used to send the spans to the traces pipeline
+ * @param taskSampleRate the ratio of successful tasks recorded as spans, between 0 and 1
+ */
+class SparkTracer(client: ObservabilityClient[TraceSpan], taskSampleRate: Double) {
+
+  private var appId: String = Utils.getAppId()
+  private var appName: String = Utils.getAppName()
+  private var appStartTime: Long = 0L
+
+  /**
+   * SQL executions in progress with their description and start time, indexed by execution ID
+   */
+  private val sqlExecutions = HashMap.empty[Long, (String, Long)]
+
+  /**
+   * Jobs in progress with their parent span ID and start time, indexed by job ID
+   */
+  private val jobs = HashMap.empty[Int, (String, Long)]
+
+  private def traceId: String = SparkTracer.hexId(appId, 16)
+
+  private def spanId(key: String): String = SparkTracer.hexId(appId + "/" + key, 8)
+
+  private def applicationSpanId: String = spanId("application")
+
+  private def sqlSpanId(executionId: Long): String = spanId(s"sql-$executionId")
+
+  private def jobSpanId(jobId: Int): String = spanId(s"job-$jobId")
+
+  private def stageSpanId(stageId: Int, attempt: Int): String = spanId(s"stage-$stageId-$attempt")
+
+  private def emit(spanId: String, parentSpanId: String, name: String, start: Long, end: Long, failed: Boolean,
+                   attributes: Map[String, Any]): Unit = {
+    val attrs = new java.util.HashMap[String, AnyRef]()
+    attributes.foreach { case (k, v) => attrs.put(k, v.asInstanceOf[AnyRef]) }
+    client.add(TraceSpan(traceId, spanId, parentSpanId, name,
+      start * SparkTracer.NANOS_PER_MILLI, end * SparkTracer.NANOS_PER_MILLI, failed, attrs))
+  }
+
+  /**
+   * Record the application start and refresh the application metadata used to derive the trace ID.
+   * @param time the application start time in milliseconds
+   */
+  def startApplication(time: Long): Unit = {
+    appId = Utils.getAppId()
+    appName = Utils.getAppName()
+    appStartTime = time
+  }
+
+  /**
+   * Send the application span, the root of the trace, and flush pending spans.
+   * @param time the application end time in milliseconds
+   */
+  def endApplication(time: Long): Unit = {
+    emit(applicationSpanId, "", s"application $appName", appStartTime, time, failed = false,
+      Map("spark.app.id" -> appId, "spark.app.name" -> appName))
+    client.flushEvents()
+  }
+
+  /**
+   * Record the start of a Spark SQL execution.
+   * @param executionId the SQL execution ID
+   * @param description the description of the query
+   * @param time the execution start time in milliseconds
+   */
+  def startSqlExecution(executionId: Long, description: String, time: Long): Unit = {
+    sqlExecutions += (executionId -> (description, time))
+  }
+
+  /**
+   * Send the span of a Spark SQL execution, child of the application span.
+   * @param executionId the SQL execution ID
+   * @param time the execution end time in milliseconds
+   */
+  def endSqlExecution(executionId: Long, time: Long): Unit = {
+    sqlExecutions.remove(executionId).foreach { case (description, start) =>
+      emit(sqlSpanId(executionId), applicationSpanId, s"sql $executionId", start, time, failed = false,
+        Map("spark.sql.execution.id" -> executionId, "spark.sql.description" -> description))
+    }
+  }
+
+  /**
+   * Record the start of a job. The parent is the SQL execution that triggered the job if any, or the application.
+   * @param jobId the job ID
+   * @param properties the job properties, containing the SQL execution ID for jobs triggered by Spark SQL
+   * @param time the job start time in milliseconds
+   */
+  def startJob(jobId: Int, properties: java.util.Properties, time: Long): Unit = {
+    val parent = Option(properties)
+      .flatMap(p => Option(p.getProperty(SparkTracer.SQL_EXECUTION_ID_PROPERTY)))
+      .map(id => sqlSpanId(id.toLong))
+      .getOrElse(applicationSpanId)
+    jobs += (jobId -> (parent, time))
+  }
+
+  /**
+   * Send the span of a job.
+   * @param jobId the job ID
+   * @param result the final status of the job, SUCCEEDED or FAILED
+   * @param time the job end time in milliseconds
+   */
+  def endJob(jobId: Int, result: String, time: Long): Unit = {
+    jobs.remove(jobId).foreach { case (parent, start) =>
+      emit(jobSpanId(jobId), parent, s"job $jobId", start, time, result != "SUCCEEDED",
+        Map("spark.job.id" -> jobId, "spark.job.result" -> result))
+    }
+  }
+
+  /**
+   * Send the span of a stage attempt, child of its job span, with the stage skew metrics as attributes.
+   * @param jobId the ID of the job running the stage
+   * @param stageId the stage ID
+   * @param attempt the stage attempt number
+   * @param name the stage name
+   * @param start the stage submission time in milliseconds
+   * @param end the stage completion time in milliseconds
+   * @param failed true if the stage failed
+   * @param metrics the stage aggregated metrics, can be null
+   */
+  def completeStage(jobId: Int, stageId: Int, attempt: Int, name: String, start: Long, end: Long, failed: Boolean,
+                    metrics: CustomStageAggMetrics): Unit = {
+    emit(stageSpanId(stageId, attempt), jobSpanId(jobId), s"stage $stageId.$attempt", start, end, failed,
+      Map("spark.stage.id" -> stageId, "spark.stage.attempt" -> attempt, "spark.stage.name" -> name) ++
+        Option(metrics).map(m => Map(
+          "inputBytesReadSkewness" -> m.inputBytesReadSkewness,
+          "maxInputBytesRead" -> m.maxInputBytesRead,
+          "shuffleBytesReadSkewness" -> m.shuffleBytesReadSkewness,
+          "maxShuffleBytesRead" -> m.maxShuffleBytesRead)).getOrElse(Map.empty))
+  }
+
+  /**
+   * Send the span of a task, child of its stage attempt span, if the task is sampled. Failed tasks are always sent.
+   * @param metrics the task metrics
+   * @param start the task launch time in milliseconds
+   * @param end the task finish time in milliseconds
+   * @param failed true if the task didn't succeed
+   */
+  def endTask(metrics: CustomTaskMetrics, start: Long, end: Long, failed: Boolean): Unit = {
+    if (failed || Random.nextDouble() < taskSampleRate) {
+      emit(spanId(s"task-${metrics.stageId}-${metrics.stageAttemptId}-${metrics.taskId}"),
+        stageSpanId(metrics.stageId, metrics.stageAttemptId), s"task ${metrics.taskId}", start, end, failed,
+        Map(
+          "spark.task.id" -> metrics.taskId,
+          "spark.task.executor" -> metrics.executorId,
+          "spark.task.partition" -> metrics.partitionId,
+          "runTime" -> metrics.runTime,
+          "executorCpuTime" -> metrics.executorCpuTime,
+          "inputBytesRead" -> metrics.inputBytesRead,
+          "shuffleBytesRead" -> metrics.shuffleBytesRead,
+          "shuffleBytesWritten" -> metrics.shuffleBytesWritten))
+    }
+  }
+}
+
+/**
+ * Encode spans as an OTLP/JSON ExportTraceServiceRequest for the otel_trace_source of Opensearch Ingestion.
+ */
+object OtlpJsonTraceEncoder extends DocumentEncoder {
+
+  private val SPAN_KIND_INTERNAL = 1
+  private val STATUS_CODE_OK = 1
+  private val STATUS_CODE_ERROR = 2
+
+  override val contentType: String = "application/json"
+
+  private def attribute(key: String, value: JsonElement): JsonObject = {
+    val anyValue = new JsonObject
+    val primitive = value.getAsJsonPrimitive
+    if (primitive.isBoolean) anyValue.addProperty("boolValue", primitive.getAsBoolean)
+    else if (primitive.isNumber && primitive.getAsDouble == primitive.getAsLong.toDouble) anyValue.addProperty("intValue", primitive.getAsLong.toString)
+    else if (primitive.isNumber) anyValue.addProperty("doubleValue", primitive.getAsDouble)
+    else anyValue.addProperty("stringValue", primitive.getAsString)
+    val attr = new JsonObject
+    attr.addProperty("key", key)
+    attr.add("value", anyValue)
+    attr
+  }
+
+  private def stringAttribute(key: String, value: String): JsonObject = {
+    val anyValue = new JsonObject
+    anyValue.addProperty("stringValue", value)
+    val attr = new JsonObject
+    attr.addProperty("key", key)
+    attr.add("value", anyValue)
+    attr
+  }
+
+  override def encode(documents: Seq[JsonObject]): Array[Byte] = {
+    val spans = new JsonArray
+    documents.foreach { doc =>
+      val span = new JsonObject
+      span.addProperty("traceId", doc.get("traceId").getAsString)
+      span.addProperty("spanId", doc.get("spanId").getAsString)
+      span.addProperty("parentSpanId", doc.get("parentSpanId").getAsString)
+      span.addProperty("name", doc.get("name").getAsString)
+      span.addProperty("kind", SPAN_KIND_INTERNAL)
+      span.addProperty("startTimeUnixNano", doc.get("startTimeUnixNano").getAsLong.toString)
+      span.addProperty("endTimeUnixNano", doc.get("endTimeUnixNano").getAsLong.toString)
+      val attributes = new JsonArray
+      doc.getAsJsonObject("attributes").entrySet().asScala
+        .filter(e => e.getValue.isJsonPrimitive)
+        .foreach(e => attributes.add(attribute(e.getKey, e.getValue)))
+      if (doc.has("executorId")) attributes.add(stringAttribute("spark.executor.id", doc.get("executorId").getAsString))
+      span.add("attributes", attributes)
+      val status = new JsonObject
+      status.addProperty("code", if (doc.get("failed").getAsBoolean) STATUS_CODE_ERROR else STATUS_CODE_OK)
+      span.add("status", status)
+      spans.add(span)
+    }
+
+    val head = documents.head
+    val resourceAttributes = new JsonArray
+    resourceAttributes.add(stringAttribute("service.name", Option(head.get("appName")).map(_.getAsString).getOrElse("spark")))
+    Option(head.get("appId")).foreach(id => resourceAttributes.add(stringAttribute("spark.app.id", id.getAsString)))
+    val resource = new JsonObject
+    resource.add("attributes", resourceAttributes)
+
+    val scope = new JsonObject
+    scope.addProperty("name", "spark-observability-collector")
+    val scopeSpans = new JsonObject
+    scopeSpans.add("scope", scope)
+    scopeSpans.add("spans", spans)
+    val scopeSpansArray = new JsonArray
+    scopeSpansArray.add(scopeSpans)
+
+    val resourceSpans = new JsonObject
+    resourceSpans.add("resource", resource)
+    resourceSpans.add("scopeSpans", scopeSpansArray)
+    val resourceSpansArray = new JsonArray
+    resourceSpansArray.add(resourceSpans)
+
+    val request = new JsonObject
+    request.add("resourceSpans", resourceSpansArray)
+    request.toString.getBytes(StandardCharsets.UTF_8)
+  }
+}
@@ -8,6 +8,9 @@ import org.apache.logging.log4j.core.impl.Log4jLogEvent
 import org.apache.logging.log4j.util.SortedArrayStringMap
 import org.apache.spark.SparkEnv
 
+import java.io.{PrintWriter, StringWriter}
+import java.nio.charset.StandardCharsets
+import java.security.MessageDigest
 import scala.util.Try
 
 /**
@@ -15,6 +18,11 @@ import scala.util.Try
  */
 object Utils {
 
+  // The number of top frames of each exception of the cause chain identifying an error
+  private val FINGERPRINT_FRAMES = 10
+  // The maximum number of exceptions of the cause chain identifying an error
+  private val FINGERPRINT_CAUSES = 5
+
   /**
    * Enriches a LogEvent with additional context data.
    * @param original The original LogEvent to enrich.
@@ -111,4 +119,76 @@ object Utils {
   def getTimeThreshold(): Int = {
     Try(SparkEnv.get.conf.get("spark.metrics.timeThreshold")).getOrElse("10").toInt
   }
+
+  /**
+   * Retrieves the traces endpoint from Spark configuration. Tracing is disabled when the endpoint is not defined.
+   * @return The traces endpoint or None.
+   */
+  def getTracesEndpoint(): Option[String] = {
+    Try(SparkEnv.get.conf.getOption("spark.metrics.tracing.endpoint")).toOption.flatten
+  }
+
+  /**
+   * Retrieves the ratio of successful tasks recorded as spans from Spark configuration.
+   * @return The task sample rate or default value of 0.01.
+   */
+  def getTaskSampleRate(): Double = {
+    Try(SparkEnv.get.conf.get("spark.metrics.tracing.taskSampleRate")).getOrElse("0.01").toDouble
+  }
+
+  /**
+   * Retrieves the wire format used to send metrics from Spark configuration.
+   * @return The wire format, json or otlp, or default value of json.
+   */
+  def getWireFormat(): String = {
+    Try(SparkEnv.get.conf.get("spark.metrics.wireFormat")).getOrElse(PayloadEncoder.JSON_FORMAT).toLowerCase
+  }
+
+  /**
+   * Retrieves where the stage aggregated metrics are computed from Spark configuration.
+   * @return The stage aggregation, listener or pipeline, or default value of listener.
+   */
+  def getStageAggregation(): String = {
+    Try(SparkEnv.get.conf.get("spark.metrics.stageAggregation")).getOrElse("listener").toLowerCase
+  }
+
+  /**
+   * Extract the task and stage IDs from the MDC task name set by Spark executors, in the form of
+   * `task 1.0 in stage 2.0 (TID 3)`.
+   * @param taskName the MDC task name, can be null
+   * @return The task ID and the stage ID, or empty strings if they can't be extracted.
+   */
+  def parseTaskName(taskName: String): (String, String) = {
+    val taskId = Try(taskName.split(" ")(1)).getOrElse("")
+    val stageId = Try(taskName.split(' ')(4)).getOrElse("")
+    (taskId, stageId)
+  }
+
+  /**
+   * Format a throwable and its causes like the standard Java stack trace.
+   * @param thrown the throwable to format
+   * @return The stack trace as a string.
+   */
+  def stackTrace(thrown: Throwable): String = {
+    val stackTrace = new StringWriter
+    thrown.printStackTrace(new PrintWriter(stackTrace))
+    stackTrace.toString
+  }
+
+  /**
+   * Compute a fingerprint identifying the occurrences of the same error, from the exception classes of the cause chain
+   * and their top frames. Messages and line numbers are ignored because they change between occurrences and versions.
+   * @param thrown the throwable to identify
+   * @return The fingerprint as 16 hexadecimal characters.
+   */
+  def stackTraceFingerprint(thrown: Throwable): String = {
+    val digest = MessageDigest.getInstance("SHA-1")
+    Iterator.iterate(thrown)(_.getCause).takeWhile(_ != null).take(FINGERPRINT_CAUSES).foreach { exception =>
+      digest.update(exception.getClass.getName.getBytes(StandardCharsets.UTF_8))
+      exception.getStackTrace.take(FINGERPRINT_FRAMES).foreach { frame =>
+        digest.update(s"|${frame.getClassName}.${frame.getMethodName}".getBytes(StandardCharsets.UTF_8))
+      }
+    }
+    digest.digest().take(8).map(b => f"$b%02x").mkString
+  }
 }
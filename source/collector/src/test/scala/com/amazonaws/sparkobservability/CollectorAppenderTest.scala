@@ -3,11 +3,76 @@
 
 package com.amazonaws.sparkobservability
 
-import org.mockito.Mockito.{mock, verify}
-import org.scalatest.funsuite.AnyFunSuite
+import com.google.gson.JsonParser
+import org.apache.logging.log4j.Level
 import org.apache.logging.log4j.core.LogEvent
+import org.apache.logging.log4j.core.impl.Log4jLogEvent
+import org.apache.logging.log4j.message.ParameterizedMessage
+import org.apache.logging.log4j.util.SortedArrayStringMap
+import org.scalatest.funsuite.AnyFunSuite
+
+import java.nio.charset.StandardCharsets
 
 
 class CollectorAppenderTest extends AnyFunSuite {
 
+  private def failure(message: String): Throwable = {
+    try {
+      throw new IllegalStateException(message, new java.io.IOException(s"cause of $message"))
+    } catch {
+      case e: Throwable => e
+    }
+  }
+
+  private def logEvent(thrown: Throwable): LogEvent = {
+    val contextData = new SortedArrayStringMap()
+    contextData.putValue("mdc.taskName", "task 3.0 in stage 2.0 (TID 7)")
+    Log4jLogEvent.newBuilder()
+      .setLoggerName("org.apache.spark.executor.Executor")
+      .setLevel(Level.ERROR)
+      .setMessage(new ParameterizedMessage("Exception in task {}", "3.0"))
+      .setThreadName("Executor task launch worker for task 3.0 in stage 2.0 (TID 7)")
+      .setTimeMillis(1700000000000L)
+      .setThrown(thrown)
+      .setContextData(contextData)
+      .build()
+  }
+
+  test("log events are sent as flat documents with a single stack trace") {
+    val client = new ObservabilityClient[LogEvent]("https://localhost/ingest", "us-east-1", 10, 10, NdjsonEncoder)
+    val body = new String(client.encodeEvents(Seq(logEvent(failure("disk full")))), StandardCharsets.UTF_8)
+    val document = JsonParser.parseString(body.trim).getAsJsonObject
+
+    assertResult("ERROR")(document.get("level").getAsString)
+    assertResult("Exception in task 3.0")(document.getAsJsonObject("message").get("message").getAsString)
+    assertResult(1)(document.getAsJsonObject("message").size)
+    assertResult("task 3.0 in stage 2.0 (TID 7)")(document.get("taskName").getAsString)
+    assert(!document.has("taskId"))
+    assert(!document.has("thrownProxy"))
+    assert(document.get("stackTrace").getAsString.startsWith("java.lang.IllegalStateException: disk full"))
+    assert(document.get("stackTrace").getAsString.contains("Caused by: java.io.IOException: cause of disk full"))
+    assertResult(16)(document.get("stackTraceFingerprint").getAsString.length)
+  }
+
+  test("documents are stamped with the send time and ID of their batch") {
+    val client = new ObservabilityClient[LogEvent]("https://localhost/ingest", "us-east-1", 10, 10, NdjsonEncoder)
+    val before = System.currentTimeMillis
+    val batch = new String(client.encodeEvents(Seq(logEvent(null), logEvent(null))), StandardCharsets.UTF_8)
+    val documents = batch.trim.split("\n").map(JsonParser.parseString(_).getAsJsonObject)
+    val next = JsonParser.parseString(new String(client.encodeEvents(Seq(logEvent(null))), StandardCharsets.UTF_8).trim).getAsJsonObject
+
+    assert(documents.forall(_.get("sendTime").getAsLong >= before))
+    assertResult(1)(documents.map(_.get("batchId").getAsString).distinct.length)
+    assert(next.get("batchId").getAsString != documents(0).get("batchId").getAsString)
+  }
+
+  test("the stack trace fingerprint ignores messages but not exception classes") {
+    assertResult(Utils.stackTraceFingerprint(failure("disk full")))(Utils.stackTraceFingerprint(failure("out of space")))
+    val other = try {
+      throw new IllegalArgumentException("disk full")
+    } catch {
+      case e: Throwable => e
+    }
+    assert(Utils.stackTraceFingerprint(other) != Utils.stackTraceFingerprint(failure("disk full")))
+  }
 }
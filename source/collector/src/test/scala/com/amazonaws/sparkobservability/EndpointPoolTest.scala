@@ -0,0 +1,67 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import org.scalatest.funsuite.AnyFunSuite
+
+import java.time.{Clock, Duration, Instant, ZoneId, ZoneOffset}
+
+
+class EndpointPoolTest extends AnyFunSuite {
+
+  private class TestClock extends Clock {
+    var now: Instant = Instant.parse("2024-01-01T00:00:00Z")
+    override def getZone: ZoneId = ZoneOffset.UTC
+    override def withZone(zone: ZoneId): Clock = this
+    override def instant(): Instant = now
+  }
+
+  private val endpoints = EndpointPool.parse("https://a.osis.amazonaws.com/ingest, https://b.osis.amazonaws.com/ingest|eu-west-1", "us-east-1")
+
+  test("endpoints are parsed with an optional region") {
+    assertResult(Seq("us-east-1", "eu-west-1"))(endpoints.map(_.region))
+    assertResult("b.osis.amazonaws.com")(endpoints(1).uri.getHost)
+    assertThrows[IllegalArgumentException](EndpointPool.parse("https://a|b|c", "us-east-1"))
+  }
+
+  test("the fastest healthy endpoint is chosen after all endpoints are tried") {
+    val pool = new EndpointPool(endpoints)
+    val first = pool.select()
+    pool.record(first, 100, success = true)
+    val second = pool.select()
+    assert(first ne second)
+    pool.record(second, 10, success = true)
+    assertResult(second)(pool.select())
+
+    // The fast endpoint degrades and the other one takes over
+    (1 to 5).foreach(_ => pool.record(second, 1000, success = true))
+    assertResult(first)(pool.select())
+  }
+
+  test("failing endpoints are ejected and probed once the ejection ends") {
+    val clock = new TestClock
+    val pool = new EndpointPool(endpoints, clock)
+    val Seq(a, b) = pool.health
+    pool.record(a, 10, success = true)
+    pool.record(b, 50, success = true)
+    (1 to 3).foreach(_ => pool.record(a, 10, success = false))
+    assert(a.ejectedUntil.isDefined)
+    assertResult(b)(pool.select())
+    assertResult(a)(pool.select(Set(b)))
+
+    // Half-open: a single probe, a failure doubles the ejection
+    clock.now = clock.now.plus(Duration.ofSeconds(31))
+    assertResult(a)(pool.select())
+    assertResult(b)(pool.select())
+    pool.record(a, 10, success = false)
+    assertResult(Duration.ofSeconds(60))(a.ejection)
+
+    // A successful probe brings the endpoint back
+    clock.now = clock.now.plus(Duration.ofSeconds(61))
+    assertResult(a)(pool.select())
+    pool.record(a, 10, success = true)
+    assert(a.ejectedUntil.isEmpty)
+    assertResult(EndpointPool.INITIAL_EJECTION)(a.ejection)
+  }
+}
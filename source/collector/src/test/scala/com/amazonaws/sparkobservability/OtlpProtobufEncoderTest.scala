@@ -0,0 +1,72 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import org.apache.logging.log4j.Level
+import org.apache.logging.log4j.core.impl.Log4jLogEvent
+import org.apache.logging.log4j.message.SimpleMessage
+import org.scalatest.funsuite.AnyFunSuite
+
+import java.io.ByteArrayInputStream
+import java.nio.charset.StandardCharsets
+import java.util.zip.GZIPInputStream
+
+
+class OtlpProtobufEncoderTest extends AnyFunSuite {
+
+  private val context = RecordContext("app", "app-1", "driver")
+
+  private def gunzip(content: Array[Byte]): Array[Byte] = {
+    val input = new GZIPInputStream(new ByteArrayInputStream(content))
+    Iterator.continually(input.read()).takeWhile(_ != -1).map(_.toByte).toArray
+  }
+
+  private def contains(content: Array[Byte], text: String): Boolean =
+    new String(content, StandardCharsets.ISO_8859_1).contains(text)
+
+  test("varints and fixed64 follow the protobuf wire format") {
+    assertResult(Seq(0x08, 0x96, 0x01))(new ProtobufWriter().varint(1, 150).toByteArray.toSeq.map(_ & 0xFF))
+    assertResult(Seq(0x11, 1, 0, 0, 0, 0, 0, 0, 0))(new ProtobufWriter().fixed64(2, 1L).toByteArray.toSeq.map(_ & 0xFF))
+    assertResult(Seq(0x1a, 0x02, 0x08, 0x01))(new ProtobufWriter().message(3, new ProtobufWriter().varint(1, 1)).toByteArray.toSeq.map(_ & 0xFF))
+  }
+
+  test("task metrics are aggregated per stage in histograms and other metrics are gauges") {
+    val task = CustomTaskMetrics("app", "app-1", "0", 1, 0, "1.0", "1", 0,
+      10, 1, 1500, 5, 100, 0, 0, 0, 200, 0, 0, 1000L)
+    val stage = CustomStageAggMetrics("app", "app-1", "0", 1, 0.5, 10, 0.1, 200, 2000L)
+    val content = gunzip(OtlpMetricsEncoder.encodeRecords(Seq(task, task, stage), context))
+    assertResult(0x0a)(content(0))
+    assert(contains(content, "spark.task.runTime"))
+    assert(contains(content, "spark.task.shuffleBytesRead"))
+    assert(contains(content, "spark.stageAgg.inputBytesReadSkewness"))
+    assert(!contains(content, "taskId"))
+    assert(!contains(content, "metricsType"))
+  }
+
+  test("timestamps and identifiers are never sent as metrics") {
+    val task = CustomTaskMetrics("app", "app-1", "0", 1, 0, "1.0", "1", 0,
+      10, 1, 1500, 5, 100, 0, 0, 0, 200, 0, 0, 1000L)
+    val stage = CustomStageAggMetrics("app", "app-1", "0", 1, 0.5, 10, 0.1, 200, 2000L)
+    val summary = CustomSummaryMetrics("app", "app-1", null, "application", "succeeded", 1000L, 5000L, 4000L,
+      1, 2, 0, 10, 0, 0, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 6000L)
+    val content = gunzip(OtlpMetricsEncoder.encodeRecords(Seq(task, stage, summary), context))
+    assert(contains(content, "spark.summary.duration"))
+    for (metricsType <- Seq("task", "stageAgg", "summary"); field <- Seq("metricTime", "startTime", "endTime", "appId")) {
+      assert(!contains(content, s"spark.$metricsType.$field"))
+    }
+  }
+
+  test("log events are encoded as log records with their severity") {
+    val event = Log4jLogEvent.newBuilder()
+      .setLoggerName("org.apache.spark.executor.Executor")
+      .setLevel(Level.WARN)
+      .setMessage(new SimpleMessage("Lost task"))
+      .setTimeMillis(1000L)
+      .build()
+    val content = gunzip(OtlpLogsEncoder.encodeRecords(Seq(event), context))
+    assert(contains(content, "Lost task"))
+    assert(contains(content, "WARN"))
+    assert(contains(content, "org.apache.spark.executor.Executor"))
+  }
+}
@@ -0,0 +1,96 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import com.google.gson.JsonObject
+import org.scalatest.funsuite.AnyFunSuite
+import software.amazon.awssdk.core.exception.RetryableException
+
+import java.io.{File, FileInputStream}
+import java.nio.charset.StandardCharsets
+import java.nio.file.Files
+import java.util.zip.GZIPInputStream
+import scala.util.Random
+
+
+class RollingObjectSinkTest extends AnyFunSuite {
+
+  private val context = RecordContext("app", "app-1", "driver")
+
+  private def batch(messages: String*): Array[Byte] = {
+    NdjsonEncoder.encode(messages.map { message =>
+      val document = new JsonObject
+      document.addProperty("message", message)
+      document
+    })
+  }
+
+  private def files(directory: File): Seq[File] = {
+    Option(directory.listFiles).toSeq.flatten.flatMap(f => if (f.isDirectory) files(f) else Seq(f)).sortBy(_.getName)
+  }
+
+  private def lines(file: File): Seq[String] = {
+    val input = new GZIPInputStream(new FileInputStream(file))
+    try new String(Iterator.continually(input.read()).takeWhile(_ != -1).map(_.toByte).toArray, StandardCharsets.UTF_8)
+      .split("\n").toSeq
+    finally input.close()
+  }
+
+  test("objects are rolled over when they reach the maximum size") {
+    val directory = Files.createTempDirectory("sink").toFile
+    val sink = RollingObjectSink(RollingObjectSink.DIRECTORY_SINK, directory.getPath, "us-east-1", 1L, 300)
+    sink.write(batch("a", "b"), context)
+    sink.write(batch("c"), context)
+    sink.close()
+
+    val objects = files(directory)
+    assertResult(2)(objects.size)
+    assert(objects.forall(_.getPath.contains("appId=app-1/executorId=driver/")))
+    assert(objects.forall(_.getName.endsWith(RollingObjectSink.EXTENSION)))
+    assertResult(Seq("""{"message":"a"}""", """{"message":"b"}"""))(lines(objects.head))
+    assertResult(Seq("""{"message":"c"}"""))(lines(objects(1)))
+  }
+
+  test("large objects are written in parts and only visible once completed") {
+    val directory = Files.createTempDirectory("sink").toFile
+    val sink = RollingObjectSink(RollingObjectSink.DIRECTORY_SINK, directory.getPath, "us-east-1", 1024L * 1024L, 300)
+    val random = new Random(42)
+    val messages = (1 to 2000).map(_ => random.alphanumeric.take(100).mkString)
+    messages.grouped(500).foreach(group => sink.write(batch(group: _*), context))
+
+    val inProgress = files(directory)
+    assertResult(1)(inProgress.size)
+    assert(inProgress.head.getName.endsWith(".inprogress"))
+
+    sink.close()
+    val objects = files(directory)
+    assertResult(1)(objects.size)
+    assert(objects.head.getName.endsWith(RollingObjectSink.EXTENSION))
+    assertResult(messages.map(m => s"""{"message":"$m"}"""))(lines(objects.head))
+  }
+
+  test("objects failing to complete are completed with the next batch") {
+    val directory = Files.createTempDirectory("sink").toFile
+    var failures = 2
+    val sink = new DirectoryObjectSink(directory.getPath, 1L, 300) {
+      override protected def complete(): Unit = {
+        if (failures > 0) {
+          failures -= 1
+          throw new IllegalStateException("completion failed")
+        }
+        super.complete()
+      }
+    }
+    sink.write(batch("a", "b"), context)
+    assertThrows[RetryableException](sink.write(batch("c"), context))
+    assert(files(directory).forall(_.getName.endsWith(".inprogress")))
+
+    sink.write(batch("c"), context)
+    sink.close()
+    val objects = files(directory)
+    assertResult(2)(objects.size)
+    assertResult(Seq("""{"message":"a"}""", """{"message":"b"}"""))(lines(objects.head))
+    assertResult(Seq("""{"message":"c"}"""))(lines(objects(1)))
+  }
+}
@@ -0,0 +1,36 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import org.scalatest.funsuite.AnyFunSuite
+
+
+class RunSummaryTest extends AnyFunSuite {
+
+  private def task(runTime: Double, shuffleBytesRead: Double): CustomTaskMetrics =
+    CustomTaskMetrics("app", "app-1", "0", 1, 0, "1.0", "1", 0,
+      10, 1, runTime, 5, 100, 0, 0, 0, shuffleBytesRead, 0, 0, 0L)
+
+  test("summary holds totals, maxima and counts") {
+    val summary = new RunSummary(1000L)
+    summary.addTask(task(10, 100), failed = false, retried = false)
+    summary.addTask(task(30, 50), failed = true, retried = true)
+    summary.addStage(failed = false)
+    summary.observeExecutors(3)
+    summary.observeExecutors(2)
+
+    val metrics = summary.toMetrics("app", "app-1", "0", RunSummary.JOB_LEVEL, "SUCCEEDED", 4000L)
+    assertResult(3000L)(metrics.duration)
+    assertResult(2)(metrics.taskCount)
+    assertResult(1)(metrics.failedTaskCount)
+    assertResult(1)(metrics.retriedTaskCount)
+    assertResult(1)(metrics.stageCount)
+    assertResult(3)(metrics.peakExecutors)
+    assertResult(40.0)(metrics.totalRunTime)
+    assertResult(30.0)(metrics.maxRunTime)
+    assertResult(150.0)(metrics.totalShuffleBytesRead)
+    assertResult(100.0)(metrics.maxShuffleBytesRead)
+    assertResult("summaryMetrics")(metrics.metricsType)
+  }
+}
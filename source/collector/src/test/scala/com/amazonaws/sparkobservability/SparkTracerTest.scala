@@ -0,0 +1,46 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import com.google.gson.{JsonObject, JsonParser}
+import org.scalatest.funsuite.AnyFunSuite
+
+import java.nio.charset.StandardCharsets
+
+
+class SparkTracerTest extends AnyFunSuite {
+
+  test("identifiers are stable and sized for OTLP") {
+    assertResult(SparkTracer.hexId("app-1", 16))(SparkTracer.hexId("app-1", 16))
+    assertResult(32)(SparkTracer.hexId("app-1", 16).length)
+    assertResult(16)(SparkTracer.hexId("app-1/job-0", 8).length)
+    assert(SparkTracer.hexId("app-1/job-0", 8) != SparkTracer.hexId("app-1/job-1", 8))
+  }
+
+  test("spans are encoded as an OTLP/JSON export request") {
+    val attributes = new JsonObject
+    attributes.addProperty("spark.job.id", 3)
+    attributes.addProperty("spark.job.result", "FAILED")
+    val span = new JsonObject
+    span.addProperty("traceId", SparkTracer.hexId("app-1", 16))
+    span.addProperty("spanId", SparkTracer.hexId("app-1/job-3", 8))
+    span.addProperty("parentSpanId", SparkTracer.hexId("app-1/application", 8))
+    span.addProperty("name", "job 3")
+    span.addProperty("startTimeUnixNano", 1000000L)
+    span.addProperty("endTimeUnixNano", 2000000L)
+    span.addProperty("failed", true)
+    span.add("attributes", attributes)
+    span.addProperty("appName", "app")
+    span.addProperty("appId", "app-1")
+
+    val request = JsonParser.parseString(new String(OtlpJsonTraceEncoder.encode(Seq(span)), StandardCharsets.UTF_8)).getAsJsonObject
+    val resourceSpans = request.getAsJsonArray("resourceSpans").get(0).getAsJsonObject
+    val serviceName = resourceSpans.getAsJsonObject("resource").getAsJsonArray("attributes").get(0).getAsJsonObject
+    assertResult("app")(serviceName.getAsJsonObject("value").get("stringValue").getAsString)
+    val encoded = resourceSpans.getAsJsonArray("scopeSpans").get(0).getAsJsonObject.getAsJsonArray("spans").get(0).getAsJsonObject
+    assertResult("1000000")(encoded.get("startTimeUnixNano").getAsString)
+    assertResult(2)(encoded.getAsJsonObject("status").get("code").getAsInt)
+    assertResult("3")(encoded.getAsJsonArray("attributes").get(0).getAsJsonObject.getAsJsonObject("value").get("intValue").getAsString)
+  }
+}
@@ -0,0 +1,73 @@
+// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+// SPDX-License-Identifier: MIT-0
+
+package com.amazonaws.sparkobservability
+
+import org.apache.logging.log4j.Level
+import org.apache.logging.log4j.core.LogEvent
+import org.apache.logging.log4j.core.impl.Log4jLogEvent
+import org.apache.logging.log4j.message.SimpleMessage
+import org.apache.logging.log4j.util.SortedArrayStringMap
+
+import java.lang.management.ManagementFactory
+
+/**
+ * Compare the bytes on the wire and the CPU time to encode 10k events with the JSON and the OTLP wire formats.
+ * The HTTP request is not sent, only the work done by the collector to build the request body is measured.
+ * Run with `sbt "Test/runMain com.amazonaws.sparkobservability.WireFormatBenchmark"`
+ */
+object WireFormatBenchmark {
+
+  private val EVENTS = 10000
+  private val WARMUP_ROUNDS = 5
+  private val ROUNDS = 20
+
+  private val threadBean = ManagementFactory.getThreadMXBean
+
+  private def taskMetrics(): Seq[CustomMetrics] = (0 until EVENTS).map { i =>
+    CustomTaskMetrics("benchmark", "app-1", (i / 1000).toString, i / 100, 0, s"${i % 100}.0", (i % 8).toString, i % 100,
+      1048576.0 + i, 1000.0 + i, 1500.0 + i % 700, 1200.0, 65536.0, 0.0, 0.0, 500.0, 524288.0, 500.0, 524288.0,
+      1700000000000L + i)
+  }
+
+  private def logEvents(): Seq[LogEvent] = (0 until EVENTS).map { i =>
+    val contextData = new SortedArrayStringMap()
+    contextData.putValue("mdc.taskName", s"task ${i % 100}.0 in stage ${i / 100}.0 (TID $i)")
+    Log4jLogEvent.newBuilder()
+      .setLoggerName("org.apache.spark.executor.Executor")
+      .setLevel(Level.INFO)
+      .setMessage(new SimpleMessage(s"Finished task ${i % 100}.0 in stage ${i / 100}.0 (TID $i). 2544 bytes result sent to driver"))
+      .setThreadName("Executor task launch worker for task 1.0 in stage 1.0 (TID 1)")
+      .setTimeMillis(1700000000000L + i)
+      .setContextData(contextData)
+      .build()
+  }
+
+  /**
+   * Encode the events several times and report the request size and the average CPU time per round.
+   */
+  private def measure[A](label: String, events: Seq[A], encode: Seq[A] => Array[Byte]): Unit = {
+    (0 until WARMUP_ROUNDS).foreach(_ => encode(events))
+    val start = threadBean.getCurrentThreadCpuTime
+    var size = 0
+    (0 until ROUNDS).foreach(_ => size = encode(events).length)
+    val cpuMillis = (threadBean.getCurrentThreadCpuTime - start) / 1000000.0 / ROUNDS
+    println(f"$label%-28s $size%12d bytes $cpuMillis%10.1f ms CPU per $EVENTS events")
+  }
+
+  def main(args: Array[String]): Unit = {
+    val metricsJson = new ObservabilityClient[CustomMetrics]("https://localhost/ingest", "us-east-1", EVENTS, 10)
+    val metricsOtlp = new ObservabilityClient[CustomMetrics]("https://localhost/v1/metrics", "us-east-1", EVENTS, 10, OtlpMetricsEncoder)
+    val logsJson = new ObservabilityClient[LogEvent]("https://localhost/ingest", "us-east-1", EVENTS, 10)
+    val logsOtlp = new ObservabilityClient[LogEvent]("https://localhost/v1/logs", "us-east-1", EVENTS, 10, OtlpLogsEncoder)
+
+    val metrics = taskMetrics()
+    val logs = logEvents()
+    measure("task metrics json", metrics, metricsJson.encodeEvents)
+    measure("task metrics json+gzip", metrics, (e: Seq[CustomMetrics]) => PayloadEncoder.gzip(metricsJson.encodeEvents(e)))
+    measure("task metrics otlp+gzip", metrics, metricsOtlp.encodeEvents)
+    measure("logs json", logs, logsJson.encodeEvents)
+    measure("logs json+gzip", logs, (e: Seq[LogEvent]) => PayloadEncoder.gzip(logsJson.encodeEvents(e)))
+    measure("logs otlp+gzip", logs, logsOtlp.encodeEvents)
+  }
+}